@@ -130,6 +130,29 @@ https://jwst-pipeline.readthedocs.io/en/latest/jwst/introduction.html#reference-
 13 Mar 2019: Test the SSH connection after opening it, to prevent a hidden
              connection issue manifesting as an exception at a later time.
 04 Oct 2019: Removed use of astropy.extern.six (since Python 2 no longer used)
+18 Oct 2026: Added find_cdp_file, which locates (and caches) the file
+             get_cdp would read without reading it.
+18 Oct 2026: Added an optional least-recently-used cache of the data
+             models opened by get_cdp (CDPModelCache), enabled with
+             enable_cdp_cache.
+18 Oct 2026: Each MiriCDPFolder keeps a MiriCDPCatalogue of its CDP files,
+             parsed into their naming convention fields and indexed by
+             substring, and saves it in an index file in the local
+             cache. The folder is only listed again when its modification
+             time changes.
+18 Oct 2026: match_cdp_filename compares the model, detector, readout
+             pattern, filter, subarray and CDP type with the parsed
+             fields of the catalogue. The folder index is checked against
+             a fingerprint of the folder listing as well as its
+             modification time.
+18 Oct 2026: update_cdp_list checks the folder modification time before
+             listing the folder, and only lists it when the time has
+             changed.
+18 Oct 2026: CDPModelCache copies are made with the public DataModel
+             copy method, with the cached arrays shared through the
+             deep copy memo.
+18 Oct 2026: get_cdp accepts the cdp_filename already found by
+             find_cdp_file, so the file is not searched for twice.
 
 Steven Beard (UKATC), Vincent Geers (UKATC)
 
@@ -140,6 +163,11 @@ import re
 import time
 import sys, getpass
 import copy
+import collections
+import json
+import hashlib
+
+import numpy as np
 
 # Python utilities for accessing the sftp repository.
 import pysftp
@@ -167,7 +195,26 @@ from miri.datamodels.util import get_data_class
 from miri.datamodels.cdp import CDP_DICT
 
 # List all public classes and global functions here.
-__all__ = ['get_cdp', 'MiriCDPInterface']
+__all__ = ['get_cdp', 'find_cdp_file', 'enable_cdp_cache',
+           'disable_cdp_cache', 'get_cdp_cache', 'parse_cdp_filename',
+           'MiriCDPInterface', 'MiriCDPCatalogue', 'CDPModelCache']
+
+# The default memory budget for the optional CDP model cache (in bytes).
+DEFAULT_CDP_CACHE_BYTES = 512 * 1024 * 1024
+
+# The CDP model cache used by get_cdp. None when the cache is disabled.
+_CDP_MODEL_CACHE = None
+
+# The subdirectory of the local CDP cache containing the CDP folder
+# index files, and the version of the index file format.
+CDP_INDEX_DIR = '.cdp_index'
+_CDP_INDEX_FORMAT = 2
+
+# The fields of the CDP naming convention, in the order they are saved
+# in a folder index.
+_CDP_NAME_FIELDS = ('model', 'detector', 'setting', 'readpatt', 'filter',
+                    'channel', 'band', 'subarray', 'reftype', 'release',
+                    'version', 'subversion', 'other')
 
 #
 # (1) Global functions
@@ -290,12 +337,163 @@ def cdp_version_decode( cdp_version ):
     return (cdprelease, cdpversion, cdpsubversion)
 
 #+++ MAIN FUNCTION +++
+def parse_cdp_filename(filename):
+    """
+    
+    Split a CDP file name into the fields of the MIRI CDP naming
+    convention:
+    
+    MIRI_<model>_<detector>_<detsetng>_<readpatt>_<channelband_or_filter>_<subarray>_<reftype>_<version>.fits
+    
+    Fields which are not present in the name are returned as ''.
+    
+    :Parameters:
+    
+    filename: str
+        The CDP file name.
+        
+    :Returns:
+    
+    fields: dict
+        A dictionary containing the 'model', 'detector', 'setting',
+        'readpatt', 'filter', 'channel', 'band', 'subarray', 'reftype',
+        'release', 'version' and 'subversion' fields, together with any
+        unrecognised parts of the name, joined by '_', in 'other'.
+    
+    """
+    fields = dict.fromkeys(_CDP_NAME_FIELDS, '')
+    name = os.path.basename(filename)
+    if name.lower().endswith('.fits'):
+        name = name[:-5]
+    tokens = name.split('_')
+    if tokens and tokens[0] == 'MIRI':
+        tokens = tokens[1:]
+    # The version code and reference type are at the end of the name.
+    if tokens:
+        match = re.match(r'^([0-9]{1,2}[A-Z]?)\.([0-9]{2})\.([0-9]{2})$',
+                         tokens[-1])
+        if match is not None:
+            (fields['release'], fields['version'], fields['subversion']) = \
+                match.groups()
+            tokens = tokens[:-1]
+    if tokens:
+        fields['reftype'] = tokens[-1]
+        tokens = tokens[:-1]
+    other = []
+    for token in tokens:
+        utoken = token.upper()
+        if not fields['model'] and utoken in MIRI_MODELS:
+            fields['model'] = utoken
+        elif not fields['detector'] and utoken in MIRI_DETECTORS:
+            fields['detector'] = utoken
+        elif not fields['setting'] and utoken in MIRI_SETTINGS:
+            fields['setting'] = utoken
+        elif not fields['readpatt'] and utoken in MIRI_READPATTS:
+            fields['readpatt'] = utoken
+        elif not fields['filter'] and utoken in MIRI_FILTERS:
+            fields['filter'] = utoken
+        elif not fields['subarray'] and utoken in MIRI_SUBARRAYS:
+            fields['subarray'] = utoken
+        else:
+            # A channel and band combination, such as 12SHORT or 3LONG,
+            # or a band on its own.
+            match = re.match(r'^([0-9]*)([A-Z\-]+)$', utoken)
+            if not fields['band'] and match is not None and \
+               match.group(2) in MIRI_BANDS:
+                (fields['channel'], fields['band']) = match.groups()
+            elif not fields['channel'] and utoken in MIRI_CHANNELS:
+                fields['channel'] = utoken
+            else:
+                other.append(token)
+    fields['other'] = '_'.join(other)
+    return fields
+
+def find_cdp_file(cdptype, detector, model='FM', readpatt='ANY',
+                  channel='ANY', band='ANY', mirifilter='ANY',
+                  subarray='FULL', integration=None, cdprelease=None,
+                  cdpversion=None, cdpsubversion=None, ftp_host=None,
+                  ftp_path=None, ftp_user='miri', ftp_passwd='',
+                  timeout=None, local_path=None, cdp_env_name='CDP_DIR',
+                  miri_env_name='MIRI_ENV', logger=LOGGER):
+    """
+    
+    Find the calibration data product file matching the specified
+    criteria and make sure it is present in the local CDP cache,
+    without reading its contents. The matching rules are the same
+    as for get_cdp, which uses this function to locate its file.
+    
+    This function can be used by a caller which needs to know which
+    file (and which version of a CDP) would be returned by get_cdp,
+    for example to decide whether data derived from that CDP can be
+    reused.
+    
+    :Parameters:
+    
+    See get_cdp.
+    
+    :Returns:
+    
+    local_filename: str
+        The path and name of the matching CDP file in the local cache.
+        Returns None if no CDP file could be matched.
+        
+    :Raises:
+    
+    TypeError
+        Raised if the cdptype is not a recognised MIRI CDP type.
+    
+    """
+    # The cdptype must be one of the available CDP types
+    if not cdptype in CDP_DICT:
+        # Not a recognised CDP type.
+        strg = "Data type \'%s\' is not a recognised MIRI CDP.\n" % cdptype
+        strg += "It must be one of: "
+        start = True
+        for key in list(CDP_DICT.keys()):
+            if start:
+                start = False
+            else:
+                strg += ", "
+            strg += "\'%s\'" % key
+        raise TypeError(strg)
+    
+    # Access the MIRI CDP repository through a CDP interface object.
+    # NOTE: The MiriCDPInterface is a singleton, so the class is created
+    # once, per session, even if get_cdp is called many times.
+    CDPInterface = MiriCDPInterface(ftp_host=ftp_host, ftp_path=ftp_path,
+                                    ftp_user=ftp_user, ftp_passwd=ftp_passwd,
+                                    timeout=timeout, local_path=local_path,
+                                    cdp_env_name=cdp_env_name,
+                                    miri_env_name=miri_env_name, logger=logger)
+    
+    # Refresh the interface if any parameters are different from when the
+    # class was first created (necessary when the class is a singleton).
+    CDPInterface.refresh(ftp_host=ftp_host, ftp_path=ftp_path,
+                         ftp_user=ftp_user, ftp_passwd=ftp_passwd,
+                         timeout=timeout, local_path=local_path,
+                         cdp_env_name=cdp_env_name,
+                         miri_env_name=miri_env_name)
+    
+    # Get the name of a CDP file matching the specified criteria.
+    (filename, ftp_path) = CDPInterface.match_cdp_latest(cdptype, model=model,
+                    detector=detector, readpatt=readpatt, channel=channel,
+                    band=band, mirifilter=mirifilter, subarray=subarray,
+                    integration=integration, cdprelease=cdprelease,
+                    cdpversion=cdpversion, cdpsubversion=cdpsubversion)         
+    
+    if filename:
+        # Update the local CDP cache to make sure it contains the specified file,
+        # and obtain the local file path and name.
+        return CDPInterface.update_cache(filename, ftp_path)
+    return None
+
 def get_cdp(cdptype, detector, model='FM', readpatt='ANY', channel='ANY',
             band='ANY', mirifilter='ANY', subarray='FULL', integration=None,
             cdprelease=None, cdpversion=None, cdpsubversion=None,
             ftp_host=None, ftp_path=None, ftp_user='miri', ftp_passwd='',
             timeout=None, local_path=None, cdp_env_name='CDP_DIR',
-            miri_env_name='MIRI_ENV', logger=LOGGER, fail_message=True):
+            miri_env_name='MIRI_ENV', logger=LOGGER, fail_message=True,
+            cdp_filename=None):
     """
     
     Get a calibration data product matching the specified criteria.
@@ -423,6 +621,10 @@ def get_cdp(cdptype, detector, model='FM', readpatt='ANY', channel='ANY',
         CDP cannot be found and None is returned.
         Set to False when using get_cdp to try different options and
         you don't want a message logged for each try.
+    cdp_filename: str (optional)
+        The local CDP file matching the given criteria, if it has
+        already been found with find_cdp_file. The file is read without
+        searching for it again. By default, the file is searched for.
         
     :Environment:
   
@@ -450,49 +652,23 @@ def get_cdp(cdptype, detector, model='FM', readpatt='ANY', channel='ANY',
     # Get a logging object
     mylogger = logger.getChild("get_cdp")
     
-    # The cdptype must be one of the available CDP types
-    if not cdptype in CDP_DICT:
-        # Not a recognised CDP type.
-        strg = "Data type \'%s\' is not a recognised MIRI CDP.\n" % cdptype
-        strg += "It must be one of: "
-        start = True
-        for key in list(CDP_DICT.keys()):
-            if start:
-                start = False
-            else:
-                strg += ", "
-            strg += "\'%s\'" % key
-        raise TypeError(strg)
-    
-    # Access the MIRI CDP repository through a CDP interface object.
-    # NOTE: The MiriCDPInterface is a singleton, so the class is created
-    # once, per session, even if get_cdp is called many times.
-    CDPInterface = MiriCDPInterface(ftp_host=ftp_host, ftp_path=ftp_path,
-                                    ftp_user=ftp_user, ftp_passwd=ftp_passwd,
-                                    timeout=timeout, local_path=local_path,
-                                    cdp_env_name=cdp_env_name,
-                                    miri_env_name=miri_env_name, logger=logger)
-    
-    # Refresh the interface if any parameters are different from when the
-    # class was first created (necessary when the class is a singleton).
-    CDPInterface.refresh(ftp_host=ftp_host, ftp_path=ftp_path,
-                         ftp_user=ftp_user, ftp_passwd=ftp_passwd,
-                         timeout=timeout, local_path=local_path,
-                         cdp_env_name=cdp_env_name,
-                         miri_env_name=miri_env_name)
-    
-    # Get the name of a CDP file matching the specified criteria.
-    (filename, ftp_path) = CDPInterface.match_cdp_latest(cdptype, model=model,
-                    detector=detector, readpatt=readpatt, channel=channel,
-                    band=band, mirifilter=mirifilter, subarray=subarray,
-                    integration=integration, cdprelease=cdprelease,
-                    cdpversion=cdpversion, cdpsubversion=cdpsubversion)         
+    # Find the local copy of a CDP file matching the specified criteria,
+    # unless it has already been found.
+    if cdp_filename:
+        local_filename = cdp_filename
+    else:
+        local_filename = find_cdp_file(cdptype, detector, model=model,
+                        readpatt=readpatt, channel=channel, band=band,
+                        mirifilter=mirifilter, subarray=subarray,
+                        integration=integration, cdprelease=cdprelease,
+                        cdpversion=cdpversion, cdpsubversion=cdpsubversion,
+                        ftp_host=ftp_host, ftp_path=ftp_path,
+                        ftp_user=ftp_user, ftp_passwd=ftp_passwd,
+                        timeout=timeout, local_path=local_path,
+                        cdp_env_name=cdp_env_name,
+                        miri_env_name=miri_env_name, logger=logger)
     
-    if filename:
-        # Update the local CDP cache to make sure it contains the specified file,
-        # and obtain the local file path and name.
-        local_filename = CDPInterface.update_cache(filename, ftp_path)
-
+    if local_filename:
         # Read the contents of the file into a new data model, using the class
         # derived associated with the data type, detector and filter.
         kwlist = [cdptype]
@@ -525,9 +701,18 @@ def get_cdp(cdptype, detector, model='FM', readpatt='ANY', channel='ANY',
                 kwlist.append('ANY')
             
         data_class = get_data_class(kwlist)
-        strg = "Reading \'%s\' model from \'%s\'" % (cdptype, local_filename)
-        mylogger.info(strg)
-        datamodel = data_class( init=local_filename )
+        
+        # Use a copy of a previously opened model if it has been cached.
+        datamodel = None
+        if _CDP_MODEL_CACHE is not None:
+            datamodel = _CDP_MODEL_CACHE.get(local_filename, data_class)
+        if datamodel is None:
+            strg = "Reading \'%s\' model from \'%s\'" % (cdptype, local_filename)
+            mylogger.info(strg)
+            datamodel = data_class( init=local_filename )
+            if _CDP_MODEL_CACHE is not None:
+                datamodel = _CDP_MODEL_CACHE.put(local_filename, data_class,
+                                                 datamodel)
     else:
         if fail_message:
             criteria = _criteria_string(cdptype, model=model,
@@ -542,6 +727,76 @@ def get_cdp(cdptype, detector, model='FM', readpatt='ANY', channel='ANY',
     # If successful, return the new data model.
     return datamodel
 
+def enable_cdp_cache(max_bytes=DEFAULT_CDP_CACHE_BYTES, logger=LOGGER):
+    """
+    
+    Enable a least-recently-used cache of the data models opened by
+    get_cdp, so a CDP file requested many times is only read once.
+    While the cache is enabled, get_cdp returns models whose arrays
+    are read-only and shared with the cached model. A caller wanting
+    to change the contents of an array must copy it first.
+    
+    If the cache is already enabled, its memory budget is changed.
+    
+    :Parameters:
+    
+    max_bytes: int (optional)
+        The maximum number of bytes of array data held in the cache.
+        The least recently used models are discarded when it is exceeded.
+        Defaults to DEFAULT_CDP_CACHE_BYTES.
+    logger: Logger object (optional)
+        A Python logger to handle the I/O.
+        
+    :Returns:
+    
+    cache: CDPModelCache
+        The cache used by get_cdp.
+    
+    """
+    global _CDP_MODEL_CACHE
+    if _CDP_MODEL_CACHE is None:
+        _CDP_MODEL_CACHE = CDPModelCache(max_bytes=max_bytes, logger=logger)
+    else:
+        _CDP_MODEL_CACHE.resize(max_bytes)
+    return _CDP_MODEL_CACHE
+
+def disable_cdp_cache():
+    """
+    
+    Disable the CDP model cache used by get_cdp, closing all the cached
+    models. Models already returned by get_cdp remain valid.
+    
+    """
+    global _CDP_MODEL_CACHE
+    if _CDP_MODEL_CACHE is not None:
+        _CDP_MODEL_CACHE.clear()
+    _CDP_MODEL_CACHE = None
+
+def get_cdp_cache():
+    """
+    
+    Return the CDP model cache used by get_cdp, or None if the cache
+    is not enabled. The cache statistics can be obtained from its
+    stats method.
+    
+    """
+    return _CDP_MODEL_CACHE
+
+def _model_arrays(datamodel):
+    # Generate all the arrays contained in a data model.
+    for (key, value) in datamodel.items():
+        if isinstance(value, np.ndarray):
+            yield value
+
+def _listing_fingerprint(names):
+    # Return a fingerprint of a folder listing: the number of names
+    # and a hash of the sorted names.
+    digest = hashlib.sha1()
+    for name in sorted(names):
+        digest.update(name.encode('utf-8', 'surrogateescape'))
+        digest.update(b'\0')
+    return "%d:%s" % (len(names), digest.hexdigest())
+
 #
 # (2) Classes
 #
@@ -554,6 +809,146 @@ class Singleton(type):
                 super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
 
+class MiriCDPCatalogue(object):
+    """
+    
+    A class which holds a catalogue of the CDP files available in a
+    folder, with each file name parsed into the fields of the CDP naming
+    convention (see parse_cdp_filename).
+    
+    Searches are answered from indexes, built when each field or
+    substring is first searched for, which record the files having each
+    value of a field or containing a substring. The CDP searches compare
+    the model, detector, readout pattern, filter, subarray and CDP type
+    fields, and the channel, band and integration substrings, so after
+    the first few searches a file name search is a set intersection
+    rather than a scan of the whole folder.
+    
+    :Parameters:
+    
+    filenames: list of str
+        The names of the CDP files.
+    records: list of dict (optional)
+        The parsed fields of each file, if already known, in the same
+        order as the file names.
+    
+    """
+    def __init__(self, filenames, records=None):
+        """
+        
+        Initialises the MiriCDPCatalogue class.
+        
+        Parameters: See class doc string.
+        
+        """
+        self.filenames = list(filenames)
+        if records is None or len(records) != len(self.filenames):
+            records = [parse_cdp_filename(filename) \
+                       for filename in self.filenames]
+        self.records = records
+        self._upper_names = [(filename.upper(), filename) \
+                             for filename in self.filenames]
+        self._all_files = frozenset(self.filenames)
+        self._substring_index = {}
+        self._field_index = {}
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def files_containing(self, substring):
+        """
+        
+        Return the set of file names containing the given substring,
+        ignoring case.
+        
+        """
+        key = substring.upper()
+        if key not in self._substring_index:
+            self._substring_index[key] = frozenset( [filename for \
+                (upper_name, filename) in self._upper_names \
+                if key in upper_name] )
+        return self._substring_index[key]
+
+    def match_substrings(self, mustcontain=[], mustnotcontain=[],
+                         candidates=None):
+        """
+        
+        Return a sorted list of the file names which contain all the
+        compulsory substrings and none of the forbidden substrings,
+        ignoring case. If a list of candidate file names is given (for
+        example, the result of a query), only those files are matched.
+        
+        """
+        if candidates is None:
+            matched = self._all_files
+        else:
+            matched = self._all_files & frozenset(candidates)
+        for match_string in mustcontain:
+            matched = matched & self.files_containing(match_string)
+            if not matched:
+                return []
+        for match_string in mustnotcontain:
+            matched = matched - self.files_containing(match_string)
+            if not matched:
+                return []
+        return sorted(matched)
+
+    def _get_field_index(self, field):
+        # Return the index of the given field, which maps each value of
+        # the field to the set of files having that value.
+        if field not in self._field_index:
+            if field not in _CDP_NAME_FIELDS:
+                strg = "\'%s\' is not a CDP file name field." % field
+                raise KeyError(strg)
+            index = {}
+            for (filename, record) in zip(self.filenames, self.records):
+                index.setdefault(record.get(field, ''), set()).add(filename)
+            self._field_index[field] = index
+        return self._field_index[field]
+
+    def field_values(self, field):
+        """
+        
+        Return a sorted list of the values of the given parsed field
+        found in the catalogue. A file which does not contain the field
+        has the value ''.
+        
+        :Raises:
+        
+        KeyError
+            Raised if the field is not one of the parsed fields.
+        
+        """
+        return sorted(self._get_field_index(field).keys())
+
+    def query(self, **criteria):
+        """
+        
+        Return a sorted list of the file names whose parsed fields
+        match all the given criteria. For example,
+        query(detector='MIRIMAGE', reftype='MASK', release='07').
+        A criterion of '' matches files which do not contain that field.
+        A criterion may also be a list of values, any of which is matched.
+        For example, query(readpatt=['FAST', 'FASTGRPAVG']).
+        
+        :Raises:
+        
+        KeyError
+            Raised if a criterion is not one of the parsed fields.
+        
+        """
+        matched = self._all_files
+        for (field, value) in criteria.items():
+            index = self._get_field_index(field)
+            if isinstance(value, (list,tuple,set,frozenset)):
+                files = set()
+                for item in value:
+                    files.update(index.get(str(item), set()))
+            else:
+                files = index.get(str(value), set())
+            matched = matched & files
+        return sorted(matched)
+
 class MiriCDPFolder(object):
     """
     
@@ -576,10 +971,12 @@ class MiriCDPFolder(object):
         Only used if an STFP connection is open.
     cdp_dir: str
         A path to the local CDP folder.
+    ftp_host: str (optional)
+        The name of the SFTP host, used to identify the folder index.
                 
     """
                                              
-    def __init__(self, sftp, ftp_path, cdp_dir, logger=LOGGER):
+    def __init__(self, sftp, ftp_path, cdp_dir, logger=LOGGER, ftp_host=''):
         """
         
         Initialises the MiriCDPFolder class.
@@ -596,12 +993,97 @@ class MiriCDPFolder(object):
         self.sftp = sftp
         self.ftp_path = str(ftp_path)
         self.cdp_dir = str(cdp_dir)
+        self.ftp_host = str(ftp_host)
         
         # Initialise the list of available CDPs
         self.cdp_files_available = []
         self.cdp_docs_available = []
+        self.catalogue = MiriCDPCatalogue([])
+        self._folder_state = None
+        self._matched_cache = {}
         self.update_cdp_list()
 
+    def _index_filename(self):
+        # The name of the file in which the folder index is saved.
+        if self.sftp is not None:
+            source = "%s:%s" % (self.ftp_host, self.ftp_path)
+        else:
+            source = "LOCAL:%s" % os.path.abspath(self.cdp_dir)
+        digest = hashlib.sha1( source.encode('utf-8') ).hexdigest()[:16]
+        return (source, os.path.join(self.cdp_dir, CDP_INDEX_DIR,
+                                     "cdp_index_%s.json" % digest))
+
+    def _load_index(self, mtime=None, fingerprint=None):
+        # Read the folder index. Returns the list of CDP files, the list
+        # of documents, the parsed records and the listing fingerprint,
+        # or None if there is no index or it does not match the given
+        # folder modification time or listing fingerprint.
+        (source, filename) = self._index_filename()
+        if not os.path.isfile(filename):
+            return None
+        try:
+            with open(filename, 'r') as fp:
+                index = json.load(fp)
+        except (IOError, OSError, ValueError) as e:
+            self.logger.debug("Could not read CDP index '%s': %s" % \
+                              (filename, str(e)))
+            return None
+        if index.get('format') != _CDP_INDEX_FORMAT or \
+           index.get('source') != source or \
+           (mtime is not None and index.get('mtime') != mtime) or \
+           (fingerprint is not None and \
+            index.get('fingerprint') != fingerprint) or \
+           tuple(index.get('fields', ())) != _CDP_NAME_FIELDS:
+            return None
+        # The records are saved as rows of field values.
+        records = [dict(zip(_CDP_NAME_FIELDS, row)) for row in index['rows']]
+        return (index['files'], index['docs'], records, index['fingerprint'])
+
+    def _use_index(self, mtime, index):
+        # Make the given folder index the current list of CDPs.
+        (self.cdp_files_available, self.cdp_docs_available, records,
+         fingerprint) = index
+        self.catalogue = MiriCDPCatalogue(self.cdp_files_available,
+                                          records=records)
+        self._folder_state = (mtime, fingerprint)
+        self._matched_cache = {}
+        if not self.cdp_files_available:
+            self.logger.warning("No CDP files available!")
+
+    def _folder_unchanged(self, mtime):
+        # Returns True if the folder modification time matches the
+        # current list of CDPs or the folder index (which is then used),
+        # so the folder does not need to be listed.
+        if self._folder_state is not None and self._folder_state[0] == mtime:
+            return True
+        index = self._load_index(mtime=mtime)
+        if index is None:
+            return False
+        self._use_index(mtime, index)
+        return True
+
+    def _save_index(self, mtime, fingerprint):
+        # Save the folder index, writing to a temporary file which is
+        # then renamed so other processes never see a partial index.
+        (source, filename) = self._index_filename()
+        index = {'format': _CDP_INDEX_FORMAT, 'source': source,
+                 'mtime': mtime, 'fingerprint': fingerprint,
+                 'files': self.cdp_files_available,
+                 'docs': self.cdp_docs_available,
+                 'fields': _CDP_NAME_FIELDS,
+                 'rows': [[record[field] for field in _CDP_NAME_FIELDS] \
+                          for record in self.catalogue.records]}
+        tmpname = filename + '.tmp%d' % os.getpid()
+        try:
+            with open(tmpname, 'w') as fp:
+                json.dump(index, fp)
+            os.replace(tmpname, filename)
+        except (IOError, OSError) as e:
+            self.logger.debug("Could not write CDP index '%s': %s" % \
+                              (filename, str(e)))
+            if os.path.isfile(tmpname):
+                os.remove(tmpname)
+
     def update_cdp_list(self):
         """
         
@@ -617,6 +1099,18 @@ class MiriCDPFolder(object):
         If there are frequent SFTP problems, manually copy all
         the available CDPs to the local cache before using this
         utility.
+        
+        The list is saved, together with the folder modification time
+        and a fingerprint of the folder listing, in an index file in the
+        CDP_INDEX_DIR subdirectory of the local cache. The folder
+        modification time is checked first, and the folder is only listed
+        again when it has changed; otherwise the current list or the index
+        is used. When the folder is listed, the CDP file names are only
+        parsed again when the fingerprint (the number of names and a hash
+        of the names) differs from the one in the index.
+        NOTE: The modification time of a folder on an SFTP server has a
+        resolution of 1 second, so a change made within the same second
+        as the last listing is not seen until the folder changes again.
 
         :Parameters:
     
@@ -625,12 +1119,16 @@ class MiriCDPFolder(object):
             By default, the connection timeout is not changed.
         
         """
-        if self.cdp_files_available:
-            del self.cdp_files_available
-        if self.cdp_docs_available:
-            del self.cdp_docs_available
-        ftp_list = []
-        msg = ''
+        # The index directory is created before the folder modification
+        # time is obtained, since creating it changes the modification
+        # time of the local cache.
+        index_dir = os.path.join(self.cdp_dir, CDP_INDEX_DIR)
+        if os.path.isdir(self.cdp_dir) and not os.path.isdir(index_dir):
+            try:
+                os.makedirs(index_dir, exist_ok=True)
+            except (IOError, OSError) as e:
+                self.logger.debug("Could not create CDP index directory: %s" % \
+                                  str(e))
         
         if self.sftp is not None:
             try:
@@ -643,9 +1141,13 @@ class MiriCDPFolder(object):
                 strg = "%s: Fatal error while changing directory to FTP folder \'%s\'\n" % (e.__class__.__name__, self.ftp_path)
                 strg += "  %s" % str(e)
                 raise IOError(strg)
-            ftp_list = self.sftp.listdir()
-            self.sftp.chdir('/')
-            self.logger.debug("CDP list updated for ftp_path=\'%s\'." % self.ftp_path)
+            try:
+                mtime = self.sftp.stat('.').st_mtime
+                if self._folder_unchanged(mtime):
+                    return
+                ftp_list = self.sftp.listdir()
+            finally:
+                self.sftp.chdir('/')
         else:
             strg = "No ftp host specified. Using local cache.\n  "
             self.logger.warning(strg)
@@ -653,7 +1155,11 @@ class MiriCDPFolder(object):
             # Make sure the local cache exists.
             abspath = os.path.abspath(self.cdp_dir)
             if os.path.isdir(abspath):
+                mtime = os.stat(abspath).st_mtime_ns
+                if self._folder_unchanged(mtime):
+                    return
                 # Walk through the local cache and find file names.
+                ftp_list = []
                 for (dirpath, dirnames, filenames) in os.walk(abspath):
                     for filename in filenames:
                         ftp_list.append(filename)
@@ -665,6 +1171,16 @@ class MiriCDPFolder(object):
                 strg += "cache directory and copy CDP files manually."
                 raise IOError(strg)
 
+        # The folder has changed. The parsed names are read from the
+        # index if the listing itself has not changed.
+        fingerprint = _listing_fingerprint(ftp_list)
+        index = self._load_index(fingerprint=fingerprint)
+        if index is not None:
+            self._use_index(mtime, index)
+            self._save_index(mtime, fingerprint)
+            return
+        self.logger.debug("CDP list updated for ftp_path=\'%s\'." % self.ftp_path)
+
         # Only add names matching MIRI CDPs (which start 'MIRI_') to the list.
         # Restrict the list to files containing '.fits' to exclude the PDF
         # and text documentation.
@@ -688,6 +1204,12 @@ class MiriCDPFolder(object):
                 if re.match("^MIRI", ftp_file) is not None and \
                    doc_type in ftp_file:
                     self.cdp_docs_available.append(ftp_file)
+
+        # Catalogue the files and save the folder index.
+        self.catalogue = MiriCDPCatalogue(self.cdp_files_available)
+        self._folder_state = (mtime, fingerprint)
+        self._matched_cache = {}
+        self._save_index(mtime, fingerprint)
                         
     def _filter_regexp(self, input_list, match_string, flags=0):
         """
@@ -775,25 +1297,16 @@ class MiriCDPFolder(object):
         """
         self.logger.debug("Must contain: " + str(mustcontain))
         self.logger.debug("Must not contain: " + str(mustnotcontain))
-        matched_files = []
-        for cdp_file in self.cdp_files_available:
-            cdp_file_u = cdp_file.upper()
-            strings_matched = True
-            for match_string in mustcontain:
-                if match_string.upper() not in cdp_file_u:
-                    strings_matched = False
-                    break
-            strings_avoided = True
-            for match_string in mustnotcontain:
-                if match_string.upper() in cdp_file_u:
-                    strings_avoided = False
-                    break
-            if strings_matched and strings_avoided:
-                matched_files.append(cdp_file)
-                
-        # Return a sorted list
-        matched_files.sort()
-        return matched_files
+        # The catalogue returns a sorted list.
+        return self.catalogue.match_substrings(mustcontain=mustcontain,
+                                               mustnotcontain=mustnotcontain)
+
+    def _field_values_containing(self, field, value):
+        # Return the values of a parsed file name field, found in the
+        # catalogue, which contain the given value (ignoring case).
+        value = str(value).upper()
+        return [item for item in self.catalogue.field_values(field) \
+                if item and value in item.upper()]
 
     def _encode_version(self, code):
         """
@@ -908,36 +1421,73 @@ class MiriCDPFolder(object):
         if self.sftp is None:
             self.logger.warning("Matching against local CDP cache only.")
         
-        # Build a list of substrings that must be contained and must be avoided.
+        # The results of previous searches are remembered until the
+        # folder changes.
+        criteria = (cdptype, model, detector, readpatt, channel, band,
+                    mirifilter, subarray, integration, cdprelease, cdpversion,
+                    cdpsubversion)
+        try:
+            if criteria in self._matched_cache:
+                return list(self._matched_cache[criteria])
+        except TypeError:
+            # Unhashable criteria are not remembered.
+            criteria = None
+        matched_files = self._match_cdp_filename(cdptype, model=model,
+                    detector=detector, readpatt=readpatt, channel=channel,
+                    band=band, mirifilter=mirifilter, subarray=subarray,
+                    integration=integration, cdprelease=cdprelease,
+                    cdpversion=cdpversion, cdpsubversion=cdpsubversion)
+        if criteria is not None:
+            self._matched_cache[criteria] = list(matched_files)
+        return matched_files
+
+    def _match_cdp_filename(self, cdptype, model='FM', detector=None,
+                            readpatt=None, channel=None, band=None,
+                            mirifilter=None, subarray='FULL', integration=None,
+                            cdprelease=None, cdpversion=None,
+                            cdpsubversion=None):
+        # Helper function which implements match_cdp_filename.
+        
+        # The model, detector, readout pattern, filter, subarray and CDP
+        # type are compared with the fields parsed from each file name,
+        # using the folder catalogue's field index. The channel, band and
+        # integration number are matched as substrings within the files
+        # selected by the fields.
+        criteria = {}
         match_strings = []
         avoid_strings = []
         
         # The filename always contains a model name.
         if model is not None and model in MIRI_MODELS:
             # Match the exact MIRI model
-            match_strings.append(model)
+            criteria['model'] = model
 
         # The model name is always followed by a detector name, unless
         # the model name is 'JPL'
         if model != 'JPL':
             if detector is not None and detector in MIRI_DETECTORS:
                 # Match the exact detector
-                match_strings.append(detector)
+                criteria['detector'] = detector
         
         # The readout pattern is optional, and a CDP valid for any
-        # pattern is specified by missing it out completely.
+        # pattern is specified by missing it out completely. A pattern
+        # matches the patterns whose names contain it (so 'FAST' also
+        # matches 'FASTGRPAVG').
         if (readpatt is not None) and (readpatt != 'ANY') and (readpatt != 'N/A'):
-            match_strings.append(readpatt)
+            criteria['readpatt'] = self._field_values_containing('readpatt',
+                                                                 readpatt)
                
         # The filter name is optional, and a CDP valid for any
         # filter is specified by missing it out completely.
         # Specifying 'GENERIC' will avoid CDPs designed for specific filters.
+        # A filter matches the filters whose names contain it (so 'F2550W'
+        # also matches 'F2550WR').
         if (mirifilter is not None) and (mirifilter != 'ANY') and \
            (mirifilter != 'GENERIC') and (mirifilter != 'N/A'):
-            match_strings.append(mirifilter)
+            criteria['filter'] = self._field_values_containing('filter',
+                                                               mirifilter)
         elif (mirifilter is not None) and (mirifilter == 'GENERIC'):
-            for filt in MIRI_FILTERS:
-                avoid_strings.append(filt)
+            criteria['filter'] = ''
             
         # If an imager CDP is needed without specifying a filter,
         # explicitly exclude the LRS CDPs, for which either the
@@ -946,7 +1496,9 @@ class MiriCDPFolder(object):
         if (detector == 'MIRIMAGE') and \
            (mirifilter == 'ANY' or mirifilter == 'N/A') and \
            (not subarray == 'SLITLESSPRISM'):
-            avoid_strings.append('P750L')
+            criteria['filter'] = [filt for filt in \
+                                  self.catalogue.field_values('filter') \
+                                  if filt != 'P750L']
 
         # The channel and band names are optional, and a CDP valid for any
         # channel or band is specified by missing either out completely.
@@ -969,27 +1521,22 @@ class MiriCDPFolder(object):
         # option will match any subarray.
         if (subarray is not None) and (subarray != 'FULL') and \
            (subarray != 'ANY') and (subarray != 'N/A') and (subarray != 'GENERIC'):
-            match_strings.append(subarray)
+            criteria['subarray'] = subarray
         if (subarray == None) or (subarray == 'FULL') or \
            (subarray == 'GENERIC') or (subarray == 'N/A'):
             # If full frame data is needed, CDPs designed for a specific
             # subarray will be avoided.
-            for sarray in MIRI_SUBARRAYS:
-                avoid_strings.append(sarray)
+            criteria['subarray'] = ''
             
-        # The file name always contains the CDP type. A "_" is appended
-        # to the match string to prevent cdptype "MASK" from matching the
-        # coronographic MASK filters.
+        # The file name always contains the CDP type.
         if (cdptype is not None) and (cdptype != 'ANY'):
             if cdptype == 'PIXELFLAT' or cdptype == 'FLAT':
                 # Special case. If the cdptype is 'PIXELFLAT' or 'FLAT' then
-                # the match 'FLAT_' but not 'SKYFLAT_' or 'FRINGE_'
-                match_strings.append("FLAT_")
-                avoid_strings.append("SKYFLAT")
-                avoid_strings.append("FRINGE")
+                # the match 'FLAT' or 'PIXELFLAT' but not 'SKYFLAT' or 'FRINGE'
+                criteria['reftype'] = ['FLAT', 'PIXELFLAT']
             else:
                 # Match any other CDP
-                match_strings.append(cdptype + "_")
+                criteria['reftype'] = cdptype
                      
         # An integration number is optional, but is always explicitly
         # included.  
@@ -997,9 +1544,16 @@ class MiriCDPFolder(object):
             match_strings.append(str(integration))
             
         # Find a list of files matching the given criteria except
-        # the version number. match_cdp_substrings returns s sorted list.
-        matched_files = self.match_cdp_substrings(mustcontain=match_strings,
-                                                  mustnotcontain=avoid_strings)
+        # the version number. The catalogue returns a sorted list.
+        self.logger.debug("Matching fields: " + str(criteria))
+        self.logger.debug("Must contain: " + str(match_strings))
+        self.logger.debug("Must not contain: " + str(avoid_strings))
+        matched_files = self.catalogue.query(**criteria)
+        if match_strings or avoid_strings:
+            matched_files = self.catalogue.match_substrings(
+                                            mustcontain=match_strings,
+                                            mustnotcontain=avoid_strings,
+                                            candidates=matched_files)
         self.logger.debug("Matched files: " + str(matched_files))
 
         # If more than one file has been matched, a band has been specified
@@ -1371,7 +1925,8 @@ class MiriCDPInterface(object, metaclass=Singleton):
         if self.ftp_host != 'LOCAL' and self.ftp_ok:
             for ftpp in self.ftp_path.split(MiriCDPInterface.FTP_PATH_SEARCH):
                 try:
-                    cdp_folder = MiriCDPFolder( self.sftp, ftpp, self.cdp_dir )
+                    cdp_folder = MiriCDPFolder( self.sftp, ftpp, self.cdp_dir,
+                                                ftp_host=self.ftp_host )
                     cdp_folder.update_cdp_list()
                 except (OSError, IOError, FileNotFoundError) as e:
                     failed_folder = True
@@ -1466,7 +2021,8 @@ class MiriCDPInterface(object, metaclass=Singleton):
             if self.ftp_host != 'LOCAL' and self.ftp_ok:
                 for ftpp in self.ftp_path.split(MiriCDPInterface.FTP_PATH_SEARCH):
                     try:
-                        cdp_folder = MiriCDPFolder( self.sftp, ftpp, self.cdp_dir )
+                        cdp_folder = MiriCDPFolder( self.sftp, ftpp, self.cdp_dir,
+                                                    ftp_host=self.ftp_host )
                         cdp_folder.update_cdp_list()
                     except (OSError, IOError, FileNotFoundError) as e:
                         failed_folder = True
@@ -2274,6 +2830,189 @@ class MiriCDPInterface(object, metaclass=Singleton):
         return strg
 
 
+
+class CDPModelCache(object):
+    """
+    
+    Class CDPModelCache - A least-recently-used cache of data models
+    read from CDP files.
+    
+    Models are keyed by the real path and modification time of the
+    CDP file and by the data model class used to read it, so a file
+    which is updated is read again. The arrays of a cached model are
+    made read-only, and each caller receives its own copy of the model
+    which shares those arrays but has its own metadata. Changing the
+    metadata of a copy, or assigning a new array to it, does not affect
+    the cached model, and closing a copy does not close the cached file.
+    
+    :Parameters:
+    
+    max_bytes: int (optional)
+        The maximum number of bytes of array data held in the cache.
+        Defaults to DEFAULT_CDP_CACHE_BYTES.
+    logger: Logger object (optional)
+        A Python logger to handle the I/O.
+    
+    """
+    def __init__(self, max_bytes=DEFAULT_CDP_CACHE_BYTES, logger=LOGGER):
+        """
+        
+        Initialises the CDPModelCache class.
+        
+        Parameters: See class doc string.
+        
+        """
+        self.logger = logger.getChild("CDPModelCache")
+        self.max_bytes = int(max_bytes)
+        # Each entry is a (datamodel, nbytes) tuple.
+        self._entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, filename, data_class):
+        filename = os.path.realpath(filename)
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            mtime = None
+        return (filename, mtime, data_class)
+
+    def _make_copy(self, datamodel):
+        # Make a copy of a cached data model with the public copy
+        # method, sharing its arrays. The arrays are entered in the
+        # memo of the deep copy, so they are not copied. The copy
+        # does not own the cached file, so closing it is harmless.
+        memo = dict( [(id(array), array) for array in \
+                      _model_arrays(datamodel)] )
+        return datamodel.copy(memo=memo)
+
+    def _evict(self):
+        # Discard least recently used models until the cache is within
+        # its memory budget.
+        while self._entries and self.nbytes > self.max_bytes:
+            (key, (datamodel, nbytes)) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+            self.logger.debug("Evicting \'%s\' from the cache." % key[0])
+            datamodel.close()
+
+    def get(self, filename, data_class):
+        """
+        
+        Return a copy of a cached data model.
+        
+        :Parameters:
+        
+        filename: str
+            The name of the CDP file.
+        data_class: class
+            The data model class with which the file was read.
+            
+        :Returns:
+        
+        datamodel: data model
+            A copy of the cached data model, with read-only arrays,
+            or None if the model is not in the cache.
+        
+        """
+        key = self._key(filename, data_class)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            (datamodel, nbytes) = self._entries[key]
+            return self._make_copy(datamodel)
+        self.misses += 1
+        return None
+
+    def put(self, filename, data_class, datamodel):
+        """
+        
+        Add a data model to the cache, discarding the least recently
+        used models if the memory budget is exceeded.
+        
+        :Parameters:
+        
+        filename: str
+            The name of the CDP file.
+        data_class: class
+            The data model class with which the file was read.
+        datamodel: data model
+            The data model read from the file. The cache takes
+            ownership of this model and closes it when it is
+            discarded.
+            
+        :Returns:
+        
+        datamodel: data model
+            A copy of the cached data model, with read-only arrays,
+            which should be used in place of the original. If the model
+            is too large to be cached the original model is returned
+            unchanged.
+        
+        """
+        arrays = list(_model_arrays(datamodel))
+        nbytes = sum([array.nbytes for array in arrays])
+        if nbytes > self.max_bytes:
+            strg = "\'%s\' (%d bytes) is too large to be cached." % \
+                (filename, nbytes)
+            self.logger.debug(strg)
+            return datamodel
+        for array in arrays:
+            array.flags.writeable = False
+        key = self._key(filename, data_class)
+        if key in self._entries:
+            (oldmodel, oldbytes) = self._entries.pop(key)
+            self.nbytes -= oldbytes
+        self._entries[key] = (datamodel, nbytes)
+        self.nbytes += nbytes
+        self._evict()
+        return self._make_copy(datamodel)
+
+    def resize(self, max_bytes):
+        """
+        
+        Change the memory budget of the cache, discarding models if
+        necessary.
+        
+        """
+        self.max_bytes = int(max_bytes)
+        self._evict()
+
+    def clear(self):
+        """
+        
+        Discard all the cached models. The statistics are not reset.
+        
+        """
+        for (datamodel, nbytes) in self._entries.values():
+            datamodel.close()
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """
+        
+        Return the cache statistics as a dictionary containing the
+        number of hits, misses and evictions, the number of models
+        cached and the number of bytes used and available.
+        
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries),
+                'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def __str__(self):
+        strg = "CDP model cache: %d models using %d of %d bytes. " % \
+            (len(self._entries), self.nbytes, self.max_bytes)
+        strg += "%d hits, %d misses, %d evictions." % \
+            (self.hits, self.misses, self.evictions)
+        return strg
+
 #
 # A minimal test and some examples of how to use the above utilities
 # are run when this file is executed as a main program.
@@ -39,6 +39,10 @@ the DQ data array. The module contains three different kinds of object:
     * combine_quality: A function a pipeline process can use to combine
       two data quality array and make a third.
       
+    * convert_dq: A function which converts a data quality array encoded
+      with one flags table into an array encoded with another. The
+      DQConverter class does the same for many arrays at once.
+      
 3) The FlagsTable class
 
    A class which defines an object capable of storing and using the
@@ -106,6 +110,10 @@ https://jwst-pipeline.readthedocs.io/en/stable/jwst/references_general/reference
 14 May 2019: Added Christophe's masking functions.
 20 Jun 2019: Allow a FlagsTable to be created from a FITS_rec object.
 04 Oct 2019: Added convert_to_recarray. Added reference to STScI flag names.
+18 Oct 2026: Added the DQConverter class, which converts data quality
+             arrays with lookup tables made once from the flag tables.
+             convert_dq now uses it. FlagsTable remembers the bitmasks
+             made from flag names.
 
 @author: Ruyman Azzollini (DIAS), Steven Beard (UKATC), Christophe Cossou (CEA)
 
@@ -326,6 +334,9 @@ def convert_dq( dq, old_table, new_table, conversion_map=flag_conversion_table):
     defined in the new table, the data quality information contained
     in that old flag is lost.
     
+    NOTE: When many arrays are converted with the same tables it is
+    quicker to create one DQConverter object and use that.
+    
     :Parameters:
     
     dq: numpy array
@@ -347,38 +358,140 @@ def convert_dq( dq, old_table, new_table, conversion_map=flag_conversion_table):
         The new data quality array.
     
     """
-    assert isinstance( old_table, FlagsTable)
-    assert isinstance( new_table, FlagsTable)
-    # Begin with a new data quality array full of zeros.
-    new_dq = np.zeros_like( dq )
-    
+    converter = DQConverter( old_table, new_table,
+                             conversion_map=conversion_map )
     print("Old data quality ranges from %d to %d" % (dq.min(), dq.max()))
-    # For each flag in the old table, find where that flag is set in the
-    # old DQ array, map it to a flag in the new table and set the new
-    # flag in the new DQ array.
-    for old_flag in old_table.flagvalues:
-        old_flag = old_flag.strip() # Strip off padding at beginning and end
-#         print("Checking old flag: %s" % old_flag)
-        # Make sure there is a valid conversion
-        if old_flag in conversion_map:
-            new_flag = conversion_map[old_flag]
-            new_flag = new_flag.strip() # Strip off padding at beginning and end
-#             print("Translates to new flag: %s" % str(new_flag))
-            if new_flag and new_flag in new_table.flagvalues:
-                bitmask = bit_to_value[old_table[old_flag]]
-                testmask = dq & bitmask
-                where = np.where(testmask != 0)
-                
-                newbitmask = bit_to_value[new_table[new_flag]]
-                new_dq[where] = new_dq[where] | newbitmask
-#             else:
-#                 print("New flag %s not found in new table." % str(new_flag))
-#         else:
-#             print("Old flag %s not found in conversion map" % old_flag)
-        
+    new_dq = converter.convert( dq )
     print("New data quality ranges from %d to %d" % (new_dq.min(), new_dq.max()))
     return new_dq
+
+class DQConverter(object):
+    """
+    
+    Class DQConverter - Converts data quality arrays encoded according
+    to an old flags table into arrays encoded according to a new table,
+    given a conversion map between old and new flag names.
+    
+    The mapping between old and new flags is worked out once, when the
+    object is created, and stored as a lookup table for each 16-bit
+    half of the old data quality values which contains a converted
+    flag. Each array is then converted with at most two table lookups,
+    instead of searching the array for each flag in turn.
+    
+    NOTE: If a flag contained in the old table is not found in the
+    conversion map, or a flag defined in the conversion map is not
+    defined in the new table, the data quality information contained
+    in that old flag is lost.
+    
+    :Parameters:
+    
+    old_table: FlagsTable object
+        The flags table from which the old DQ arrays have been encoded.
+    new_table: FlagsTable object
+        The flags table which will be used to encode the new arrays.
+    conversion_map: dictionary (optional)
+        A dictionary giving the mapping between flag names in the old
+        table to flag names in the new table.
+        Defaults to the default flag conversion table for the CDP-3
+        release.
+    
+    """
+    # The number of bits looked up at a time. A table of 2**16 entries
+    # is small enough to stay in the processor cache.
+    lookup_bits = 16
+    # The number of elements converted at a time. This limits the size
+    # of the scratch arrays.
+    chunk_size = 1048576
+    
+    def __init__(self, old_table, new_table,
+                 conversion_map=flag_conversion_table):
+        assert isinstance( old_table, FlagsTable)
+        assert isinstance( new_table, FlagsTable)
+        # For each flag in the old table, find the corresponding flag
+        # in the new table and record which new bits are raised by
+        # each old bit.
+        self.bitmap = {}
+        for old_flag in old_table.flagvalues:
+            old_bit = old_table.flagvalues[old_flag]
+            old_flag = old_flag.strip() # Strip off padding at beginning and end
+            # Make sure there is a valid conversion
+            if old_flag in conversion_map:
+                new_flag = conversion_map[old_flag]
+                new_flag = new_flag.strip() # Strip off padding at beginning and end
+                if new_flag and new_flag in new_table.flagvalues:
+                    newbitmask = bit_to_value[new_table[new_flag]]
+                    self.bitmap[old_bit] = self.bitmap.get(old_bit, 0) | \
+                        newbitmask
+        
+        # Make a lookup table for each group of lookup_bits bits of the
+        # old data quality values containing at least one converted bit.
+        # The table gives the new bits raised by each possible value of
+        # those bits.
+        self._luts = []
+        values = np.arange(2**self.lookup_bits)
+        for shift in range(0, MAXBITS, self.lookup_bits):
+            lut = np.zeros(values.size, dtype=np.uint64)
+            for bit in range(shift, min(shift+self.lookup_bits, MAXBITS)):
+                if bit in self.bitmap:
+                    raised = (values & bit_to_value[bit - shift]) != 0
+                    lut[raised] |= np.uint64(self.bitmap[bit])
+            if np.any(lut):
+                self._luts.append( (shift, lut) )
+
+    def __str__(self):
+        strg = "DQConverter mapping %d old flags" % len(self.bitmap)
+        for old_bit in sorted(self.bitmap.keys()):
+            strg += "\n  2**%2d --> %s" % (old_bit,
+                                          format_mask(self.bitmap[old_bit]))
+        return strg
+
+    def convert(self, dq):
+        """
         
+        Convert a data quality array.
+        
+        :Parameters:
+        
+        dq: numpy array
+            An integer array containing the old data quality information,
+            encoded according to the old flag table.
+            
+        :Returns:
+        
+        new_dq: numpy array
+            The new data quality array, which has the same shape and
+            data type as the old one.
+        
+        """
+        dq = np.asarray(dq)
+        new_dq = np.zeros(dq.shape, dtype=dq.dtype)
+        if not self._luts or dq.size == 0:
+            return new_dq
+        # The lookup tables are converted to the data type of the array.
+        luts = [(shift, lut.astype(dq.dtype)) for (shift, lut) in self._luts]
+        flat_dq = np.ascontiguousarray(dq).reshape(-1)
+        flat_new_dq = new_dq.reshape(-1)
+        # The array is converted in chunks, reusing the same index and
+        # lookup arrays for each chunk.
+        nchunk = min(self.chunk_size, flat_dq.size)
+        valuemask = 2**self.lookup_bits - 1
+        index = np.empty(nchunk, dtype=np.intp)
+        looked_up = np.empty(nchunk, dtype=dq.dtype)
+        for start in range(0, flat_dq.size, nchunk):
+            old_chunk = flat_dq[start:start+nchunk]
+            new_chunk = flat_new_dq[start:start+nchunk]
+            nelements = old_chunk.size
+            for (shift, lut) in luts:
+                # Extract the bits starting at the given bit and look
+                # up the new flags they raise.
+                np.right_shift(old_chunk, shift, out=index[:nelements],
+                               casting='unsafe')
+                np.bitwise_and(index[:nelements], valuemask,
+                               out=index[:nelements])
+                np.take(lut, index[:nelements], out=looked_up[:nelements])
+                np.bitwise_or(new_chunk, looked_up[:nelements], out=new_chunk)
+        return new_dq
+
 def flags_table_to_metadata( flags_table, meta_dq ):
     """
     
@@ -898,6 +1011,8 @@ class FlagsTable(object):
         self.keys = []
         self.flagvalues = {}
         self.flagdescr = {}
+        # The bitmasks made from lists of flag names are remembered.
+        self._bitmask_cache = {}
         if flagtable is None or len(flagtable) < 1:
             # The flag table may be defined empty and populated later.
             return
@@ -993,6 +1108,7 @@ class FlagsTable(object):
             self.flagvalues[keyword] = value
             # Items set individually like this have an unknown description.
             self.flagdescr[keyword] = ''
+            self._bitmask_cache.clear()
         else:
             strg = "Changing an existing entry in a flags table "
             strg += "is not allowed. Only new entries may be added."
@@ -1056,6 +1172,7 @@ class FlagsTable(object):
         elif isinstance(other, FlagsTable):
             # Two flag tables are being combined together.
             newobject = copy.deepcopy(self)
+            newobject._bitmask_cache.clear()
             for key in other.keys:
                 if key not in newobject.keys:
                     self._check_value_range( other.flagvalues[key] )
@@ -1111,6 +1228,7 @@ class FlagsTable(object):
         if not isinstance(newtable, (tuple,list,np.array,np.recarray,FITS_rec)):
             strg = "New table must be a tuple, list or numpy array"
             raise TypeError(strg)
+        self._bitmask_cache.clear()
         
         if len(newtable[0]) == 3:
             # Flag table containing BIT, NAME, DESCRIPTION.
@@ -1184,6 +1302,14 @@ class FlagsTable(object):
         if not isinstance(flags, (tuple,list)):
             flags = [flags]
         
+        # The bitmask made from a list of flag names is only worked out
+        # once. Flag values are combined every time, since the result
+        # keeps their data type.
+        key = tuple(flags)
+        named = all([isinstance(flag, str) for flag in flags])
+        if named and key in self._bitmask_cache:
+            return self._bitmask_cache[key]
+        
         bitmask = 0
         for flag in flags:
             # If the flag is a string, look up its value
@@ -1193,6 +1319,8 @@ class FlagsTable(object):
             else:
                 # Otherwise assume the flag already contains a value.
                 bitmask |= flag
+        if named:
+            self._bitmask_cache[key] = bitmask
         return bitmask
     
     def raiseflags(self, dqarr, flags):
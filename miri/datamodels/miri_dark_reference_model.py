@@ -65,6 +65,9 @@ https://jwst-pipeline.readthedocs.io/en/latest/jwst/datamodels/index.html
 07 Oct 2019: Removed '.yaml' suffix from schema references.
 26 Mar 2020: Ensure the model_type remains as originally defined when saving
              to a file.
+18 Oct 2026: slope_data now fits all the ramps at once with the
+             miri.tools.ramp_fitting module. Corrected the 3-D case, which
+             used an undefined integration index.
              
 @author: Steven Beard (UKATC), Vincent Geers (UKATC)
 
@@ -78,6 +81,7 @@ import numpy as np
 from miri.datamodels.ancestry import get_my_model_type
 from miri.datamodels.dqflags import insert_value_column
 from miri.datamodels.miri_measured_model import MiriMeasuredModel
+from miri.tools.ramp_fitting import ramp_slopes
 
 # List all classes and global functions here.
 __all__ = ['dark_reference_flags', 'MiriDarkReferenceModel']
@@ -90,23 +94,6 @@ dark_reference_setup = \
              (1, 'UNRELIABLE_DARK',  'Dark variance large')]
 dark_reference_flags = insert_value_column(dark_reference_setup)
 
-#
-# Global helper function
-#
-def linear_regression(x, y):
-    """
-    
-    Linear regression function. Fit an intercept and a slope
-    to a set of x,y coordinates
-    
-    """
-    #print("Fitting", y, "\nagainst", x)
-    matrix = np.vstack( [x, np.ones_like(x)] ).T
-    slope, intercept = np.linalg.lstsq(matrix,y)[0]
-    #print("gives slope=", slope, "intercept=", intercept)
-    return (slope, intercept)
-
-
 class MiriDarkReferenceModel(MiriMeasuredModel):
     """
     
@@ -254,17 +241,15 @@ class MiriDarkReferenceModel(MiriMeasuredModel):
         Return a new data model in which the group planes have
         been fitted with a straight line to make slope data.
         The units of the output data change from 'DN' to 'DN/s'
-
-        NOTE: This function is very inefficient!
         
         :Parameters:
         
         startgroup: int, optional
-            The first group to be averaged. Defaults to the first group
+            The first group to be fitted. Defaults to the first group
             in the data model.
         endgroup: int, optional
-            The last group to be averaged. Defaults to the last group in
-            the data model.
+            One more than the last group to be fitted. Defaults to the
+            number of groups in the data model.
             
         :Returned:
         
@@ -291,39 +276,12 @@ class MiriDarkReferenceModel(MiriMeasuredModel):
                 self.meta.exposure.group_time = grptime
         
         if self.data.ndim == 4:
-            nints = self.data.shape[0]
             ngroups = self.data.shape[1]
-            nrows = self.data.shape[2]
-            ncolumns = self.data.shape[3]
-
-            # Initialise the output.
-            output = np.zeros([nints, nrows, ncolumns], dtype=self.data.dtype)
 
-            # Full straight line fit
-            if startgroup is None and endgroup is None:
-                timearray = grptime * np.array( list(range(0, ngroups)) )
-                for intg in range(0, nints):
-                    for row in range(0, nrows):
-                        for column in range(0, ncolumns):
-                            # Ouch! Slope calculated one (row,column) at a time.
-                            # Can the efficiency be improved?
-                            (slope, ic) = linear_regression( timearray,
-                                                self.data[intg,:,row,column] )
-                            output[intg,row,column] = slope
-            else:
-                if startgroup is None:
-                    startgroup = 0
-                if endgroup is None:
-                    endgroup = self.data.shape[1]
-                timearray = grptime * np.array( list(range(startgroup, endgroup)) )
-                for intg in range(0, nints):
-                    for row in range(0, nrows):
-                        for column in range(0, ncolumns):
-                            # Ouch! Slope calculated one (row,column) at a time.
-                            # Can the efficiency be improved?
-                            (slope, ic) = linear_regression( timearray,
-                                                self.data[intg,startgroup:endgroup,row,column] )
-                            output[intg,row,column] = slope
+            # Full straight line fit, made for all ramps at once.
+            slope = ramp_slopes( self.data, grptime=grptime,
+                                 startgroup=startgroup, endgroup=endgroup )
+            output = slope.astype(self.data.dtype)
             output_dq = np.squeeze(self.dq)
         
             # Create a new 3-D dark data model from this slope data.
@@ -344,35 +302,11 @@ class MiriDarkReferenceModel(MiriMeasuredModel):
         
         elif self.data.ndim == 3:
             ngroups = self.data.shape[0]
-            nrows = self.data.shape[1]
-            ncolumns = self.data.shape[2]
-
-            # Initialise the output.
-            output = np.zeros([nrows, ncolumns], dtype=self.data.dtype)
 
-            # Full straight line fit
-            if startgroup is None and endgroup is None:
-                timearray = grptime * np.array( list(range(0, ngroups)) )
-                for row in range(0, nrows):
-                    for column in range(0, ncolumns):
-                        # Ouch! Slope calculated one (row,column) at a time.
-                        # Can the efficiency be improved?
-                        (slope, ic) = linear_regression( timearray,
-                                            self.data[intg,:,row,column] )
-                        output[intg,row,column] = slope
-            else:
-                if startgroup is None:
-                    startgroup = 0
-                if endgroup is None:
-                    endgroup = self.data.shape[1]
-                timearray = grptime * np.array( list(range(startgroup, endgroup)) )
-                for row in range(0, nrows):
-                    for column in range(0, ncolumns):
-                        # Ouch! Slope calculated one (row,column) at a time.
-                        # Can the efficiency be improved?
-                        (slope, ic) = linear_regression( timearray,
-                                            self.data[intg,startgroup:endgroup,row,column] )
-                        output[intg,row,column] = slope
+            # Full straight line fit, made for all ramps at once.
+            slope = ramp_slopes( self.data, grptime=grptime,
+                                 startgroup=startgroup, endgroup=endgroup )
+            output = slope.astype(self.data.dtype)
             output_dq = np.squeeze(self.dq)
         
             # Create a new 3-D dark data model from this slope data.
@@ -88,6 +88,26 @@ https://jwst-docs.stsci.edu/display/JDAT/JWST+File+Names%2C+Formats%2C+and+Data+
 28 Nov 2018: Corrected a mistake in the schema for simulated data.
 09 Mar 2020: MIRI-768: Explicitly delete the ERR array before saving the
              exposure data when one is not required.
+18 Oct 2026: slope_data now fits all the ramps at once with the
+             miri.tools.ramp_fitting module, and can optionally exclude
+             groups and pixels flagged in the GROUPDQ and PIXELDQ arrays.
+             Removed the linear_regression helper function.
+             Added max_memory parameter to slope_data.
+18 Oct 2026: Added apply_reverse_grid, which applies a per-pixel or
+             per-amplifier reverse linearity table.
+18 Oct 2026: Added the streaming option, which averages groups and
+             integrations as they are added. _average_data replaced by
+             a reshape-and-mean reduction (which also corrects averaged
+             integrations being divided more than once). The averaged
+             GROUPDQ flags are saved with averaged data.
+18 Oct 2026: add_dark adds the DARK and clips the data in place, so the
+             float32 data array is not converted into float64 temporary
+             arrays and searched with np.where.
+18 Oct 2026: Added get_data_array, so readouts can be written straight
+             into the SCI data.
+18 Oct 2026: slope_data fits the ramps a block of rows at a time by
+             default and makes the quick estimate one integration at a
+             time, so no data-sized float64 arrays are created.
 
 @author: Steven Beard (UKATC)
 
@@ -106,27 +126,16 @@ import copy
 
 # Import the MIRI ramp data model utilities.
 from miri.datamodels.miri_measured_model import MiriRampModel
+from miri.datamodels.miri_linearity_model import apply_reverse_grid
 from miri.datamodels.plotting import DataModelPlotVisitor
+from miri.tools.ramp_fitting import ramp_slopes, diff_slopes
 
 # List all classes and global functions here.
 __all__ = ['MiriExposureModel']
 
-#
-# Global helper function
-#
-def linear_regression(x, y):
-    """
-    
-    Linear regression function. Fit an intercept and a slope
-    to a set of x,y coordinates
-    
-    """
-    #print("Fitting", y, "\nagainst", x)
-    matrix = np.vstack( [x, np.ones_like(x)] ).T
-    slope, intercept = np.linalg.lstsq(matrix,y)[0]
-    #print("gives slope=", slope, "intercept=", intercept)
-    return (slope, intercept)
-
+# The default maximum working memory (in bytes) used by slope_data
+# when fitting the ramps.
+_SLOPE_MAX_MEMORY = 256 * 1024 * 1024
 
 class MiriExposureModel(MiriRampModel):
     """
@@ -204,6 +213,16 @@ class MiriExposureModel(MiriRampModel):
     include_groupdq: bool, optional
         Set to False to remove the groupdq data array and the groupdq_def table
         from the exposure data. The default is True.
+    streaming: bool, optional
+        Set to True to average the groups and integrations as they are
+        added, so the full-resolution exposure data are never held in
+        memory. The data and groupdq arrays then contain ngroups/grpavg
+        groups and nints/intavg integrations, get_group and
+        get_integration return the averaged data containing the given
+        group or integration, and functions which modify the data
+        in-situ apply to the averaged data. Each group must only be
+        added once. The default is False. Ignored when neither groups
+        nor integrations are averaged.
     
     \*\*kwargs:
         All other keyword arguments are passed to the DataModel initialiser.
@@ -217,7 +236,7 @@ class MiriExposureModel(MiriRampModel):
                  refcolumns, grpavg=1, intavg=1, nframes=1,
                  groupgap=0, pixeldq=None, maskwith=None, pixeldq_def=None,
                  groupdq_def=None, include_err=False, include_pixeldq=True,
-                 include_groupdq=True, **kwargs):
+                 include_groupdq=True, streaming=False, **kwargs):
         """
         
         Initialises the MiriExposureModel class.
@@ -284,8 +303,15 @@ class MiriExposureModel(MiriRampModel):
        
         # Create zero-filled arrays of the correct shape.
         # Floating point is used here because the STScI RampModel also
-        # declares floating point data.
-        datashape = [int_nints, int_ngroups, int_rows, int_columns]
+        # declares floating point data. When streaming, only the
+        # averaged data are held.
+        streaming = streaming and (int_grpavg > 1 or int_intavg > 1)
+        if streaming:
+            (int_nints_data, int_ngroups_data) = \
+                (int_nints // int_intavg, int_ngroups // int_grpavg)
+        else:
+            (int_nints_data, int_ngroups_data) = (int_nints, int_ngroups)
+        datashape = [int_nints_data, int_ngroups_data, int_rows, int_columns]
         #print("MiriExposureModel: data shape (ints,groups,rows,columns)=", datashape)
         zerodata = np.zeros(datashape, dtype=np.float32)
         if include_groupdq:
@@ -303,7 +329,8 @@ class MiriExposureModel(MiriRampModel):
             zeroerr = None
         
         if int_refrows > 0 and int_refcolumns > 0:
-            refoutshape = [int_nints, int_ngroups, int_refrows, int_refcolumns]
+            refoutshape = [int_nints_data, int_ngroups_data, int_refrows,
+                           int_refcolumns]
             #print("MiriExposureModel: Adding REFOUT of shape=", refoutshape)
             zerorefout = np.zeros(refoutshape, dtype=np.float32)
         else:
@@ -345,6 +372,9 @@ class MiriExposureModel(MiriRampModel):
         self.readpatt = readpatt
         self.ngroups_file = self.ngroups // self.grpavg
         self.nints_file = self.nints // self.intavg
+        self.streaming = streaming
+        # The weight given to each group added to the averaged data.
+        self._stream_weight = np.float32(1.0 / (self.grpavg * self.intavg))
 
         # Start with no averaged data
         self._data_averaged = None
@@ -663,7 +693,25 @@ class MiriExposureModel(MiriRampModel):
         # The given data must be the same size as the existing SCI_data array.
         data = np.asarray(data, dtype=self.data.dtype)
         #print("MiriExposureModel (set exposure): Adding exposure of shape=", data.shape)
-        if data.size == self.data.size:
+        if self.streaming:
+            # Average the full-resolution data before storing it.
+            fullshape = (self.nints, self.ngroups) + self.data.shape[-2:]
+            if data.size != np.prod(fullshape):
+                strg = "Exposure data array (%d-D) has the wrong size " % \
+                    data.ndim
+                strg += "(%d instead of %d)." % (data.size, np.prod(fullshape))
+                raise TypeError(strg)
+            self.data = self._average_array(data.reshape(fullshape))
+            if dq is not None:
+                if self.include_groupdq:
+                    dq = np.asarray(dq, dtype=self.groupdq.dtype)
+                    self.groupdq |= self._combine_groupdq(dq.reshape(fullshape))
+                else:
+                    strg = "Incompatible arguments. A groupdq array is "
+                    strg += "provided when include_groupdq=False. "
+                    strg += "The array is ignored."
+                    LOGGER.error(strg)
+        elif data.size == self.data.size:
             if data.ndim == 4:
                 # 4-D data is expected
                 self.data = data
@@ -732,15 +780,28 @@ class MiriExposureModel(MiriRampModel):
         # of the data array is checked.
         #
         data = np.asarray(data, dtype=self.data.dtype)
-        if data.shape == self.data.shape[-3:]:
-            self.data[intg, :, :, :] = data
+        if data.shape == (self.ngroups,) + self.data.shape[-2:]:
+            if self.streaming:
+                # Accumulate the averaged groups into the averaged data.
+                groupshape = (self.ngroups_file, self.grpavg) + data.shape[-2:]
+                intg_data = data.reshape(groupshape).sum(axis=1)
+                intg_data *= self._stream_weight
+                self.data[intg // self.intavg, :, :, :] += intg_data
+                del intg_data
+            else:
+                self.data[intg, :, :, :] = data
             # Invalidate the averaged data
             self._data_averaged = None
             # Update the group data quality array if necessary.
             if dq is not None:
                 if self.include_groupdq:
                     dq = np.asarray(dq, dtype=self.groupdq.dtype)  # Convert to same data type.
-                    self.groupdq[intg, :, :, :] |= dq
+                    if self.streaming:
+                        dq = np.bitwise_or.reduce(dq.reshape(groupshape),
+                                                  axis=1)
+                        self.groupdq[intg // self.intavg, :, :, :] |= dq
+                    else:
+                        self.groupdq[intg, :, :, :] |= dq
                 else:
                     strg = "Incompatible arguments. A groupdq array is "
                     strg += "provided when include_groupdq=False. "
@@ -763,6 +824,8 @@ class MiriExposureModel(MiriRampModel):
             The integration required, starting from 0.
         
         """
+        if self.streaming:
+            intg = intg // self.intavg
         return self.data[intg, :, :, :]
 
     def set_group(self, data, group, intg, dq=None):
@@ -807,7 +870,12 @@ class MiriExposureModel(MiriRampModel):
         detector_shape = (self.rows, self.columns)
         if data.shape == detector_shape:
             #print("MiriExposureModel (set group): Adding group of shape=", data.shape)
-            self.data[intg, group, :, :] = data  
+            if self.streaming:
+                # Accumulate the group into the averaged data.
+                (intg, group) = (intg // self.intavg, group // self.grpavg)
+                self.data[intg, group, :, :] += data * self._stream_weight
+            else:
+                self.data[intg, group, :, :] = data  
             # Invalidate the averaged data
             self._data_averaged = None
             # Update the group data quality array if necessary.
@@ -826,6 +894,26 @@ class MiriExposureModel(MiriRampModel):
                                              str(detector_shape))
             raise TypeError(strg)
 
+    def get_data_array(self):
+        """
+        
+        Return the 4-D SCI data array, so that readouts can be written
+        into it directly instead of with set_group. The data are assumed
+        to change.
+        
+        :Returns:
+        
+        data: numpy array
+            The SCI data array, or None if the groups and integrations
+            are averaged as they are added (see the streaming option).
+            
+        """
+        if self.streaming:
+            return None
+        # Invalidate the averaged data
+        self._data_averaged = None
+        return self.data
+
     def get_group(self, group, intg):
         """
         
@@ -840,6 +928,8 @@ class MiriExposureModel(MiriRampModel):
             The integration required, starting from 0.
         
         """
+        if self.streaming:
+            (intg, group) = (intg // self.intavg, group // self.grpavg)
         return self.data[intg, group, :, :]
     
     def add_dark(self, darkarray, clipvalue=65535.0 ):
@@ -894,13 +984,13 @@ class MiriExposureModel(MiriRampModel):
 
             # Add the DARK to the first integration
             # Skip the reference rows (assuming they are at the top)
-            self.data[0, :, :darkrows, :darkcols] = \
-                    self.data[0, :, :darkrows, :darkcols] + \
-                    darkarray[0, :ngroups, :, :]
+            view = self.data[0, :, :darkrows, :darkcols]
+            np.add(view, darkarray[0, :ngroups, :, :], out=view,
+                   casting='unsafe')
             # Add the DARK to the second and subsequent integrations.
-            self.data[1:, :, :darkrows, :darkcols] = \
-                    self.data[1:, :, :darkrows, :darkcols] + \
-                    darkarray[1, :ngroups, :, :]
+            view = self.data[1:, :, :darkrows, :darkcols]
+            np.add(view, darkarray[1, :ngroups, :, :], out=view,
+                   casting='unsafe')
 
         elif darkarray.ndim == 3:
             # 3-D data has been provided.
@@ -915,9 +1005,9 @@ class MiriExposureModel(MiriRampModel):
 
             # Add the DARK to the all groups.
             # Skip the reference rows (assuming they are at the top)
-            self.data[:, :, :darkrows, :darkcols] = \
-                    self.data[:, :, :darkrows, :darkcols] + \
-                    darkarray[:ngroups, :, :]
+            view = self.data[:, :, :darkrows, :darkcols]
+            np.add(view, darkarray[:ngroups, :, :], out=view,
+                   casting='unsafe')
  
         else:
             strg = "DARK data array has the wrong shape "
@@ -928,16 +1018,7 @@ class MiriExposureModel(MiriRampModel):
         # Adding the dark must not allow the resulting data to go negative
         # or contain zeros. It must also not allow the data to go above
         # the maximum value for 16-bit telemetry data.
-        whereneg = np.where( self.data < 1.0 )
-        if whereneg and (len(whereneg[0]) > 0):
-            strg = "%d negative pixels after adding DARK." % len(whereneg[0])
-            LOGGER.debug(strg)
-            self.data[whereneg] = 1.0
-        whereclipped = np.where( self.data > 65535.0 )
-        if whereclipped and (len(whereclipped[0]) > 0):
-            strg = "%d saturated pixels after adding DARK." % len(whereclipped[0])
-            LOGGER.debug(strg)
-            self.data[whereclipped] = 65535.0 
+        self._clip_translated(65535.0, operation='adding DARK')
             
     def apply_translation(self, translation_table, fromcolumn=None,
                           tocolumn=None, clipvalue=65535.0 ):
@@ -987,21 +1068,59 @@ class MiriExposureModel(MiriRampModel):
         else:
             strg = "Translation table array must be 1-D"
             raise TypeError(strg)
+        self._clip_translated(clipvalue)
+
+    def apply_reverse_grid(self, reverse_grid, step, clipvalue=65535.0 ):
+        """
+        
+        Apply a reverse linearity grid to the exposure data in-situ (for
+        simulation purposes). The grid is derived from a MIRI LINEARITY
+        CDP file by the MiriLinearityModel.get_reverse_grid function and
+        contains a table for each pixel or for each amplifier.
+        The exposure data and grid are assumed both to be in DN units.
+            
+        :Parameters:
+        
+        reverse_grid: array of float
+            An array with dimensions (knots, rows, columns) containing
+            the nonlinear DN values at linear DN values of 0, step,
+            2*step, etc... A grid with fewer rows or columns than the
+            data is repeated across the data.
+        step: float
+            The linear DN step between grid entries.
+        clipvalue: float (optional)
+            An upper limit to which data are clipped after the
+            translation. The default value is 65535.0, which keeps the
+            exposure data within the range of 16-bit telemetry. Set to
+            None to turn off the clipping.
+            
+        :Raises:
     
+        TypeError
+            Raised if the grid does not match the shape of the data.
+            
+        """
+        LOGGER.debug("Applying linearity grid of shape %s" % \
+                     str(reverse_grid.shape))
+        apply_reverse_grid(self.data, reverse_grid, step, out=self.data)
+        self._clip_translated(clipvalue)
+
+    def _clip_translated(self, clipvalue, operation='translation'):
         # The translation table must not allow the resulting data to go
         # negative or contain zeros. It must also not allow the data to go
         # above the maximum value for 16-bit telemetry data.
-        whereneg = np.where( self.data < 1.0 )
-        if whereneg and (len(whereneg[0]) > 0):
-            strg = "%d negative pixels after translation." % len(whereneg[0])
+        # The data are clipped in place (NaN values are left unchanged).
+        nneg = np.count_nonzero( self.data < 1.0 )
+        if nneg > 0:
+            strg = "%d negative pixels after %s." % (nneg, operation)
             LOGGER.debug(strg)
-            self.data[whereneg] = 1.0
+            np.maximum(self.data, 1.0, out=self.data)
         if clipvalue is not None:
-            whereclipped = np.where( self.data > clipvalue )
-            if whereclipped and (len(whereclipped[0]) > 0):
-                strg = "%d saturated pixels after translation." % len(whereclipped[0])
+            nclipped = np.count_nonzero( self.data > clipvalue )
+            if nclipped > 0:
+                strg = "%d saturated pixels after %s." % (nclipped, operation)
                 LOGGER.debug(strg)
-                self.data[whereclipped] = clipvalue 
+                np.minimum(self.data, clipvalue, out=self.data)
 
     def save(self, path, *args, **kwargs):
         """
@@ -1069,7 +1188,11 @@ class MiriExposureModel(MiriRampModel):
                 newproduct.meta.exposure.ngroups = self.ngroups
                 newproduct.meta.exposure.groups_averaged = self.grpavg
                 newproduct.meta.exposure.integrations_averaged = self.intavg
-                newproduct.set_exposure(self.data_averaged)
+                if self.include_groupdq and self.groupdq is not None:
+                    newproduct.set_exposure(self.data_averaged,
+                                            dq=self._average_groupdq())
+                else:
+                    newproduct.set_exposure(self.data_averaged)
 
                 # Explicitly delete the ERR array before saving if not needed.
                 if not self.include_err:
@@ -1093,13 +1216,12 @@ class MiriExposureModel(MiriRampModel):
                 super(MiriExposureModel, newproduct).save(path, *args, **kwargs)
                 del newproduct
 
-    def slope_data(self, grptime=2.77504, diff_only=False):
+    def slope_data(self, grptime=2.77504, diff_only=False, use_dq=False,
+                   max_memory=_SLOPE_MAX_MEMORY):
         """
         
         Return a copy of the SCI data array where all group planes
         have been fitted with a straight line to make slope data.
-
-        NOTE: This function is very inefficient!
         
         :Parameters:
         
@@ -1109,6 +1231,14 @@ class MiriExposureModel(MiriRampModel):
         diff_only: bool, optional, default=False
             If True, implement a quick and dirty estimate of the
             slope by subtracting the last frame from the first.
+        use_dq: bool, optional, default=False
+            If True, exclude groups flagged in the GROUPDQ array and
+            pixels flagged in the PIXELDQ array from the straight line
+            fit. Slopes which cannot be fitted are set to NaN.
+        max_memory: int, optional, default=256MB
+            The maximum number of bytes of working memory to be used by
+            the straight line fit, which fits the ramps a block of rows
+            at a time. If None, all the rows are fitted at once.
             
         :Returned:
         
@@ -1119,27 +1249,27 @@ class MiriExposureModel(MiriRampModel):
             
         """
         assert self.ngroups > 1
-        # TODO: Very inefficient and does not calculate ERR or DQ arrays.
-        output = np.zeros([self.nints, self.rows, self.columns],
-                            dtype=self.data.dtype)
-        
+        # TODO: Does not calculate ERR or DQ arrays.
         if diff_only:
             # Quick and dirty estimate which subtracts the last
             # ramp from the first. timediff should never be zero because
             # self.ngroups is forced to be > 1.
             timediff = grptime * (self.ngroups - 1)
-            output = (self.data[:,-1,:,:] - self.data[:,0,:,:]) / float(timediff)
+            output = diff_slopes(self.data, timediff)
         else:
-            # Full straight line fit
-            timearray = grptime * np.array( list(range(0, self.ngroups)) )
-            for intg in range(0, self.nints):
-                for row in range(0, self.rows):
-                    for column in range(0, self.columns):
-                        # Ouch! Slope calculated one (row,column) at a time.
-                        # Can the efficiency be improved?
-                        (slope, ic) = linear_regression( timearray,
-                                            self.data[intg,:,row,column] )
-                        output[intg,row,column] = slope
+            # Full straight line fit, made for all ramps at once.
+            groupdq = None
+            pixeldq = None
+            if use_dq:
+                if self.include_groupdq and self.groupdq is not None:
+                    groupdq = self.groupdq
+                if self.include_pixeldq and self.pixeldq is not None:
+                    pixeldq = self.pixeldq
+            slope = ramp_slopes( self.data, grptime=grptime,
+                                 groupdq=groupdq, pixeldq=pixeldq,
+                                 max_memory=max_memory )
+            output = slope.astype(np.float32)
+            del slope
         return output
 
     def cube_data(self):
@@ -1160,7 +1290,8 @@ class MiriExposureModel(MiriRampModel):
             
         """
         cube_data = copy.deepcopy(self.data)
-        cube_data.shape = [self.nints * self.ngroups, self.rows, self.columns]
+        cube_data.shape = [self.data.shape[0] * self.data.shape[1],
+                           self.rows, self.columns]
         return cube_data
     
     def _extract_refout(self):
@@ -1212,33 +1343,37 @@ class MiriExposureModel(MiriRampModel):
             The averaged exposure data array.
             
         """
-        # TODO: This function looks inefficient - can it be improved?
-        output = np.zeros([self.nints_file, self.ngroups_file,
-                           self.rows, self.columns], dtype=self.data.dtype)
-        count = np.zeros([self.nints_file, self.ngroups_file, 1, 1],
-                         dtype=self.data.dtype)
-
-        for intg in range(0, self.nints):
-            intg_file = intg // self.intavg
-            for grp in range(0, self.ngroups):
-                grp_file = grp // self.grpavg
-                output[intg_file, grp_file, :, :] += self.data[intg, grp, :, :]
-                count[intg_file, grp_file, 0, 0] += 1.0
-
-            # Avoid divide by zero.
-            iszero = np.where(count < 1.0)
-            if iszero:
-                count[iszero] = 1.0
-            output = output / count
-
-        del count            
-        return output
+        return self._average_array(self.data)
+
+    def _average_array(self, data):
+        # Average a full-resolution exposure data array over groups and
+        # integrations. The array is reshaped so that the groups and
+        # integrations making up each average lie along their own axes.
+        avgshape = (self.nints_file, self.intavg, self.ngroups_file,
+                    self.grpavg) + data.shape[-2:]
+        return data.reshape(avgshape).mean(axis=(1,3), dtype=self.data.dtype)
+
+    def _combine_groupdq(self, groupdq):
+        # Combine the full-resolution GROUPDQ flags of the groups and
+        # integrations making up each average.
+        avgshape = (self.nints_file, self.intavg, self.ngroups_file,
+                    self.grpavg) + groupdq.shape[-2:]
+        return np.bitwise_or.reduce(groupdq.reshape(avgshape), axis=(1,3))
+
+    def _average_groupdq(self):
+        # The GROUPDQ flags matching the averaged data.
+        if self.streaming:
+            return self.groupdq
+        return self._combine_groupdq(self.groupdq)
 
     @property
     def data_averaged(self):
         # Generate the averaged data on the fly. This ensures the
         # averaging is always up to date with the latest data array.
-        if self.data is not None and (self.grpavg > 1 or self.intavg > 1):
+        # Streamed data are averaged already.
+        if self.streaming:
+            return self.data
+        elif self.data is not None and (self.grpavg > 1 or self.intavg > 1):
             # Generate the averaged data if it is not available.
             if self._data_averaged is None:
                 self._data_averaged = self._average_data()
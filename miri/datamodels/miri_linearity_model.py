@@ -68,6 +68,11 @@ https://jwst-pipeline.readthedocs.io/en/latest/jwst/datamodels/index.html
              names. Removed '.yaml' suffix from schema references.
 26 Mar 2020: Ensure the model_type remains as originally defined when saving
              to a file.
+18 Oct 2026: The apply function evaluates the polynomial by Horner's rule.
+             get_forward_table and get_reverse_table vectorised. Added
+             the invert and get_reverse_grid functions, which solve the
+             polynomials of every pixel at once, and the
+             apply_reverse_grid function.
 
 @author: Steven Beard (UKATC), Vincent Geers (UKATC)
 
@@ -83,7 +88,8 @@ from miri.datamodels.dqflags import insert_value_column
 from miri.datamodels.miri_measured_model import MiriMeasuredModel
 
 # List all classes and global functions here.
-__all__ = ['linearity_reference_flags', 'MiriLinearityModel']
+__all__ = ['linearity_reference_flags', 'MiriLinearityModel',
+           'apply_reverse_grid']
 
 # The new JWST linearity reference flags
 linearity_reference_setup = \
@@ -94,6 +100,179 @@ linearity_reference_setup = \
              (4, 'DROPOUT',         'Data derived from incomplete input')] # Was CDP_PARTIAL_DATA 
 linearity_reference_flags = insert_value_column( linearity_reference_setup )
 
+# The number of grid entries solved at once by get_reverse_grid.
+_GRID_BLOCK_SIZE = 1048576
+
+
+def _polyval(coeffs, x, out):
+    # Evaluate the polynomial sum(coeffs[k] * x**k) by Horner's rule,
+    # writing the result to out. Each coefficient must broadcast
+    # against x.
+    ncoeffs = len(coeffs)
+    out[...] = coeffs[ncoeffs-1]
+    for icoeff in range(ncoeffs-2, -1, -1):
+        np.multiply(out, x, out=out)
+        np.add(out, coeffs[icoeff], out=out)
+    return out
+
+def _invert_polynomial(coeffs, value, max_dn, tolerance, maxiter,
+                       guess=None):
+    # Solve sum(coeffs[k] * x**k) = value for x within [0, max_dn] for
+    # every element at once. Newton's method is used, falling back to
+    # bisection whenever a Newton step would leave the interval known
+    # to contain the root. Values outside the range of a polynomial are
+    # clipped, so they converge to the nearer end of the interval.
+    # Elements with undefined coefficients give NaN.
+    ncoeffs = len(coeffs)
+    dcoeffs = [icoeff * coeffs[icoeff] for icoeff in range(1, ncoeffs)]
+    if not dcoeffs:
+        dcoeffs = [np.zeros_like(coeffs[0])]
+    shape = np.broadcast(coeffs[0], value).shape
+    value = np.broadcast_to(value, shape)
+
+    # The direction of each polynomial across the interval is used to
+    # make every function increase.
+    lowest = _polyval(coeffs, 0.0, np.empty(shape))
+    highest = _polyval(coeffs, float(max_dn), np.empty(shape))
+    with np.errstate(invalid='ignore'):
+        undefined = ~np.isfinite(lowest) | ~np.isfinite(highest)
+        falling = highest < lowest
+        target = np.clip(value, np.minimum(lowest, highest),
+                         np.maximum(lowest, highest))
+    direction = np.where(falling, -1.0, 1.0) if np.any(falling) else None
+    if not np.any(undefined):
+        undefined = None
+
+    lower = np.zeros(shape)
+    upper = np.full(shape, float(max_dn))
+    if guess is None:
+        # Start from the linear term of the polynomial.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = (target - coeffs[0]) / coeffs[1] if ncoeffs > 1 \
+                else np.zeros(shape)
+        x[~np.isfinite(x)] = 0.5 * max_dn
+        np.clip(x, 0.0, float(max_dn), out=x)
+    else:
+        x = np.clip(np.broadcast_to(guess, shape), 0.0, float(max_dn))
+    if undefined is not None:
+        x[undefined] = 0.0
+    func = np.empty(shape)
+    deriv = np.empty(shape)
+    change = np.empty(shape)
+    selected = np.empty(shape, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for iteration in range(0, maxiter):
+            _polyval(coeffs, x, func)
+            func -= target
+            if direction is not None:
+                func *= direction
+            if undefined is not None:
+                func[undefined] = 0.0
+            # Narrow the interval containing the root.
+            np.less(func, 0.0, out=selected)
+            np.copyto(lower, x, where=selected)
+            np.logical_not(selected, out=selected)
+            np.copyto(upper, x, where=selected)
+            # Take a Newton step, or bisect the interval when the step
+            # goes outside it.
+            _polyval(dcoeffs, x, deriv)
+            if direction is not None:
+                deriv *= direction
+            np.divide(func, deriv, out=change)
+            if undefined is not None:
+                change[undefined] = 0.0
+            x -= change
+            np.less_equal(lower, x, out=selected)
+            selected &= np.less_equal(x, upper)
+            if not np.all(selected):
+                outside = np.logical_not(selected)
+                width = upper[outside] - lower[outside]
+                x[outside] = lower[outside] + 0.5 * width
+                change[outside] = width
+            if np.abs(change).max(initial=0.0) <= tolerance:
+                break
+    if undefined is not None:
+        x[undefined] = np.nan
+    return x
+
+def apply_reverse_grid(linramp, grid, step, out=None):
+    """
+    
+    Apply a reverse linearity grid, generated by the
+    MiriLinearityModel.get_reverse_grid function, to a ramp of linear
+    DN values. The nonlinear DN value of each pixel is interpolated
+    from the grid entries for that pixel.
+    
+    A grid with fewer rows or columns than the data is repeated across
+    the data, so a grid containing one column for each amplifier is
+    applied to all the interleaved columns read by that amplifier.
+    
+    :Parameters:
+    
+    linramp: array-like
+        Input array containing a ramp of linear DN values.
+    grid: array-like
+        The grid of nonlinear DN values, with dimensions (knots, rows,
+        columns), given at linear DN values of 0, step, 2*step, etc...
+    step: float
+        The linear DN step between grid entries.
+    out: numpy array (optional)
+        If given, an array in which to write the results. It may be
+        the input array.
+        
+    :Returns:
+    
+    outramp: array-like
+        Output array containing a ramp of nonlinear DN values.
+    
+    :Raises:
+    
+    TypeError
+        Raised if the grid does not match the shape of the data.
+        
+    """
+    linramp = np.asarray(linramp)
+    grid = np.asarray(grid)
+    if grid.ndim != 3 or grid.shape[0] < 2 or linramp.ndim < 2 or \
+       linramp.shape[-2] % grid.shape[1] != 0 or \
+       linramp.shape[-1] % grid.shape[2] != 0:
+        strg = "Linearity grid of shape %s " % str(grid.shape)
+        strg += "does not match data of shape %s." % str(linramp.shape)
+        raise TypeError(strg)
+    if out is None:
+        if np.issubdtype(linramp.dtype, np.floating):
+            out = np.empty_like(linramp)
+        else:
+            out = np.empty(linramp.shape)
+    (nrows, ncolumns) = linramp.shape[-2:]
+    rowindex = (np.arange(nrows) % grid.shape[1]).reshape(nrows, 1)
+    colindex = np.arange(ncolumns) % grid.shape[2]
+    lastknot = grid.shape[0] - 1
+
+    # Process one frame at a time to limit the size of the temporary
+    # arrays.
+    inframes = linramp.reshape(-1, nrows, ncolumns)
+    outframes = out.reshape(-1, nrows, ncolumns)
+    position = np.empty((nrows, ncolumns))
+    for frame in range(0, inframes.shape[0]):
+        np.divide(inframes[frame], float(step), out=position)
+        np.clip(position, 0.0, float(lastknot), out=position)
+        undefined = np.isnan(position)
+        position[undefined] = 0.0
+        knot = position.astype(np.intp)
+        np.minimum(knot, lastknot-1, out=knot)
+        position -= knot
+        lower = grid[knot, rowindex, colindex]
+        upper = grid[knot+1, rowindex, colindex]
+        upper -= lower
+        upper *= position
+        upper += lower
+        upper[undefined] = np.nan
+        outframes[frame] = upper
+    if not np.may_share_memory(outframes, out):
+        out[...] = outframes.reshape(out.shape)
+    return out
+
 
 class MiriLinearityModel(MiriMeasuredModel):
     """
@@ -353,11 +532,147 @@ class MiriLinearityModel(MiriMeasuredModel):
         assert (len(inramp.shape) > 1)
         assert (inramp.shape[-1] == self.data.shape[-1])
         assert (inramp.shape[-2] == self.data.shape[-2])
-        ncoeffs = self.data.shape[0]
-        outramp = np.zeros_like(inramp)
-        for icoeff in range(0, ncoeffs):
-            outramp += self.data[icoeff,:,:] * (inramp[:,:,:] ** icoeff)     
-        return outramp
+        if np.issubdtype(inramp.dtype, np.floating):
+            outramp = np.empty_like(inramp)
+        else:
+            outramp = np.empty(inramp.shape)
+        return _polyval(self.data, inramp, outramp)
+
+    def invert(self, outramp, max_dn=65535, tolerance=0.01, maxiter=50):
+        """
+        
+        Reverse the linearity correction for a ramp of DN values, so
+        that apply(invert(outramp)) reproduces outramp. The polynomial
+        of every pixel is solved at once, by Newton's method with a
+        bisection fallback. The input data must match the number of
+        rows and columns contained in the linearity coefficients array.
+        
+        :Parameters:
+        
+        outramp: array-like
+            Input array containing a corrected ramp of DN values.
+        max_dn: int (optional)
+            The maximum uncorrected DN value. Defaults to 65535.
+            Corrected values outside the range of a pixel's polynomial
+            are limited to 0 or max_dn.
+        tolerance: float (optional)
+            The accuracy required of the solution, in DN.
+            Defaults to 0.01.
+        maxiter: int (optional)
+            The maximum number of iterations. Defaults to 50.
+        
+        :Returns:
+        
+        inramp: array-like
+            Output array containing an uncorrected ramp of DN values.
+            Pixels with undefined coefficients contain NaN.
+        
+        """
+        outramp = np.asarray(outramp)
+        assert (len(outramp.shape) > 1)
+        assert (outramp.shape[-1] == self.data.shape[-1])
+        assert (outramp.shape[-2] == self.data.shape[-2])
+        if np.issubdtype(outramp.dtype, np.floating):
+            inramp = np.empty_like(outramp)
+        else:
+            inramp = np.empty(outramp.shape)
+        coeffs = np.asarray(self.data, dtype=np.float64)
+        
+        # Solve one frame at a time to limit the size of the temporary
+        # arrays, starting from the solution for the previous frame.
+        (nrows, ncolumns) = outramp.shape[-2:]
+        outframes = outramp.reshape(-1, nrows, ncolumns)
+        inframes = inramp.reshape(-1, nrows, ncolumns)
+        solution = None
+        for frame in range(0, outframes.shape[0]):
+            solution = _invert_polynomial(coeffs, outframes[frame], max_dn,
+                                          tolerance, maxiter, guess=solution)
+            inframes[frame] = solution
+        if not np.may_share_memory(inframes, inramp):
+            inramp[...] = inframes.reshape(inramp.shape)
+        return inramp
+
+    def get_reverse_grid(self, step=1024, max_dn=65535, namps=None,
+                         tolerance=0.01, dtype=np.float32):
+        """
+        
+        Return a compact reverse linearity table for every pixel.
+        The table contains the uncorrected DN values which would be
+        corrected to 0, step, 2*step, ... DN, so that uncorrected DN
+        values can be interpolated for any corrected DN value with
+        the apply_reverse_grid function. A per-pixel alternative to
+        get_reverse_table.
+        
+        :Parameters:
+        
+        step: int (optional)
+            The corrected DN step between table entries.
+            Defaults to 1024.
+        max_dn: int (optional)
+            The maximum uncorrected DN value. Defaults to 65535.
+        namps: int (optional)
+            If given, the median coefficients of the interleaved
+            columns read by each of namps amplifiers are used, and a
+            table with one row and namps columns is returned.
+            By default a table is returned for every pixel.
+        tolerance: float (optional)
+            The accuracy required of each table entry, in DN.
+            Defaults to 0.01.
+        dtype: numpy dtype (optional)
+            The data type of the table. Defaults to np.float32.
+            
+        :Returns:
+        
+        reverse_grid: array of float
+            An array with dimensions (knots, rows, columns) containing
+            the uncorrected DN value at each knot for each pixel or
+            amplifier. Pixels with undefined coefficients are left
+            uncorrected.
+            
+        """
+        coeffs = np.array(self.data, dtype=np.float64)
+        if namps is not None:
+            ampcoeffs = np.empty((coeffs.shape[0], 1, namps))
+            for amp in range(0, namps):
+                ampcoeffs[:,0,amp] = np.nanmedian(coeffs[:,:,amp::namps],
+                                                  axis=(1,2))
+            coeffs = ampcoeffs
+        
+        # Pixels with undefined coefficients are given the identity
+        # polynomial.
+        undefined = ~np.all(np.isfinite(coeffs), axis=0)
+        if np.any(undefined):
+            coeffs[:,undefined] = 0.0
+            if coeffs.shape[0] > 1:
+                coeffs[1,undefined] = 1.0
+        
+        # The table covers the largest corrected DN value of any pixel.
+        highest = _polyval(coeffs, float(max_dn),
+                           np.empty(coeffs.shape[1:]))
+        nknots = max(int(np.ceil(np.max(highest) / float(step))), 1) + 1
+        grid = np.empty((nknots,) + coeffs.shape[1:], dtype=dtype)
+        knots = float(step) * np.arange(nknots).reshape(nknots, 1, 1)
+        nblock = max(_GRID_BLOCK_SIZE // highest.size, 1)
+        if nblock > 1:
+            # Solve several knots at once when there are few pixels.
+            for first in range(0, nknots, nblock):
+                grid[first:first+nblock] = _invert_polynomial(coeffs,
+                                                knots[first:first+nblock],
+                                                max_dn, tolerance, 50)
+        else:
+            # Solve one knot at a time, starting each solution from an
+            # extrapolation of the previous two.
+            (solution, guess) = (None, None)
+            for knot in range(0, nknots):
+                previous = solution
+                solution = _invert_polynomial(coeffs, knots[knot], max_dn,
+                                              tolerance, 50, guess=guess)
+                grid[knot] = solution
+                if previous is None:
+                    guess = solution
+                else:
+                    guess = 2.0 * solution - previous
+        return grid
     
     def get_forward_table(self, row, column, max_dn=65535):
         """
@@ -394,13 +709,11 @@ class MiriLinearityModel(MiriMeasuredModel):
         inarray = np.arange(0.0, float(max_dn), 1.0)
         
         # Convert the array using the given polynomial coefficients
-        ncoeffs = self.data.shape[0]
-        farray = np.zeros_like(inarray)
-        for icoeff in range(0, ncoeffs):
-            farray += self.data[icoeff,row,column] * (inarray ** icoeff)
+        farray = _polyval(self.data[:,row,column], inarray,
+                          np.empty_like(inarray))
             
         # Convert the output array to integer.
-        outarray = np.floor(farray+0.5).astype(np.int)
+        outarray = np.floor(farray+0.5).astype(int)
         return outarray
 
     def get_reverse_table(self, row, column, max_dn=65535, fill_gaps=True):
@@ -438,10 +751,8 @@ class MiriLinearityModel(MiriMeasuredModel):
             
         """
         # Determine the maximum DN in the reverse table
-        ncoeffs = self.data.shape[0]
-        fmax = 0.0
-        for icoeff in range(0, ncoeffs):
-            fmax += self.data[icoeff,row,column] * (float(max_dn) ** icoeff)
+        fmax = _polyval(self.data[:,row,column], float(max_dn),
+                        np.empty(()))
         max_dn_out = int(fmax+0.5)
         # Initialise a reverse table
         rarray = np.zeros([max_dn_out+1])
@@ -449,36 +760,33 @@ class MiriLinearityModel(MiriMeasuredModel):
         # Start by generating a forward table.
         ftable = self.get_forward_table(row, column, max_dn=max_dn)
         
-        # Use the forward table to populate the reverse table
-        for indn in range(0, max_dn):
-            outdn = int(ftable[indn])
-            rarray[outdn] = indn
+        # Use the forward table to populate the reverse table. Where
+        # several input DN values give the same output DN, the largest
+        # is used.
+        np.maximum.at(rarray, ftable, np.arange(0.0, float(max_dn), 1.0))
             
         # If any elements remain unpopulated, interpolate the nearest
-        # non-zero values.
+        # non-zero values. Each run of gaps is filled with equal
+        # increments from the value before the run, which reach the
+        # value after the run at its last element.
         if fill_gaps:
-            runopen = False
-            for outdn in range(1, max_dn_out):
-                if rarray[outdn] == 0:
-                    if not runopen:
-                        runstart = outdn
-                        runopen = True
-                else:
-                    if runopen:
-                        runend = outdn
-                        runopen = False
-                        leftvalue = rarray[runstart-1]
-                        rightvalue = rarray[runend]
-                        inc = (rightvalue - leftvalue)/float(runend-runstart)
-                        for rundn in range(runstart,runend):
-                            rarray[rundn] = rarray[rundn-1] + inc
+            filled = np.flatnonzero(rarray[1:max_dn_out]) + 1
+            if len(filled) > 0:
+                gaps = np.arange(1, filled[-1])
+                gaps = gaps[rarray[gaps] == 0]
+                after = filled[np.searchsorted(filled, gaps)]
+                before = np.concatenate(([0], filled))[
+                    np.searchsorted(filled, gaps)]
+                inc = (rarray[after] - rarray[before]) / \
+                    (after - before - 1).astype(float)
+                rarray[gaps] = rarray[before] + inc * (gaps - before)
             if rarray[max_dn_out] == 0:
                 rarray[max_dn_out] = max_dn
             if rarray[max_dn_out-1] == 0:
                 rarray[max_dn_out-1] = (rarray[max_dn_out-2] + rarray[max_dn_out])/2.0
             
         # Convert the output array to integer.
-        reverse_array = np.floor(rarray+0.5).astype(np.int)
+        reverse_array = np.floor(rarray+0.5).astype(int)
         return reverse_array
 
     # "coeffs" is an alias for the "data" attribute.
@@ -539,6 +847,12 @@ if __name__ == '__main__':
         reverse = testdata1.get_reverse_table(row=1, column=1)
         print("Reverse table of length", len(reverse))
         print(str(reverse))
+        # Test the batched inverse and the reverse grid
+        inramp = testdata1.invert( outramp )
+        print("inverted ramp=", inramp)
+        grid = testdata1.get_reverse_grid()
+        print("Reverse grid of shape", grid.shape)
+        print("ramp from grid=", apply_reverse_grid( outramp, grid, 1024 ))
         
         #print(str(reverse))
         if PLOTTING:
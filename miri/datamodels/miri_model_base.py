@@ -185,6 +185,18 @@ https://jwst-pipeline.readthedocs.io/en/latest/jwst/datamodels/index.html
 13 Dec 2019: Modified copy_metadata to prevent DATAMODL, FILETYPE, FILENAME
              and REFTYPE keywords being copied.
 10 Feb 2020: Corrected typo in the list_data_arrays function.
+18 Oct 2026: Resolved and merged schemas are kept in a process-wide cache
+             (see get_merged_schema and clear_schema_cache), so a data
+             model no longer loads and resolves its schema every time it
+             is created. The STScI data model functions are not modified.
+18 Oct 2026: FITS keyword searches and copy_metadata now use an index of
+             the FITS keywords defined in each schema, built once per
+             schema, instead of walking the schema on every call.
+18 Oct 2026: Added set_metadata_from_fits_headers, so the metadata of a
+             file can be read without reading its data.
+18 Oct 2026: Metadata values rejected by the schema are skipped with a
+             warning by set_metadata_from_fits_headers. Added keep_open,
+             which keeps a file open until the data model is closed.
 
 @author: Steven Beard (UKATC), Vincent Geers (UKATC)
 
@@ -192,6 +204,7 @@ https://jwst-pipeline.readthedocs.io/en/latest/jwst/datamodels/index.html
 
 import os
 import datetime
+import threading
 # import logging
 # logging.basicConfig(level=logging.INFO) # Default level is informational output
 # LOGGER = logging.getLogger("miri.datamodels") # Get a default parent logger
@@ -199,6 +212,7 @@ import warnings
 import numpy as np
 #import numpy.ma as ma
 from astropy.time import Time
+import astropy.io.fits as pyfits
 from asdf.tags.core import HistoryEntry
 from  asdf import AsdfFile
 from asdf import schema as asdf_schema
@@ -206,6 +220,8 @@ from asdf import schema as asdf_schema
 import jwst.datamodels.fits_support as mfits
 import jwst.datamodels.schema as mschema
 from jwst.datamodels.model_base import DataModel
+from jwst.datamodels.validate import ValidationWarning
+from jsonschema import ValidationError
 
 # Import the MIRI data models and the data model plotter.
 import miri.datamodels
@@ -214,7 +230,20 @@ from miri.datamodels.plotting import DataModelPlotVisitor
 from miri.parameters import SUBARRAY, CDP_USEAFTER_DICT
 
 # List all classes and global functions here.
-__all__ = ['get_exp_type', 'MiriDataModel']
+__all__ = ['get_exp_type', 'get_merged_schema', 'clear_schema_cache',
+           'MiriDataModel']
+
+# A process-wide cache of the resolved and merged data model schemas,
+# keyed by schema URL and ASDF extensions, together with the lock which
+# protects it and the identities of the cached schemas.
+_SCHEMA_CACHE = {}
+_SCHEMA_CACHE_LOCK = threading.RLock()
+_MERGED_SCHEMA_IDS = set()
+
+# The FITS keyword indexes of the cached schemas, keyed by schema
+# identity, and the metadata copying plans between pairs of them.
+_FITS_INDEX_CACHE = {}
+_COPY_PLAN_CACHE = {}
 
 #
 # Public global function.
@@ -289,6 +318,67 @@ def get_exp_type(detector, mirifilter, subarray='FULL', datatype='SCIENCE'):
         exp_type = ''
     return exp_type
 
+def get_merged_schema(schema_url, extensions=None):
+    """
+
+    Return the schema with the given URL, with all its references resolved
+    and its property trees merged, as required by a data model.
+
+    Loading and merging a schema takes tens of milliseconds, so each schema
+    is only loaded once per process and then shared by every data model
+    using it. The cached schemas must be treated as read-only. A data model
+    which needs a different schema should use extend_schema, which makes
+    a new schema.
+
+    :Parameters:
+
+    schema_url: str
+        The schema URL, relative to the MIRI schema URL prefix
+        (e.g. "miri_core.schema").
+    extensions: list of ASDF extension objects, optional
+        The ASDF extensions in use when the schema is resolved.
+        Schemas resolved with different extensions are cached separately.
+
+    :Returns:
+
+    schema: dict
+        The resolved and merged schema.
+
+    """
+    if extensions:
+        extkey = tuple( [ext.__class__.__name__ for ext in extensions] )
+    else:
+        extkey = ()
+    key = (schema_url, extkey)
+    schema = _SCHEMA_CACHE.get(key)
+    if schema is None:
+        with _SCHEMA_CACHE_LOCK:
+            schema = _SCHEMA_CACHE.get(key)
+            if schema is None:
+                schema_path = os.path.join(URL_PREFIX, schema_url)
+                asdf_file = AsdfFile()
+                schema = asdf_schema.load_schema(schema_path,
+                                                 resolver=asdf_file.resolver,
+                                                 resolve_references=True)
+                schema = mschema.merge_property_trees(schema)
+                _SCHEMA_CACHE[key] = schema
+                _MERGED_SCHEMA_IDS.add(id(schema))
+    return schema
+
+def clear_schema_cache():
+    """
+
+    Empty the cache of merged schemas, so each schema is loaded again
+    the next time a data model using it is created. This function must
+    be called if a schema file is changed while a program is running.
+
+    """
+    with _SCHEMA_CACHE_LOCK:
+        _SCHEMA_CACHE.clear()
+        _MERGED_SCHEMA_IDS.clear()
+        _FITS_INDEX_CACHE.clear()
+        _COPY_PLAN_CACHE.clear()
+
 #
 # Private helper functions.
 #
@@ -383,6 +473,132 @@ def _shape_to_string(shape, axes=None):
         strg = ' x '.join(str(s) for s in shape)
     return strg
 
+def _get_fits_index(schema):
+    """
+
+    Helper function which returns the _FitsKeywordIndex of a schema.
+    The indexes of cached schemas are themselves cached.
+
+    """
+    if id(schema) not in _MERGED_SCHEMA_IDS:
+        return _FitsKeywordIndex(schema)
+    index = _FITS_INDEX_CACHE.get(id(schema))
+    if index is None:
+        index = _FitsKeywordIndex(schema)
+        with _SCHEMA_CACHE_LOCK:
+            if id(schema) in _MERGED_SCHEMA_IDS:
+                _FITS_INDEX_CACHE[id(schema)] = index
+    return index
+
+
+class _FitsKeywordIndex(object):
+    """
+
+    A private helper class which records where each FITS keyword is
+    defined within a data model schema, so the schema only needs to
+    be walked once. The index maps each dot-separated schema path to
+    its (HDU name, FITS keyword, title) and each (HDU name, FITS keyword)
+    back to its schema path.
+
+    :Parameters:
+
+    schema: dict
+        The merged data model schema to be indexed.
+
+    """
+    def __init__(self, schema):
+        """
+
+        Initialises the _FitsKeywordIndex class.
+
+        Parameters: See class doc string.
+
+        """
+        self.schema = schema
+        # The set of all the schema paths.
+        self.paths = set()
+        # A dictionary of {path: (path, hdu, keyword, title, kind)} for
+        # every element associated with a FITS keyword, in schema order.
+        # kind is 'COMMENT', 'HISTORY', 'BUILTIN' or ''.
+        entries = {}
+        # A dictionary of {keyword: path} for each HDU.
+        self.hdu_elements = {}
+        # A dictionary of {keyword: [(path, hdu), ...]}.
+        self.keyword_paths = {}
+        # A dictionary of the default values defined in the schema.
+        self.defaults = {}
+
+        def index_element(subschema, path, combiner, ctx, recurse):
+            hdu = subschema.get('fits_hdu')
+            if not hdu:
+                # If there isn't a 'fits_hdu' declaration an item
+                # is assumed to be in the PRIMARY HDU.
+                hdu = 'PRIMARY'
+            keyw = subschema.get('fits_keyword')
+            kw = '.'.join(path)
+            self.hdu_elements.setdefault(hdu, {})[keyw] = kw
+            if not path:
+                return
+            self.paths.add(kw)
+            if keyw:
+                self.keyword_paths.setdefault(keyw, []).append( (kw, hdu) )
+            # Reject a null or blank keyword
+            if not keyw or keyw == 'BLANK':
+                return
+            if keyw in ('COMMENT', 'HISTORY'):
+                kind = keyw
+            elif mfits._is_builtin_fits_keyword(keyw) or \
+                 keyw in ('SIMPLE', 'EXTEND'):
+                # SIMPLE and EXTEND work around a bug in mfits
+                kind = 'BUILTIN'
+            else:
+                kind = ''
+            entries[kw] = (kw, hdu, keyw, subschema.get('title'), kind)
+            if 'default' in subschema:
+                self.defaults[kw] = subschema['default']
+
+        mschema.walk_schema(schema, index_element)
+        self.entries = list(entries.values())
+
+    def select(self, hdu_name=None, include_comments=False,
+               include_history=False, include_builtin=False):
+        """
+
+        Return the (path, hdu, keyword, title) of the entries in the
+        given HDU (or in any HDU if hdu_name is None), optionally
+        including COMMENT, HISTORY and builtin FITS keywords.
+
+        """
+        excluded = []
+        if not include_comments:
+            excluded.append('COMMENT')
+        if not include_history:
+            excluded.append('HISTORY')
+        if not include_builtin:
+            excluded.append('BUILTIN')
+        return [entry[:4] for entry in self.entries \
+                if entry[4] not in excluded and \
+                (hdu_name is None or entry[1] == hdu_name)]
+
+    def get_value(self, datamodel, path):
+        """
+
+        Return the value of a metadata item, looked up directly in the
+        underlying tree of the given data model (which must use the
+        indexed schema). This gives the same result as datamodel[path]
+        without creating a node object for each level of the path.
+        The schema default is returned for an undefined item.
+
+        """
+        node = datamodel._instance
+        for part in path.split('.'):
+            if not isinstance(node, dict):
+                return datamodel[path]
+            if part not in node:
+                return self.defaults.get(path)
+            node = node[part]
+        return node
+
 
 class MiriDataModel(DataModel):
     """
@@ -430,15 +646,18 @@ class MiriDataModel(DataModel):
         # list of extensions, in which case the list needs to be passed
         # unchanged to the parent class.
 
-        schema_path = os.path.join(URL_PREFIX, self.schema_url)
-        asdf_file = AsdfFile()
-        schema = asdf_schema.load_schema(schema_path,
-                                         resolver=asdf_file.resolver,
-                                         resolve_references=True)
-        self._schema = mschema.merge_property_trees(schema)
+        # Files kept open by keep_open until the data model is closed.
+        self._open_files = []
+
+        # The schema is shared with all other data models of the same class.
+        schema = get_merged_schema(self.schema_url, extensions=extensions)
+        self._schema = schema
         # Initialise the underlying STScI data model.
-        super(MiriDataModel, self).__init__(init=init, schema=self.schema,
+        super(MiriDataModel, self).__init__(init=init, schema=schema,
                                             **kwargs)
+        # The STScI data model merges the schema it is given again, which
+        # makes an identical copy. Use the shared schema instead.
+        self._schema = schema
 
         # Initialise the observation date if not already defined.
         if hasattr(self, 'meta'):
@@ -456,6 +675,36 @@ class MiriDataModel(DataModel):
 
         #self._report_deprecated_values('__init__')
 
+    def keep_open(self, fileobj):
+        """
+
+        Keep a file open for as long as the data model is open. This is
+        needed when the data arrays are memory-mapped from the file.
+        The file is closed when the data model is closed.
+
+        :Parameters:
+
+        fileobj: file-like object
+            The file (for example, a pyfits.HDUList) to be closed with
+            the data model. It must have a close() method.
+
+        """
+        self._open_files.append(fileobj)
+
+    def close(self):
+        """
+
+        Close the data model, together with any files kept open with
+        keep_open.
+
+        """
+        try:
+            super(MiriDataModel, self).close()
+        finally:
+            open_files = getattr(self, '_open_files', [])
+            while open_files:
+                open_files.pop().close()
+
     def _reference_model(self):
         """
 
@@ -1564,6 +1813,19 @@ class MiriDataModel(DataModel):
             raise AttributeError(strg)
         self._report_deprecated_values('set_wcs_metadata_refs')
 
+    def _get_fits_index(self):
+        """
+
+        Return the index of the FITS keywords defined in the schema of
+        this data model. The index is rebuilt if the schema changes.
+
+        """
+        index = self.__dict__.get('_fits_index')
+        if index is None or index.schema is not self._schema:
+            index = _get_fits_index(self._schema)
+            self.__dict__['_fits_index'] = index
+        return index
+
     def copy_metadata(self, other, ignore=[]):
         """
 
@@ -1593,27 +1855,46 @@ class MiriDataModel(DataModel):
             alwaysignore = ['DATAMODL', 'FILETYPE', 'REFTYPE', 'FILENAME']
 
             # Copy all metadata apart from keyword matches specified
-            # in the ignore list.
-            fitskwdict = other.fits_metadata_dict()
-            metakeys = list(fitskwdict.keys())
-            notcopied = 0
-            names = []
-            for key in metakeys:
-                tobecopied = True
-                for ignorekw in ignore+alwaysignore:
-                    if ignorekw and (ignorekw in key):
-                        # Skip to the next keyword
-                        tobecopied = False
-                        break
-                if tobecopied:
-                    # Ignore KeyError or AttributeError exceptions
-                    # when metadata is not defined in both data models.
-                    try:
-                        if other[key] is not None:
-                            self[key] = other[key]
-                    except (KeyError, AttributeError):
-                        notcopied += 1
-                        names.append(key)
+            # in the ignore list. Only metadata defined in the schemas
+            # of both data models can be copied. The list of items to be
+            # copied between two cached schemas is only worked out once.
+            plankey = (id(other.schema), id(self.schema), tuple(ignore))
+            plan = _COPY_PLAN_CACHE.get(plankey)
+            if plan is None:
+                this_index = self._get_fits_index()
+                other_index = other._get_fits_index()
+                tocopy = []
+                names = []
+                for (key, hdu, keyw, title) in other_index.select():
+                    tobecopied = True
+                    for ignorekw in ignore+alwaysignore:
+                        if ignorekw and (ignorekw in key):
+                            # Skip to the next keyword
+                            tobecopied = False
+                            break
+                    if tobecopied:
+                        if key in this_index.paths:
+                            tocopy.append(key)
+                        else:
+                            names.append(key)
+                plan = (tocopy, names)
+                if id(other.schema) in _MERGED_SCHEMA_IDS and \
+                   id(self.schema) in _MERGED_SCHEMA_IDS:
+                    with _SCHEMA_CACHE_LOCK:
+                        _COPY_PLAN_CACHE[plankey] = plan
+            (tocopy, names) = plan
+            names = list(names)
+            other_index = other._get_fits_index()
+            for key in tocopy:
+                # Ignore KeyError or AttributeError exceptions
+                # when metadata cannot be copied.
+                try:
+                    value = other_index.get_value(other, key)
+                    if value is not None:
+                        self[key] = value
+                except (KeyError, AttributeError):
+                    names.append(key)
+            notcopied = len(names)
             if notcopied > 0:
                 strg = "%d metadata items could not be copied." % notcopied
                 strg += "\nMissed items: "
@@ -2061,36 +2342,13 @@ class MiriDataModel(DataModel):
         Makes use of the search facilities in jwst.datamodels.schema
 
         """
-        # Define a function to be applied at each level of the schema.
-        def find_fits_elements(subschema, path, combiner, ctx, recurse):
-            hdu = subschema.get('fits_hdu')
-            if not hdu:
-                # If there isn't a 'fits_hdu' declaration an item
-                # is assumed to be in the PRIMARY HDU.
-                hdu = 'PRIMARY'
-            keyw = subschema.get('fits_keyword')
-            # Reject a null path or a null or blank keyword
-            if not path:
-                return
-            if not keyw or keyw == 'BLANK':
-                return
-            # Only include comment, history and builtin keywords if requested.
-            if not include_comments and keyw == 'COMMENT':
-                return
-            if not include_history and keyw == 'HISTORY':
-                return
-            if not include_builtin and mfits._is_builtin_fits_keyword(keyw):
-                return
-            # Work around bug in mfits
-            if not include_builtin and (keyw == 'SIMPLE' or keyw == 'EXTEND'):
-                return
-            comment = subschema.get('title')
-            kw = '.'.join(path)
-            results[kw] = (hdu, keyw, comment)
-
-        # Walk through the schema and apply the search function.
         results = {}
-        mschema.walk_schema(self.schema, find_fits_elements, results)
+        index = self._get_fits_index()
+        for (kw, hdu, keyw, comment) in index.select(
+                                        include_comments=include_comments,
+                                        include_history=include_history,
+                                        include_builtin=include_builtin):
+            results[kw] = (hdu, keyw, comment)
         return results
 
     def get_fits_header_dict(self, hdu_name='PRIMARY', include_undefined=False,
@@ -2135,41 +2393,59 @@ class MiriDataModel(DataModel):
         Makes use of the search facilities in jwst.datamodels.schema
 
         """
-        # Define a function to be applied at each level of the schema.
-        def find_fits_elements(subschema, path, combiner, ctx, recurse):
-            hdu = subschema.get('fits_hdu')
-            if not hdu:
-                # If there isn't a 'fits_hdu' declaration an item
-                # is assumed to be in the PRIMARY HDU.
-                hdu = 'PRIMARY'
-            if (hdu_name is not None) and (hdu != hdu_name):
-                return
-            keyw = subschema.get('fits_keyword')
-            # Reject a null path or a null or blank keyword
-            if not path:
-                return
-            if not keyw or keyw == 'BLANK':
-                return
-            # Only include comment, history and builtin keywords if requested.
-            if not include_comments and keyw == 'COMMENT':
-                return
-            if not include_history and keyw == 'HISTORY':
-                return
-            if not include_builtin and mfits._is_builtin_fits_keyword(keyw):
-                return
-            # Work around bug in mfits
-            if not include_builtin and (keyw == 'SIMPLE' or keyw == 'EXTEND'):
-                return
-            kw = '.'.join(path)
-            if not include_undefined and self[kw] is None:
-                return
-            results[keyw] = self[kw]
-
-        # Walk through the schema and apply the search function.
         results = {}
-        mschema.walk_schema(self.schema, find_fits_elements, results)
+        index = self._get_fits_index()
+        for (kw, hdu, keyw, comment) in index.select(hdu_name=hdu_name,
+                                        include_comments=include_comments,
+                                        include_history=include_history,
+                                        include_builtin=include_builtin):
+            value = self[kw]
+            if include_undefined or value is not None:
+                results[keyw] = value
         return results
 
+    def set_metadata_from_fits_headers(self, hdulist):
+        """
+
+        Set the metadata of this data model from the headers of a FITS
+        file, without reading any data. Only the metadata associated with
+        a FITS keyword in the schema are set. COMMENT, HISTORY and builtin
+        FITS keywords (such as NAXIS) are ignored, as are metadata stored
+        only in the ASDF extension.
+
+        :Parameters:
+
+        hdulist: pyfits.HDUList
+            The FITS HDU list from which to read the headers.
+
+        """
+        index = self._get_fits_index()
+        for (ii, hdu) in enumerate(hdulist):
+            if ii == 0:
+                hdu_name = 'PRIMARY'
+            else:
+                hdu_name = hdu.name
+            header = hdu.header
+            for (kw, hdu_name, keyw, comment) in \
+                    index.select(hdu_name=hdu_name):
+                if keyw in header:
+                    value = header[keyw]
+                    # Skip keywords with an undefined value.
+                    if value is None or \
+                       isinstance(value, pyfits.card.Undefined):
+                        continue
+                    # A value which is not valid for the schema is
+                    # skipped, so the rest of the metadata can be read.
+                    try:
+                        self[kw] = value
+                    except (ValidationError, ValidationWarning, KeyError,
+                            AttributeError, TypeError, ValueError) as e:
+                        strg = "Could not set %s from FITS keyword %s=%s " % \
+                            (kw, keyw, str(value))
+                        strg += "(%s). Keyword skipped." % \
+                            e.__class__.__name__
+                        warnings.warn(strg)
+
     def dataname_to_hduname(self, name):
         """
 
@@ -2390,26 +2666,11 @@ class MiriDataModel(DataModel):
         Makes use of the search facilities in jwst.datamodels.schema
 
         """
-        # Define a function to be applied at each level of the schema.
-        def find_fits_elements(subschema, path, combiner, ctx, recurse):
-            keyw = subschema.get('fits_keyword')
-            hdu = subschema.get('fits_hdu')
-            if not hdu:
-                # If there isn't a 'fits_hdu' declaration an item
-                # is assumed to be in the PRIMARY HDU.
-                hdu = 'PRIMARY'
-            if (keyw == keyword) and path:
-                kw = '.'.join(path)
-                value = self[kw]
-                results[kw] = (hdu, value)
-
-        # Walk through the schema and apply the search function.
         results = {}
-        mschema.walk_schema(self.schema, find_fits_elements, results)
-        vlist = []
-        for key in results:
-            vlist.append(results[key])
-        return vlist
+        index = self._get_fits_index()
+        for (kw, hdu) in index.keyword_paths.get(keyword, []):
+            results[kw] = (hdu, self[kw])
+        return list(results.values())
 
     def get_elements_for_fits_hdu(self, schema, hdu_name='PRIMARY'):
         """
@@ -2432,19 +2693,11 @@ class MiriDataModel(DataModel):
             paths to the metadata elements.
 
         """
-        def find_fits_elements(subschema, path, combiner, ctx, recurse):
-            hdu = subschema.get('fits_hdu')
-            if not hdu:
-                # If there isn't a 'fits_hdu' declaration an item
-                # is assumed to be in the PRIMARY HDU.
-                hdu = 'PRIMARY'
-            if hdu == hdu_name:
-                results[subschema.get('fits_keyword')] = '.'.join(path)
-
-        results = {}
-        mschema.walk_schema(schema, find_fits_elements, results)
-
-        return results
+        if schema is self.schema:
+            index = self._get_fits_index()
+        else:
+            index = _get_fits_index(schema)
+        return dict(index.hdu_elements.get(hdu_name, {}))
 
     def get_fits_keyword(self, keyword, hdu_name='PRIMARY'):
         """
@@ -36,12 +36,23 @@ https://jwst-pipeline.readthedocs.io/en/latest/jwst/datamodels/index.html
 27 Jun 2018: Added HasDataErrAndGroups class to be used with ramp data.
 12 Mar 2019: Removed use of astropy.extern.six (since Python 2 no longer used).
 12 Feb 2020: Added _check_broadcastable() methods.
+18 Oct 2026: Added combine() methods and in-place operators, which
+             write results into existing arrays. The error arrays are
+             combined in chunks using reusable scratch arrays.
+18 Oct 2026: DQ arrays are reduced with np.bitwise_or.reduce and masks
+             made by broadcasting, without np.where index lists. Masks are
+             reused while their DQ array is unchanged.
+18 Oct 2026: The scratch arrays used to combine the errors are released
+             at the end of each operation and the chunks are smaller.
 
 @author: Steven Beard (UKATC), Vincent Geers (UKATC)
 
 """
 
 import sys
+import zlib
+from collections import OrderedDict
+
 import numpy as np
 import numpy.ma as ma
 
@@ -89,6 +100,156 @@ def are_broadcastable( *shapes ):
         return True
 
 
+# The operations known to the combine() methods, with the numpy ufunc
+# used to apply them and the verb used in error messages.
+_OPERATIONS = {'add': (np.add, 'add'),
+               'subtract': (np.subtract, 'subtract'),
+               'multiply': (np.multiply, 'multiply'),
+               'divide': (np.true_divide, 'divide')}
+
+# The maximum number of elements processed at a time when combining
+# error arrays. This limits the size of the scratch buffers, which
+# need 2 MB each for 64-bit floats.
+_CHUNK_SIZE = 262144
+
+def _can_store(array, shape):
+    # True if the given array can hold a result of the given shape.
+    return isinstance(array, np.ndarray) and array.shape == shape and \
+        array.flags.writeable
+
+def _apply_ufunc(ufunc, operand1, operand2, out=None):
+    # Apply a binary ufunc, writing the result into the out array if it
+    # has the right shape and can hold the result data type. Otherwise
+    # a new array is returned. numpy handles any overlap between the
+    # out array and the operands.
+    shape = np.broadcast(operand1, operand2).shape
+    if _can_store(out, shape):
+        try:
+            return ufunc(operand1, operand2, out=out)
+        except TypeError:
+            # The result cannot be cast to the data type of the out array.
+            pass
+    return ufunc(operand1, operand2)
+
+def _copy_array(array, out=None):
+    # Return a copy of an array, written into the out array if possible.
+    if array is None or array is out:
+        return array
+    array = np.asarray(array)
+    if _can_store(out, array.shape):
+        try:
+            np.copyto(out, array, casting='same_kind')
+            return out
+        except TypeError:
+            pass
+    return array.copy()
+
+def _zeros_like(array, out=None):
+    # Return an array of zeros like the given array, reusing the out
+    # array if possible.
+    if _can_store(out, np.shape(array)):
+        out.fill(0)
+        return out
+    return np.zeros_like(array)
+
+def _store_array(datamodel, name, array):
+    # Store a result in a data model, unless it has been written
+    # directly into the existing array.
+    if array is not getattr(datamodel, name, None):
+        setattr(datamodel, name, array)
+
+def _chunks(shape, max_size=_CHUNK_SIZE):
+    # Generate the indices which split an array of the given shape into
+    # chunks of no more than max_size elements (but at least one element
+    # of the leading axes), by stepping through the leading axes and
+    # slicing the first axis which is too large to take in one go.
+    size = int(np.prod(shape))
+    if size <= max_size:
+        yield Ellipsis
+        return
+    naxes = 0
+    while naxes < len(shape) - 1 and size // shape[naxes] > max_size:
+        size //= shape[naxes]
+        naxes += 1
+    step = max(max_size // (size // shape[naxes]), 1)
+    for leading in np.ndindex(*shape[:naxes]):
+        for start in range(0, shape[naxes], step):
+            yield leading + (slice(start, start + step),)
+
+# The error combination kernels. Each writes its result into the out
+# array, using the scratch arrays for intermediate results. The out
+# array may be the same as the first error array, which is only read
+# before the out array is first written. The order of the operations
+# matches the formulae given in the HasDataErrAndDq methods.
+def _quadrature_kernel(out, scratch, error1, error2):
+    np.square(error1, out=out)
+    np.square(error2, out=scratch[0])
+    np.add(out, scratch[0], out=out)
+    np.sqrt(out, out=out)
+
+def _multiplicative_kernel(out, scratch, error1, error2, data1, data2):
+    np.square(error1, out=out)
+    np.multiply(out, np.square(data2, out=scratch[0]), out=out)
+    np.square(data1, out=scratch[0])
+    np.multiply(scratch[0], np.square(error2, out=scratch[1]),
+                out=scratch[0])
+    np.add(out, scratch[0], out=out)
+    np.sqrt(out, out=out)
+
+def _divisive_kernel(out, scratch, error1, error2, data1, data2):
+    np.square(data2, out=scratch[0])
+    np.square(error1, out=out)
+    np.divide(out, scratch[0], out=out)
+    np.square(error2, out=scratch[1])
+    np.multiply(scratch[1], np.square(data1, out=scratch[2]),
+                out=scratch[1])
+    np.multiply(scratch[0], scratch[0], out=scratch[0])
+    np.divide(scratch[1], scratch[0], out=scratch[1])
+    np.add(out, scratch[1], out=out)
+    np.sqrt(out, out=out)
+
+
+# The number of masks reused by each data model (see _generate_mask).
+_MASK_CACHE_SIZE = 2
+
+def _unsigned_dq(dq):
+    # Ensure a data quality array is of unsigned integer type, so bitwise
+    # operations are possible. Unsigned arrays are not copied.
+    dq = np.asarray(dq)
+    if dq.dtype.kind != 'u':
+        dq = np.asarray(dq, dtype=np.uint)
+    return dq
+
+def _dq_fingerprint(dq):
+    # A checksum of the contents of a data quality array, used to check
+    # whether the array has changed since a mask was made from it.
+    # None is returned if the array is not contiguous.
+    if dq.flags.c_contiguous:
+        return zlib.crc32(memoryview(dq).cast('B'))
+    return None
+
+def _make_dq_mask(shape, dq, bitmask=1):
+    # Make a boolean mask of the given shape which is True wherever the
+    # data quality flags selected by bitmask are set. A DQ array with
+    # more dimensions than the mask is combined along its leading axes
+    # with a bitwise OR. A DQ array with fewer dimensions is broadcast
+    # while the mask is made, so the full-size DQ array is never
+    # created. ma.nomask is returned if the shapes do not match.
+    dq = _unsigned_dq(dq)
+    ndim = len(shape)
+    if ndim < dq.ndim and jmutil.can_broadcast(dq.shape, shape):
+        dq = np.bitwise_or.reduce(dq, axis=tuple(range(dq.ndim - ndim)))
+    elif int(np.prod(shape)) < dq.size or \
+         not jmutil.can_broadcast(shape, dq.shape):
+        return ma.nomask
+    if bitmask is not None:
+        # None means all bits set.
+        dq = np.bitwise_and(dq, bitmask)
+    maskdq = np.empty(shape, dtype=bool)
+    np.not_equal(dq, 0, out=maskdq)
+    return maskdq
+
+
 class HasMask(object):
     """
     
@@ -335,83 +496,130 @@ class HasData(object):
         else:
             return True
 
-    def __add__(self, other):
+    def _combine_ancillary(self, other, op, kind, out):
         """
         
-        Add a scalar, an array or another MiriMeasuredModel object to
-        this MiriMeasuredModel object.
+        Helper function which combines any arrays other than the primary
+        data array. The base class has no other arrays. Subclasses
+        override this function to combine their error and data quality
+        arrays. It is called before the primary data array is changed.
+        
+        :Parameters:
+        
+        other: scalar, numpy array or DataModel
+            The second operand.
+        op: str
+            The operation: 'add', 'subtract', 'multiply' or 'divide'.
+        kind: str
+            The kind of second operand: 'scalar', 'array' or 'model'.
+        out: DataModel
+            The data model receiving the result.
+        
+        """
+        pass
+
+    def combine(self, other, op, out=None):
+        """
+        
+        Combine this data model with a scalar, an array or another
+        DataModel object, storing the result in a given data model.
+        
+        When out is this data model the arrays are updated in place,
+        and when out is another data model of the same shape the result
+        is written into its existing arrays, so no new arrays are needed
+        to hold the result. The operators +=, -=, *= and /= use this
+        function with out set to this data model.
+        
+        :Parameters:
+        
+        other: scalar, numpy array or DataModel
+            The second operand.
+        op: str
+            The operation: 'add', 'subtract', 'multiply' or 'divide'.
+        out: DataModel, optional
+            The data model receiving the result. The metadata of this
+            data model is copied to it. If not given, a new data model
+            of the same class is created (as by the +, -, * and /
+            operators).
+            
+        :Returns:
+        
+        out: DataModel
+            The data model containing the result.
+            
+        :Raises:
+        
+        ValueError
+            Raised if the operation is not recognised or if dividing
+            by a scalar zero.
+        TypeError
+            Raised if the second operand cannot be combined with this
+            data model.
         
         """
+        if op not in _OPERATIONS:
+            strg = "%s: Unknown operation \'%s\'. " % \
+                (self.__class__.__name__, str(op))
+            strg += "Must be one of %s." % str(sorted(_OPERATIONS.keys()))
+            raise ValueError(strg)
+        (ufunc, verb) = _OPERATIONS[op]
         # Check this object is capable of mathematical operation.
         self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-        
+
         if isinstance(other,(float,int)):
-            # A scalar quantity is being added.
-            newobject.data = self.data + other
-            
+            # A scalar quantity. Trap a divide by zero.
+            if op == 'divide' and np.abs(other) <= sys.float_info.epsilon:
+                strg = "%s: Divide by scalar zero!" % self.__class__.__name__
+                raise ValueError(strg)
+            kind = 'scalar'
+            operand = other
         elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being added to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data + np.asarray(other)
-            
+            # A data array. This should work provided the two arrays are
+            # broadcastable.
+            kind = 'array'
+            operand = np.asarray(other)
         elif isinstance(other, DataModel):
-            # Two data products are being added together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data + other.data
-            else:
+            # Another data product. Ensure it has a valid primary data array.
+            if not (hasattr(other, 'data') and self._isvalid(other.data)):
                 raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
+                                "primary data array.")
+            kind = 'model'
+            operand = other.data
         else:
-            strg = "Cannot add " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
+            strg = "Cannot %s " % verb + str(self.__class__.__name__)
+            strg += " and " + str(other.__class__.__name__) + " objects."
             raise TypeError(strg)
+
+        if out is None:
+            # Start with an empty version of the current object.
+            out = self.__class__()
+        if out is not self:
+            # Clone the metadata.
+            out.update( self )
+        # The other arrays may depend on the original primary data
+        # array, so they are combined first.
+        self._combine_ancillary(other, op, kind, out)
+        _store_array(out, 'data', _apply_ufunc(ufunc, self.data, operand,
+                                               getattr(out, 'data', None)))
+        return out
+
+    def __add__(self, other):
+        """
         
-        return newobject
+        Add a scalar, an array or another MiriMeasuredModel object to
+        this MiriMeasuredModel object.
+        
+        """
+        return self.combine(other, 'add')
 
     def __sub__(self, other):
         """
         
-        Subtract a scalar, an array or another MiriMeasuredModel object 
+        Subtract a scalar, an array or another MiriMeasuredModel object
         from this MiriMeasuredModel object.
         
         """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
- 
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being subtracted.
-            newobject.data = self.data - other
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being subtracted to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data - np.asarray(other)
-            
-        elif isinstance(other, DataModel):
-            # Two data products are being subtracted together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data - other.data
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot subtract " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
+        return self.combine(other, 'subtract')
 
     def __mul__(self, other):
         """
@@ -420,37 +628,7 @@ class HasData(object):
         another MiriMeasuredModel object.
         
         """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
- 
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being multiplied.
-            newobject.data = self.data * other
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being multiplied to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data * np.asarray(other)
-            
-        elif isinstance(other, DataModel):
-            # Two data products are being multiplied together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data * other.data
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot multiply " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
+        return self.combine(other, 'multiply')
        
     def __truediv__(self, other):
         """
@@ -459,48 +637,51 @@ class HasData(object):
         another MiriMeasuredModel object.
         
         """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
- 
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being divided.
-            if np.abs(other) <= sys.float_info.epsilon:
-                strg = "%s: Divide by scalar zero!" % self.__class__.__name__
-                del newobject
-                raise ValueError(strg)
-            newobject.data = self.data / other
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being multiplied to this product. This should
-            # work provided the two arrays are broadcastable.
-            # NOTE: Any divide by zero operations will be trapped by numpy.
-            newobject.data = self.data / np.asarray(other)
-            
-        elif isinstance(other, DataModel):
-            # The data product is being divided by another. Ensure they
-            # both have a valid primary data array.
-            # NOTE: Any divide by zero operations will be trapped by numpy.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data / other.data
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot divide " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
+        return self.combine(other, 'divide')
 
     # In Python 3, division is the same as true division.
     def __div__(self, other):
         return self.__truediv__(other)
 
+    def __iadd__(self, other):
+        """
+        
+        Add a scalar, an array or another MiriMeasuredModel object to
+        this MiriMeasuredModel object in place.
+        
+        """
+        return self.combine(other, 'add', out=self)
+
+    def __isub__(self, other):
+        """
+        
+        Subtract a scalar, an array or another MiriMeasuredModel object
+        from this MiriMeasuredModel object in place.
+        
+        """
+        return self.combine(other, 'subtract', out=self)
+
+    def __imul__(self, other):
+        """
+        
+        Multiply this MiriMeasuredModel object by a scalar, an array or
+        another MiriMeasuredModel object in place.
+        
+        """
+        return self.combine(other, 'multiply', out=self)
+
+    def __itruediv__(self, other):
+        """
+        
+        Divide this MiriMeasuredModel object by a scalar, an array or
+        another MiriMeasuredModel object in place.
+        
+        """
+        return self.combine(other, 'divide', out=self)
+
+    def __idiv__(self, other):
+        return self.__itruediv__(other)
+
 
 class HasDataErrAndDq(HasData):
     """
@@ -616,23 +797,10 @@ class HasDataErrAndDq(HasData):
         in a bitwise manner.
         
         """
-        # Ensure the input array is of unsigned integer type
-        dqarray = np.asarray(dqarray, dtype=np.uint)
-        # The new shape has the highest dimension removed
-        newshape = dqarray.shape[1:]
-        # Start with a DQ array full of zeros
-        newdq = np.zeros( newshape, dtype=np.uint)
-        # Split the data quality array along the highest
-        # axis into a list of pieces.
-        npieces = dqarray.shape[0]
-        for piece in np.split(dqarray, npieces, 0):
-            # Convert each piece into an N-1 dimensional array of integers.
-            # Each should be the same size and shape as the new DQ array.
-            npiece = np.asarray( np.squeeze( piece ), dtype=np.uint)
-            # Merge each new piece into the new DQ array with a bitwise OR
-            newdq |= npiece
-        # The result should be a new mask with reduced dimensionality
-        return newdq        
+        # The quality flags are combined along the highest axis with a
+        # bitwise OR, and the result converted to unsigned integer type.
+        dqarray = _unsigned_dq(dqarray)
+        return np.asarray(np.bitwise_or.reduce(dqarray, axis=0), dtype=np.uint)
 
     def _generate_mask(self, data, dq, bitmask=1):
         """
@@ -658,50 +826,35 @@ class HasDataErrAndDq(HasData):
             A mask which can be used with the data array.
     
         """
-#         print("+++ Generating mask from", data, "\nand", dq,
-#               "\nwith bitmask", bitmask)
         # A mask can only be generated when both arrays exist and
         # are not empty. The DATA array and DQ array must also be
         # broadcastable.
         if self._isvalid(data) and dq is not None:
-            # Ensure the data quality array is of unsigned integer type
-            # so bitwise operations are possible.
-            dq = np.asarray(dq, dtype=np.uint)
-            if data.ndim < dq.ndim and jmutil.can_broadcast(dq.shape, data.shape):
-                # The DQ array is larger than the array being masked.
-                # This is a special case.
-                # Shrink down the DQ array until the dimensions match.
-                shrunk_dq = self._shrink_dq(dq)
-                while (shrunk_dq.ndim > data.ndim):
-                    shrunk_dq = self._shrink_dq(shrunk_dq)
-
-                # Start with a zero (False) mask and mask off (set to True)
-                # all the pixels indicated by the DQ array.
-                maskdq = np.zeros(data.shape, dtype=np.bool)
-                if bitmask is None:
-                    # None means all bits set.
-                    bad = np.where(shrunk_dq != 0)
-                else:
-                    bad = np.where((shrunk_dq & bitmask) != 0)
-                maskdq[bad] = True
-                return maskdq
-      
-            elif data.size >= dq.size and jmutil.can_broadcast(data.shape, dq.shape):
-                # Broadcast the DQ array onto something the same shape
-                # as the data array.
-                datadq = np.zeros(data.shape, dtype=np.uint) + dq
-                # Start with a zero (False) mask and mask off (set to True)
-                # all the pixels indicated by the DQ array.
-                maskdq = np.zeros(data.shape, dtype=np.bool)
-                if bitmask is None:
-                    # None means all bits set.
-                    bad = np.where(datadq != 0)
-                else:
-                    bad = np.where((datadq & bitmask) != 0)
-                maskdq[bad] = True
-                return maskdq
-            else:
-                return ma.nomask # or None
+            dq = np.asarray(dq)
+            shape = np.shape(data)
+            # Masks made from unchanged data quality arrays are reused.
+            # A copy is returned because a masked array can change
+            # its mask.
+            key = (id(dq), bitmask, shape)
+            fingerprint = _dq_fingerprint(dq)
+            cache = getattr(self, '_mask_cache', None)
+            if cache is None:
+                cache = OrderedDict()
+                self._mask_cache = cache
+            if key in cache:
+                (cached_dq, cached_fingerprint, maskdq) = cache[key]
+                if cached_dq is dq and fingerprint is not None and \
+                   cached_fingerprint == fingerprint:
+                    cache.move_to_end(key)
+                    return maskdq.copy()
+                del cache[key]
+            maskdq = _make_dq_mask(shape, dq, bitmask=bitmask)
+            if fingerprint is not None and maskdq is not ma.nomask:
+                cache[key] = (dq, fingerprint, maskdq)
+                while len(cache) > _MASK_CACHE_SIZE:
+                    cache.popitem(last=False)
+                return maskdq.copy()
+            return maskdq
         else:
             return ma.nomask # or None
 
@@ -787,7 +940,43 @@ class HasDataErrAndDq(HasData):
         maskdq = self._generate_mask(data, dq)
         return ma.array(data, mask=maskdq, fill_value=fill_value)
 
-    def _combine_errors_maximum(self, error1, error2):
+    def _combine_errors(self, kernel, nscratch, out, *arrays):
+        """
+        
+        Helper function which applies one of the error combination
+        kernels to the given arrays, the first of which must be the
+        first error array.
+        
+        The result is written into the out array if it has the right
+        shape and only shares memory with the first error array.
+        Otherwise a new array is created. Large arrays are processed
+        in chunks, so the scratch arrays needed for the intermediate
+        results stay small. The scratch arrays are released when the
+        operation finishes.
+        
+        """
+        arrays = [np.asarray(array) for array in arrays]
+        shape = np.broadcast(*arrays).shape
+        if not _can_store(out, shape) or \
+           not np.can_cast(np.result_type(*arrays), out.dtype, 'same_kind') or \
+           (out is not arrays[0] and np.may_share_memory(out, arrays[0])) or \
+           any([np.may_share_memory(out, array) for array in arrays[1:]]):
+            dtype = np.result_type(*arrays)
+            if not np.issubdtype(dtype, np.inexact):
+                dtype = np.float64
+            out = np.empty(shape, dtype=dtype)
+        arrays = [np.broadcast_to(array, shape) for array in arrays]
+        buffers = [np.empty(min(out.size, _CHUNK_SIZE), dtype=out.dtype) \
+                   for ii in range(nscratch)]
+        for index in _chunks(shape):
+            outchunk = out[index]
+            scratch = [buffer[:outchunk.size].reshape(outchunk.shape) \
+                       for buffer in buffers]
+            kernel(outchunk, scratch, *[array[index] for array in arrays])
+        del buffers
+        return out
+
+    def _combine_errors_maximum(self, error1, error2, out=None):
         """
         
         Helper function to combine two error arrays and return the maximum.
@@ -798,16 +987,18 @@ class HasDataErrAndDq(HasData):
         the same error source and you prefer to believe the most pessimistic
         estimate. Use with care.
         
+        If given, the result is written into the out array when possible.
+        
         """
         # The end product will have an ERR unit only if both products
         # started with an ERR unit.
         if error1 is not None and error2 is not None:
-            newerr = np.maximum(error1, error2)
+            newerr = _apply_ufunc(np.maximum, error1, error2, out)
         else:
             newerr = None
         return newerr
 
-    def _combine_errors_quadrature(self, error1, error2):
+    def _combine_errors_quadrature(self, error1, error2, out=None):
         """
         
         Helper function to combine two error arrays in quadrature.
@@ -817,21 +1008,23 @@ class HasDataErrAndDq(HasData):
         of data with independent errors. This assumption might not
         be valid in all circumstances, so use with care.
         
+        If given, the result is written into the out array when possible.
+        
         """
         # The end product will have an ERR unit only if both products
         # started with an ERR unit.
         if error1 is not None and error2 is not None:
+            # newerr = sqrt(err1^2 + err2^2)
             # NOTE: These operations might cause an overflow
             # for some data types.
-            err1sq = np.square(error1)
-            err2sq = np.square(error2)
-            sumsq = err1sq + err2sq
-            newerr = np.sqrt(sumsq)
+            newerr = self._combine_errors(_quadrature_kernel, 1, out,
+                                          error1, error2)
         else:
             newerr = None
         return newerr
 
-    def _combine_errors_multiplicative(self, error1, error2, data1, data2):
+    def _combine_errors_multiplicative(self, error1, error2, data1, data2,
+                                       out=None):
         """
         
         Helper function to combine two error arrays in quadrature,
@@ -845,28 +1038,29 @@ class HasDataErrAndDq(HasData):
         of data with independent errors. This assumption might not
         be valid in all circumstances, so use with care.
         
+        If given, the result is written into the out array when possible.
+        
         """
         # The end product will have an ERR unit only if both products
         # started with an ERR unit.
         if error1 is not None and error2 is not None:
             if data1 is not None and data2 is not None:
+                # newerr = sqrt(data2^2 * err1^2 + data1^2 * err2^2)
                 # NOTE: These operations might cause an overflow
                 # for some data types.
-                data1sq = np.square(data1)
-                data2sq = np.square(data2)
-                err1sq = np.square(error1)
-                err2sq = np.square(error2)
-                sumsq = (data2sq * err1sq) + (data1sq * err2sq)
                 #newerr = np.sqrt(sumsq) / (data1sq+data2sq) ???
-                newerr = np.sqrt(sumsq)
+                newerr = self._combine_errors(_multiplicative_kernel, 2, out,
+                                              error1, error2, data1, data2)
             else:
                 # Without the data arrays the weighting is unknown.
-                return self._combine_errors_quadrature(error1, error2)
+                return self._combine_errors_quadrature(error1, error2,
+                                                       out=out)
         else:
             newerr = None
         return newerr
 
-    def _combine_errors_divisive(self, error1, error2, data1, data2):
+    def _combine_errors_divisive(self, error1, error2, data1, data2,
+                                 out=None):
         """
         
         Helper function to combine two error arrays in quadrature,
@@ -884,36 +1078,35 @@ class HasDataErrAndDq(HasData):
         of data with independent errors. This assumption might not
         be valid in all circumstances, so use with care.
         
+        If given, the result is written into the out array when possible.
+        
         """
         # The end product will have an ERR unit only if both products
         # started with an ERR unit.
         if error1 is not None and error2 is not None:
             if data1 is not None and data2 is not None:
+                # newerr = sqrt(err1^2 / data2^2 +
+                #               (err2^2 * data1^2) / (data2^2 * data2^2))
                 # NOTE: These operations might cause an overflow
                 # for some data types.
-                data1sq = np.square(data1)
-                data2sq = np.square(data2)
                 # NOTE: The errors will blow up if any of the data2sq values
                 # are close to zero. There might be a divide by zero.
-                err1sq = np.square(error1)
-                err2sq = np.square(error2)
-                sumsq = (err1sq / data2sq) + \
-                        ((err2sq * data1sq) / (data2sq * data2sq))
-#                 sumsq = (data2weight * err1sq) + (data1sq * err2sq)
                 
                 # Comment by Juergen Schreiber:
                 # Shouldn't the error propagation according to Gauss be
                 # sqrt(err1sq*sci2weight + err2sq*sci1sq/(sci2sq*sci2sq))
                 # since the partial derivation of a/b on b is -a/(b*b)
-                newerr = np.sqrt(sumsq)
+                newerr = self._combine_errors(_divisive_kernel, 3, out,
+                                              error1, error2, data1, data2)
             else:
                 # Without the data arrays the weighting is unknown.
-                return self._combine_errors_quadrature(error1, error2)
+                return self._combine_errors_quadrature(error1, error2,
+                                                       out=out)
         else:
             newerr = None
         return newerr
 
-    def _combine_quality(self, dq1, dq2):
+    def _combine_quality(self, dq1, dq2, out=None):
         """
         
         Helper function to combine the quality arrays of two
@@ -921,267 +1114,94 @@ class HasDataErrAndDq(HasData):
         either of the two products is flagged as bad in the
         result.
         
+        If given, the result is written into the out array when possible.
+        
         """
+        if out is not None and dq1 is not None and dq2 is not None:
+            return _apply_ufunc(np.bitwise_or, dq1, dq2, out)
         return combine_quality(dq1, dq2)
 
-    def __add__(self, other):
+    def _combine_err(self, other, op, kind, out):
         """
         
-        Add a scalar, an array or another DataModel object to
-        this MiriMeasuredModel object.
+        Helper function which combines the error array of this object
+        with a scalar, an array or another DataModel object and stores
+        the result in the out object.
         
         """
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-        
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being added. Add to the SCI array but
-            # leave the ERR and DQ arrays as they are.
-            newobject.data = self.data + other
-            if not self.noerr:
-                newobject.err = self.err
-            newobject.dq = self.dq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being added to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data + np.asarray(other)
-            # Adding a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.dq = self.dq
-             
-        elif isinstance(other, DataModel):
-            # Two data products are being added together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data + other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = \
-                            self._combine_errors_quadrature(self.err,
-                                                            other.err)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-                    
-                if hasattr(other, 'dq') and self._isvalid(other.dq):
-                    newobject.dq = self._combine_quality(self.dq, other.dq)
+        if self.noerr:
+            return
+        current = getattr(out, 'err', None)
+        if kind == 'scalar':
+            if op in ('add', 'subtract'):
+                # Adding or subtracting a scalar leaves the ERR array
+                # as it is.
+                newerr = _copy_array(self.err, current)
             else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot add " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-        
-        return newobject
-
-    def __sub__(self, other):
-        """
-        
-        Subtract a scalar, an array or another DataModel object from
-        this MiriMeasuredModel object.
-        
-        """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being subtracted. Subtract from the SCI
-            # array but leave the ERR and DQ arrays as they are.
-            newobject.data = self.data - other
-            if not self.noerr:
-                newobject.err = self.err
-            newobject.dq = self.dq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being subtracted to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data - np.asarray(other)
-            # Adding a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.dq = self.dq
-            
-        elif isinstance(other, DataModel):
-            # Two data products are being subtracted. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data - other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = \
-                            self._combine_errors_quadrature(self.err, other.err)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-                    
-                if hasattr(other, 'dq') and self._isvalid(other.dq):
-                    newobject.dq = self._combine_quality(self.dq, other.dq)
+                # Multiplying or dividing by a scalar scales the ERR array.
+                newerr = _apply_ufunc(_OPERATIONS[op][0], self.err, other,
+                                      current)
+        elif kind == 'model' and hasattr(other, 'err') and \
+             self._isvalid(other.err):
+            if op in ('add', 'subtract'):
+                newerr = self._combine_errors_quadrature(self.err, other.err,
+                                                         out=current)
+            elif op == 'multiply':
+                newerr = self._combine_errors_multiplicative( \
+                                self.err, other.err, self.data, other.data,
+                                out=current)
             else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
+                newerr = self._combine_errors_divisive( \
+                                self.err, other.err, self.data, other.data,
+                                out=current)
         else:
-            strg = "Cannot subtract " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
+            # Combining with a plain data array erases the error
+            # information. If only one error array is known, the combined
+            # error also becomes unknown.
+            newerr = _zeros_like(self.err, current)
+        _store_array(out, 'err', newerr)
 
-    def __mul__(self, other):
+    def _combine_dq_array(self, name, other, kind, out):
         """
         
-        Multiply this MiriMeasuredModel object by a scalar, an array or
-        another DataModel object.
+        Helper function which combines the named data quality array
+        of this object with the matching array of another DataModel
+        object and stores the result in the out object. Combining with
+        a scalar or plain data array leaves the quality flags as they are.
         
-        """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being multiplied. Multiply the SCI and ERR
-            # arrays but leave the DQ array as it is.
-            newobject.data = self.data * other
-            if not self.noerr:
-                newobject.err = self.err * other
-            newobject.dq = self.dq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being multiplied to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data * np.asarray(other)
-            # Multiplying a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.dq = self.dq
-            
-        elif isinstance(other, DataModel):
-            # Two data products are being multiplied together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data * other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = self._combine_errors_multiplicative( \
-                                            self.err, other.err, self.data,
-                                            other.data)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-
-                if hasattr(other, 'dq') and self._isvalid(other.dq):
-                    newobject.dq = self._combine_quality(self.dq, other.dq)
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
+        """
+        dq1 = getattr(self, name, None)
+        current = getattr(out, name, None)
+        if kind == 'model' and hasattr(other, name) and \
+           self._isvalid(getattr(other, name)):
+            newdq = self._combine_quality(dq1, getattr(other, name),
+                                          out=current)
         else:
-            strg = "Cannot multiply " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
+            newdq = _copy_array(dq1, current)
+        _store_array(out, name, newdq)
 
-        return newobject
-       
-    def __truediv__(self, other):
+    def _combine_ancillary(self, other, op, kind, out):
         """
         
-        Divide this MiriMeasuredModel object by a scalar, an array or
-        another DataModel object.
+        Helper function which combines the ERR and DQ arrays.
+        See HasData._combine_ancillary.
         
-        """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being divided. Divide the SCI and ERR
-            # arrays but leave the DQ array as it is.
-            # Trap a divide by zero..
-            if np.abs(other) <= sys.float_info.epsilon:
-                strg = "%s: Divide by scalar zero!" % self.__class__.__name__
-                del newobject
-                raise ValueError(strg)
-            newobject.data = self.data / other
-            if not self.noerr:
-                newobject.err = self.err / other
-            newobject.dq = self.dq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being multiplied to this product. This should
-            # work provided the two arrays are broadcastable.
-            # NOTE: Any divide by zero operations will be trapped by numpy.
-            newobject.data = self.data / np.asarray(other)
-            # Dividing by a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.dq = self.dq
-            
-        elif isinstance(other, DataModel):
-            # The data product is being divided by another. Ensure they
-            # both have a valid primary data array.
-            # NOTE: Any divide by zero operations will be trapped by numpy.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data / other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = self._combine_errors_divisive( \
-                                            self.err, other.err, self.data,
-                                            other.data)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-
-                if hasattr(other, 'dq') and self._isvalid(other.dq):
-                    newobject.dq = self._combine_quality(self.dq, other.dq)
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot divide " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
-
-    # From Python 3, division is the same as true division.
-    def __div__(self, other):
-        return self.__truediv__(other)
+        """
+        self._combine_err(other, op, kind, out)
+        self._combine_dq_array('dq', other, kind, out)
 
     @property
     def data_masked(self):
         # Generate the masked data on the fly. This ensures the
         # masking is always up to date with the latest dq array.
-        # TODO: Can this result be cached and the cache invalidated
-        # when either the data or dq arrays change?
-        if self.data is not None and self.data.ndim > 0 and self.dq is not None:
-            if np.all(self.dq == 0):
+        # The mask is reused while the dq array is unchanged.
+        dq = self.dq
+        if self.data is not None and self.data.ndim > 0 and dq is not None:
+            if not np.any(dq):
                 # All data good.
                 return self.data
             else:
-                self._data_mask = self._generate_mask(self.data, self.dq)
+                self._data_mask = self._generate_mask(self.data, dq)
                 self._data_fill_value = self._generate_fill(self.data,
                                                             self._data_fill)
                 return ma.array(self.data, mask=self._data_mask,
@@ -1193,16 +1213,16 @@ class HasDataErrAndDq(HasData):
     def err_masked(self):
         # Generate the masked error array on the fly. This ensures the
         # masking is always up to date with the latest dq array.
-        # TODO: Can this result be cached and the cache invalidated
-        # when either the err or dq arrays change?
+        # The mask is reused while the dq array is unchanged.
         if self.noerr:
             return None
-        if self.err is not None and self.err.ndim > 0 and self.dq is not None:
-            if np.all(self.dq == 0):
+        dq = self.dq
+        if self.err is not None and self.err.ndim > 0 and dq is not None:
+            if not np.any(dq):
                 # All data good.
                 return self.err
             else:
-                self._err_mask = self._generate_mask(self.err, self.dq)
+                self._err_mask = self._generate_mask(self.err, dq)
                 self._err_fill_value = self._generate_fill(self.err,
                                                            self._err_fill)
                 return ma.array(self.err, mask=self._err_mask,
@@ -1241,267 +1261,16 @@ class HasDataErrAndGroups(HasDataErrAndDq):
         super(HasDataErrAndGroups, self).__init__(data=data, err=err, dq=None,
                                                   noerr=noerr )
 
-    def __add__(self, other):
+    def _combine_ancillary(self, other, op, kind, out):
         """
         
-        Add a scalar, an array or another DataModel object to
-        this MiriMeasuredModel object.
+        Helper function which combines the ERR, PIXELDQ and GROUPDQ
+        arrays. See HasData._combine_ancillary.
         
         """
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-        
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being added. Add to the SCI array but
-            # leave the ERR and DQ arrays as they are.
-            newobject.data = self.data + other
-            if not self.noerr:
-                newobject.err = self.err
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being added to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data + np.asarray(other)
-            # Adding a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-             
-        elif isinstance(other, DataModel):
-            # Two data products are being added together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data + other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = \
-                            self._combine_errors_quadrature(self.err,
-                                                            other.err)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-                    
-                if hasattr(other, 'pixeldq') and self._isvalid(other.pixeldq):
-                    newobject.pixeldq = self._combine_quality(self.pixeldq, other.pixeldq)
-                if hasattr(other, 'groupdq') and self._isvalid(other.groupdq):
-                    newobject.groupdq = self._combine_quality(self.groupdq, other.groupdq)
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot add " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-        
-        return newobject
-
-    def __sub__(self, other):
-        """
-        
-        Subtract a scalar, an array or another DataModel object from
-        this MiriMeasuredModel object.
-        
-        """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being subtracted. Subtract from the SCI
-            # array but leave the ERR and DQ arrays as they are.
-            newobject.data = self.data - other
-            if not self.noerr:
-                newobject.err = self.err
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being subtracted to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data - np.asarray(other)
-            # Adding a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, DataModel):
-            # Two data products are being subtracted. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data - other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = \
-                            self._combine_errors_quadrature(self.err, other.err)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-                    
-                if hasattr(other, 'pixeldq') and self._isvalid(other.pixeldq):
-                    newobject.pixeldq = self._combine_quality(self.pixeldq, other.pixeldq)
-                if hasattr(other, 'groupdq') and self._isvalid(other.groupdq):
-                    newobject.groupdq = self._combine_quality(self.groupdq, other.groupdq)
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot subtract " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
-
-    def __mul__(self, other):
-        """
-        
-        Multiply this MiriMeasuredModel object by a scalar, an array or
-        another DataModel object.
-        
-        """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being multiplied. Multiply the SCI and ERR
-            # arrays but leave the DQ array as it is.
-            newobject.data = self.data * other
-            if not self.noerr:
-                newobject.err = self.err * other
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being multiplied to this product. This should
-            # work provided the two arrays are broadcastable.
-            newobject.data = self.data * np.asarray(other)
-            # Multiplying a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, DataModel):
-            # Two data products are being multiplied together. Ensure they
-            # both have a valid primary data array.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data * other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = self._combine_errors_multiplicative( \
-                                            self.err, other.err, self.data,
-                                            other.data)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-
-                if hasattr(other, 'pixeldq') and self._isvalid(other.pixeldq):
-                    newobject.pixeldq = self._combine_quality(self.pixeldq, other.pixeldq)
-                if hasattr(other, 'groupdq') and self._isvalid(other.groupdq):
-                    newobject.groupdq = self._combine_quality(self.groupdq, other.groupdq)
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot multiply " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
-       
-    def __truediv__(self, other):
-        """
-        
-        Divide this MiriMeasuredModel object by a scalar, an array or
-        another DataModel object.
-        
-        """  
-        # Check this object is capable of mathematical operation.
-        self._check_for_data()
-        # Start with an empty version of the current object and clone
-        # the metadata.
-        newobject = self.__class__()
-        newobject.update( self )
-
-        if isinstance(other,(float,int)):
-            # A scalar quantity is being divided. Divide the SCI and ERR
-            # arrays but leave the DQ array as it is.
-            # Trap a divide by zero..
-            if np.abs(other) <= sys.float_info.epsilon:
-                strg = "%s: Divide by scalar zero!" % self.__class__.__name__
-                del newobject
-                raise ValueError(strg)
-            newobject.data = self.data / other
-            if not self.noerr:
-                newobject.err = self.err / other
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, (ma.masked_array,np.ndarray,list,tuple)):
-            # A data array is being multiplied to this product. This should
-            # work provided the two arrays are broadcastable.
-            # NOTE: Any divide by zero operations will be trapped by numpy.
-            newobject.data = self.data / np.asarray(other)
-            # Dividing by a plain data array erases the error information.
-            if not self.noerr:
-                newobject.err = np.zeros_like(self.err)
-            newobject.pixeldq = self.pixeldq
-            newobject.groupdq = self.groupdq
-            
-        elif isinstance(other, DataModel):
-            # The data product is being divided by another. Ensure they
-            # both have a valid primary data array.
-            # NOTE: Any divide by zero operations will be trapped by numpy.
-            if hasattr(other, 'data') and self._isvalid(other.data):
-                newobject.data = self.data / other.data
-                if not self.noerr:
-                    if hasattr(other, 'err') and self._isvalid(other.err):
-                        newobject.err = self._combine_errors_divisive( \
-                                            self.err, other.err, self.data,
-                                            other.data)
-                    else:
-                        # If only one error array is known, the combined error
-                        # becomes unknown.
-                        newobject.err = np.zeros_like(self.err)
-
-                if hasattr(other, 'pixeldq') and self._isvalid(other.pixeldq):
-                    newobject.pixeldq = self._combine_quality(self.pixeldq, other.pixeldq)
-                if hasattr(other, 'groupdq') and self._isvalid(other.groupdq):
-                    newobject.groupdq = self._combine_quality(self.groupdq, other.groupdq)
-            else:
-                raise TypeError("Both data products must contain a " + \
-                                "primary data array.")            
-        else:
-            strg = "Cannot divide " + str(self.__class__.__name__)
-            strg += " and " + str(other.__class__.__name__) + "objects."
-            del newobject
-            raise TypeError(strg)
-
-        return newobject
-
-    # From Python 3, division is the same as true division.
-    def __div__(self, other):
-        return self.__truediv__(other)
+        self._combine_err(other, op, kind, out)
+        self._combine_dq_array('pixeldq', other, kind, out)
+        self._combine_dq_array('groupdq', other, kind, out)
 
 #
 # A minimal test is run when this file is run as a main program.
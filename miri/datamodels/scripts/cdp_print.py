@@ -17,6 +17,8 @@
 #              changed to meta.reftype. TYPE keyword replaced by DATAMODL.
 # 02 Nov 2018: Added ability to display metadata info and/or a data summary
 #              instead of the full data listing.
+# 18 Oct 2026: Only read the file headers when displaying metadata only,
+#              and memory-map the data otherwise.
 #
 # @author: Steven Beard (UKATC)
 #
@@ -138,8 +140,13 @@ if __name__ == "__main__":
         datatype = ''
 
     # Display the data model using the class derived from the
-    # data type.
-    with miri.datamodels.open( init=inputfile, astype=datatype ) as datamodel:
+    # data type. When only the metadata are displayed the data are not
+    # read. Otherwise they are memory-mapped, so only the data needed
+    # are read.
+    header_only = infoonly and not (statsonly or makeplot or writefile)
+    with miri.datamodels.open( init=inputfile, astype=datatype,
+                               lazy=True,
+                               header_only=header_only ) as datamodel:
         if hasattr(datamodel.meta, 'reftype'):
             datatype = datamodel.meta.reftype
             strg = "The data model is of type \'%s\'" % str(datatype)
@@ -4,6 +4,12 @@
 # 
 # 02 Jul 2013: Created.
 # 27 May 2015: Replaced pyfits with astropy.io.fits
+# 18 Oct 2026: The slope data are assembled in arrays of the types
+#              given in the slope data schema (float32 rather than
+#              float64) and the data product is no longer copied.
+# 18 Oct 2026: A file of ramp data is converted by fitting the ramps
+#              with fit_ramps_file, a block of rows at a time from the
+#              memory-mapped file.
 #
 # @author: Steven Beard (UKATC)
 #
@@ -14,6 +20,11 @@ Script `convert_slope_data` converts a LVL2 file of slope data in DHAS
 format into standard MIRI format. The script relies on the MIRI slope
 data product, which is based on the STScI data model.
 
+If the input file contains ramp data (a 4-D SCI extension) instead,
+a straight line is fitted to the ramps to make the slope data. The ramps
+are fitted a block of rows at a time from the memory-mapped file, so the
+whole file is never read into memory.
+
 The following command arguments are defined by position:
 
     inputfile[0]
@@ -41,6 +52,44 @@ import numpy as np
 import astropy.io.fits as pyfits
 
 from miri.datamodels.miri_measured_model import MiriSlopeModel
+from miri.tools.ramp_fitting import fit_ramps_file
+
+def is_ramp_file( filename ):
+    """
+    
+    Returns True if the given FITS file contains ramp data (a SCI
+    extension with 4 dimensions) rather than DHAS slope data.
+    
+    """
+    with pyfits.open(filename, memmap=True) as hdulist:
+        if 'SCI' in hdulist:
+            return (hdulist['SCI'].header.get('NAXIS', 0) == 4)
+    return False
+
+def fit_ramp_data( filename ):
+    """
+    
+    Fits a straight line to the ramps contained in a FITS file (such as
+    a MIRI level 1b exposure) and returns the slope data arrays in the
+    same form as load_dhas_lvl2. The ramps are fitted a block of rows at
+    a time by fit_ramps_file, excluding the groups and pixels flagged in
+    the GROUPDQ and PIXELDQ extensions. Ramps which cannot be fitted are
+    flagged as DO_NOT_USE.
+    
+    """
+    with pyfits.open(filename, memmap=True) as hdulist:
+        header = hdulist[0].header.copy()
+        ngroups = hdulist['SCI'].header['NAXIS3']
+    (slope, intercept, slope_err) = fit_ramps_file( filename, use_dq=True )
+    signal = slope.astype(np.float32)
+    err = slope_err.astype(np.float32)
+    zeropt = intercept.astype(np.float32)
+    del slope, intercept, slope_err
+    dq = np.isnan(signal).astype(np.uint32)
+    nreads = np.full(signal.shape, ngroups, dtype=np.int32)
+    readsat = np.full(signal.shape, -1, dtype=np.int32)
+    ngoodseg = np.ones(signal.shape, dtype=np.int32)
+    return header, signal, err, dq, zeropt, nreads, readsat, ngoodseg, None
 
 def load_dhas_lvl2( filename ):
     """
@@ -75,14 +124,16 @@ def load_dhas_lvl2( filename ):
         if nints > 0:
             slopeshape = [nints, avgdata.shape[1], avgdata.shape[2]]
             
-            signal = np.zeros(slopeshape)
-            err = np.zeros(slopeshape)
-            dq = np.ones(slopeshape, dtype=np.uint16)
-            zeropt = np.zeros(slopeshape)
-            nreads = np.zeros(slopeshape, dtype=np.uint16)
-            readsat = np.zeros(slopeshape, dtype=np.uint16)
-            ngoodseg = np.zeros(slopeshape, dtype=np.uint16)
-            fiterr = np.zeros(slopeshape)
+            # The arrays have the types given in the slope data schema,
+            # so they are not converted (and copied) again when saved.
+            signal = np.zeros(slopeshape, dtype=np.float32)
+            err = np.zeros(slopeshape, dtype=np.float32)
+            dq = np.ones(slopeshape, dtype=np.uint32)
+            zeropt = np.zeros(slopeshape, dtype=np.float32)
+            nreads = np.zeros(slopeshape, dtype=np.int32)
+            readsat = np.zeros(slopeshape, dtype=np.int32)
+            ngoodseg = np.zeros(slopeshape, dtype=np.int32)
+            fiterr = np.zeros(slopeshape, dtype=np.float32)
             
             intnum = 0
             for hdunum in range(1, len(hdulist)):
@@ -125,8 +176,8 @@ if __name__ == "__main__":
     # Parse arguments
     help_text = __doc__
     usage = "%prog [opt] inputfile outputfile\n"
-    usage += "Converts a DHAS format LVL2 slope data into "
-    usage += "standard MIRI slope data format."
+    usage += "Converts a DHAS format LVL2 slope data (or fits ramp data) "
+    usage += "into standard MIRI slope data format."
     parser = optparse.OptionParser(usage)
     parser.add_option("-v", "--verbose", dest="verb", action="store_true",
                       help="Verbose mode"
@@ -156,17 +207,27 @@ if __name__ == "__main__":
     makeplot = options.makeplot
     overwrite = options.overwrite
 
-    # Read the header and data from given file.
+    # Read the header and data from given file, fitting the ramps
+    # if the file contains ramp data.
     if verb:
         print("Reading %s" % inputfile)
-    (header, signal, err, dq, zeropt, nreads, readsat, ngoodseg, fiterr) = \
-        load_dhas_lvl2( inputfile )
-
-
-    # Convert the DHAS mask into a MIRI CDP mask
-    with MiriSlopeModel( init=inputfile ) as oldproduct:
-        # Make a copy of the data product just created.
-        slopeproduct = oldproduct.copy()
+    if is_ramp_file( inputfile ):
+        (header, signal, err, dq, zeropt, nreads, readsat, ngoodseg,
+         fiterr) = fit_ramp_data( inputfile )
+        slopeproduct = MiriSlopeModel( data=signal, err=err, dq=dq,
+                                       zeropt=zeropt, nreads=nreads,
+                                       readsat=readsat, ngoodseg=ngoodseg )
+        with pyfits.open(inputfile, memmap=True) as hdulist:
+            slopeproduct.set_metadata_from_fits_headers( hdulist )
+    else:
+        (header, signal, err, dq, zeropt, nreads, readsat, ngoodseg,
+         fiterr) = load_dhas_lvl2( inputfile )
+        # The data product read from the input file is used to make the
+        # output product. Its arrays are replaced in place (rather than
+        # copying the product, which would duplicate the data in memory),
+        # so the product read from the input file is consumed. The input
+        # file itself is not changed.
+        slopeproduct = MiriSlopeModel( init=inputfile )
         slopeproduct.data = signal
         slopeproduct.err = err
         slopeproduct.dq = dq
@@ -175,7 +236,9 @@ if __name__ == "__main__":
         slopeproduct.readsat = readsat
         slopeproduct.ngoodseg = nreads
         slopeproduct.fiterr = fiterr
-        
+    del signal, err, dq, zeropt, nreads, readsat, ngoodseg, fiterr
+
+    try:
         # Apply modifications required to meet CDP-1 specifications
         if 'READOUT' in header and not slopeproduct.meta.exposure.readpatt:
             slopeproduct.meta.exposure.readpatt = header['READOUT']
@@ -192,5 +255,6 @@ if __name__ == "__main__":
         slopeproduct.save( outputfile, overwrite=overwrite)
         if verb:
             print("Data saved to %s\n" % outputfile)
-            
-        del oldproduct, slopeproduct
+    finally:
+        slopeproduct.close()
+        del slopeproduct
@@ -23,6 +23,9 @@ packages.
 12 Jul 2017: Replaced "clobber" parameter with "overwrite".
 17 Oct 2019: Moved from MiriTeam/spectroscopy to MiriTE/datamodels
              to work around a problem with AsdfExtension.
+18 Oct 2026: The flatten functions skip the DQ-flagged elements directly
+             when masked=True, instead of making masked arrays, so the
+             data can be flattened a block at a time.
 
 @author: Steven Beard (UKATC), Ruyman Azzollini (DIAS)
 
@@ -303,9 +306,9 @@ class Spectrum2D(Spectrum1D):
             if all of the contributing pixels are bad (and use the
             error array to mark the reduction in quality).
         masked: bool, optional
-            Set to True to use the masked versions of the data arrays.
-            By default, the non-masked versions are used. This is more
-            efficient but may generate runtime warning messages.
+            Set to True to exclude the data elements masked by the
+            DQ array (those flagged DO_NOT_USE) from the result.
+            By default, all the data elements are used.
 
         :Returns:
 
@@ -313,17 +316,17 @@ class Spectrum2D(Spectrum1D):
             A 1-D spectrum object containing the extracted spectrum.        
 
         """
+        # The DO_NOT_USE flag (bit 0) marks the elements hidden by the
+        # masked versions of the data arrays.
         if masked:
-            (flat_data, flat_error, flat_quality) = \
-                spec2d_to_spec1d(self.data_masked,
-                                 self.err_masked, self.dq,
-                                 waveaxis=self.waveaxis,
-                                 weighted=weighted, perfect=perfect)
+            bitmask = 1
         else:
-            (flat_data, flat_error, flat_quality) = \
+            bitmask = None
+        (flat_data, flat_error, flat_quality) = \
                 spec2d_to_spec1d(self.data, self.err, self.dq,
                                  waveaxis=self.waveaxis,
-                                 weighted=weighted, perfect=perfect)
+                                 weighted=weighted, perfect=perfect,
+                                 bitmask=bitmask)
         title = "(flattened to 1-D spectrum)"
 
         # NOTE: The STScI data model doesn't not support masked arrays,
@@ -499,9 +502,9 @@ class Spectrum3D(Spectrum1D):
             if all of the contributing pixels are bad (and use the
             error array to mark the reduction in quality).
         masked: bool, optional
-            Set to True to use the masked versions of the data arrays.
-            By default, the non-masked versions are used. This is more
-            efficient but may generate runtime warning messages.
+            Set to True to exclude the data elements masked by the
+            DQ array (those flagged DO_NOT_USE) from the result.
+            By default, all the data elements are used.
 
         :Returns:
 
@@ -509,17 +512,17 @@ class Spectrum3D(Spectrum1D):
             A 2-D image object containing the averaged image.        
         
         """
+        # The DO_NOT_USE flag (bit 0) marks the elements hidden by the
+        # masked versions of the data arrays.
         if masked:
-            (flat_data, flat_error, flat_quality) = \
-                spec3d_to_image(self.data_masked,
-                                self.err_masked, self.dq,
-                                waveaxis=self.waveaxis,
-                                weighted=weighted, perfect=perfect)
+            bitmask = 1
         else:
-            (flat_data, flat_error, flat_quality) = \
+            bitmask = None
+        (flat_data, flat_error, flat_quality) = \
                 spec3d_to_image(self.data, self.err, self.dq,
                                 waveaxis=self.waveaxis,
-                                weighted=weighted, perfect=perfect)
+                                weighted=weighted, perfect=perfect,
+                                bitmask=bitmask)
         title = "(flattened to image)"
 
         # NOTE: The STScI data model doesn't not support masked arrays,
@@ -556,9 +559,9 @@ class Spectrum3D(Spectrum1D):
             if all of the contributing pixels are bad (and use the
             error array to mark the reduction in quality).
         masked: bool, optional
-            Set to True to use the masked versions of the data arrays.
-            By default, the non-masked versions are used. This is more
-            efficient but may generate runtime warning messages.
+            Set to True to exclude the data elements masked by the
+            DQ array (those flagged DO_NOT_USE) from the result.
+            By default, all the data elements are used.
 
         :Returns:
 
@@ -566,17 +569,17 @@ class Spectrum3D(Spectrum1D):
             A 1-D spectrum object containing the extracted spectrum.        
         
         """
+        # The DO_NOT_USE flag (bit 0) marks the elements hidden by the
+        # masked versions of the data arrays.
         if masked:
-            (flat_data, flat_error, flat_quality) = \
-                spec3d_to_spec1d(self.data_masked,
-                                 self.err_masked, self.dq,
-                                 waveaxis=self.waveaxis,
-                                 weighted=weighted, perfect=perfect)
+            bitmask = 1
         else:
-            (flat_data, flat_error, flat_quality) = \
+            bitmask = None
+        (flat_data, flat_error, flat_quality) = \
                 spec3d_to_spec1d(self.data, self.err, self.dq,
                                  waveaxis=self.waveaxis,
-                                 weighted=weighted, perfect=perfect)
+                                 weighted=weighted, perfect=perfect,
+                                 bitmask=bitmask)
         title = "(flattened to 1-D spectrum)"
 
         # NOTE: The STScI data model doesn't not support masked arrays,
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+
+Module test_cdp_cache - Contains the unit tests for the CDPModelCache
+class in the datamodels.cdplib module.
+
+:History:
+
+18 Oct 2026: Created.
+18 Oct 2026: Test get_cdp with a CDP file which has already been found.
+
+@author: MIRI Software Team
+
+"""
+
+import os
+import time
+import unittest
+import warnings
+
+import numpy as np
+
+from miri.datamodels.miri_gain_model import MiriGainModel
+from miri.datamodels.cdplib import CDPModelCache, enable_cdp_cache, \
+    disable_cdp_cache, get_cdp_cache, get_cdp
+
+
+class TestCDPModelCache(unittest.TestCase):
+
+    # Test the CDPModelCache class.
+
+    def setUp(self):
+        # Create two gain CDP files.
+        self.testfiles = ["MiriGainModel_cache_test1.fits",
+                          "MiriGainModel_cache_test2.fits"]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for (ii, testfile) in enumerate(self.testfiles):
+                data = np.full((8,10), 5.5 + ii)
+                with MiriGainModel( data=data ) as dataproduct:
+                    dataproduct.save(testfile, overwrite=True)
+        # The gain data are stored as 32-bit floats.
+        self.nbytes = 8 * 10 * 4
+
+    def tearDown(self):
+        # Remove temporary files, if able to.
+        for testfile in self.testfiles:
+            if os.path.isfile(testfile):
+                try:
+                    os.remove(testfile)
+                except Exception as e:
+                    strg = "Could not remove temporary file, " + testfile + \
+                        "\n   " + str(e)
+                    warnings.warn(strg)
+
+    def _read(self, cache, testfile):
+        datamodel = cache.get(testfile, MiriGainModel)
+        if datamodel is None:
+            datamodel = cache.put(testfile, MiriGainModel,
+                                  MiriGainModel(init=testfile))
+        return datamodel
+
+    def test_hits(self):
+        cache = CDPModelCache(max_bytes=10 * self.nbytes)
+        model1 = self._read(cache, self.testfiles[0])
+        model2 = self._read(cache, self.testfiles[0])
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['entries'], 1)
+        self.assertTrue(stats['nbytes'] >= self.nbytes)
+        self.assertTrue(np.all(model1.data == 5.5))
+        self.assertTrue(np.all(model2.data == 5.5))
+        # Each caller has its own model, but the arrays are shared.
+        self.assertIsNot(model1, model2)
+        self.assertTrue(np.shares_memory(model1.data, model2.data))
+        # A model read with a different class is a different entry.
+        self.assertIsNone(cache.get(self.testfiles[0], object))
+        descr = str(cache)
+        self.assertIsNotNone(descr)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_read_only(self):
+        cache = CDPModelCache(max_bytes=10 * self.nbytes)
+        model1 = self._read(cache, self.testfiles[0])
+        # The shared arrays cannot be changed.
+        def change_data(datamodel):
+            datamodel.data[0,0] = 1.0
+        self.assertRaises(ValueError, change_data, model1)
+        # Changing metadata or closing a copy does not affect the cache.
+        model1.meta.filename = 'changed.fits'
+        model1.close()
+        del model1
+        model2 = self._read(cache, self.testfiles[0])
+        self.assertEqual(model2.meta.filename,
+                         os.path.basename(self.testfiles[0]))
+        self.assertTrue(np.all(model2.data == 5.5))
+        cache.clear()
+
+    def test_eviction(self):
+        # Only one model fits in the budget.
+        cache = CDPModelCache(max_bytes=int(1.5 * self.nbytes))
+        self._read(cache, self.testfiles[0])
+        self._read(cache, self.testfiles[1])
+        self._read(cache, self.testfiles[0])
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['entries'], 1)
+        # A model larger than the budget is returned but not cached.
+        cache.resize(self.nbytes // 2)
+        self.assertEqual(len(cache), 0)
+        model = self._read(cache, self.testfiles[1])
+        self.assertTrue(np.all(model.data == 6.5))
+        self.assertEqual(len(cache), 0)
+        # Updating a file invalidates its entry.
+        cache.resize(10 * self.nbytes)
+        self._read(cache, self.testfiles[1])
+        mtime = os.stat(self.testfiles[1]).st_mtime
+        os.utime(self.testfiles[1], (time.time(), mtime + 10.0))
+        self.assertIsNone(cache.get(self.testfiles[1], MiriGainModel))
+        cache.clear()
+
+    def test_enable(self):
+        self.assertIsNone(get_cdp_cache())
+        try:
+            cache = enable_cdp_cache(max_bytes=1000)
+            self.assertIs(get_cdp_cache(), cache)
+            self.assertIs(enable_cdp_cache(max_bytes=2000), cache)
+            self.assertEqual(cache.max_bytes, 2000)
+        finally:
+            disable_cdp_cache()
+        self.assertIsNone(get_cdp_cache())
+
+    def test_get_cdp_filename(self):
+        # A CDP file which has already been found is read without
+        # searching for it again.
+        with get_cdp('GAIN', 'MIRIMAGE',
+                     cdp_filename=self.testfiles[0]) as datamodel:
+            self.assertTrue(isinstance(datamodel, MiriGainModel))
+            self.assertTrue(np.all(datamodel.data == 5.5))
+        del datamodel
+
+
+# If being run as a main program, run the tests.
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+
+Module test_cdp_catalogue - Contains the unit tests for the CDP file
+name parser, the MiriCDPCatalogue class and the folder index used by
+the MiriCDPFolder class in the datamodels.cdplib module.
+
+:History:
+
+18 Oct 2026: Created.
+18 Oct 2026: The folder is not listed while its modification time is
+             unchanged.
+
+@author: MIRI Software Team
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from miri.datamodels import cdplib
+from miri.datamodels.cdplib import parse_cdp_filename, MiriCDPCatalogue, \
+    MiriCDPFolder, CDP_INDEX_DIR
+
+
+TEST_FILES = ['MIRI_FM_MIRIMAGE_MASK_07.00.00.fits',
+              'MIRI_FM_MIRIMAGE_MASK_07.02.01.fits',
+              'MIRI_FM_MIRIMAGE_FAST_GAIN_07.00.00.fits',
+              'MIRI_FM_MIRIMAGE_SLOW_GAIN_07.00.00.fits',
+              'MIRI_FM_MIRIMAGE_F560W_FLAT_06.01.00.fits',
+              'MIRI_FM_MIRIFUSHORT_12SHORT_FLAT_07.01.00.fits',
+              'MIRI_FM_MIRIFULONG_34LONG_SUB64_DARK_07.00.00.fits']
+
+
+class TestCDPCatalogue(unittest.TestCase):
+
+    # Test the parse_cdp_filename function and MiriCDPCatalogue class.
+
+    def test_parse(self):
+        fields = parse_cdp_filename(
+            'MIRI_FM_MIRIFUSHORT_12SHORT-MEDIUM_SUB64_FLAT_07.01.00.fits')
+        self.assertEqual(fields['model'], 'FM')
+        self.assertEqual(fields['detector'], 'MIRIFUSHORT')
+        self.assertEqual(fields['channel'], '12')
+        self.assertEqual(fields['band'], 'SHORT-MEDIUM')
+        self.assertEqual(fields['subarray'], 'SUB64')
+        self.assertEqual(fields['reftype'], 'FLAT')
+        self.assertEqual((fields['release'], fields['version'],
+                          fields['subversion']), ('07', '01', '00'))
+        self.assertEqual(fields['other'], '')
+        fields = parse_cdp_filename('MIRI_FM_MIRIMAGE_SLOW_ODD_GAIN.fits')
+        self.assertEqual(fields['readpatt'], 'SLOW')
+        self.assertEqual(fields['reftype'], 'GAIN')
+        self.assertEqual(fields['release'], '')
+        self.assertEqual(fields['other'], 'ODD')
+
+    def test_match(self):
+        catalogue = MiriCDPCatalogue(TEST_FILES)
+        self.assertEqual(len(catalogue), len(TEST_FILES))
+        # Substring searches ignore case and give a sorted list.
+        matched = catalogue.match_substrings(['mirimage', '_GAIN'])
+        self.assertEqual(matched, sorted(TEST_FILES[2:4]))
+        matched = catalogue.match_substrings(['MIRIMAGE', '_GAIN'],
+                                             ['_FAST_'])
+        self.assertEqual(matched, [TEST_FILES[3]])
+        self.assertEqual(catalogue.match_substrings(['NOT_THERE']), [])
+        matched = catalogue.match_substrings()
+        self.assertEqual(matched, sorted(TEST_FILES))
+        # Queries compare parsed fields.
+        matched = catalogue.query(detector='MIRIMAGE', reftype='MASK')
+        self.assertEqual(matched, TEST_FILES[0:2])
+        matched = catalogue.query(detector='MIRIMAGE', reftype='MASK',
+                                  version='02')
+        self.assertEqual(matched, [TEST_FILES[1]])
+        matched = catalogue.query(reftype='FLAT', filter='')
+        self.assertEqual(matched, [TEST_FILES[5]])
+        matched = catalogue.query(detector='MIRIMAGE',
+                                  readpatt=['FAST', 'SLOW'])
+        self.assertEqual(matched, TEST_FILES[2:4])
+        self.assertEqual(catalogue.field_values('readpatt'),
+                         ['', 'FAST', 'SLOW'])
+        self.assertRaises(KeyError, catalogue.query, colour='RED')
+
+
+class TestCDPFolderIndex(unittest.TestCase):
+
+    # Test the folder index made by a local MiriCDPFolder.
+
+    def setUp(self):
+        self.cdp_dir = tempfile.mkdtemp(prefix='MiriCDPFolder_test_')
+        for filename in TEST_FILES:
+            self._make_file(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.cdp_dir, ignore_errors=True)
+
+    def _make_file(self, filename):
+        with open(os.path.join(self.cdp_dir, filename), 'w') as fp:
+            fp.write("Not really a CDP")
+
+    def test_index(self):
+        folder = MiriCDPFolder(None, '', self.cdp_dir)
+        self.assertEqual(sorted(folder.cdp_files_available),
+                         sorted(TEST_FILES))
+        index_dir = os.path.join(self.cdp_dir, CDP_INDEX_DIR)
+        index_files = os.listdir(index_dir)
+        self.assertEqual(len(index_files), 1)
+        # The index directory is not listed as a CDP file.
+        self.assertFalse(CDP_INDEX_DIR in folder.cdp_files_available)
+
+        # A new folder object reads the index, which is not written
+        # again while the folder is unchanged.
+        index_file = os.path.join(index_dir, index_files[0])
+        index_mtime_ns = os.stat(index_file).st_mtime_ns
+        folder = MiriCDPFolder(None, '', self.cdp_dir)
+        self.assertEqual(sorted(folder.cdp_files_available),
+                         sorted(TEST_FILES))
+        self.assertEqual(os.stat(index_file).st_mtime_ns, index_mtime_ns)
+        self.assertEqual(folder.match_cdp_latest('MASK', model='FM',
+                                                 detector='MIRIMAGE'),
+                         TEST_FILES[1])
+
+        # The folder is not listed while its modification time is
+        # unchanged, even when its contents have changed.
+        mtime_ns = os.stat(self.cdp_dir).st_mtime_ns
+        os.remove(os.path.join(self.cdp_dir, TEST_FILES[-1]))
+        os.utime(self.cdp_dir, ns=(mtime_ns, mtime_ns))
+        with mock.patch.object(cdplib.os, 'walk',
+                               side_effect=AssertionError("Folder listed")):
+            folder.update_cdp_list()
+            self.assertTrue(TEST_FILES[-1] in folder.cdp_files_available)
+            folder = MiriCDPFolder(None, '', self.cdp_dir)
+            self.assertTrue(TEST_FILES[-1] in folder.cdp_files_available)
+        # The folder is listed again when its modification time changes.
+        mtime_ns += 10000000000
+        os.utime(self.cdp_dir, ns=(mtime_ns, mtime_ns))
+        folder.update_cdp_list()
+        self.assertFalse(TEST_FILES[-1] in folder.cdp_files_available)
+        folder = MiriCDPFolder(None, '', self.cdp_dir)
+        self.assertFalse(TEST_FILES[-1] in folder.cdp_files_available)
+
+        # Adding a file changes the folder time and the folder is listed
+        # again when it is next updated.
+        new_file = 'MIRI_FM_MIRIMAGE_MASK_07.03.00.fits'
+        self._make_file(new_file)
+        mtime_ns += 10000000000
+        os.utime(self.cdp_dir, ns=(mtime_ns, mtime_ns))
+        folder.update_cdp_list()
+        self.assertTrue(new_file in folder.cdp_files_available)
+        self.assertEqual(folder.match_cdp_latest('MASK', model='FM',
+                                                 detector='MIRIMAGE'),
+                         new_file)
+        self.assertEqual(len(os.listdir(index_dir)), 1)
+        folder = MiriCDPFolder(None, '', self.cdp_dir)
+        self.assertTrue(new_file in folder.cdp_files_available)
+
+    def test_match_fields(self):
+        # The file names are matched against their parsed fields.
+        folder = MiriCDPFolder(None, '', self.cdp_dir)
+        self.assertEqual(folder.match_cdp_filename('GAIN', model='FM',
+                                                   detector='MIRIMAGE'),
+                         TEST_FILES[2:4])
+        self.assertEqual(folder.match_cdp_filename('GAIN', model='FM',
+                                                   detector='MIRIMAGE',
+                                                   readpatt='SLOW'),
+                         [TEST_FILES[3]])
+        self.assertEqual(folder.match_cdp_filename('FLAT', model='FM',
+                                                   detector='MIRIMAGE',
+                                                   mirifilter='F560W'),
+                         [TEST_FILES[4]])
+        self.assertEqual(folder.match_cdp_filename('FLAT', model='FM',
+                                                   detector='MIRIMAGE',
+                                                   mirifilter='GENERIC'),
+                         [])
+        self.assertEqual(folder.match_cdp_filename('FLAT', model='FM',
+                                                   band='SHORT'),
+                         [TEST_FILES[5]])
+        # A full frame search avoids the subarray CDPs.
+        self.assertEqual(folder.match_cdp_filename('DARK', model='FM',
+                                                   detector='MIRIFULONG'),
+                         [])
+        self.assertEqual(folder.match_cdp_filename('DARK', model='FM',
+                                                   detector='MIRIFULONG',
+                                                   subarray='SUB64'),
+                         [TEST_FILES[6]])
+        self.assertEqual(folder.match_cdp_filename('MASK', model='FM',
+                                                   detector='MIRIMAGE',
+                                                   cdpversion=2),
+                         [TEST_FILES[1]])
+
+
+# If being run as a main program, run the tests.
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,7 @@ Simple tests of classes in "dqflags" module.
 25 Sep 2013: created
 03 Oct 2013: Converted into unit tests.
 06 Aug 2015: Updated following changes to the JWST flag tables.
+18 Oct 2026: Added tests of the DQConverter class and the bitmask cache.
 
 @author: Ruyman Azzollini (DIAS), Steven Beard (UKATC)
 
@@ -279,6 +280,76 @@ class TestMiriFlagsTable(unittest.TestCase):
                     [3, 3, 3, 3, 3, 3]]
         self.assertTrue( np.all( dq == expected ))
 
+    def test_bitmask_cache(self):
+        # The bitmasks made from flag names are remembered, but must
+        # follow changes to the table.
+        bitmask = self.flagtable.flags_to_bitmask(['SATURATED', 'DO_NOT_USE'])
+        self.assertEqual( bitmask, 3 )
+        self.assertEqual(
+            self.flagtable.flags_to_bitmask(['SATURATED', 'DO_NOT_USE']), 3 )
+        self.assertEqual( self.flagtable.flags_to_bitmask([1, 4]), 5 )
+        newtable = dqflags.FlagsTable( [(0, 'DO_NOT_USE', '')] )
+        self.assertRaises(KeyError, newtable.flags_to_bitmask, 'DEAD')
+        self.assertEqual( newtable.flags_to_bitmask('DO_NOT_USE'), 1 )
+        newtable['DEAD'] = 20
+        self.assertEqual( newtable.flags_to_bitmask(['DO_NOT_USE', 'DEAD']),
+                          2**20 + 1 )
+
+
+class TestDQConverter(unittest.TestCase):
+    
+    # Test the convert_dq function and the DQConverter class.
+    
+    def setUp(self):
+        # An old style flags table and the new master flags.
+        old_setup = [(0, 'unusable',    'Unusable data'),
+                     (1, 'non_science', 'Non science data'),
+                     (2, 'dead',        'Dead pixel'),
+                     (3, 'unknown',     'Flag without a conversion'),
+                     (17, 'HOT',        'Hot pixel'),
+                     (30, 'NOISY',      'Noisy pixel')]
+        self.old_table = dqflags.FlagsTable( old_setup )
+        self.new_table = dqflags.FlagsTable( dqflags.master_flags )
+
+    def tearDown(self):
+        del self.old_table, self.new_table
+
+    def _convert_by_flag(self, dq):
+        # Convert a DQ array one flag at a time.
+        new_dq = np.zeros_like(dq)
+        for old_flag in self.old_table.keys:
+            if old_flag in dqflags.flag_conversion_table:
+                new_flag = dqflags.flag_conversion_table[old_flag]
+                raised = self.old_table.test_flags_any(dq, old_flag)
+                new_dq[raised] = self.new_table.raiseflags(new_dq[raised],
+                                                           new_flag)
+        return new_dq
+
+    def test_convert(self):
+        dq = np.array([[0, 1, 2, 3],
+                       [4, 8, 2**17, 2**30],
+                       [2**30 + 2**17 + 5, 15, 0, 2**31 - 1]], dtype=np.int32)
+        expected = np.array([[0, 1, 2**9, 2**9 + 1],
+                             [2**10, 0, 2**11, 2**24],
+                             [2**24 + 2**11 + 2**10 + 1, 2**10 + 2**9 + 1,
+                              0, 2**24 + 2**11 + 2**10 + 2**9 + 1]])
+        converter = dqflags.DQConverter(self.old_table, self.new_table)
+        new_dq = converter.convert(dq)
+        self.assertEqual( new_dq.dtype, dq.dtype )
+        self.assertTrue( np.array_equal(new_dq, expected) )
+        self.assertTrue( np.array_equal(new_dq, self._convert_by_flag(dq)) )
+        new_dq = dqflags.convert_dq(dq, self.old_table, self.new_table)
+        self.assertTrue( np.array_equal(new_dq, expected) )
+        descr = str(converter)
+        self.assertIsNotNone(descr)
+        
+        # Larger arrays are converted in chunks.
+        converter.chunk_size = 7
+        dq = np.random.randint(0, 2**31 - 1, size=(5,6,7)).astype(np.uint32)
+        self.assertTrue( np.array_equal(converter.convert(dq),
+                                        self._convert_by_flag(dq)) )
+
+
 # If being run as a main program, run the tests.
 if __name__ == '__main__':
     unittest.main()
@@ -22,6 +22,9 @@ in the datamodels.miri_exposure_model module.
              output data.
 12 Jul 2017: Replaced "clobber" parameter with "overwrite".
 27 Feb 2018: Added translation table test.
+18 Oct 2026: Added streaming averaging test.
+18 Oct 2026: Added add_dark test.
+18 Oct 2026: Added get_data_array test.
 
 @author: Steven Beard (UKATC)
 
@@ -183,6 +186,44 @@ class TestMiriExposureModel(unittest.TestCase):
         averaged = self.dataproduct.data_averaged
         self.assertIsNotNone(averaged)
         self.assertTrue( averaged.size < avgproduct.data.size )
+
+    def test_streaming(self):
+        # Test that averaging groups and integrations as they are added
+        # gives the same result as averaging the complete exposure.
+        nints = 4
+        ngroups = 6
+        bigdata = np.arange(nints*ngroups*self.nrows*self.ncolumns,
+                            dtype=np.float32)
+        bigdata.shape = (nints, ngroups, self.nrows, self.ncolumns)
+        expected = bigdata.reshape(2, 2, 3, 2, self.nrows, self.ncolumns)
+        expected = expected.mean(axis=(1,3))
+        dqdata2d = np.zeros((self.nrows,self.ncolumns), dtype=np.uint32)
+        dqdata2d[0,0] = 4
+        products = []
+        for streaming in (False, True):
+            product = MiriExposureModel(rows=self.nrows, columns=self.ncolumns,
+                                        ngroups=ngroups, nints=nints,
+                                        readpatt='FAST', refrows=0,
+                                        refcolumns=0, grpavg=2, intavg=2,
+                                        streaming=streaming)
+            for intg in range(0, nints):
+                for group in range(0, ngroups):
+                    if intg == 1 and group == 1:
+                        product.set_group(bigdata[intg,group], group, intg,
+                                          dq=dqdata2d)
+                    else:
+                        product.set_group(bigdata[intg,group], group, intg)
+            self.assertTrue( np.allclose(product.data_averaged, expected) )
+            products.append(product)
+        # Only the averaged data are held when streaming.
+        self.assertEqual(products[1].data.shape, expected.shape)
+        self.assertTrue( np.allclose(products[1].get_group(3, 1),
+                                     expected[0,1]) )
+        # The GROUPDQ flags are combined into the averaged group.
+        self.assertTrue( np.all(products[1].groupdq[0,0] == dqdata2d) )
+        self.assertTrue( np.all(products[1].groupdq[1:] == 0) )
+        for product in products:
+            product.close()
         
     def test_fitsio(self):
         # Suppress metadata warnings
@@ -230,6 +271,36 @@ class TestMiriExposureModel(unittest.TestCase):
         self.assertGreater(end_time, start_time, \
             "Exposure end time is not later than exposure start time")
         
+    def test_add_dark(self):
+        # Adding a DARK keeps the float32 data and clips the result
+        # between 1 and 65535 DN.
+        shape = self.dataproduct.data.shape
+        dark = np.zeros((2, self.ngroups) + shape[-2:])
+        dark[0] = 2.5
+        dark[1] = 4.0
+        dark[0,0,0,0] = -100.0
+        dark[1,1,1,1] = 100000.0
+        self.dataproduct.add_dark(dark)
+        data = self.dataproduct.data
+        self.assertEqual(data.dtype, np.float32)
+        self.assertEqual(data[0,0,0,0], 1.0)
+        self.assertEqual(data[1,1,1,1], 65535.0)
+        self.assertEqual(data[0,1,2,3], 23.5)
+        self.assertEqual(data[1,2,3,4], 25.0)
+        # A 3-D DARK is added to every integration.
+        self.dataproduct.add_dark(dark[1])
+        self.assertEqual(self.dataproduct.data[0,1,2,3], 27.5)
+        self.assertEqual(self.dataproduct.data[1,2,3,4], 29.0)
+        self.assertRaises(TypeError, self.dataproduct.add_dark,
+                          np.zeros(shape[-2:]))
+
+    def test_get_data_array(self):
+        # Readouts written into the data array are seen by the model.
+        data = self.dataproduct.get_data_array()
+        self.assertIs(data, self.dataproduct.data)
+        data[0,1,:,:] = 42.0
+        self.assertTrue(np.all(self.dataproduct.get_group(1, 0) == 42.0))
+
     def test_translation_table(self):
         # Test the application of a nonlinearity translation table.
         data4x5 = np.array([[1.,2.,3.,4.,5.],
@@ -36,6 +36,7 @@ in the datamodels.miri_linearity_model module.
 12 Jul 2017: Replaced "clobber" parameter with "overwrite".
 07 Oct 2019: FIXME: dq_def removed from unit tests until data corruption
              bug fixed (Bug 589).
+18 Oct 2026: Added tests of the apply, invert and table functions.
 
 @author: Steven Beard (UKATC)
 
@@ -48,7 +49,7 @@ import warnings
 import numpy as np
 
 from miri.datamodels.miri_linearity_model import \
-    linearity_reference_flags, MiriLinearityModel
+    linearity_reference_flags, MiriLinearityModel, apply_reverse_grid
 from miri.datamodels.tests.util import assert_products_equal
 
 
@@ -176,6 +177,102 @@ class TestMiriLinearityModel(unittest.TestCase):
         self.assertTrue(data.all() == coeffs.all())
 
 
+class TestLinearityFunctions(unittest.TestCase):
+    
+    # Test the functions which apply and invert the linearity correction.
+    
+    def setUp(self):
+        # Typical coefficients, varying slightly from pixel to pixel.
+        coeffs1d = np.array([0.0, 0.865384, 4.64239e-6, -6.16093e-11,
+                             7.23130e-16])
+        scale = np.array([[1.0, 1.01, 0.99, 1.02],
+                          [0.98, 1.0, 1.03, 0.97],
+                          [1.0, 1.0, 1.0, 1.0]])
+        self.coeffs = coeffs1d.reshape(5,1,1) * scale
+        self.dataproduct = MiriLinearityModel( coeffs=self.coeffs )
+        self.inramp = np.array([0.25, 0.5, 0.75, 1.0]).reshape(4,1,1) * \
+            np.linspace(1000.0, 60000.0, 12).reshape(3,4)
+        
+    def tearDown(self):
+        del self.dataproduct
+
+    def _polynomial(self, x, row, column):
+        coeffs = self.dataproduct.data[:,row,column]
+        return sum([coeffs[icoeff] * (x ** icoeff)
+                    for icoeff in range(0, len(coeffs))])
+
+    def test_apply(self):
+        outramp = self.dataproduct.apply(self.inramp)
+        self.assertEqual(outramp.shape, self.inramp.shape)
+        for row in range(0, 3):
+            for column in range(0, 4):
+                expected = self._polynomial(self.inramp[:,row,column],
+                                            row, column)
+                self.assertTrue(np.allclose(outramp[:,row,column], expected,
+                                            rtol=1.0e-12))
+        
+    def test_invert(self):
+        outramp = self.dataproduct.apply(self.inramp)
+        inramp = self.dataproduct.invert(outramp)
+        self.assertTrue(np.allclose(inramp, self.inramp, atol=0.01))
+        # Values beyond the range of the polynomial are limited.
+        limits = self.dataproduct.invert(np.full((1,3,4), 1.0e6))
+        self.assertTrue(np.all(limits == 65535.0))
+        limits = self.dataproduct.invert(np.full((1,3,4), -10.0))
+        self.assertTrue(np.all(limits == 0.0))
+        # Pixels with undefined coefficients give NaN.
+        self.dataproduct.data[2,1,1] = np.nan
+        inramp = self.dataproduct.invert(outramp)
+        self.assertTrue(np.all(np.isnan(inramp[:,1,1])))
+        inramp[:,1,1] = self.inramp[:,1,1]
+        self.assertTrue(np.allclose(inramp, self.inramp, atol=0.01))
+
+    def test_tables(self):
+        # The forward table rounds the polynomial.
+        forward = self.dataproduct.get_forward_table(1, 2)
+        self.assertEqual(len(forward), 65535)
+        expected = np.floor(self._polynomial(np.arange(0.0, 65535.0), 1, 2)
+                            + 0.5)
+        self.assertTrue(np.all(forward == expected))
+        # Every output DN of the forward table maps back to the largest
+        # input DN giving it, and the gaps between them are filled.
+        reverse = self.dataproduct.get_reverse_table(1, 2)
+        self.assertEqual(len(reverse),
+                         int(self._polynomial(65535.0, 1, 2) + 0.5) + 1)
+        self.assertTrue(np.all(forward[reverse[forward]] == forward))
+        self.assertTrue(np.all(np.diff(reverse[forward]) >= 0))
+        self.assertTrue(np.all(np.diff(reverse[1:]) >= 0))
+        # A polynomial steeper than 1 leaves gaps in the table, which
+        # are filled from the neighbouring values.
+        self.dataproduct.data[:,1,2] = [0.0, 2.5, 0.0, 0.0, 0.0]
+        reverse = self.dataproduct.get_reverse_table(1, 2, max_dn=10)
+        self.assertEqual(list(reverse), [0, 1, 1, 1, 2, 2, 3, 3, 3, 4,
+                                         4, 5, 5, 5, 6, 6, 7, 7, 7, 8,
+                                         8, 9, 9, 9, 10, 10])
+        
+    def test_reverse_grid(self):
+        outramp = self.dataproduct.apply(self.inramp)
+        grid = self.dataproduct.get_reverse_grid(step=256)
+        self.assertEqual(grid.shape[1:], (3,4))
+        self.assertEqual(grid.dtype, np.float32)
+        inramp = apply_reverse_grid(outramp, grid, 256)
+        self.assertTrue(np.allclose(inramp, self.inramp, atol=1.0))
+        # Writing the results back to the input array.
+        apply_reverse_grid(outramp, grid, 256, out=outramp)
+        self.assertTrue(np.allclose(outramp, inramp))
+        
+        # The tables of amplifiers reading interleaved columns repeat
+        # across the data.
+        grid = self.dataproduct.get_reverse_grid(step=1, namps=2)
+        self.assertEqual(grid.shape[1:], (1,2))
+        inramp = apply_reverse_grid(self.dataproduct.apply(self.inramp),
+                                    grid, 1)
+        self.assertTrue(np.allclose(inramp[:,2,:], self.inramp[:,2,:],
+                                    atol=0.1))
+        self.assertRaises(TypeError, apply_reverse_grid,
+                          np.zeros((2,3,5)), grid, 1)
+
+
 # If being run as a main program, run the tests.
 if __name__ == '__main__':
     unittest.main()
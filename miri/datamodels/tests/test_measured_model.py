@@ -65,6 +65,11 @@ in the datamodels.miri_measured_model module.
 07 Oct 2019: FIXME: dq_def removed from unit tests until data corruption
              bug fixed (Bug 589).
 12 Feb 2020: Reinstated the array broadcasting test.
+18 Oct 2026: Added a test of the schema cache.
+18 Oct 2026: Added tests of the FITS keyword lookups and metadata copying.
+18 Oct 2026: Added a test of in-place arithmetic.
+18 Oct 2026: Test masks follow changes to the DQ array.
+18 Oct 2026: Added a test of the chunked error combination.
 
 @author: Steven Beard (UKATC)
 
@@ -80,8 +85,11 @@ import numpy as np
 from miri.datamodels.dqflags import master_flags, pixeldq_flags, \
     groupdq_flags
 
+from miri.datamodels.miri_model_base import get_merged_schema, \
+    clear_schema_cache
 from miri.datamodels.miri_measured_model import MiriMeasuredModel, \
     MiriRampModel, MiriSlopeModel
+from miri.datamodels.operations import _chunks, _CHUNK_SIZE
 from miri.datamodels.tests.util import assert_recarray_equal, \
     assert_products_equal
 
@@ -302,7 +310,46 @@ class TestMiriMeasuredModel(unittest.TestCase):
         strg = self.simpleproduct.get_history_str()
         self.assertIsNotNone(strg)
         self.assertGreater(len(strg), 0)
-    
+
+    def test_fits_keywords(self):
+        # FITS keywords can be looked up in both directions.
+        metadict = self.simpleproduct.fits_metadata_dict()
+        self.assertEqual(metadict['meta.instrument.detector'][:2],
+                         ('PRIMARY', 'DETECTOR'))
+        elements = self.simpleproduct.get_elements_for_fits_hdu(
+                                    self.simpleproduct.schema, 'PRIMARY')
+        self.assertEqual(elements['DETECTOR'], 'meta.instrument.detector')
+        header = self.simpleproduct.get_fits_header_dict()
+        self.assertEqual(header['DETECTOR'], 'MIRIMAGE')
+        self.assertEqual(header['READPATT'], 'SLOW')
+        self.assertFalse('COMMENT' in header)
+        values = self.simpleproduct.find_fits_values('DETECTOR')
+        self.assertEqual(values, [('PRIMARY', 'MIRIMAGE')])
+        self.simpleproduct.set_fits_keyword('READPATT', 'FAST')
+        self.assertEqual(self.simpleproduct.get_fits_keyword('READPATT'),
+                         'FAST')
+        self.assertRaises(KeyError, self.simpleproduct.get_fits_keyword,
+                          'NOTAKEYWORD')
+
+    def test_copy_metadata(self):
+        # Metadata are copied to another data model, apart from the
+        # items which are ignored.
+        newproduct = MiriMeasuredModel(data=self.primary)
+        newproduct.copy_metadata(self.simpleproduct,
+                                ignore=['exposure.readpatt'])
+        self.assertEqual(newproduct.meta.instrument.detector, 'MIRIMAGE')
+        self.assertEqual(newproduct.meta.exposure.ngroups, 10)
+        self.assertNotEqual(newproduct.meta.exposure.readpatt, 'SLOW')
+        # Copying to a data model with a different schema only copies
+        # the metadata defined in both schemas.
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            slopeproduct = MiriSlopeModel(data=[self.primary])
+            slopeproduct.copy_metadata(self.simpleproduct)
+        self.assertEqual(slopeproduct.meta.instrument.detector, 'MIRIMAGE')
+        self.assertEqual(slopeproduct.meta.exposure.nints, 1)
+        del newproduct, slopeproduct
+
     def test_content(self):
         # The data, err and dq attributes are aliases for the primary,
         # error and quality arrays
@@ -319,6 +366,25 @@ class TestMiriMeasuredModel(unittest.TestCase):
                                tables='dq_def' )
         del datacopy
 
+    def test_schema_cache(self):
+        # Data models of the same class share the same merged schema.
+        newproduct = MiriMeasuredModel(data=self.primary)
+        self.assertIs(newproduct.schema, self.dataproduct.schema)
+        self.assertIs(newproduct.schema,
+                      get_merged_schema(MiriMeasuredModel.schema_url))
+        self.assertIsNot(newproduct.schema, MiriRampModel().schema)
+        # The schema is loaded again after the cache is cleared, and the
+        # new schema is the same as the old one.
+        clear_schema_cache()
+        newschema = get_merged_schema(MiriMeasuredModel.schema_url)
+        self.assertIsNot(newschema, self.dataproduct.schema)
+        self.assertEqual(newschema, self.dataproduct.schema)
+        del newproduct
+        # The STScI data model functions are left unchanged.
+        import jwst.datamodels.schema as mschema
+        self.assertEqual(mschema.merge_property_trees.__module__,
+                         'jwst.datamodels.schema')
+
     def test_fitsio(self):
         # Suppress metadata warnings
         with warnings.catch_warnings():
@@ -376,6 +442,31 @@ class TestMiriMeasuredModel(unittest.TestCase):
         self.assertAlmostEqual(meandata2, 10)
         meanerr2 = np.mean(newdp2.err_masked)
         self.assertAlmostEqual(meanerr2, 1)
+
+        # The masks must follow changes made to the DQ array in place,
+        # and changing a masked array must not affect later masks.
+        newdp2.dq[0,0] = 1
+        self.assertTrue(newdp2.data_masked.mask[0,0])
+        masked = newdp2.data_masked
+        masked[0,2] = np.ma.masked
+        self.assertFalse(newdp2.data_masked.mask[0,2])
+        newdp2.dq[0,0] = 0
+        self.assertFalse(newdp2.err_masked.mask[0,0])
+
+        # A 3-D DQ array is combined with a bitwise OR to mask 2-D data,
+        # and a 2-D DQ array masks every plane of 3-D data.
+        dq3 = np.zeros([2,3,4], dtype=np.uint32)
+        dq3[1,2,3] = 1
+        dq3[0,1,1] = 2
+        mask = newdp2._generate_mask(newdp2.data, dq3)
+        self.assertEqual(mask.shape, (3,4))
+        self.assertEqual(np.count_nonzero(mask), 1)
+        self.assertTrue(mask[2,3])
+        mask = newdp2._generate_mask(newdp2.data, dq3, bitmask=None)
+        self.assertEqual(np.count_nonzero(mask), 2)
+        mask = newdp2._generate_mask(np.ones([2,3,4]), c2)
+        self.assertEqual(mask.shape, (2,3,4))
+        self.assertTrue(np.array_equal(mask[1], np.asarray(c2) != 0))
         
         del newdp, newdp2
 
@@ -502,6 +593,93 @@ class TestMiriMeasuredModel(unittest.TestCase):
             del newdp, newdp2, newdp3, newdp4
             del result
 
+    def test_inplace_arithmetic(self):
+        # In-place operations must give the same results as the
+        # equivalent operators while keeping the existing arrays.
+        a2 = [[90,80,70,60],[50,40,30,20],[10,5,-10,-20]]
+        b2 = [[1,2,3,4],[5,6,7,8],[9,10,11,12]]
+        c2 = [[0,1,1,0],[0,2,0,2],[1,0,1,0]]
+        newdp = MiriMeasuredModel(data=a2, err=b2, dq=c2)
+        operands = [3.0, np.array(a2), newdp, self.dataproduct]
+        for op in ('add', 'subtract', 'multiply', 'divide'):
+            for operand in operands:
+                expected = self.dataproduct.combine(operand, op)
+                result = self.dataproduct.copy()
+                if operand is self.dataproduct:
+                    # Combine the product with itself.
+                    operand = result
+                arrays = (result.data, result.err, result.dq)
+                if op == 'add':
+                    result += operand
+                elif op == 'subtract':
+                    result -= operand
+                elif op == 'multiply':
+                    result *= operand
+                else:
+                    result /= operand
+                self.assertIs(result.data, arrays[0])
+                self.assertTrue(np.allclose(result.data, expected.data))
+                self.assertTrue(np.allclose(result.err, expected.err,
+                                            equal_nan=True))
+                self.assertTrue(np.array_equal(result.dq, expected.dq))
+                if operand is not result:
+                    self.assertIs(result.err, arrays[1])
+                    self.assertIs(result.dq, arrays[2])
+                del expected, result
+
+        # The result can be written into another data product, leaving
+        # the original unchanged.
+        out = newdp.copy()
+        arrays = (out.data, out.err, out.dq)
+        result = self.dataproduct.combine(newdp, 'multiply', out=out)
+        self.assertIs(result, out)
+        self.assertIs(out.data, arrays[0])
+        self.assertIs(out.err, arrays[1])
+        expected = self.dataproduct * newdp
+        self.assertTrue(np.allclose(out.data, expected.data))
+        self.assertTrue(np.allclose(out.err, expected.err))
+        self.assertTrue(np.array_equal(out.dq, expected.dq))
+        self.assertTrue(np.allclose(self.dataproduct.data, self.primary))
+        self.assertEqual(out.meta.instrument.detector, 'MIRIFUSHORT')
+        # The result of an operator does not share the arrays of the
+        # original, so can be changed in place.
+        result = self.dataproduct + 1.0
+        result *= 2.0
+        self.assertTrue(np.allclose(self.dataproduct.err, self.error))
+        del out, result, expected
+
+        self.assertRaises(ValueError, self.dataproduct.combine, newdp, 'power')
+        def divide_by_zero(dataproduct):
+            dataproduct /= 0.0
+        self.assertRaises(ValueError, divide_by_zero, self.dataproduct)
+        self.assertRaises(TypeError, self.dataproduct.combine, 'text', 'add')
+
+    def test_chunked_errors(self):
+        # The error arrays are combined in chunks which cover every
+        # element once and are no larger than the chunk size.
+        for shape in [(5,), (7,11), (3,4,5,6), (2,0,3)]:
+            counts = np.zeros(shape, dtype=int)
+            for index in _chunks(shape, max_size=10):
+                chunk = counts[index]
+                self.assertTrue(chunk.size <= max(10, shape[-1]))
+                chunk += 1
+            self.assertTrue(np.all(counts == 1))
+        # Arrays larger than one chunk give the same result as the
+        # formula applied to the whole array.
+        shape = (3, 400, 300)
+        self.assertTrue(np.prod(shape) > _CHUNK_SIZE)
+        data1 = np.linspace(1.0, 2.0, np.prod(shape)).reshape(shape)
+        error1 = np.full(shape, 0.1)
+        data2 = np.full(shape[1:], 4.0)
+        error2 = np.full(shape[1:], 0.2)
+        model1 = MiriMeasuredModel(data=data1, err=error1)
+        model2 = MiriMeasuredModel(data=data2, err=error2)
+        result = model1 / model2
+        expected = np.sqrt(error1**2 / data2**2 +
+                           (error2**2 * data1**2) / (data2**2 * data2**2))
+        self.assertTrue(np.allclose(result.err, expected))
+        del model1, model2, result
+
     def test_broadcasting(self):
         # Test that operations where the broadcasting of one array
         # onto a similar shaped array work.
@@ -14,6 +14,9 @@ Simple tests of the data model utility functions in datamodels/util.py.
 04 Oct 2019: BUG IN DQ_DEF!! Disabled verify_cdp
 07 Oct 2019: FIXME: test_verify_cdp_file removed from unit tests until
              data corruption bug fixed (Bug 589).
+18 Oct 2026: Added tests of the lazy and header_only options of open.
+18 Oct 2026: Test that a lazily opened file is closed with its data model
+             and that invalid header values are skipped.
 
 @author: Steven Beard (UKATC)
 
@@ -21,6 +24,7 @@ Simple tests of the data model utility functions in datamodels/util.py.
 
 import os
 import unittest
+import warnings
 import numpy as np
 
 import astropy.io.fits as pyfits
@@ -126,6 +130,66 @@ class TestFileIO(unittest.TestCase):
             del hdulist
             del model
 
+    def test_open_lazy(self):
+        # Check that each data model can be opened with its data arrays
+        # memory-mapped, and that changing the data does not change the
+        # file.
+        for (filename, datamodel) in self.models_to_test:
+            with util.open( filename, lazy=True ) as model:
+                self.assertTrue(isinstance(model, datamodel))
+                self.assertEqual(model.meta.instrument.detector, 'MIRIMAGE')
+                self.assertEqual(model.data.flat[-1], 5.0)
+                model.data.flat[-1] = 6.0
+            del model
+            with util.open( filename ) as model:
+                self.assertEqual(model.data.flat[-1], 5.0)
+            del model
+        # The memory-mapped file is closed with the data model.
+        (filename, datamodel) = self.models_to_test[0]
+        model = util.open( filename, lazy=True )
+        hdulists = list(model._open_files)
+        self.assertEqual(len(hdulists), 1)
+        closed = []
+        hdulists[0].close = lambda: closed.append(True)
+        model.close()
+        self.assertEqual(closed, [True])
+        self.assertEqual(model._open_files, [])
+        del model, hdulists
+
+    def test_open_header_only(self):
+        # Check that the metadata of each data model can be read
+        # without reading its data.
+        for (filename, datamodel) in self.models_to_test:
+            with util.open( filename, header_only=True ) as model:
+                self.assertTrue(isinstance(model, datamodel))
+                self.assertEqual(model.meta.instrument.detector, 'MIRIMAGE')
+                self.assertEqual(model.meta.exposure.readpatt, 'SLOW')
+                self.assertEqual(model.meta.filename, filename)
+                self.assertEqual(model.data.size, 0)
+            del model
+        # A class can also be given explicitly.
+        (filename, datamodel) = self.sim_models_to_test[0]
+        with util.open( filename, astype=datamodel,
+                        header_only=True ) as model:
+            self.assertEqual(model.meta.exposure.ngroups, 3)
+        del model
+        # A header value which is not valid for the schema is skipped
+        # with a warning, and the remaining metadata are still read.
+        (filename, datamodel) = self.cdp_models_to_test[1]
+        with pyfits.open( filename, mode='update' ) as hdulist:
+            hdulist[0].header['READPATT'] = 'NOTAPATTERN'
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with datamodel( strict_validation=True ) as model:
+                with pyfits.open( filename ) as hdulist:
+                    model.set_metadata_from_fits_headers(hdulist)
+                self.assertIsNone(model.meta.exposure.readpatt)
+                self.assertEqual(model.meta.instrument.detector, 'MIRIMAGE')
+                self.assertEqual(model.meta.instrument.filter, 'F560W')
+            del model
+        messages = [str(warning.message) for warning in caught]
+        self.assertTrue(any(['READPATT' in message for message in messages]))
+
     def test_verify_fits_file(self):
         # Check that the FITS verification function passes the simple
         # files created by this test.
@@ -81,6 +81,10 @@ processing the MIRI data models.
 12 Mar 2019: Removed use of astropy.extern.six (since Python 2 no longer used).
 07 Oct 2019: FIXME: dq_def removed from CDP verification tests until data
              corruption bug fixed (Bug 589).
+18 Oct 2026: Added lazy and header_only options to the open function, so
+             large files can be opened without reading all their data.
+18 Oct 2026: A lazily opened file is closed through the public
+             MiriDataModel.keep_open and close methods.
 
 @author: Steven Beard (UKATC), Vincent Geers (UKATC)
 
@@ -228,7 +232,7 @@ def get_data_class( kwlist, dictionary=CDP_DICT ):
 #
 # Universal data model opening function
 #
-def open( init=None, astype=None):
+def open( init=None, astype=None, lazy=False, header_only=False ):
     """
     
     Creates a MIRI Data Product object from the given initializer using
@@ -244,6 +248,10 @@ def open( init=None, astype=None):
     datamodel = open( "myfile.fits", astype=MiriImagerPointSpreadFunction )
     
     datamodel = open( (3,4) )
+    
+    datamodel = open( "myramp.fits", lazy=True )
+    
+    datamodel = open( "myramp.fits", header_only=True )
 
     :Parameters:
 
@@ -272,6 +280,19 @@ def open( init=None, astype=None):
         See the MIRI wiki for a complete list.
         The data type can also be specified by providing a class explicitly
         in this parameter.
+    lazy: bool, optional, default=False
+        Only used when opening a FITS file. If True, the data arrays are
+        memory-mapped from the file instead of being read, so only the
+        parts of an array actually used (such as one integration of a
+        ramp) are read from disk. Changes to the arrays are kept in memory
+        and are not written back to the file. The file remains open until
+        the data model is closed. Arrays stored with scaling keywords
+        (such as unsigned integer DQ arrays) are still read in full, as
+        are files opened with a class which is not a MiriDataModel.
+    header_only: bool, optional, default=False
+        Only used when opening a FITS file. If True, only the FITS headers
+        are read. The data model contains the metadata defined by FITS
+        keywords in its schema, but no data.
 
     :Returns:
 
@@ -295,6 +316,14 @@ def open( init=None, astype=None):
     else:
         datatype = ''
         mirimodel = astype
+    if isinstance(init, bytes):
+        init = init.decode('utf-8')
+    # In lazy mode the file is memory-mapped copy-on-write, so the data
+    # arrays can be changed without changing the file.
+    if lazy:
+        fits_mode = 'copyonwrite'
+    else:
+        fits_mode = 'readonly'
 
     # Check whether a class has been specified explicitly
     if mirimodel is None:
@@ -303,9 +332,7 @@ def open( init=None, astype=None):
         # be distinguished using the file header.
         try:
             if isinstance(init, str) or hasattr(init, "read"):
-                hdulist = pyfits.open(init)
-            elif isinstance(init, bytes):
-                hdulist = pyfits.open(init.decode('utf-8'))
+                hdulist = pyfits.open(init, mode=fits_mode)
             elif isinstance(init, pyfits.HDUList):
                 hdulist = init
                 preserve_hdulist = True
@@ -359,13 +386,11 @@ def open( init=None, astype=None):
                 kwlist.append(datatype)
             
         except Exception as e:
+            if hdulist is not None and not preserve_hdulist:
+                hdulist.close()
             strg = "Failed to open FITS object, \'%s\'\n" % str(init)
             strg += "  %s: %s" % (e.__class__.__name__, str(e))
             raise IOError(strg)
-        finally:
-            if hdulist is not None and not preserve_hdulist:
-                hdulist.close()
-                del hdulist
 
         # Attempt to convert the keyword list to a MIRI data model class
         mirimodel = get_data_class(copy.copy(kwlist), dictionary=CDP_DICT)
@@ -373,6 +398,8 @@ def open( init=None, astype=None):
             # Not a CDP. Try the simulation data products.
             mirimodel = get_data_class(copy.copy(kwlist), dictionary=SIM_DICT)
         if mirimodel is None:    
+            if hdulist is not None and not preserve_hdulist:
+                hdulist.close()
             # Unknown initialisers or data types are interpreted by jwst.datamodels
             strg = "\n***Data type could not be determined from metadata. "
             strg += "Opening as a plain jwst.datamodels data model."
@@ -380,6 +407,50 @@ def open( init=None, astype=None):
             mirimodel = jwst.datamodels.open( init )
             return mirimodel
 
+    elif lazy or header_only:
+        # The file is only opened here when it is to be read lazily.
+        try:
+            if isinstance(init, str) or hasattr(init, "read"):
+                hdulist = pyfits.open(init, mode=fits_mode)
+            elif isinstance(init, pyfits.HDUList):
+                hdulist = init
+                preserve_hdulist = True
+        except Exception as e:
+            strg = "Failed to open FITS object, \'%s\'\n" % str(init)
+            strg += "  %s: %s" % (e.__class__.__name__, str(e))
+            raise IOError(strg)
+
+    if hdulist is None:
+        return mirimodel(init)
+    if header_only and issubclass(mirimodel, MiriDataModel):
+        # Create an empty data model and fill in its metadata from the
+        # FITS headers. The data are never read.
+        try:
+            datamodel = mirimodel()
+            datamodel.set_metadata_from_fits_headers(hdulist)
+            if isinstance(init, str):
+                datamodel.meta.filename = os.path.basename(init)
+        finally:
+            if not preserve_hdulist:
+                hdulist.close()
+        return datamodel
+    if lazy and issubclass(mirimodel, MiriDataModel):
+        # The data model reads its arrays from the memory-mapped file,
+        # which must stay open until the data model is closed.
+        try:
+            datamodel = mirimodel(hdulist)
+        except Exception:
+            if not preserve_hdulist:
+                hdulist.close()
+            raise
+        if not preserve_hdulist:
+            datamodel.keep_open(hdulist)
+            if isinstance(init, str):
+                datamodel.meta.filename = os.path.basename(init)
+        return datamodel
+    # The file header is no longer needed.
+    if not preserve_hdulist:
+        hdulist.close()
     return mirimodel(init)
 
 # -----------------------------------------------------------------------------
@@ -156,6 +156,25 @@ effects simulated by SCASim.
              bug worked around on 12 Feb 2016 (Bug 16).
 24 May 2018: Documentation update. Ensure _MAXEXPECTED is an integer.
 04 Jun 2018: anneal function renamed hard_reset.
+18 Oct 2026: Added a fast_readout option, which samples the Poisson
+             noise with a numpy Generator owned by the integrator and
+             reuses work buffers in place instead of calling
+             scipy.stats.poisson.rvs on newly allocated arrays.
+             Added split_rows and merge_rows, so that bands of rows can
+             be integrated independently.
+             Added hit_by_cosmic_rays, which deposits a batch of cosmic
+             ray hits with one scatter-add. Cosmic rays at the edge of
+             the array are clipped by slicing instead of a pixel loop.
+             Added a kernel option to ImperfectIntegrator, which can
+             apply the integrator effects in place on persistent work
+             buffers, optionally evaluating the integration with
+             numexpr. Replaced the deprecated np.int type.
+             Added is_perfect and integrate_ramp, which simulates a
+             series of integration periods and readouts on a perfect
+             integrator in one batch. hit_by_cosmic_rays can deposit
+             the energy into a separate target array.
+             Added a precision option, which selects float32 instead of
+             float64 for the expected counts and work arrays.
 
 @author: Steven Beard (UKATC)
 
@@ -166,7 +185,7 @@ import logging
 logging.basicConfig(level=logging.INFO) # Default level is informational output 
 LOGGER = logging.getLogger("miri.simulators") # Get a default logger
 
-from copy import deepcopy
+from copy import copy, deepcopy
 import math
 import sys
 import scipy.stats
@@ -186,6 +205,87 @@ _MAXEXPECTED = _MAXINT - (100 * int(math.sqrt(_MAXINT)))
 # valid. The detector will stop drifting after this time has elapsed.
 _MAXCLOCK = 100000.0
 
+# The kernels available for applying the ImperfectIntegrator effects.
+# 'numpy' creates new arrays at every step, 'inplace' updates persistent
+# work buffers with numpy out= arguments and 'numexpr' also evaluates
+# each integration as one numexpr expression.
+INTEGRATOR_KERNELS = ('numpy', 'inplace', 'numexpr')
+
+# numexpr is optional. It is only imported when the numexpr kernel is
+# selected.
+_numexpr = None
+
+# The floating point precisions in which the expected counts may be
+# simulated. float64 is the default. float32 halves the memory needed
+# for the integrator arrays, at the cost of rounding errors which are
+# much smaller than the Poisson noise.
+INTEGRATOR_PRECISIONS = ('float64', 'float32')
+
+# The counters and timers copied back from a band of rows by merge_rows.
+_BAND_STATE = ('nperiods', 'nints', 'readings', 'nperiods_at_readout',
+               'exposure_time', 'clock_time', 'time_at_reset')
+
+def _is_row_array(value, shape):
+    """
+    
+    Helper function which returns True if value is an array whose
+    last two dimensions match the given integrator shape.
+    
+    """
+    return isinstance(value, np.ndarray) and value.ndim >= 2 and \
+        value.shape[-2:] == tuple(shape)
+
+def precision_dtype(precision):
+    """
+    
+    Return the numpy floating point type corresponding to the given
+    simulation precision.
+    
+    :Parameters:
+    
+    precision: string or numpy type
+        One of the precisions listed in INTEGRATOR_PRECISIONS, or the
+        equivalent numpy type. None selects the default float64.
+        
+    :Returns:
+    
+    dtype: numpy dtype
+        The floating point type.
+        
+    :Raises:
+    
+    ValueError
+        Raised if the precision is not recognised.
+        
+    """
+    if precision is None:
+        return np.dtype(np.float64)
+    try:
+        dtype = np.dtype(precision)
+    except TypeError:
+        dtype = None
+    if dtype is None or dtype.name not in INTEGRATOR_PRECISIONS:
+        strg = "Unrecognised simulation precision: %s. " % str(precision)
+        strg += "It must be one of %s." % str(INTEGRATOR_PRECISIONS)
+        raise ValueError(strg)
+    return dtype
+
+def _import_numexpr():
+    """
+    
+    Helper function which imports the optional numexpr module, returning
+    None if it is not available.
+    
+    """
+    global _numexpr
+    if _numexpr is None:
+        try:
+            import numexpr
+        except ImportError:
+            return None
+        _numexpr = numexpr
+    return _numexpr
+
 def linear_regression(x, y):
     """
     
@@ -228,6 +328,18 @@ class PoissonIntegrator(object):
         A flag that may be used to switch off Poisson noise (for
         example to observe what effects in a simulation are caused
         by Poisson noise).
+    fast_readout: boolean, optional, default=False
+        Set to True to sample the Poisson noise with the integrator's
+        own numpy random Generator, reusing work buffers between
+        readouts. The result is reproducible for a given seed (see
+        set_seed) but is not the same random sequence as the default
+        scipy.stats.poisson sampler.
+    precision: string, optional, default='float64'
+        The floating point precision of the expected counts and work
+        arrays, which must be one of INTEGRATOR_PRECISIONS. 'float32'
+        halves the memory needed by the integrator. Its rounding errors
+        are much smaller than a count for the levels reached by a
+        detector.
     verbose: int, optional, default=2
         Verbosity level. Activates print statements when non-zero.
         
@@ -271,6 +383,10 @@ class PoissonIntegrator(object):
         was last sampled.
     flux: float array
         The last flux on which the integrator was integrated.
+    rng: numpy.random.Generator
+        The random number generator used by the fast readout. It is
+        created on first use from the global numpy random state,
+        unless already defined by set_seed.
     nints: int
         The number of integrations executed since the PoissonIntegrator
         object was created, or since a new exposure was started.
@@ -299,9 +415,12 @@ class PoissonIntegrator(object):
         total accumulated integration time since the last reset.
     
     """
+    # Work buffers, which are not copied by split_rows or merge_rows.
+    _WORK_BUFFERS = ('_diff_buffer', '_read_buffer')
 
     def __init__(self, rows, columns, particle="photon", time_unit="seconds",
-                 bucket_size=None, simulate_poisson_noise=True, verbose=1,
+                 bucket_size=None, simulate_poisson_noise=True,
+                 fast_readout=False, precision='float64', verbose=1,
                  logger=LOGGER):
         """
         
@@ -332,15 +451,16 @@ class PoissonIntegrator(object):
         self.time_unit = time_unit
         self.bucket_size = bucket_size
         self.pedestal = None  # Fixed pedestal value added to the zeropoint.
+        self.dtype = precision_dtype(precision)
                 
         # All the internal counters are initialised to zero.
         # NOTE: The expected count is maintained in a floating point
         # array which is truncated to integer when read out.
-        self.zeropoint = np.zeros(self.shape)      # Zeropoint from which to begin counting.
-        self.expected_count = np.zeros(self.shape) # The expected count after an integration.
-        self.last_count = np.zeros(self.shape)     # The expected count at last readout
+        self.zeropoint = np.zeros(self.shape, dtype=self.dtype)      # Zeropoint from which to begin counting.
+        self.expected_count = np.zeros(self.shape, dtype=self.dtype) # The expected count after an integration.
+        self.last_count = np.zeros(self.shape, dtype=self.dtype)     # The expected count at last readout
         self.last_readout = np.zeros(self.shape, dtype=np.uint32) # The actual count at last readout
-        self.flux = np.zeros(self.shape)           # The flux (in particles per time unit) being integrated.
+        self.flux = np.zeros(self.shape, dtype=self.dtype)           # The flux (in particles per time unit) being integrated.
         self.nperiods = 0    # Number of integration periods since reset.
         self.nints = 0       # Number of integrations since creation or new exposure.
         self.readings = 0    # Number of readings/groups since reset.
@@ -353,6 +473,14 @@ class PoissonIntegrator(object):
         self.simulate_poisson_noise = simulate_poisson_noise
         if not simulate_poisson_noise and self.verbose > 0:
             self.logger.info("NOTE: Poisson noise is turned off.")
+
+        # This flag selects the fast readout, which samples the Poisson
+        # noise with its own random number generator and reuses the
+        # work buffers allocated on the first readout.
+        self.fast_readout = fast_readout
+        self.rng = None
+        self._diff_buffer = None
+        self._read_buffer = None
     
     def __del__(self):
         """
@@ -371,6 +499,11 @@ class PoissonIntegrator(object):
             del self.last_count
             del self.expected_count
             del self.zeropoint
+            # Objects created in methods
+            if self._diff_buffer is not None:
+                del self._diff_buffer
+            if self._read_buffer is not None:
+                del self._read_buffer
         except Exception:
             pass
     
@@ -421,6 +554,8 @@ class PoissonIntegrator(object):
         Set the seed for the numpy random number generator.
         This function can be used while testing to ensure the
         Poisson noise generated subsequently is well defined.
+        The random Generator used by the fast readout is seeded
+        with the same value.
         
         :Parameters:
         
@@ -431,6 +566,7 @@ class PoissonIntegrator(object):
             
         """
         np.random.seed(seedvalue)
+        self.rng = np.random.default_rng(seedvalue)
         
     def _apply_zeropoint(self, data, nresets=1):
         """
@@ -542,7 +678,9 @@ class PoissonIntegrator(object):
         # Apply the zeropoint function, depending on the number of
         # resets requested.
         signal = self.zeropoint + self.expected_count
-        self.zeropoint = self._apply_zeropoint(signal, nresets=nresets)
+        self.zeropoint = np.asarray(self._apply_zeropoint(signal,
+                                                          nresets=nresets),
+                                    dtype=self.dtype)
         # If necessary, shift the zeropoint by the pedestal.
         # TODO: Wouldn't it be more natural to do this at the readout stage?
         if self.pedestal is not None:
@@ -605,16 +743,18 @@ class PoissonIntegrator(object):
             # Make sure that the given flux is a numpy array (otherwise the
             # flux.shape attribute will not be defined and the shape test will
             # fail).
-            self.flux = np.asarray(flux)
+            self.flux = np.asarray(flux, dtype=self.dtype)
             if self.flux.shape == self.shape:      
                 # The input flux array must always be positive.
-                # Replace negative values with zero.
-                arenegative = np.where(self.flux < 0.0)
-                self.flux[arenegative] = 0.0
+                # Replace negative values with zero. The flux is only
+                # searched when it contains a negative value.
+                if self.flux.min() < 0.0:
+                    self.flux[self.flux < 0.0] = 0.0
        
                 # Apply the integrator function
-                self.expected_count = \
-                    self._apply_integrator(self.expected_count, self.flux, time)
+                self.expected_count = np.asarray(
+                    self._apply_integrator(self.expected_count, self.flux, time),
+                    dtype=self.dtype)
 
                 if self.verbose > 3:
                     strg = "Expected count after integration: "
@@ -700,6 +840,8 @@ class PoissonIntegrator(object):
         if int(nsamples) <= 0:
             strg = "Number of samples must be at least 1."
             raise ValueError(strg)
+        if self.fast_readout:
+            return self._readout_fast()
         
         # Simulate Poisson noise when the poisson_noise flag is True,
         if self.simulate_poisson_noise:
@@ -772,7 +914,8 @@ class PoissonIntegrator(object):
         # function is called.
         # NOTE: The last readout is measured from the zeropoint, which needs to be subtracted.
         self.readings += 1
-        self.last_readout = readout_array.astype(np.uint32) - self.zeropoint
+        self.last_readout = np.subtract(readout_array.astype(np.uint32),
+                                        self.zeropoint, dtype=self.dtype)
         self.nperiods_at_readout = self.nperiods
         
         if self.verbose > 5:
@@ -784,6 +927,285 @@ class PoissonIntegrator(object):
         
         # Return the readout converted to int to make a discrete count.
         return readout_array.astype(np.uint32)
+
+    def _readout_fast(self):
+        """
+        
+        Helper function which reads out the integrator in the same way
+        as the readout method, but samples the Poisson noise with the
+        integrator's own random Generator and works in place on buffers
+        which are reused from one readout to the next.
+        
+        :Returns:
+        
+        readout_array: array_like
+            The latest count as read out (with Poisson noise).
+            
+        """
+        if self._diff_buffer is None:
+            self._diff_buffer = np.empty(self.shape, dtype=self.dtype)
+            self._read_buffer = np.empty(self.shape, dtype=self.dtype)
+        read_buffer = self._read_buffer
+
+        if self.simulate_poisson_noise:
+            self._make_rng()
+            # The difference between the expected count now and at the last
+            # readout. fmax replaces negative and NaN values with zero.
+            filtered_diff = self._diff_buffer
+            np.subtract(self.expected_count, self.last_count,
+                        out=filtered_diff)
+            np.fmax(filtered_diff, 0.0, out=filtered_diff)
+            try:
+                read_diff = self.rng.poisson(filtered_diff)
+            except ValueError as e:
+                strg = "Poisson sampling error. Difference array:\n"
+                strg += str(filtered_diff)
+                strg += "\n" + str(e)
+                raise ValueError(strg)
+            np.add(self.zeropoint, self.last_readout, out=read_buffer)
+            np.add(read_buffer, read_diff, out=read_buffer)
+            del read_diff
+        else:
+            np.add(self.zeropoint, self.expected_count, out=read_buffer)
+
+        if self.bucket_size is None:
+            maxread = _MAXINT
+        else:
+            maxread = self.bucket_size
+        np.clip(read_buffer, 0.0, maxread, out=read_buffer)
+        readout_array = read_buffer.astype(np.uint32)
+
+        # Remember the last expected count and last readout (measured
+        # from the zeropoint). last_readout starts as an integer array,
+        # so it is converted to floating point on the first readout.
+        np.copyto(self.last_count, self.expected_count)
+        if self.last_readout.dtype != read_buffer.dtype:
+            self.last_readout = np.empty(self.shape, dtype=self.dtype)
+        np.subtract(readout_array, self.zeropoint, out=self.last_readout)
+        self.readings += 1
+        self.nperiods_at_readout = self.nperiods
+
+        if self.verbose > 5:
+            self.logger.debug("   min=%d, max=%d (fast readout)" % \
+                              (readout_array.min(), readout_array.max()))
+        return readout_array
+
+    def _make_rng(self):
+        """
+        
+        Helper function which creates the integrator's random Generator,
+        if not already defined. The Generator is derived from the global
+        numpy random state, so that a seed given to np.random.seed is
+        honoured.
+        
+        """
+        if self.rng is None:
+            self.rng = np.random.default_rng(
+                np.random.randint(0, np.iinfo(np.int32).max))
+        return self.rng
+
+    def is_perfect(self):
+        """
+        
+        Return True if the integrator accumulates counts in proportion
+        to the flux and is zeroed exactly by a reset, so that
+        integrate_ramp may be used. A PoissonIntegrator is always
+        perfect.
+        
+        """
+        return True
+
+    def integrate_ramp(self, flux, times, deposits=None, nsamples=1):
+        """
+        
+        Integrate on a constant particle flux for a series of integration
+        periods, reading out the integrator at the end of each period.
+        The effect is the same as calling integrate followed by readout
+        for each period in turn, but all the periods are simulated at
+        once. The Poisson noise is sampled with the integrator's own
+        random Generator (see fast_readout), which is created if needed.
+        
+        The counts accumulated by a perfect integrator are the cumulative
+        sum of the counts expected in each period, and the readouts are
+        the cumulative sum of Poisson samples of those counts.
+        
+        :Parameters:
+        
+        flux: array_like
+            Photon flux array in particles per time unit. It must be the
+            same shape and size as the photon counter. Negative values
+            are treated as if they are zero.
+        times: array_like of float
+            The integration time of each period in time units. None of
+            them may be negative.
+        deposits: array_like, optional
+            If given, a 3-D array containing, for each period, the
+            particles deposited on the integrator before it integrates
+            (for example by cosmic ray hits). The deposits must not be
+            negative.
+        nsamples: int, optional, default=1
+            The number of samples made when reading out.
+            
+        :Returns:
+        
+        readout_array: array_like uint32
+            A 3-D array containing the readout at the end of each period.
+            
+        :Raises:
+    
+        ValueError
+            Raised if the integrator is not perfect or if any of the
+            times or deposits are negative.
+        TypeError
+            Raised if the flux or deposits have the wrong shape.
+            
+        """
+        if not self.is_perfect():
+            strg = "integrate_ramp can only be used on a perfect integrator."
+            raise ValueError(strg)
+        if int(nsamples) <= 0:
+            strg = "Number of samples must be at least 1."
+            raise ValueError(strg)
+        times = np.asarray(times, dtype=np.float64).ravel()
+        if times.size > 0 and times.min() < 0.0:
+            raise ValueError("Integration time must be positive")
+        flux = np.asarray(flux, dtype=self.dtype)
+        if flux.shape != self.shape:
+            strg = "Input flux array has the wrong shape: %s instead of %s" % \
+                (str(flux.shape), str(self.shape))
+            raise TypeError(strg)
+        if flux.min() < 0.0:
+            flux = np.maximum(flux, 0.0)
+        ngroups = times.size
+        if self.verbose > 5:
+            self.logger.debug("+++Integrate and read out %d periods." % ngroups)
+        rng = self._make_rng()
+        if ngroups == 0:
+            return np.zeros((0,) + self.shape, dtype=np.uint32)
+
+        # The expected count at the end of each period.
+        counts = np.multiply.outer(times.astype(self.dtype), flux)
+        if deposits is not None:
+            deposits = np.asarray(deposits, dtype=self.dtype)
+            if deposits.shape != counts.shape:
+                strg = "Deposits array has the wrong shape: %s instead of %s" % \
+                    (str(deposits.shape), str(counts.shape))
+                raise TypeError(strg)
+            if deposits.min() < 0.0:
+                raise ValueError("Deposits must not be negative")
+            np.add(counts, deposits, out=counts)
+        np.add(counts[0], self.expected_count, out=counts[0])
+        np.cumsum(counts, axis=0, out=counts)
+        np.minimum(counts, _MAXEXPECTED, out=counts)
+
+        if self.bucket_size is None:
+            maxread = _MAXINT
+        else:
+            maxread = self.bucket_size
+        if self.simulate_poisson_noise:
+            # Sample the counts gained in each period. Each readout is the
+            # last readout plus the new sample, so the readouts are the
+            # cumulative sum of the samples. The readouts never decrease,
+            # so clipping the sum is the same as clipping each readout.
+            readouts = np.empty_like(counts)
+            np.subtract(counts[0], self.last_count, out=readouts[0])
+            np.subtract(counts[1:], counts[:-1], out=readouts[1:])
+            np.fmax(readouts, 0.0, out=readouts)
+            read_diff = rng.poisson(readouts)
+            np.cumsum(read_diff, axis=0, out=read_diff)
+            np.add(read_diff, self.zeropoint + self.last_readout,
+                   out=readouts)
+            del read_diff
+        else:
+            readouts = counts + self.zeropoint
+        np.clip(readouts, 0.0, maxread, out=readouts)
+        readout_array = readouts.astype(np.uint32)
+        del readouts
+
+        # Leave the integrator in the state reached after the last period.
+        for time in times:
+            self.clock_time += float(time)
+            self.exposure_time += float(time)
+        self.flux = flux
+        self.nperiods += ngroups
+        self.readings += ngroups
+        self.nperiods_at_readout = self.nperiods
+        self.expected_count = np.array(counts[-1])
+        self.last_count = np.array(counts[-1])
+        del counts
+        self.last_readout = np.subtract(readout_array[-1], self.zeropoint,
+                                        dtype=self.dtype)
+        return readout_array
+
+    def split_rows(self, rowstart, rowstop):
+        """
+        
+        Return a new integrator holding a copy of the state of a band
+        of rows of this integrator. Every pixel of an integrator
+        evolves independently, so the band can be integrated and read
+        out on its own and later combined with merge_rows.
+        
+        :Parameters:
+        
+        rowstart: int
+            The first row of the band (numbered from 0).
+        rowstop: int
+            The row after the last row of the band.
+            
+        :Returns:
+        
+        band: PoissonIntegrator
+            An integrator of the same class and properties, with
+            (rowstop-rowstart) rows. Its random Generator is undefined
+            until set_seed is called (or it is first used).
+            
+        :Raises:
+        
+        ValueError
+            Raised if the band of rows is out of range.
+            
+        """
+        if rowstart < 0 or rowstop > self.shape[0] or rowstop <= rowstart:
+            strg = "Invalid band of rows (%d to %d) " % (rowstart, rowstop)
+            strg += "for an integrator with %d rows." % self.shape[0]
+            raise ValueError(strg)
+        band = copy(self)
+        band.shape = (rowstop - rowstart, self.shape[1])
+        for (name, value) in list(self.__dict__.items()):
+            if _is_row_array(value, self.shape):
+                setattr(band, name, np.array(value[..., rowstart:rowstop, :]))
+        band.rng = None
+        for name in self._WORK_BUFFERS:
+            setattr(band, name, None)
+        return band
+
+    def merge_rows(self, bands, rowstarts):
+        """
+        
+        Copy the state of some bands of rows, created with split_rows,
+        back into this integrator. The counters and timers are taken
+        from the first band.
+        
+        :Parameters:
+        
+        bands: list of PoissonIntegrator
+            The bands of rows, which together must cover the integrator.
+        rowstarts: list of int
+            The first row of each band.
+            
+        """
+        for (name, value) in list(bands[0].__dict__.items()):
+            if name in self._WORK_BUFFERS:
+                continue
+            if _is_row_array(value, bands[0].shape):
+                merged = np.empty(value.shape[:-2] + self.shape,
+                                  dtype=value.dtype)
+                for (band, rowstart) in zip(bands, rowstarts):
+                    rowstop = rowstart + band.shape[0]
+                    merged[..., rowstart:rowstop, :] = getattr(band, name)
+                setattr(self, name, merged)
+        for name in _BAND_STATE:
+            setattr(self, name, getattr(bands[0], name))
  
     def __str__(self):
         """
@@ -914,6 +1336,27 @@ class ImperfectIntegrator(PoissonIntegrator):
         A flag that may be used to switch off Poisson noise (for
         example to observe what effects in a simulation are caused
         by Poisson noise).
+    fast_readout: boolean, optional, default=False
+        Set to True to sample the Poisson noise with the integrator's
+        own numpy random Generator, reusing work buffers between
+        readouts. The result is reproducible for a given seed (see
+        set_seed) but is not the same random sequence as the default
+        scipy.stats.poisson sampler.
+    kernel: string, optional, default='numpy'
+        The kernel used to apply the integrator effects (see
+        set_kernel).
+        
+        * 'numpy' - create new arrays at every step.
+        * 'inplace' - update persistent work buffers in place. The
+          result is identical to the 'numpy' kernel.
+        * 'numexpr' - as 'inplace', but evaluate each integration as
+          a single numexpr expression. The numexpr package must be
+          installed. The result may differ from the other kernels by
+          rounding errors.
+        
+    precision: string, optional, default='float64'
+        The floating point precision of the expected counts and work
+        arrays, which must be one of INTEGRATOR_PRECISIONS.
     verbose: int, optional, default=2
         Verbosity level. Activates print statements when non-zero.
         
@@ -932,6 +1375,9 @@ class ImperfectIntegrator(PoissonIntegrator):
     
     ValueError
         Raised if any of the initialisation parameters are out of range.
+    ImportError
+        Raised if the numexpr kernel is selected but numexpr is not
+        installed.
 
     :Attributes:
     
@@ -991,10 +1437,13 @@ class ImperfectIntegrator(PoissonIntegrator):
         Set to None to turn off the fast latency effect altogether.
          
     """
+    # Work buffers, which are not copied by split_rows or merge_rows.
+    _WORK_BUFFERS = PoissonIntegrator._WORK_BUFFERS + ('_kernel_buffers',)
 
     def __init__(self, rows, columns, particle="photon", time_unit="seconds",
-                 bucket_size=None, simulate_poisson_noise=True, verbose=2,
-                 logger=LOGGER):
+                 bucket_size=None, simulate_poisson_noise=True,
+                 fast_readout=False, kernel='numpy', precision='float64',
+                 verbose=2, logger=LOGGER):
         """
         
         Constructor for class ImperfectIntegrator.
@@ -1008,6 +1457,8 @@ class ImperfectIntegrator(PoissonIntegrator):
                                                   time_unit=time_unit,
                                                   bucket_size=bucket_size,
                                                   simulate_poisson_noise=simulate_poisson_noise,
+                                                  fast_readout=fast_readout,
+                                                  precision=precision,
                                                   verbose=verbose, logger=logger)
         
         # Define quantities that make the integrator imperfect.
@@ -1034,6 +1485,11 @@ class ImperfectIntegrator(PoissonIntegrator):
 
         self.last_flux = self.flux
         self.slow_latent = np.zeros(self.shape, dtype=np.uint32)
+
+        # The kernel used to apply the integrator effects and the work
+        # buffers it updates in place.
+        self._kernel_buffers = None
+        self.set_kernel(kernel)
 # UNCOMMENT FOR EXTRA PLOTTING
 #         self.m_factor = np.zeros(self.shape, dtype=np.uint32)
 #         self.s_factor = np.zeros(self.shape, dtype=np.uint32)
@@ -1058,6 +1514,8 @@ class ImperfectIntegrator(PoissonIntegrator):
             # Objects created in methods
             if self.persistence_poly is not None:
                 del self.persistence_poly
+            if self._kernel_buffers is not None:
+                del self._kernel_buffers
              
             # Finally, tidy up the parent class
             super(ImperfectIntegrator, self).__del__()
@@ -1262,13 +1720,94 @@ class ImperfectIntegrator(PoissonIntegrator):
         self.slow_latency_params = slow_parameters
         self.fast_latency_params = fast_parameters
 
-    def _persistence_function(self, data, coeffs, zerolevel=0.0):
+    def set_kernel(self, kernel):
+        """
+        
+        Select the kernel used to apply the integrator effects.
+        
+        :Parameters:
+        
+        kernel: string
+            One of the kernels listed in INTEGRATOR_KERNELS.
+            
+            * 'numpy' - create new arrays at every step.
+            * 'inplace' - update persistent work buffers in place,
+              using numpy out= arguments. The result is identical
+              to the 'numpy' kernel.
+            * 'numexpr' - as 'inplace', but evaluate each integration
+              as a single numexpr expression.
+
+        :Raises:
+    
+        ValueError
+            Raised if the kernel is not recognised.
+        ImportError
+            Raised if the numexpr kernel is selected but numexpr
+            is not installed.
+          
+        """
+        if kernel not in INTEGRATOR_KERNELS:
+            strg = "Unknown integrator kernel \'%s\'. " % str(kernel)
+            strg += "It must be one of %s." % str(INTEGRATOR_KERNELS)
+            raise ValueError(strg)
+        if kernel == 'numexpr' and _import_numexpr() is None:
+            strg = "The numexpr integrator kernel needs the numexpr package."
+            raise ImportError(strg)
+        if self.verbose > 3:
+            self.logger.debug("+++Set integrator kernel to " + str(kernel))
+        self.kernel = kernel
+        self._kernel_buffers = None
+
+    def is_perfect(self):
+        """
+        
+        Return True if none of the imperfections are simulated, so the
+        integrator behaves in the same way as a PoissonIntegrator and
+        integrate_ramp may be used.
+        
+        """
+        if self.persistence is not None and \
+           not (isinstance(self.persistence, (float,int)) and \
+                self.persistence == 0.0):
+            return False
+        if self.sensitivity is not None and self.bucket_size is not None:
+            # A constant sensitivity of at least 1.0 is clipped to 1.0.
+            if self.sensitivity[1] != 0.0 or self.sensitivity[0] < 1.0:
+                return False
+        return self.zp_slow is None and self.zp_fast is None and \
+            self.slow_latency_params is None and \
+            self.fast_latency_params is None
+
+    def _work_buffer(self, name, dtype=None):
+        """
+        
+        Return the named work buffer, which has the same shape as the
+        integrator. The buffer is created the first time it is needed.
+        By default the buffer has the precision of the integrator.
+        
+        """
+        if dtype is None:
+            dtype = self.dtype
+        if self._kernel_buffers is None:
+            self._kernel_buffers = {}
+        buffer = self._kernel_buffers.get(name, None)
+        if buffer is None or buffer.shape != self.shape or \
+           buffer.dtype != dtype:
+            buffer = np.empty(self.shape, dtype=dtype)
+            self._kernel_buffers[name] = buffer
+        return buffer
+
+    def _persistence_function(self, data, coeffs, zerolevel=0.0, out=None):
         """
         
         Apply the persistence function to some data. The persistence
         function only applies to the signal above the defined zero level.
+        If an out array is given the result is written into it (out
+        may be the same array as data).
         
         """
+        if out is not None:
+            return self._persistence_inplace(data, coeffs, zerolevel, out)
         if coeffs is None:
             # No persistence
             newdata = data * 0.0
@@ -1287,13 +1826,49 @@ class ImperfectIntegrator(PoissonIntegrator):
         else:
             maxread = self.bucket_size
         return np.clip(newdata, 0, maxread)
+
+    def _persistence_inplace(self, data, coeffs, zerolevel, out):
+        """
+        
+        Helper function which applies the persistence function to some
+        data, writing the result into the out array. The operations are
+        made in the same order as in _persistence_function.
+        
+        """
+        if coeffs is None:
+            # No persistence
+            np.multiply(data, 0.0, out=out)
+        elif isinstance(coeffs,(float,int)):
+            # The persistence type is linear
+            np.subtract(data, zerolevel, out=out)
+            np.multiply(out, coeffs, out=out)
+            np.add(out, zerolevel, out=out)
+        else:
+            # Polynomial persistence, evaluated with Horner's scheme
+            # in the same way as np.polyval.
+            if self.persistence_poly is None:
+                self.persistence_poly = np.poly1d(coeffs)
+            xdata = self._work_buffer('persistence_x')
+            np.subtract(data, zerolevel, out=xdata)
+            out.fill(0.0)
+            for coeff in self.persistence_poly.coeffs:
+                np.multiply(out, xdata, out=out)
+                np.add(out, coeff, out=out)
+            np.add(out, zerolevel, out=out)
+        # The persistence cannot go below zero or above the bucket size.
+        if self.bucket_size is None:
+            maxread = _MAXINT
+        else:
+            maxread = self.bucket_size
+        return np.clip(out, 0, maxread, out=out)
         
     def _zeropoint_function(self, shape, slow_coeffs, fast_coeffs, integ, flux,
-                            clock_time):
+                            clock_time, out=None):
         """
         
         Calculate a zeropoint function from the integration number,
-        incoming flux and time since switch on.
+        incoming flux and time since switch on. If an out array is
+        given the zeropoint is written into it.
         
         NOTE: integ starts at 1.
         
@@ -1309,7 +1884,11 @@ class ImperfectIntegrator(PoissonIntegrator):
             assert len(fast_coeffs[0]) > 1
 
         # Start with a base zeropoint
-        zeropoint = np.zeros(shape)
+        if out is None:
+            zeropoint = np.zeros(shape, dtype=self.dtype)
+        else:
+            zeropoint = out
+            zeropoint.fill(0.0)
         
         # The zeropoint drifts slowly as a function of clock time in seconds,
         # up to a maximum clock time.
@@ -1321,7 +1900,13 @@ class ImperfectIntegrator(PoissonIntegrator):
         # dependent on the incoming flux.
         if (fast_coeffs is not None) and integ > 1:
             ii = min(integ - 2, (len(fast_coeffs)-1))
-            zeropoint += fast_coeffs[ii][0] + (fast_coeffs[ii][1] * flux)
+            if out is None:
+                zeropoint += fast_coeffs[ii][0] + (fast_coeffs[ii][1] * flux)
+            else:
+                jump = self._work_buffer('zeropoint_jump')
+                np.multiply(flux, fast_coeffs[ii][1], out=jump)
+                np.add(jump, fast_coeffs[ii][0], out=jump)
+                zeropoint += jump
 # Extra line left over from when the coeffs represented a 2nd order polynomial
 #                             + coeffs[ii][2] * flux * flux
                     
@@ -1330,20 +1915,29 @@ class ImperfectIntegrator(PoissonIntegrator):
             maxread = _MAXINT
         else:
             maxread = self.bucket_size
-        return np.clip(zeropoint, 0, maxread)
+        return np.clip(zeropoint, 0, maxread, out=out)
     
-    def _sensitivity_function(self, slope, const, data):
+    def _sensitivity_function(self, slope, const, data, out=None):
         """
         
         Calculate the sensitivity of the integrator, as a function
         of current count. This function represents the ability of
         the integrator to receive new counts as a function of the
         headroom left between the current count and the bucket size.
+        If an out array is given the sensitivity is written into it.
 
         The change in sensitivity as a function of count headroom
         will make the integrator response non-linear.
         
         """
+        if out is not None:
+            if self.bucket_size is not None:
+                np.multiply(data, slope, out=out)
+                np.divide(out, self.bucket_size, out=out)
+                np.add(out, const, out=out)
+            else:
+                out.fill(1.0)
+            return np.clip(out, 0.0, 1.0, out=out)
         if self.bucket_size is not None:
             # The sensitivity depends on the relative headroom between
             # the current count and the bucket size. Assume a linear
@@ -1358,12 +1952,15 @@ class ImperfectIntegrator(PoissonIntegrator):
         # return np.clip(sensitivity, 0.0, 1.2)
         return np.clip(sensitivity, 0.0, 1.0)
 
-    def _latency_function(self, flux, last_flux):
+    def _latency_function(self, flux, last_flux, out=None):
         """
          
-        Apply the latency functions to the incoming flux.
+        Apply the latency functions to the incoming flux. If an out
+        array is given the result is written into it.
          
         """
+        if out is not None:
+            return self._latency_inplace(flux, last_flux, out)
         # The integrator behaves as if it has a memory of
         # the previous flux.
         # First apply the fast latency function, where a "fast_gain"
@@ -1393,12 +1990,37 @@ class ImperfectIntegrator(PoissonIntegrator):
 #             self.m_factor = m_factor
         return newflux
 
+    def _latency_inplace(self, flux, last_flux, out):
+        """
+        
+        Helper function which applies the latency functions to the
+        incoming flux, writing the result into the out array. The
+        operations are made in the same order as in _latency_function.
+        
+        """
+        if self.fast_latency_params is not None:
+            fast_beta = self.fast_latency_params[0]
+            np.subtract(last_flux, flux, out=out)
+            np.multiply(out, fast_beta, out=out)
+            np.add(out, flux, out=out)
+        else:
+            np.copyto(out, flux)
+        if self.slow_latency_params is not None:
+            slow_beta = self.slow_latency_params[0]
+            m_factor = self._work_buffer('latency_factor')
+            np.multiply(self.slow_latent, slow_beta, out=m_factor)
+            np.add(m_factor, 1.0, out=m_factor)
+            np.multiply(out, m_factor, out=out)
+        return out
+
     def _apply_zeropoint(self, data, nresets=1):
         """
         
         Apply the zero point function to a set of data
         
         """
+        if self.kernel != 'numpy':
+            return self._apply_zeropoint_inplace(data, nresets=nresets)
         # An imperfect integrator builds up a latent image based
         # on the count remaining before the reset and the slow
         # decay factor.
@@ -1443,7 +2065,52 @@ class ImperfectIntegrator(PoissonIntegrator):
 #                                                   zerolevel=zeropoint)
             
         newdata = zeropoint + newdata
-        return newdata.astype(np.int)
+        return newdata.astype(np.int64)
+
+    def _apply_zeropoint_inplace(self, data, nresets=1):
+        """
+        
+        Apply the zero point function to a set of data, updating the
+        latent images and work buffers in place. The result is the
+        same as the one given by the numpy kernel.
+        
+        """
+        if self.slow_latency_params is not None:
+            slow_gamma = 1.0 - (self.exposure_time / self.slow_latency_params[1])
+            if self.slow_latent.dtype == self.dtype:
+                np.multiply(self.slow_latent, slow_gamma, out=self.slow_latent)
+                np.add(self.slow_latent, data, out=self.slow_latent)
+            else:
+                # The initial integer latent image is replaced once.
+                self.slow_latent = np.asarray(
+                    slow_gamma * self.slow_latent + data, dtype=self.dtype)
+
+        # The smoothed flux is kept in its own buffer, so it can be
+        # updated without changing the flux given by the caller.
+        if self.fast_latency_params is not None:
+            fast_gamma = 1.0 - (self.exposure_time / self.fast_latency_params[1])
+            last_flux = self._work_buffer('last_flux')
+            np.subtract(self.last_flux, self.flux, out=last_flux)
+            np.multiply(last_flux, fast_gamma, out=last_flux)
+            np.add(last_flux, self.flux, out=last_flux)
+            self.last_flux = last_flux
+        else:
+            self.last_flux = self.flux
+
+        zeropoint = self._zeropoint_function(data.shape, self.zp_slow,
+                                             self.zp_fast, self.nints,
+                                             self.flux, self.clock_time,
+                                             out=self._work_buffer('zeropoint'))
+        newdata = self._persistence_function(data, self.persistence,
+                                             zerolevel=0.0,
+                                             out=self._work_buffer('persistence'))
+        for n in range(0,nresets-1):
+            self._persistence_function(newdata, self.persistence,
+                                       zerolevel=0.0, out=newdata)
+        np.add(zeropoint, newdata, out=zeropoint)
+        result = self._work_buffer('zeropoint_int', dtype=np.int64)
+        np.copyto(result, zeropoint, casting='unsafe')
+        return result
 
     def _apply_integrator(self, data, flux, time):
         """
@@ -1456,6 +2123,10 @@ class ImperfectIntegrator(PoissonIntegrator):
         """
         if self.verbose > 6:
             self.logger.debug("+++Imperfect integrator")
+        if self.kernel == 'inplace':
+            return self._apply_integrator_inplace(data, flux, time)
+        elif self.kernel == 'numexpr':
+            return self._apply_integrator_numexpr(data, flux, time)
         # The incoming flux is affected by the integrator latency
         # function, in which a certain amount of the flux from the
         # previous integration is retained.
@@ -1484,6 +2155,72 @@ class ImperfectIntegrator(PoissonIntegrator):
         del temp_data, newcounts
         return newdata
 
+    def _apply_integrator_inplace(self, data, flux, time):
+        """
+        
+        Apply the integrator function to the data in place, using
+        persistent work buffers. The data array is updated and
+        returned. The result is the same as the one given by the
+        numpy kernel.
+        
+        """
+        newcounts = self._latency_function(flux, self.last_flux,
+                                           out=self._work_buffer('counts'))
+        np.multiply(newcounts, float(time), out=newcounts)
+        if self.sensitivity is not None:
+            sensitivity = self._sensitivity_function(
+                                self.sensitivity[1], self.sensitivity[0],
+                                data, out=self._work_buffer('sensitivity'))
+            np.multiply(newcounts, sensitivity, out=newcounts)
+            
+        if self.verbose > 3:
+            strg = "Adding flux counts ranging from "
+            strg += "min=%.2f to max=%.2f." % (newcounts.min(), newcounts.max())
+            self.logger.debug( strg )
+
+        np.add(data, newcounts, out=data)
+        return np.clip(data, 0, _MAXEXPECTED, out=data)
+
+    def _apply_integrator_numexpr(self, data, flux, time):
+        """
+        
+        Apply the integrator function to the data in place, evaluating
+        the latency, sensitivity and clipping functions with numexpr.
+        The data array is updated and returned.
+        
+        """
+        numexpr = _import_numexpr()
+        variables = {'data': data, 'flux': flux, 'time': float(time)}
+        expression = 'flux'
+        if self.fast_latency_params is not None:
+            variables['last_flux'] = self.last_flux
+            variables['fast_beta'] = float(self.fast_latency_params[0])
+            expression = '(flux + fast_beta * (last_flux - flux))'
+        if self.slow_latency_params is not None:
+            # numexpr does not support unsigned integers.
+            variables['slow_latent'] = \
+                np.asarray(self.slow_latent, dtype=self.dtype)
+            variables['slow_beta'] = float(self.slow_latency_params[0])
+            expression += ' * (1.0 + slow_beta * slow_latent)'
+        expression += ' * time'
+        if self.sensitivity is not None:
+            # The sensitivity is needed twice by the clipping function,
+            # so it is evaluated first.
+            sensitivity = self._sensitivity_function(
+                                self.sensitivity[1], self.sensitivity[0],
+                                data, out=self._work_buffer('sensitivity'))
+            variables['sensitivity'] = sensitivity
+            expression += ' * sensitivity'
+        counts = self._work_buffer('counts')
+        numexpr.evaluate('data + ' + expression, local_dict=variables,
+                         out=counts, casting='unsafe')
+        numexpr.evaluate('where(counts < 0.0, 0.0, ' \
+                         'where(counts > maxexpected, maxexpected, counts))',
+                         local_dict={'counts': counts,
+                                     'maxexpected': float(_MAXEXPECTED)},
+                         out=data, casting='unsafe')
+        return data
+
     def hard_reset(self):
         """
         
@@ -1500,8 +2237,8 @@ class ImperfectIntegrator(PoissonIntegrator):
             self.logger.debug("+++hard_reset ")
            
         # Remove latents and persistence 
-        self.zeropoint = np.zeros(self.shape)
-        self.expected_count = np.zeros(self.shape)
+        self.zeropoint = np.zeros(self.shape, dtype=self.dtype)
+        self.expected_count = np.zeros(self.shape, dtype=self.dtype)
         self.clock_time = 0.0     # Clock time since switch on.
             
         # Finish with a reset
@@ -1565,37 +2302,89 @@ class ImperfectIntegrator(PoissonIntegrator):
         
             # Add the energy to the particle count. (If the counter
             # goes above the bucket size it will be truncated at the
-            # next readout.)
-            if rowstart >= 0 and rowend < self.expected_count.shape[0] and \
-               colstart >= 0 and colend < self.expected_count.shape[1]:
-            
-                # The slicing is only simple if the energy array is entirely
-                # within the particle count array.
-                self.expected_count[rowstart:rowend, colstart:colend] = \
-                    self.expected_count[rowstart:rowend, colstart:colend] + \
-                    energy_map
-            
-            elif rowstart < self.expected_count.shape[0] and rowend >= 0 and \
-                colstart < self.expected_count.shape[1] and colend >= 0:
-            
-                # The energy array is partly inside the particle count array,
-                # so more complex assignment is needed. (This is a lot less
-                # efficient than numpy slicing.)
-                for rw in range(rowstart,rowend):
-                    if rw >=0 and rw < self.expected_count.shape[0]:
-                        for cl in range(colstart,colend):
-                            if cl >=0 and cl < self.expected_count.shape[1]:
-                                erw = rw - rowstart
-                                ecl = cl - colstart
-                                self.expected_count[rw,cl] = \
-                                    self.expected_count[rw,cl] + \
-                                    energy_map[erw,ecl]
+            # next readout.) Any part of the energy array falling
+            # outside the particle count array is clipped off.
+            rowlo = max(rowstart, 0)
+            rowhi = min(rowend, self.expected_count.shape[0])
+            collo = max(colstart, 0)
+            colhi = min(colend, self.expected_count.shape[1])
+            if rowlo < rowhi and collo < colhi:
+                self.expected_count[rowlo:rowhi, collo:colhi] += \
+                    energy_map[rowlo-rowstart:rowhi-rowstart,
+                               collo-colstart:colhi-colstart]
             else:
                 # Ignore a cosmic ray which is completely outside the array.
                 if self.verbose > 4:
                     self.logger.debug("Cosmic ray at row %d column %d ignored." % \
                         (row,column))
 
+    def hit_by_cosmic_rays(self, energy_maps, rows, columns, target=None):
+        """
+        
+        Dump the energy from a batch of cosmic rays onto the integrator
+        in one operation. The effect is the same as calling
+        hit_by_cosmic_ray for each cosmic ray in turn.
+        
+        :Parameters:
+        
+        energy_maps: array_like
+            Either a 1-D array containing a single energy for each cosmic
+            ray or a 3-D array containing a 2-D energy map for each
+            cosmic ray (see hit_by_cosmic_ray).
+        rows: array_like of int
+            The rows on which the cosmic ray energies are centred.
+        columns: array_like of int
+            The columns on which the cosmic ray energies are centred.
+        target: array_like, optional
+            If given, a floating point array with the same shape as the
+            integrator to which the energy is added instead of the
+            expected count (for example, to build the deposits given to
+            integrate_ramp).
+            
+        :Raises:
+    
+        TypeError
+            Raised if the energy maps are invalid.
+            
+        """
+        if target is None:
+            target = self.expected_count
+        rows = np.asarray(rows, dtype=int)
+        columns = np.asarray(columns, dtype=int)
+        energy_maps = np.asarray(energy_maps,
+                                 dtype=self.expected_count.dtype)
+        if energy_maps.ndim == 1:
+            energy_maps = energy_maps[:, np.newaxis, np.newaxis]
+        if energy_maps.ndim != 3 or energy_maps.shape[0] != rows.size or \
+           columns.size != rows.size:
+            strg = "Cosmic ray energy maps must be a 1-D or 3-D array "
+            strg += "with one entry for each row and column."
+            raise TypeError(strg)
+        if rows.size == 0:
+            return
+        if self.verbose > 5:
+            self.logger.debug("%d cosmic ray hits totalling %.0f %s." % \
+                (rows.size, energy_maps.sum(), self.particle))
+
+        # Calculate the row and column of every element of every energy
+        # map, and discard the elements falling outside the array.
+        (nhits, nrows, ncolumns) = energy_maps.shape
+        hit_rows = rows[:,np.newaxis,np.newaxis] - nrows//2 + \
+            np.arange(nrows)[np.newaxis,:,np.newaxis]
+        hit_columns = columns[:,np.newaxis,np.newaxis] - ncolumns//2 + \
+            np.arange(ncolumns)[np.newaxis,np.newaxis,:]
+        (arows, acolumns) = self.expected_count.shape
+        inside = (hit_rows >= 0) & (hit_rows < arows) & \
+            (hit_columns >= 0) & (hit_columns < acolumns)
+        flat_index = np.broadcast_to(hit_rows * acolumns, inside.shape)[inside] + \
+            np.broadcast_to(hit_columns, inside.shape)[inside]
+        
+        # Scatter-add all the energies at once. Energies landing on
+        # the same pixel are summed.
+        esum = np.bincount(flat_index, weights=energy_maps[inside],
+                           minlength=arows * acolumns)
+        target += esum.reshape(self.expected_count.shape)
+
     def leak(self, leakage, row, column):
         """
         
@@ -27,11 +27,24 @@ amplifier
 cosmic_ray
     CosmicRay            - Describes a cosmic ray event.
     CosmicRayEnvironment - Describes the cosmic ray environment.
+
+batch_simulation
+    run_batch - Run a manifest of simulations in parallel worker processes.
+
+cdp_store
+    CDPStore - A read-only store of derived calibration arrays shared
+               between processes.
+
+profiling
+    StageProfiler - Measures the time and memory used by each stage
+                    of a simulation.
     
 Scripts
 -------
 scasim - Run an SCASIM simulation.
 
+scasim_batch - Run a batch of SCASIM simulations described by a manifest.
+
 convert_exposure_data - Convert exposure data between FITSWRiter and STScI format
 
 plot_exposure - Plot the contents of an exposure (or ramp) data file.
@@ -44,6 +57,8 @@ make_fringe_map - Make an artificial fringe map.
 
 make_sca_calibration - Make an artificial calibration file.
 
+make_cr_cache - Cache the processed cosmic ray library hit maps.
+
 
 Data
 ----
@@ -59,6 +74,10 @@ data/SCATestInput80x64.fits
 05 Jun 2013: Moved description of top level modules to miri.simulators.
 21 Nov 2017: Updated list of scripts.
 05 Jan 2018: More version control information added. SVN info dropped.
+18 Oct 2026: Added batch_simulation module and scasim_batch script.
+18 Oct 2026: Added make_cr_cache script.
+18 Oct 2026: Added cdp_store module.
+18 Oct 2026: Added profiling module.
 
 """
 
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+
+Module batch_simulation - Runs a batch of SCA simulations described
+by a manifest, farming independent jobs out to separate worker
+processes.
+
+Each job in the manifest describes one call to the
+SensorChipAssembly simulate_files method: an input illumination
+file, an output file, a detector and any other simulation parameters.
+Jobs are grouped into "chains". The jobs within a chain are run one
+after the other on the same simulated detector, in manifest order, so
+detector persistence is carried from one exposure to the next exactly
+as it would be if the files were given to simulate_files as a list.
+Separate chains are independent of each other and may be run at the
+same time in a pool of worker processes. By default there is one chain
+per detector.
+
+Before the worker processes are started, the calling process sets up
+a detector once for each distinct combination of detector, readout mode,
+subarray and calibration parameters found in the batch. This imports
+exactly the CDP files the simulations will use into the local CDP
+cache, so they are downloaded once rather than by several workers at
+the same time. The CDP models themselves are not kept, since they cannot
+be shared with the workers. If the CDP_STORE_DIR environment variable is
+defined, the calibration arrays derived from those CDPs are also saved
+in a CDP store (see the cdp_store module), which the workers then map
+instead of deriving the arrays again.
+
+The manifest is a JSON file containing either a list of jobs or a
+dictionary with a "jobs" list and an optional "defaults" dictionary of
+parameters shared by all the jobs. For example::
+
+    {"defaults": {"readout_mode": "FAST", "ngroups": 10,
+                  "overwrite": true},
+     "jobs": [{"inputfile": "ima1.fits", "outputfile": "ima1_out.fits",
+               "detector": "MIRIMAGE"},
+              {"inputfile": "ima2.fits", "outputfile": "ima2_out.fits",
+               "detector": "MIRIMAGE"},
+              {"inputfile": "lw1.fits", "outputfile": "lw1_out.fits",
+               "detector": "MIRIFULONG", "nints": 2}]}
+
+Jobs may include a "chain" key to group them explicitly.
+
+:Reference:
+
+The concurrent.futures module
+https://docs.python.org/3/library/concurrent.futures.html
+
+:History:
+
+18 Oct 2026: Created.
+18 Oct 2026: Mention the CDP store in the module description.
+18 Oct 2026: CDPs are preloaded once by the calling process, with the
+             readout mode and subarray of each job, instead of by every
+             worker process.
+
+@author: MIRI Software Team
+
+"""
+
+# Python logging facility.
+import logging
+# Get the top level logger.
+LOGGER = logging.getLogger("miri.simulators") # Get a default parent logger
+
+import time
+import json
+import inspect
+import concurrent.futures
+
+from miri.simulators.scasim.detector import SIM_CDP_FTP_PATH
+from miri.simulators.scasim.exposure_data import get_file_header
+from miri.simulators.scasim.sensor_chip_assembly import SensorChipAssembly, \
+     detector_properties, _get_parameter_defaults
+
+# Manifest keys which are not passed directly to simulate_files.
+_JOB_KEYS = ('inputfile', 'outputfile', 'detector', 'chain', 'job')
+
+
+def _simulation_parameters():
+    # The names of the optional simulate_files parameters.
+    signature = inspect.signature(SensorChipAssembly.simulate_files)
+    names = list(signature.parameters.keys())
+    return [name for name in names if name not in \
+            ('self', 'inputfile', 'outputfile', 'detectorid')]
+
+def read_manifest(filename):
+    """
+
+    Read a batch simulation manifest from a JSON file.
+
+    :Parameters:
+
+    filename: str
+        The name of the JSON file containing the manifest.
+
+    :Returns:
+
+    jobs: list of dict
+        A list of job descriptions, with any manifest defaults applied.
+
+    :Raises:
+
+    TypeError
+        Raised if the manifest does not have the expected structure.
+    KeyError
+        Raised if a job is missing a compulsory key or contains an
+        unrecognised parameter.
+
+    """
+    with open(filename, 'r') as fp:
+        manifest = json.load(fp)
+    return make_jobs(manifest)
+
+def make_jobs(manifest):
+    """
+
+    Convert a manifest structure into a validated list of jobs.
+
+    :Parameters:
+
+    manifest: list of dict or dict
+        Either a list of job descriptions or a dictionary containing
+        a 'jobs' list and an optional 'defaults' dictionary.
+
+    :Returns:
+
+    jobs: list of dict
+        A list of job descriptions, with any manifest defaults applied.
+
+    :Raises:
+
+    TypeError
+        Raised if the manifest does not have the expected structure.
+    KeyError
+        Raised if a job is missing a compulsory key or contains an
+        unrecognised parameter.
+
+    """
+    if isinstance(manifest, dict):
+        if 'jobs' not in manifest:
+            strg = "Batch manifest dictionary must contain a \'jobs\' list."
+            raise TypeError(strg)
+        defaults = manifest.get('defaults', {})
+        joblist = manifest['jobs']
+    else:
+        defaults = {}
+        joblist = manifest
+    if not isinstance(joblist, (list,tuple)) or \
+       not isinstance(defaults, dict):
+        strg = "Batch manifest jobs must be a list of dictionaries."
+        raise TypeError(strg)
+
+    allowed = set(_JOB_KEYS).union(_simulation_parameters())
+    jobs = []
+    for jobnum, entry in enumerate(joblist):
+        if not isinstance(entry, dict):
+            strg = "Batch manifest job %d is not a dictionary." % jobnum
+            raise TypeError(strg)
+        job = dict(defaults)
+        job.update(entry)
+        for key in ('inputfile', 'outputfile', 'detector'):
+            if key not in job:
+                strg = "Batch manifest job %d has no \'%s\'." % (jobnum, key)
+                raise KeyError(strg)
+        unknown = sorted(set(job.keys()) - allowed)
+        if unknown:
+            strg = "Batch manifest job %d contains unrecognised " % jobnum
+            strg += "parameters: %s" % ", ".join(unknown)
+            raise KeyError(strg)
+        job['job'] = jobnum
+        jobs.append(job)
+    return jobs
+
+def make_chains(jobs):
+    """
+
+    Group a list of jobs into persistence-coupled chains.
+
+    Jobs are grouped by their 'chain' key, or by detector if no chain
+    is given. The jobs in each chain keep their manifest order.
+
+    :Parameters:
+
+    jobs: list of dict
+        A list of job descriptions.
+
+    :Returns:
+
+    chains: list of list of dict
+        A list of chains, in order of first appearance in the manifest.
+
+    """
+    chains = {}
+    for job in jobs:
+        key = job.get('chain', job['detector'])
+        chains.setdefault(str(key), []).append(job)
+    # Dictionaries preserve their insertion order.
+    return list(chains.values())
+
+def _setup_parameters(job, cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH):
+    # The SensorChipAssembly setup parameters used by a job, with the
+    # readout mode, subarray, temperature and cosmic ray mode defaulted
+    # from the input file in the same way as simulate_files.
+    names = inspect.signature(SensorChipAssembly.setup).parameters.keys()
+    kwargs = dict((key, value) for (key, value) in job.items() \
+                  if key in names and key not in _JOB_KEYS)
+    kwargs.setdefault('cdp_ftp_host', cdp_ftp_host)
+    kwargs.setdefault('cdp_ftp_path', cdp_ftp_path)
+    fpm = detector_properties.get('DETECTORS_DICT', str(job['detector']))
+    header = get_file_header(job['inputfile'])
+    (readout_mode, subarray, frame_time, temperature, cosmic_ray_mode) = \
+        _get_parameter_defaults(fpm, header, kwargs.get('readout_mode'),
+                                kwargs.get('subarray'), None,
+                                kwargs.get('temperature'),
+                                kwargs.get('cosmic_ray_mode'), verbose=0)
+    kwargs['readout_mode'] = readout_mode
+    kwargs['subarray'] = subarray
+    kwargs['temperature'] = temperature
+    kwargs['cosmic_ray_mode'] = cosmic_ray_mode
+    kwargs['verbose'] = 0
+    return kwargs
+
+def preload_cdps(jobs, cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
+                 logger=LOGGER):
+    """
+
+    Import the CDPs needed by a batch of simulation jobs, so they are
+    present in the local CDP cache (and in the CDP store, if there is
+    one) before the simulations start. A detector is set up once for
+    each distinct combination of the detector, readout mode, subarray
+    and calibration parameters used by the jobs, so the same CDP
+    variants are imported as the simulations will use. This function
+    is called by the calling process before any worker is started.
+    Failures are logged but are not fatal, since the simulation will
+    try to import the CDPs again and will report any problem itself.
+
+    :Parameters:
+
+    jobs: list of dict
+        The job descriptions (see make_jobs).
+    cdp_ftp_host: str, optional
+        The SFTP host from which CDPs are imported, unless a job
+        specifies its own. If not specified, the default host is used.
+    cdp_ftp_path: str, optional
+        The SFTP path(s) searched for CDP files, unless a job specifies
+        its own.
+
+    """
+    sca = SensorChipAssembly(logger=logger)
+    done = set()
+    for job in jobs:
+        try:
+            kwargs = _setup_parameters(job, cdp_ftp_host=cdp_ftp_host,
+                                       cdp_ftp_path=cdp_ftp_path)
+            key = (job['detector'],) + tuple(sorted(kwargs.items()))
+            if key not in done:
+                done.add(key)
+                sca.setup(job['detector'], **kwargs)
+        except Exception as e:
+            strg = "Could not preload CDPs for batch job %d (%s): %s" % \
+                (job['job'], job['detector'], str(e))
+            logger.warning(strg)
+    del sca
+
+def run_chain(chain, logger=LOGGER):
+    """
+
+    Run a chain of simulation jobs, one after the other, on the same
+    simulated detector. A job which fails is recorded and the chain
+    continues with the next job.
+
+    :Parameters:
+
+    chain: list of dict
+        The jobs making up the chain.
+
+    :Returns:
+
+    report: list of dict
+        One entry per job, giving the job number, input and output file
+        names, detector, status ('OK' or 'FAILED'), any error message
+        and the elapsed time in seconds.
+
+    """
+    # Each chain has its own detector object, so the chain does not
+    # share detector persistence with any other chain run in the same
+    # process.
+    sca = SensorChipAssembly(logger=logger)
+    report = []
+    for job in chain:
+        kwargs = dict((key, value) for (key, value) in job.items() \
+                      if key not in _JOB_KEYS)
+        entry = {'job': job['job'],
+                 'inputfile': job['inputfile'],
+                 'outputfile': job['outputfile'],
+                 'detector': job['detector'],
+                 'chain': job.get('chain', job['detector']),
+                 'status': 'OK', 'error': '', 'elapsed': 0.0}
+        start = time.time()
+        try:
+            sca.simulate_files(job['inputfile'], job['outputfile'],
+                               job['detector'], **kwargs)
+        except Exception as e:
+            entry['status'] = 'FAILED'
+            entry['error'] = "%s: %s" % (e.__class__.__name__, str(e))
+            strg = "Batch job %d (%s) failed. %s" % \
+                (job['job'], job['inputfile'], entry['error'])
+            logger.error(strg)
+        entry['elapsed'] = time.time() - start
+        report.append(entry)
+    del sca
+    return report
+
+def run_batch(jobs, nworkers=None, report_file=None, preload=True,
+              cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
+              logger=LOGGER):
+    """
+
+    Run a batch of SCA simulations, with independent chains of jobs
+    run in parallel worker processes.
+
+    :Parameters:
+
+    jobs: str or list of dict or dict
+        Either the name of a JSON manifest file or a manifest structure
+        (see make_jobs).
+    nworkers: int, optional
+        The maximum number of worker processes. If None, the number of
+        processors on the machine is used. If 1 or fewer, or if there is
+        only one chain, the jobs are run in the calling process.
+    report_file: str, optional
+        If given, the name of a JSON file to which the timing report
+        is written.
+    preload: bool, optional, default=True
+        If True, the CDPs used by the jobs are imported by the calling
+        process before any simulation is started (see preload_cdps).
+    cdp_ftp_host: str, optional
+        The SFTP host from which CDPs are preloaded, for jobs which do
+        not specify their own.
+    cdp_ftp_path: str, optional
+        The SFTP path(s) searched for preloaded CDP files, for jobs
+        which do not specify their own.
+
+    :Returns:
+
+    report: list of dict
+        The per-job report described in run_chain, in manifest order.
+
+    """
+    if isinstance(jobs, str):
+        jobs = read_manifest(jobs)
+    else:
+        jobs = make_jobs(jobs)
+    chains = make_chains(jobs)
+    strg = "Running %d simulation jobs in %d chains." % \
+        (len(jobs), len(chains))
+    logger.info(strg)
+
+    start = time.time()
+    report = []
+    if preload:
+        preload_cdps(jobs, cdp_ftp_host=cdp_ftp_host,
+                     cdp_ftp_path=cdp_ftp_path, logger=logger)
+    if len(chains) < 2 or (nworkers is not None and nworkers <= 1):
+        for chain in chains:
+            report += run_chain(chain, logger=logger)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=nworkers) as executor:
+            futures = [executor.submit(run_chain, chain) for chain in chains]
+            for future in concurrent.futures.as_completed(futures):
+                report += future.result()
+    report.sort(key=lambda entry: entry['job'])
+
+    nfailed = len([entry for entry in report if entry['status'] != 'OK'])
+    strg = "%d simulation jobs completed in %.2f seconds (%d failed)." % \
+        (len(report), time.time() - start, nfailed)
+    logger.info(strg)
+    if report_file:
+        with open(report_file, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    return report
+
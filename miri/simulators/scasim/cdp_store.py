@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+
+Module cdp_store - Contains the CDPStore class, a read-only store of
+simulator-ready calibration arrays shared between processes.
+
+Each DetectorArray derives its working calibration arrays (bad pixel
+masks and gain, dark and read noise maps extended to include the
+reference rows, scaled into electrons where necessary) from the CDP
+files every time it is created. When many simulations are run at once,
+for example by the batch_simulation module, every process repeats this
+work and holds its own copy of the arrays.
+
+A CDPStore saves the derived arrays in a directory, in numpy .npy files
+which are memory-mapped read-only when they are loaded. The operating
+system shares the pages of a memory-mapped file between all the
+processes reading it, so the arrays are only held in memory once, and
+only the parts of an array actually used are read. Putting the store
+on a RAM disk (such as /dev/shm) avoids disk access altogether.
+
+Each entry in the store is keyed by a hash of the kind of array, the
+detector, readout pattern, subarray and CDP version requested, the
+geometry of the detector and the name, size and modification time of
+the CDP file used, so a new entry is made whenever any of these change.
+Entries are written to a temporary directory which is then renamed,
+so a process never sees a partly written entry.
+
+The store is used by DetectorArray when the CDP_STORE_DIR environment
+variable names a store directory.
+
+:Reference:
+
+numpy.load and numpy.lib.format.open_memmap
+https://numpy.org/doc/stable/reference/generated/numpy.load.html
+
+:History:
+
+18 Oct 2026: Created.
+
+@author: MIRI Software Team
+
+"""
+
+# Python logging facility.
+import logging
+# Get the top level logger.
+LOGGER = logging.getLogger("miri.simulators") # Get a default parent logger
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+# The name of the environment variable defining the store directory.
+CDP_STORE_ENV_NAME = 'CDP_STORE_DIR'
+
+# The name of the file describing each store entry.
+_ATTRIBUTES_FILE = 'attributes.json'
+
+
+def _file_signature(filename):
+    # The name, size and modification time of a file, or just the
+    # name if the file does not exist.
+    if filename and os.path.isfile(filename):
+        stat = os.stat(filename)
+        return (os.path.abspath(filename), stat.st_size, int(stat.st_mtime))
+    return (filename,)
+
+class CDPStore(object):
+    """
+
+    Class CDPStore - A directory of read-only, memory-mapped arrays
+    derived from MIRI CDPs.
+
+    :Parameters:
+
+    store_dir: str
+        The directory containing the store. It is created if necessary.
+    logger: Logger object (optional)
+        A Python logger to handle the I/O.
+
+    """
+    def __init__(self, store_dir, logger=LOGGER):
+        """
+
+        Initialises the CDPStore class.
+
+        Parameters: See class doc string.
+
+        """
+        if not store_dir:
+            strg = "A CDP store directory must be given."
+            raise ValueError(strg)
+        self.store_dir = store_dir
+        self.logger = logger
+
+    def make_key(self, kind, cdp_filename=None, **criteria):
+        """
+
+        Make the key identifying a store entry.
+
+        :Parameters:
+
+        kind: str
+            The kind of data held in the entry (e.g. 'GAIN').
+        cdp_filename: str, optional
+            The name of the CDP file from which the data are derived.
+            The size and modification time of the file are included in
+            the key, so a key changes whenever its CDP file is updated.
+        criteria: keyword arguments
+            Any other parameters affecting the derived data, such as
+            the detector, readout pattern, subarray, CDP version and
+            detector geometry. The values must have a stable repr.
+
+        :Returns:
+
+        key: str
+            A key of the form '<kind>_<hash>', which is also the name
+            of the entry directory.
+
+        """
+        items = [str(kind), _file_signature(cdp_filename)]
+        for name in sorted(criteria.keys()):
+            items.append( (name, criteria[name]) )
+        digest = hashlib.sha1( repr(items).encode('utf-8') ).hexdigest()[:16]
+        return "%s_%s" % (kind, digest)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.store_dir, key)
+
+    def __contains__(self, key):
+        return os.path.isfile(os.path.join(self._entry_dir(key),
+                                           _ATTRIBUTES_FILE))
+
+    def load(self, key, mmap=True):
+        """
+
+        Load an entry from the store.
+
+        :Parameters:
+
+        key: str
+            The key returned by make_key.
+        mmap: bool, optional, default=True
+            If True, the arrays are memory-mapped read-only, so they
+            are shared with every other process using the same entry.
+            Otherwise they are read into memory.
+
+        :Returns:
+
+        (arrays, attributes): tuple of (dict, dict)
+            A dictionary of the arrays in the entry and a dictionary
+            of the scalar attributes saved with them. None is returned
+            if the entry does not exist or cannot be read.
+
+        """
+        if key not in self:
+            return None
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, _ATTRIBUTES_FILE), 'r') as fp:
+                description = json.load(fp)
+            arrays = {}
+            for name in description['arrays']:
+                filename = os.path.join(entry_dir, name + '.npy')
+                if mmap:
+                    arrays[name] = np.load(filename, mmap_mode='r')
+                else:
+                    arrays[name] = np.load(filename)
+        except (IOError, OSError, ValueError, KeyError) as e:
+            strg = "Could not read CDP store entry \'%s\': %s" % (key, str(e))
+            self.logger.warning(strg)
+            return None
+        return (arrays, description['attributes'])
+
+    def save(self, key, arrays, attributes=None):
+        """
+
+        Save an entry in the store. An entry which already exists is
+        left unchanged (it was made from the same data).
+
+        :Parameters:
+
+        key: str
+            The key returned by make_key.
+        arrays: dict of ndarray
+            The arrays to be saved, by name.
+        attributes: dict, optional
+            Any scalar attributes to be saved with the arrays. The
+            values must be serialisable as JSON.
+
+        :Returns:
+
+        saved: bool
+            True if the entry was saved, False if it could not be
+            written (in which case a warning is logged).
+
+        """
+        if key in self:
+            return True
+        description = {'arrays': sorted(arrays.keys()),
+                       'attributes': attributes or {}}
+        tmp_dir = None
+        try:
+            if not os.path.isdir(self.store_dir):
+                os.makedirs(self.store_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(prefix='.' + key + '_',
+                                       dir=self.store_dir)
+            for (name, data) in arrays.items():
+                np.save(os.path.join(tmp_dir, name + '.npy'),
+                        np.ascontiguousarray(data))
+            with open(os.path.join(tmp_dir, _ATTRIBUTES_FILE), 'w') as fp:
+                json.dump(description, fp)
+            try:
+                os.rename(tmp_dir, self._entry_dir(key))
+                tmp_dir = None
+            except OSError:
+                # Another process has saved the same entry first.
+                if key not in self:
+                    raise
+        except (IOError, OSError, TypeError, ValueError) as e:
+            strg = "Could not write CDP store entry \'%s\': %s" % (key, str(e))
+            self.logger.warning(strg)
+            return False
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        return True
+
+    def clear(self):
+        """
+
+        Remove every entry from the store.
+
+        """
+        if os.path.isdir(self.store_dir):
+            for name in os.listdir(self.store_dir):
+                path = os.path.join(self.store_dir, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def __str__(self):
+        if os.path.isdir(self.store_dir):
+            nentries = len([name for name in os.listdir(self.store_dir) \
+                            if not name.startswith('.')])
+        else:
+            nentries = 0
+        return "CDP store \'%s\' containing %d entries" % (self.store_dir,
+                                                            nentries)
+
+def get_cdp_store(store_dir=None, logger=LOGGER):
+    """
+
+    Return the CDP store in the given directory, or in the directory
+    named by the CDP_STORE_DIR environment variable.
+
+    :Parameters:
+
+    store_dir: str, optional
+        The store directory. If not given, the CDP_STORE_DIR environment
+        variable is used.
+    logger: Logger object (optional)
+        A Python logger to handle the I/O.
+
+    :Returns:
+
+    store: CDPStore
+        The CDP store, or None if no store directory is defined.
+
+    """
+    if store_dir is None:
+        store_dir = os.environ.get(CDP_STORE_ENV_NAME, '')
+    if not store_dir:
+        return None
+    return CDPStore(store_dir, logger=logger)
@@ -79,6 +79,14 @@ ray events.
 31 Oct 2017: Reduced verbosity of cosmic ray event reporting.
 28 Nov 2018: Added the load_cosmic_ray_single function, which creates a
              cosmic ray environment where events always have the same energy.
+18 Oct 2026: The convolved and blurred hit maps are calculated once, when
+             the environment is created, rather than for every event.
+             Events are generated as arrays, with energies selected from
+             the cumulative distribution by a binary search.
+18 Oct 2026: Added a cache of processed library hit maps, stored in a
+             memory-mappable .npy file keyed by a hash of the library files
+             and the cosmic ray properties. Library images are rebinned
+             as one array.
 
 @author: Steven Beard (UKATC)
 
@@ -90,9 +98,10 @@ logging.basicConfig(level=logging.INFO) # Default level is informational output
 LOGGER = logging.getLogger("miri.simulators") # Get a default parent logger
 
 import math, os
+import hashlib
 #import random as rn
 import numpy as np
-from scipy.signal import convolve2d
+from scipy.signal import convolve2d, convolve
 from scipy.ndimage.filters import gaussian_filter
 import astropy.io.fits as pyfits
 
@@ -114,12 +123,19 @@ cosmic_ray_properties = ParameterFileManager(
                             description="cosmic ray properties",
                             logger=LOGGER)
 
+# The environment variable naming the directory in which processed cosmic
+# ray hit maps are cached. If it is not defined, no cache is used unless
+# a cache directory is given explicitly.
+CR_CACHE_ENV_NAME = 'CR_CACHE_DIR'
+
 def _rebin(arr, new_shape, use_maximum=False, conserve_e=False):
     """
     
     Helper function which rebins a 2-D array to a new shape.
     A new array is returned with each new pixel containing the mean or
-    the maximum value found in the contributing pixels.
+    the maximum value found in the contributing pixels. An array with
+    more than 2 dimensions is treated as a stack of 2-D arrays, each
+    of which is rebinned separately.
     
     The conserve_e flag can be set to True to conserve the total electron
     count or to False to preserve the maximum electron count per pixel.
@@ -130,16 +146,17 @@ def _rebin(arr, new_shape, use_maximum=False, conserve_e=False):
     
     """
     if conserve_e:
-        oldsum = arr.sum()
-    shape = (new_shape[0], arr.shape[0] // new_shape[0],
-             new_shape[1], arr.shape[1] // new_shape[1])
+        oldsum = arr.sum(axis=(-2,-1), keepdims=True)
+    shape = arr.shape[:-2] + \
+        (new_shape[0], arr.shape[-2] // new_shape[0],
+         new_shape[1], arr.shape[-1] // new_shape[1])
     if use_maximum:
-        newarr = arr.reshape(shape).max(-1).max(1)
+        newarr = arr.reshape(shape).max(-1).max(-2)
     else:
-        newarr = arr.reshape(shape).max(-1).mean(1)
+        newarr = arr.reshape(shape).max(-1).mean(-2)
     # If requested, conserve the total number of electrons within the image.
     if conserve_e:
-        newsum = newarr.sum()
+        newsum = newarr.sum(axis=(-2,-1), keepdims=True)
         newarr = newarr * oldsum / newsum
     return newarr     
 
@@ -446,6 +463,13 @@ class CosmicRayEnvironment(object):
         in the energies list. Used by the LIBRARY method only.
         If not None, this array must be the same number of elements as the
         energies array.
+    hit_maps: array_like, optional
+        A data cube containing the hit map of each of the cosmic ray
+        events contained in the energies list, with the coupling and
+        scattering functions already applied (for example, read from
+        a cosmic ray cache). Used by the LIBRARY method only, in place
+        of the images array. If None, the hit maps are calculated from
+        the images array.
     convolve_ipc: boolean (optional)
         If True, convolve all cosmic ray events with the detector
         capacitative coupling function. The default is True.
@@ -479,7 +503,7 @@ class CosmicRayEnvironment(object):
     
     def __init__(self, cr_flux, method, energies, distribution=None,
                  images=None, nucleons=None, convolve_ipc=True,
-                 blur_sigma=0.0, verbose=2, logger=LOGGER):
+                 blur_sigma=0.0, hit_maps=None, verbose=2, logger=LOGGER):
         """
         
         Constructor for class CosmicRayEnvironment.
@@ -562,6 +586,32 @@ class CosmicRayEnvironment(object):
         self.blur_sigma = blur_sigma
         self._verbose = verbose
 
+        # Calculate the hit map for each possible event once, so the
+        # (expensive) coupling and scattering functions are not
+        # applied every time an event is generated.
+        if self.distribution is not None:
+            self.cumulative = np.cumsum(self.distribution)
+            # The hit map is generated from the capacitative coupling
+            coupling = np.array(cosmic_ray_properties['CR_COUPLING'])
+            self.hit_maps = self._coupling_and_scattering(
+                                coupling[np.newaxis,:,:] * \
+                                self.energies[:,np.newaxis,np.newaxis])
+        else:
+            self.cumulative = None
+            if hit_maps is not None:
+                hit_maps = np.asarray(hit_maps)
+                if hit_maps.ndim != 3 or hit_maps.shape[0] != len(energies):
+                    strg = "Hit maps must be a data cube with a slice "
+                    strg += "for each element in the energies array "
+                    strg += "(%d elements)." % len(energies)
+                    raise TypeError(strg)
+                # Keep the given array, which might be memory-mapped.
+                self.hit_maps = hit_maps
+            elif self.images is not None:
+                self.hit_maps = self._coupling_and_scattering(self.images)
+            else:
+                self.hit_maps = None
+
     def set_metadata(self, metadata):
         """
         
@@ -614,6 +664,9 @@ class CosmicRayEnvironment(object):
         if self.images is not None:
             strg += "\n   and events ranging from %.1f to %.1f electrons." % \
                 (self.images.min(), self.images.max())
+        elif self.hit_maps is not None and self.cumulative is None:
+            strg += "\n   and hit maps ranging from %.1f to %.1f electrons." % \
+                (self.hit_maps.min(), self.hit_maps.max())
         if self.coupling is not None:
             strg += "\n   An IPC coupling function is applied. "
         if self.blur_sigma > 0.0:
@@ -639,19 +692,17 @@ class CosmicRayEnvironment(object):
             strg += "Images array (e) min=%g; max=%g; mean=%g; std=%g; median=%g\n" % \
                 (self.images.min(), self.images.max(), self.images.mean(),
                  self.images.std(), np.median(self.images))
-        
+        if self.hit_maps is not None and self.cumulative is None:
             # Generate an electron count (ignoring zero counts, which will
             # not display logarithmically).
             electrons_per_event = []
             electrons_per_pixel = []
             primary_pixels_per_event = []
             all_pixels_per_event = []
-            for sl in range(0,self.images.shape[0]):
-                crmap = self.images[sl,:,:]
-    
-                # If required, convolve the hit map with the capacitive
+            for sl in range(0,self.hit_maps.shape[0]):
+                # The hit map already includes the capacitive
                 # coupling and scattering functions of the detector.
-                crmap = self._coupling_and_scattering(crmap)
+                crmap = self.hit_maps[sl,:,:]
                 
                 nonzero = np.where(crmap > 0)
                 # Count the number of pixels affected by this event.
@@ -702,15 +753,25 @@ class CosmicRayEnvironment(object):
         
         Helper function which applies IPC coupling and scattering to
         a 2-D array and returns a new 2-D array. Entries less than
-        1.0 are replaced by 1.0.
+        1.0 are replaced by 1.0. A 3-D array is treated as a stack
+        of 2-D arrays, each of which is processed separately.
         
         """
-        output = input
-        if self.coupling is not None:
-            output = convolve2d(output, self.coupling)
-        # If required, blur the hit map
-        if self.blur_sigma > 0.0:
-            output = gaussian_filter(output, self.blur_sigma)
+        output = np.asarray(input, dtype=float)
+        if output.ndim > 2:
+            # Convolve and blur each plane but not across planes.
+            if self.coupling is not None:
+                output = convolve(output, self.coupling[np.newaxis,:,:],
+                                  method='direct')
+            if self.blur_sigma > 0.0:
+                output = gaussian_filter(output,
+                                (0.0, self.blur_sigma, self.blur_sigma))
+        else:
+            if self.coupling is not None:
+                output = convolve2d(output, self.coupling)
+            # If required, blur the hit map
+            if self.blur_sigma > 0.0:
+                output = gaussian_filter(output, self.blur_sigma)
         # Round to the nearest whole number of electrons.
         output = output.round(0)
         return output
@@ -874,12 +935,10 @@ class CosmicRayEnvironment(object):
         # Generate an electron count (ignoring zero counts, which will
         # not display logarithmically).
         electrons = []
-        for sl in range(0,self.images.shape[0]):
-            crmap = self.images[sl,:,:]
-
-            # If required, convolve the hit map with the capacitive
+        for sl in range(0,self.hit_maps.shape[0]):
+            # The hit map already includes the capacitive
             # coupling and scattering functions of the detector.
-            crmap = self._coupling_and_scattering(crmap)
+            crmap = self.hit_maps[sl,:,:]
             
             nonzero = np.where(crmap > 0)
             esum = 0
@@ -1015,9 +1074,40 @@ class CosmicRayEnvironment(object):
             take place.
             
         """
-        # Cosmic ray events will be collected into an event list.
+        (hit_rows, hit_columns, lkup) = self.generate_event_arrays(rows,
+                                                columns, time, pixsize)
         event_list = []
+        for (hit_row, hit_column, index) in zip(hit_rows, hit_columns, lkup):
+            event_list.append( self._make_event(hit_row, hit_column, index) )
+        return event_list
 
+    def generate_event_arrays(self, rows, columns, time, pixsize):
+        """
+        
+        Generate the cosmic ray events which happen while a specified
+        detector is integrating for a specified time, as arrays of
+        target coordinates and event indices. This is faster than
+        generate_events when there are a large number of events.
+        
+        :Parameters:
+        
+        rows: int
+            The number of detector rows.
+        columns: int
+            The number of detector columns.
+        time: float
+            The integration time in seconds.
+        pixsize: float
+            The detector pixel size in microns.
+            
+        :Returns:
+        
+        (hit_rows, hit_columns, lkup): tuple of 3 int arrays
+            The row and column hit by each event and the index of
+            each event within the energies (and hit_maps) arrays.
+            
+        """
+        nevents = 0
         # Generate detector events if there are detector pixels.
         if rows > 0 and columns > 0:
             # First calculate the number of detector events that are expected,
@@ -1032,15 +1122,7 @@ class CosmicRayEnvironment(object):
             if (self._verbose > 2) and (expected_events > 0):
                 self.logger.info( "Number of detector CR events " + \
                     "expected=%d and actual=%d." % (expected_events, nevents))
-                
-            # For each of these events choose a random target pixel and
-            # select a cosmic ray energy either from the given probability
-            # distribution or from the library.
-            for ev in range(0,nevents):
-                cosmic_ray = self.generate_event(rows, columns)
-                event_list.append(cosmic_ray)
-            
-        return event_list
+        return self._random_events(rows, columns, nevents)
     
     def generate_event(self, rows, columns):
         """
@@ -1065,48 +1147,54 @@ class CosmicRayEnvironment(object):
         event: CosmicRay
             A cosmic ray event
             
+        """
+        (hit_rows, hit_columns, lkup) = self._random_events(rows, columns, 1)
+        return self._make_event(hit_rows[0], hit_columns[0], lkup[0])
+
+    def _random_events(self, rows, columns, nevents):
+        """
+        
+        Helper function which chooses a random target pixel and a
+        random event index for each of nevents cosmic ray events.
+        
         """
         # The cosmic ray can hit the detector anywhere over its surface
-        hit_row = int(np.random.uniform(0, rows))
-        hit_column = int(np.random.uniform(0, columns))
-        hit_coords = (hit_row, hit_column)
+        hit_rows = np.random.uniform(0, rows, nevents).astype(int)
+        hit_columns = np.random.uniform(0, columns, nevents).astype(int)
             
-        if self.method == 'RANDOM' or self.method == 'SINGLE_ENERGY':
-            # Select a random event from the list of possible energies
+        if self.cumulative is not None:
+            # Select random events from the list of possible energies
             # weighted by the given incremental probability
-            # distribution.
-            prob = np.random.uniform(0.0, self.distribution.sum())
-            lkup = -1
-            ptotal = 0.0
-            while (ptotal < prob) and (lkup < len(self.energies)):
-                lkup += 1
-                ptotal += self.distribution[lkup]
-            energy = self.energies[lkup]
-            # The hit map is generated from the capacitative coupling
-            hit_map = np.array(cosmic_ray_properties['CR_COUPLING']) * energy
-
-            # If required, blur the map to simulate scattering.
-            hit_map = self._coupling_and_scattering(hit_map)
-            nucleon=''
+            # distribution, by looking up a uniform random number in
+            # the cumulative distribution.
+            prob = np.random.uniform(0.0, self.cumulative[-1], nevents)
+            lkup = np.searchsorted(self.cumulative, prob, side='right')
+            lkup = np.minimum(lkup, len(self.energies)-1)
         else:
-            # Select a random event from the list with a uniform
+            # Select random events from the list with a uniform
             # probability distribution.
-            lkup = int(np.random.uniform(0, len(self.energies)))
-            energy = self.energies[lkup]
-            hit_map = self.images[lkup]
-
-            # If required, convolve the hit map with the capacitive
-            # coupling and scattering functions of the detector.
-            hit_map = self._coupling_and_scattering(hit_map)
+            lkup = np.random.uniform(0, len(self.energies),
+                                     nevents).astype(int)
+        return (hit_rows, hit_columns, lkup)
 
+    def _make_event(self, hit_row, hit_column, lkup):
+        """
+        
+        Helper function which creates a CosmicRay object for the given
+        target pixel and event index.
+        
+        """
+        if self.nucleons is None:
+            nucleon = ''
+        else:
             nc = self.nucleons[lkup]
             nucleon = cosmic_ray_properties.get('CR_NUCLEONS')[nc]
-
-        cosmic_ray = CosmicRay(energy, hit_coords, hit_map=hit_map,
+        cosmic_ray = CosmicRay(self.energies[lkup],
+                               (int(hit_row), int(hit_column)),
+                               hit_map=self.hit_maps[lkup],
                                nucleon=nucleon, verbose=self._verbose,
                                logger=self.logger)
-        
-        return cosmic_ray        
+        return cosmic_ray
 
 
 def load_cosmic_ray_single(cosmic_ray_mode='SOLAR_MIN', energy=1.0e4, verbose=2,
@@ -1229,8 +1317,298 @@ def load_cosmic_ray_random(cosmic_ray_mode='SOLAR_MIN', verbose=2,
                                   verbose=verbose, logger=logger)
     return cr_env
 
+def _read_cosmic_ray_files(file_list, verbose=2, logger=LOGGER):
+    """
+    
+    Helper function which reads a list of STScI-format cosmic ray
+    library files and returns the combined (images, nucleons, energies)
+    arrays, with the energy and electron multipliers and any rebinning
+    applied.
+    
+    """
+    images = []
+    nucleons = []
+    energies = []
+    for filename in file_list:
+        if verbose > 1:
+            logger.info( "Reading cosmic ray library file: \'%s\'" % filename)
+        with pyfits.open(filename) as hdulist:
+            images.append( np.asarray(hdulist[1].data) )
+            nucleons.append( np.asarray(hdulist[2].data) )
+            energies.append( np.asarray(hdulist[3].data) )
+    images = np.concatenate(images) * \
+                cosmic_ray_properties['CR_ELECTRON_MULTIPLIER']
+    nucleons = np.concatenate(nucleons)
+    energies = np.concatenate(energies) * \
+                cosmic_ray_properties['CR_ENERGY_MULTIPLIER']
+
+    # If necessary, rebin the images array down to a new size.
+    binfactor = cosmic_ray_properties['CR_BINNING_FACTOR']
+    if  binfactor > 1:
+        newshape = (images.shape[-2]//binfactor, images.shape[-1]//binfactor)
+        maxshape = (newshape[0] * binfactor, newshape[1] * binfactor)
+        images = _rebin( images[:,:maxshape[0],:maxshape[1]], newshape )
+    return (images, nucleons, energies)
+
+def cosmic_ray_library_files(cosmic_ray_mode='SOLAR_MIN', variant=''):
+    """
+    
+    Return a list of all the known cosmic ray library files for the
+    given cosmic ray mode and variant.
+    
+    :Parameters:
+    
+    cosmic_ray_mode: string, optional, default='SOLAR_MIN'
+        The cosmic ray mode ('SOLAR_MIN', 'SOLAR_MAX' or 'SOLAR_FLARE').
+    variant: string, optional, default=''
+        The variant of the cosmic ray libraries (if any).
+        
+    :Returns:
+    
+    file_list: list of str
+        The names of the library files.
+    
+    """
+    file_list = []
+    num_min = cosmic_ray_properties.get('CR_LIBRARY_FILES', 'MIN')
+    num_max = cosmic_ray_properties.get('CR_LIBRARY_FILES', 'MAX')
+    for filenum in range(num_min, num_max+1):
+        if variant:
+            file_name = '%s0%d_%s.fits' % \
+                (cosmic_ray_properties.get('CR_LIBRARY_FILES', cosmic_ray_mode), \
+                 filenum, variant)
+        else:
+            file_name = '%s0%d.fits' % \
+                (cosmic_ray_properties.get('CR_LIBRARY_FILES', cosmic_ray_mode), \
+                 filenum)
+        file_list.append(file_name)
+    return file_list
+
+def _cache_key(file_list, convolve_ipc=True):
+    """
+    
+    Helper function which returns a hash identifying the hit maps
+    derived from the given list of library files with the current
+    cosmic ray properties. The hash changes if any of the files or
+    any of the parameters affecting the hit maps change.
+    
+    """
+    items = []
+    for filename in file_list:
+        stat = os.stat(filename)
+        items.append( (os.path.abspath(filename), stat.st_size,
+                       int(stat.st_mtime)) )
+    items.append( cosmic_ray_properties['CR_BINNING_FACTOR'] )
+    items.append( cosmic_ray_properties['CR_BLUR'] )
+    items.append( cosmic_ray_properties['CR_ELECTRON_MULTIPLIER'] )
+    items.append( cosmic_ray_properties['CR_ENERGY_MULTIPLIER'] )
+    if convolve_ipc:
+        items.append( cosmic_ray_properties['CR_COUPLING'] )
+    return hashlib.sha1( repr(items).encode('utf-8') ).hexdigest()[:16]
+
+def cosmic_ray_cache_files(file_list, cosmic_ray_mode='SOLAR_MIN',
+                           convolve_ipc=True, cache_dir=None):
+    """
+    
+    Return the names of the cache files holding the hit maps derived
+    from a list of cosmic ray library files.
+    
+    :Parameters:
+    
+    file_list: list of str
+        The cosmic ray library files contributing to the cache.
+    cosmic_ray_mode: string, optional, default='SOLAR_MIN'
+        The cosmic ray mode, which is included in the file names.
+    convolve_ipc: boolean (optional)
+        True if the hit maps are convolved with the detector
+        capacitative coupling function. The default is True.
+    cache_dir: str, optional
+        The directory containing the cache. If not specified, the
+        directory named by the CR_CACHE_DIR environment variable is used.
+        
+    :Returns:
+    
+    (maps_file, events_file): tuple of 2 str
+        The name of a .npy file containing the hit maps and the name
+        of a .npz file containing the energies and nucleons. None is
+        returned if no cache directory is defined.
+    
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CR_CACHE_ENV_NAME, '')
+    if not cache_dir:
+        return None
+    key = _cache_key(file_list, convolve_ipc=convolve_ipc)
+    prefix = os.path.join(cache_dir, 'CR_%s_%s' % (cosmic_ray_mode, key))
+    return (prefix + '_maps.npy', prefix + '_events.npz')
+
+def build_cosmic_ray_cache(file_list, cosmic_ray_mode='SOLAR_MIN',
+                           convolve_ipc=True, cache_dir=None, verbose=2,
+                           logger=LOGGER):
+    """
+    
+    Read a list of cosmic ray library files, calculate the rebinned,
+    coupled, blurred and rounded hit map of each event and save them
+    in a cache from which they can be loaded (and memory-mapped) by
+    load_cosmic_ray_cache.
+    
+    :Parameters:
+    
+    file_list: list of str
+        The cosmic ray library files to be combined into the cache.
+    cosmic_ray_mode: string, optional, default='SOLAR_MIN'
+        The cosmic ray mode, which is included in the file names.
+    convolve_ipc: boolean (optional)
+        If True, convolve all cosmic ray events with the detector
+        capacitative coupling function. The default is True.
+    cache_dir: str, optional
+        The directory in which to save the cache. If not specified,
+        the directory named by the CR_CACHE_DIR environment variable
+        is used.
+    verbose: int, optional, default=2
+        Verbosity level. Activates print statements when non-zero.
+    logger: Logger object (optional)
+        A Python logger to handle the I/O.
+        
+    :Returns:
+    
+    (maps_file, events_file): tuple of 2 str
+        The names of the cache files created.
+        
+    :Raises:
+    
+    ValueError
+        Raised if no cache directory is defined.
+    
+    """
+    cache_files = cosmic_ray_cache_files(file_list,
+                                         cosmic_ray_mode=cosmic_ray_mode,
+                                         convolve_ipc=convolve_ipc,
+                                         cache_dir=cache_dir)
+    if cache_files is None:
+        strg = "No cosmic ray cache directory given "
+        strg += "and %s is not defined." % CR_CACHE_ENV_NAME
+        raise ValueError(strg)
+    (images, nucleons, energies) = _read_cosmic_ray_files(file_list,
+                                                          verbose=verbose,
+                                                          logger=logger)
+    cr_env = CosmicRayEnvironment(0.0, 'LIBRARY', energies,
+                                  images=images, nucleons=nucleons,
+                                  convolve_ipc=convolve_ipc,
+                                  blur_sigma=cosmic_ray_properties['CR_BLUR'],
+                                  verbose=0, logger=logger)
+    _save_cosmic_ray_cache(cache_files, cr_env.hit_maps, nucleons, energies)
+    if verbose > 1:
+        logger.info( "Cosmic ray cache written to \'%s\'" % cache_files[0])
+    return cache_files
+
+def _save_cosmic_ray_cache(cache_files, hit_maps, nucleons, energies):
+    """
+    
+    Helper function which saves the contents of a cosmic ray cache.
+    The files are written under temporary names and then renamed,
+    so a process reading the cache never sees a partly written file.
+    
+    """
+    (maps_file, events_file) = cache_files
+    cache_dir = os.path.dirname(maps_file)
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    suffix = '.tmp%d' % os.getpid()
+    with open(events_file + suffix, 'wb') as fp:
+        np.savez(fp, nucleons=nucleons, energies=energies)
+    os.replace(events_file + suffix, events_file)
+    with open(maps_file + suffix, 'wb') as fp:
+        np.save(fp, np.ascontiguousarray(hit_maps))
+    os.replace(maps_file + suffix, maps_file)
+
+def load_cosmic_ray_cache(file_list, cosmic_ray_mode='SOLAR_MIN',
+                          convolve_ipc=True, cache_dir=None, mmap=True,
+                          verbose=2, logger=LOGGER):
+    """
+    
+    Create a CosmicRayEnvironment object from the hit maps derived from
+    a list of cosmic ray library files, using a cache created by
+    build_cosmic_ray_cache. If the cache does not exist, or is out of
+    date, it is created first (if possible). If the cache cannot be
+    written the environment is created from the library files directly.
+    
+    :Parameters:
+    
+    file_list: list of str
+        The cosmic ray library files contributing to the environment.
+    cosmic_ray_mode: string, optional, default='SOLAR_MIN'
+        The cosmic ray mode to be simulated. Available modes are:
+        
+        * 'SOLAR_MIN' - Solar minimum
+        * 'SOLAR_MAX' - Solar maximum
+        * 'SOLAR_FLARE' - Solar flare (worst case scenario)
+        
+    convolve_ipc: boolean (optional)
+        If True, convolve all cosmic ray events with the detector
+        capacitative coupling function. The default is True.
+    cache_dir: str, optional
+        The directory containing the cache. If not specified, the
+        directory named by the CR_CACHE_DIR environment variable is used.
+    mmap: bool, optional, default=True
+        If True, the hit maps are memory-mapped from the cache, so they
+        are shared between processes and only read when needed.
+    verbose: int, optional, default=2
+        Verbosity level. Activates print statements when non-zero.
+    logger: Logger object (optional)
+        A Python logger to handle the I/O.
+     
+    :Returns:
+    
+    A new CosmicRayEnvironment object.
+    
+    """
+    cr_flux = cosmic_ray_properties.get('CR_FLUX', cosmic_ray_mode) * \
+            cosmic_ray_properties['CR_FLUX_MULTIPLIER']
+    sigma = cosmic_ray_properties['CR_BLUR']
+    cache_files = cosmic_ray_cache_files(file_list,
+                                         cosmic_ray_mode=cosmic_ray_mode,
+                                         convolve_ipc=convolve_ipc,
+                                         cache_dir=cache_dir)
+    if cache_files is not None and not os.path.isfile(cache_files[0]):
+        try:
+            build_cosmic_ray_cache(file_list, cosmic_ray_mode=cosmic_ray_mode,
+                                   convolve_ipc=convolve_ipc,
+                                   cache_dir=cache_dir, verbose=verbose,
+                                   logger=logger)
+        except (IOError, OSError) as e:
+            strg = "Could not write cosmic ray cache: %s" % str(e)
+            logger.warning(strg)
+            cache_files = None
+
+    if cache_files is None:
+        (images, nucleons, energies) = _read_cosmic_ray_files(file_list,
+                                                        verbose=verbose,
+                                                        logger=logger)
+        hit_maps = None
+    else:
+        if verbose > 1:
+            logger.info( "Reading cosmic ray cache: \'%s\'" % cache_files[0])
+        if mmap:
+            hit_maps = np.load(cache_files[0], mmap_mode='r')
+        else:
+            hit_maps = np.load(cache_files[0])
+        with np.load(cache_files[1]) as events:
+            nucleons = events['nucleons']
+            energies = events['energies']
+        images = None
+
+    cr_env = CosmicRayEnvironment(cr_flux, 'LIBRARY', energies,
+                                  distribution=None,
+                                  images=images, nucleons=nucleons,
+                                  convolve_ipc=convolve_ipc,
+                                  blur_sigma=sigma, hit_maps=hit_maps,
+                                  verbose=verbose, logger=logger)
+    return cr_env
+
 def load_cosmic_ray_library(filename, cosmic_ray_mode='SOLAR_MIN',
-                            convolve_ipc=True, verbose=2, logger=LOGGER):
+                            convolve_ipc=True, cache_dir=None, verbose=2,
+                            logger=LOGGER):
     """
     
     Create a CosmicRayEnvironment object from the information contained
@@ -1250,6 +1628,11 @@ def load_cosmic_ray_library(filename, cosmic_ray_mode='SOLAR_MIN',
     convolve_ipc: boolean (optional)
         If True, convolve all cosmic ray events with the detector
         capacitative coupling function. The default is True.
+    cache_dir: str, optional
+        A directory in which the processed cosmic ray hit maps are
+        cached (see load_cosmic_ray_cache). If not specified, the
+        directory named by the CR_CACHE_DIR environment variable is
+        used. If neither is defined, no cache is used.
     verbose: int, optional, default=2
         Verbosity level. Activates print statements when non-zero.
         
@@ -1269,41 +1652,14 @@ def load_cosmic_ray_library(filename, cosmic_ray_mode='SOLAR_MIN',
     A new CosmicRayEnvironment object.
     
     """
-    cr_flux = cosmic_ray_properties.get('CR_FLUX', cosmic_ray_mode) * \
-            cosmic_ray_properties['CR_FLUX_MULTIPLIER']
-
-    if verbose > 1:
-        logger.info( "Reading cosmic ray library file: \'%s\'" % filename)
-    hdulist = pyfits.open(filename)
-    images = hdulist[1].data * \
-                cosmic_ray_properties['CR_ELECTRON_MULTIPLIER']
-    nucleons = hdulist[2].data
-    energies = hdulist[3].data * \
-                cosmic_ray_properties['CR_ENERGY_MULTIPLIER'] 
-    sigma = cosmic_ray_properties['CR_BLUR']
-
-    # If necessary, rebin the images array down to a new size.
-    binfactor = cosmic_ray_properties['CR_BINNING_FACTOR']
-    if  binfactor > 1:
-        newimages = []
-        newshape = (images.shape[-2]//binfactor, images.shape[-1]//binfactor)
-        maxshape = (newshape[0] * binfactor, newshape[1] * binfactor)
-        for dim3 in range(0,images.shape[-3]):
-            slice = images[dim3,:maxshape[0],:maxshape[1]]
-            newslice = _rebin( slice, newshape )
-            newimages.append(newslice)
-        images = np.asarray(newimages)
-    
-    cr_env = CosmicRayEnvironment(cr_flux, 'LIBRARY', energies,
-                                  distribution=None,
-                                  images=images, nucleons=nucleons,
-                                  convolve_ipc=convolve_ipc,
-                                  blur_sigma=sigma,
-                                  verbose=verbose, logger=logger)
-    return cr_env
+    return load_cosmic_ray_cache([filename], cosmic_ray_mode=cosmic_ray_mode,
+                                 convolve_ipc=convolve_ipc,
+                                 cache_dir=cache_dir, verbose=verbose,
+                                 logger=logger)
 
 def load_cosmic_ray_libraries(cosmic_ray_mode='SOLAR_MIN', variant='',
-                              convolve_ipc=True, verbose=2, logger=LOGGER):
+                              convolve_ipc=True, cache_dir=None, verbose=2,
+                              logger=LOGGER):
     """
     
     Create a CosmicRayEnvironment object from the information contained
@@ -1328,6 +1684,11 @@ def load_cosmic_ray_libraries(cosmic_ray_mode='SOLAR_MIN', variant='',
     convolve_ipc: boolean (optional)
         If True, convolve all cosmic ray events with the detector
         capacitative coupling function. The default is True.
+    cache_dir: str, optional
+        A directory in which the processed cosmic ray hit maps are
+        cached (see load_cosmic_ray_cache). If not specified, the
+        directory named by the CR_CACHE_DIR environment variable is
+        used. If neither is defined, no cache is used.
     verbose: int, optional, default=2
         Verbosity level. Activates print statements when non-zero.
         
@@ -1348,66 +1709,13 @@ def load_cosmic_ray_libraries(cosmic_ray_mode='SOLAR_MIN', variant='',
     
     """
     # First obtain a list of available files for the given cosmic ray mode.
-    file_list = []
-    num_min = cosmic_ray_properties.get('CR_LIBRARY_FILES', 'MIN')
-    num_max = cosmic_ray_properties.get('CR_LIBRARY_FILES', 'MAX')
-    for filenum in range(num_min, num_max+1):
-        if variant:
-            file_name = '%s0%d_%s.fits' % \
-                (cosmic_ray_properties.get('CR_LIBRARY_FILES', cosmic_ray_mode), \
-                 filenum, variant)
-        else:
-            file_name = '%s0%d.fits' % \
-                (cosmic_ray_properties.get('CR_LIBRARY_FILES', cosmic_ray_mode), \
-                 filenum)
-        file_list.append(file_name)
+    file_list = cosmic_ray_library_files(cosmic_ray_mode, variant=variant)
     
-    # The flux level depends on cosmic ray mode.
-    cr_flux = cosmic_ray_properties.get('CR_FLUX', cosmic_ray_mode) * \
-            cosmic_ray_properties['CR_FLUX_MULTIPLIER']
-
-    # Read the files one by one and concatenate the contents.
-    firsttime = True
-    for filename in file_list:
-        if verbose > 1:
-            logger.info( "Reading cosmic ray library file: \'%s\'" % filename)
-        hdulist = pyfits.open(filename)
-        if firsttime:
-            images = hdulist[1].data
-            nucleons = hdulist[2].data
-            energies = hdulist[3].data
-            firsttime = False
-        else:
-            images_new = hdulist[1].data
-            nucleons_new = hdulist[2].data
-            energies_new = hdulist[3].data
-            images = np.concatenate( (images, images_new) )
-            nucleons = np.concatenate( (nucleons, nucleons_new) )
-            energies = np.concatenate( (energies, energies_new) )
-    images = images * cosmic_ray_properties['CR_ELECTRON_MULTIPLIER'] 
-    energies = energies * cosmic_ray_properties['CR_ENERGY_MULTIPLIER'] 
-    sigma = cosmic_ray_properties['CR_BLUR']
-
-    # If necessary, rebin the images array down to a new size.
-    binfactor = cosmic_ray_properties['CR_BINNING_FACTOR']
-    if  binfactor > 1:
-        newimages = []
-        newshape = (images.shape[-2]//binfactor, images.shape[-1]//binfactor)
-        maxshape = (newshape[0] * binfactor, newshape[1] * binfactor)
-        for dim3 in range(0,images.shape[-3]):
-            slice = images[dim3,:maxshape[0],:maxshape[1]]
-            newslice = _rebin( slice, newshape )
-            newimages.append(newslice)
-        images = np.asarray(newimages)
-
     # Create a grand cosmic ray environment from the combined data.
-    cr_env = CosmicRayEnvironment(cr_flux, 'LIBRARY', energies,
-                                  distribution=None,
-                                  images=images, nucleons=nucleons,
-                                  convolve_ipc=convolve_ipc,
-                                  blur_sigma=sigma,
-                                  verbose=verbose, logger=logger)
-    return cr_env
+    return load_cosmic_ray_cache(file_list, cosmic_ray_mode=cosmic_ray_mode,
+                                 convolve_ipc=convolve_ipc,
+                                 cache_dir=cache_dir, verbose=verbose,
+                                 logger=logger)
 
 def plot_cosmic_ray_events(event_list, plotrows, plotcols):
     """
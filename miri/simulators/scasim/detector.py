@@ -238,6 +238,45 @@ Calibration Data Products (CDPs).
              electrons.
 05 Mar 2020: Added print statements to debug readnoise variation.
 16 Apr 2020: Removed references to obsolete amplifier class.
+18 Oct 2026: Added fast_readout parameter, passed to the integrator.
+             set_seed also seeds the integrator's random Generator.
+18 Oct 2026: Added simulate_integrations, which simulates a series of
+             integrations in parallel bands of rows. The electron flux,
+             cosmic ray hit and read effects calculations are factored
+             out of integrate, hit_by_cosmic_rays and readout so both
+             methods share them.
+18 Oct 2026: Cosmic ray hits are deposited in batches with the integrator
+             hit_by_cosmic_rays method.
+18 Oct 2026: The derived bad pixel, gain, dark and read noise maps are
+             saved in (and attached from) a shared CDP store when the
+             CDP_STORE_DIR environment variable is defined.
+18 Oct 2026: The bad pixel mask and flat-field CDP models are no longer
+             modified in place, so they can be shared by the get_cdp
+             model cache.
+18 Oct 2026: Added NONLINEARITY_TABLE_MODE, which can select a reverse
+             linearity table for each amplifier or each pixel. These
+             tables are saved in the CDP store.
+18 Oct 2026: electron_flux caches the electron flux maps for the first and
+             later integrations of an exposure, so they are not rebuilt
+             for every group. Added clear_flux_cache.
+18 Oct 2026: Added integrator_kernel parameter, passed to the integrator.
+18 Oct 2026: Added simulate_ramp, which simulates all the groups of an
+             integration in batches when the integrator is perfect.
+18 Oct 2026: Added a precision parameter, which selects the floating
+             point precision of the integrator, the electron flux maps
+             and the readout calculations. The read effects preserve
+             the precision of the data and no longer search for
+             negative values with np.where.
+18 Oct 2026: simulate_integrations writes the readouts of each band
+             straight into an output array (such as the exposure data),
+             instead of stitching together a copy of every band. By
+             default, no more workers than processors are used.
+18 Oct 2026: The CDP file found when looking for a CDP store entry is
+             passed to get_cdp, which no longer searches for it again.
+18 Oct 2026: The reverse linearity tables for the two halves of the
+             detector are only derived when NONLINEARITY_TABLE_MODE is
+             'HALVES', or when the amplifier or pixel tables cannot be
+             used (see get_linearity_halves).
 
 @author: Steven Beard (UKATC), Vincent Geers (UKATC)
 
@@ -250,6 +289,7 @@ LOGGER = logging.getLogger("miri.simulators") # Get a default parent logger
 
 import os
 import math
+import concurrent.futures
 # import gc # FIXME: Solve file open issue before using this.
 import numpy as np
 
@@ -262,10 +302,11 @@ from miri.datamodels.cdp import MiriDarkReferenceModel
 #from miri.datamodels import MiriMeasuredModel
 from miri.datamodels.cdp import MiriGainModel, MiriReadnoiseModel, \
     MiriBadPixelMaskModel
-from miri.datamodels.cdplib import get_cdp, cdp_version_decode, \
-    MiriCDPInterface, MIRI_SUBARRAYS
+from miri.datamodels.cdplib import get_cdp, find_cdp_file, \
+    cdp_version_decode, MiriCDPInterface, MIRI_SUBARRAYS
 
 from miri.simulators import ImperfectIntegrator
+from miri.simulators.scasim.cdp_store import get_cdp_store
 
 # Search for the detector parameters file and parse it into a
 # properties dictionary. The file is searched for in 3 places:
@@ -312,10 +353,27 @@ AVERAGED_DARK = False
 # dependence will not be included, but the saturation level will be
 # more accurate.
 NONLINEARITY_BY_TABLE = True
+# When nonlinearity is simulated by table, NONLINEARITY_TABLE_MODE selects
+# the tables used.
+# 'HALVES' uses one table for each half of the detector, derived from the
+# coefficients in the middle of that half.
+# 'AMPLIFIER' uses one table for each amplifier, derived from the median
+# coefficients of the columns read by that amplifier.
+# 'PIXEL' uses a compact table for every pixel, with entries every
+# NONLINEARITY_GRID_STEP linear DN. It is only used when the data have
+# the same shape as the nonlinearity CDP; otherwise 'HALVES' is used.
+NONLINEARITY_TABLE_MODE = 'HALVES'
+NONLINEARITY_GRID_STEP = 1024
 
 # Set to True to include debugging information in the metadata
 EXTRA_METADATA = False
 
+# The memory (in bytes) which simulate_ramp may use for its work arrays,
+# which limits the number of groups simulated in each batch, and the
+# number of 8-byte work arrays needed for each group.
+_RAMP_MAX_MEMORY = 256 * 1024 * 1024
+_RAMP_WORK_ARRAYS = 6
+
 #
 # Global helper functions
 #
@@ -443,6 +501,159 @@ def frame_rti(detectorrows, ampcolumns, colstart, colstop, rowstart, rowstop,
     return frame_rti
 
 
+def _row_bands(nrows, nbands):
+    """
+    
+    Helper function which divides a number of rows into nbands
+    bands of (almost) equal size. Returns a list of (rowstart, rowstop).
+    
+    """
+    nbands = max(1, min(int(nbands), nrows))
+    edges = np.linspace(0, nrows, nbands+1).astype(int)
+    return [(int(edges[ii]), int(edges[ii+1])) for ii in range(0, nbands)]
+
+def _apply_cosmic_ray_hits(pixels, hits, rowoffset=0, target=None):
+    """
+    
+    Helper function which applies a list of cosmic ray hits, as
+    generated by DetectorArray.cosmic_ray_hits, to an integrator.
+    The hit rows are shifted by rowoffset, so the integrator can
+    contain a band of rows starting at that row.
+    
+    Hits with the same shape of energy map are deposited together
+    in one batch. Any (rare) leakage events are applied afterwards.
+    If a target array is given the energy is deposited there instead
+    of on the integrator (see ImperfectIntegrator.hit_by_cosmic_rays).
+    Leakage events are always applied to the integrator.
+    
+    """
+    batches = {}
+    for (energy, row, column, leak) in hits:
+        if not leak:
+            batch = batches.setdefault(np.shape(energy), ([], [], []))
+            batch[0].append(energy)
+            batch[1].append(row - rowoffset)
+            batch[2].append(column)
+    for (energies, rows, columns) in batches.values():
+        pixels.hit_by_cosmic_rays(np.asarray(energies), rows, columns,
+                                  target=target)
+    for (energy, row, column, leak) in hits:
+        if leak:
+            pixels.leak(energy, row - rowoffset, column)
+
+def _apply_read_effects(read_data, readnoise_map=None, noise_factor=1.0,
+                        gain_map=None, removeneg=True, rng=None):
+    """
+    
+    Helper function which adds read noise to some readout data,
+    converts the data from electrons to DN and (optionally) replaces
+    negative values with zero.
+    
+    The read noise is sampled from rng, if given, otherwise from
+    the global numpy random number generator. The result has the
+    same floating point precision as read_data.
+    
+    """
+    dtype = read_data.dtype
+    if readnoise_map is not None:
+        # Take a random sample of numbers from a normal distribution
+        # with zero mean and unit variance and distribute them over
+        # the detector pixels.
+        if rng is None:
+            randArray = np.random.randn(read_data.shape[0],
+                                        read_data.shape[1]).astype(dtype)
+        else:
+            randArray = rng.standard_normal(read_data.shape, dtype=dtype)
+        # Multiply by the noise scaling factor.
+        # FIXME: The multiplication is needed, even when x 1.0 because it changes the data type.
+        noise = np.asarray(readnoise_map * noise_factor, dtype=dtype)
+        np.multiply(randArray, noise, out=randArray)
+        read_data = read_data + randArray
+        del randArray
+    if gain_map is not None:
+        read_data = np.divide(read_data, gain_map, dtype=dtype)
+    if removeneg:
+        np.maximum(read_data, 0.0, out=read_data)
+    return read_data
+
+def _band_placements(placements, rowstart, rowstop):
+    """
+    
+    Helper function which works out where the rows of a band, from
+    rowstart to rowstop, are placed in the output of
+    DetectorArray.simulate_integrations. placements is a list of
+    (first detector row, last detector row + 1, column slice, first
+    output row) describing the whole output. Returns a list of (band
+    row slice, column slice, output row slice, band output row slice),
+    where the last slice numbers the rows of an output array containing
+    only this band.
+    
+    """
+    band_placements = []
+    bandrow = 0
+    for (firstrow, lastrow, columns, outrow) in placements:
+        (first, last) = (max(firstrow, rowstart), min(lastrow, rowstop))
+        if first < last:
+            band_placements.append( (slice(first - rowstart, last - rowstart),
+                                     columns,
+                                     slice(outrow + first - firstrow,
+                                           outrow + last - firstrow),
+                                     slice(bandrow, bandrow + last - first)) )
+            bandrow += last - first
+    return band_placements
+
+def _simulate_band(pixels, fluxes, schedule, rowstart, placements, out,
+                   total_samples=1, readnoise_map=None, noise_factor=1.0,
+                   gain_map=None, removeneg=True):
+    """
+    
+    Helper function which simulates a series of integrations on an
+    integrator containing a band of detector rows. See
+    DetectorArray.simulate_integrations.
+    
+    Each readout is written straight into the 4-D output array, out,
+    at the rows given by placements (see _band_placements). If out
+    is a shape rather than an array, an output array of that shape
+    containing only the rows of this band is created and returned
+    (for a pool of processes, which cannot write into the memory of
+    the caller).
+    
+    Returns the integrator (with its final state) and the output
+    array created, or None.
+    
+    """
+    band_placements = _band_placements(placements, rowstart,
+                                       rowstart + pixels.shape[0])
+    band_data = None
+    if not isinstance(out, np.ndarray):
+        nrows = sum([bandrows.stop - bandrows.start for \
+                     (rows, columns, outrows, bandrows) in band_placements])
+        band_data = np.empty((out[0], out[1], nrows, out[3]),
+                             dtype=np.uint32)
+        band_placements = [(rows, columns, bandrows, bandrows) for \
+                           (rows, columns, outrows, bandrows) in band_placements]
+        out = band_data
+    for (intnum, (nresets, groups)) in enumerate(schedule):
+        pixels.reset(nresets=nresets, new_exposure=(intnum == 0))
+        for (group, (time, hits)) in enumerate(groups):
+            _apply_cosmic_ray_hits(pixels, hits, rowoffset=rowstart)
+            pixels.integrate(fluxes[intnum], time)
+            read_data = \
+                pixels.readout(nsamples=total_samples).astype(pixels.dtype)
+            read_data = _apply_read_effects(read_data,
+                                            readnoise_map=readnoise_map,
+                                            noise_factor=noise_factor,
+                                            gain_map=gain_map,
+                                            removeneg=removeneg,
+                                            rng=pixels.rng)
+            # The readout is converted to unsigned integer, in the same
+            # way as DetectorArray.readout, before it is stored.
+            for (rows, columns, outrows, bandrows) in band_placements:
+                out[intnum, group, outrows, :] = \
+                    read_data[rows, columns].astype(np.uint32)
+    return (pixels, band_data)
+
+
 class DetectorArray(object):
     """
     
@@ -540,6 +751,19 @@ class DetectorArray(object):
     simulate_latency: boolean, optional, default=True
         A flag that may be used to switch off the simulation of
         detector latency and persistence effects.
+    fast_readout: boolean, optional, default=False
+        Set to True to sample the Poisson noise with the fast readout
+        of the integrator, which uses its own numpy random Generator
+        and reuses work buffers. See ImperfectIntegrator.
+    integrator_kernel: string, optional, default='numpy'
+        The kernel used by the integrator to apply the detector
+        effects: 'numpy', 'inplace' or 'numexpr'. See
+        ImperfectIntegrator.set_kernel.
+    precision: string, optional, default='float64'
+        The floating point precision of the integrator, the electron
+        flux maps and the readout calculations: 'float64' or 'float32'.
+        float32 halves the memory needed by the simulation. The
+        rounding errors are much smaller than 1 DN.
     cdp_ftp_host: str, optional, default=None
         If specified, the address of the server hosting the CDP
         repository. The string 'LOCAL' may be used to restrict searches
@@ -600,7 +824,8 @@ class DetectorArray(object):
                  simulate_dark_current=True, simulate_flat_field=True,
                  simulate_gain=True, simulate_nonlinearity=True,
                  simulate_drifts=True, simulate_latency=True,
-                 cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
+                 fast_readout=False, integrator_kernel='numpy',
+                 precision='float64', cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
                  readnoise_version='', bad_pixels_version='',
                  dark_map_version='', flat_field_version='',
                  linearity_version='', gain_version='',
@@ -700,7 +925,12 @@ class DetectorArray(object):
                                 time_unit=time_unit,
                                 bucket_size=well_depth,
                                 simulate_poisson_noise=simulate_poisson_noise,
+                                fast_readout=fast_readout,
+                                kernel=integrator_kernel,
+                                precision=precision,
                                 verbose=verbose)
+        # The floating point precision of the simulation.
+        self.dtype = self.pixels.dtype
         self.temperature = temperature
         # Initialise the cosmic ray counters.
         self.cosmic_ray_count = 0
@@ -735,6 +965,11 @@ class DetectorArray(object):
         self.mean_dark = 0.0
         self.simulate_read_noise = simulate_read_noise
         self.simulate_flat_field = simulate_flat_field
+        # Derived calibration arrays are shared through a CDP store
+        # when one is defined.
+        self.cdp_store = get_cdp_store(logger=self.toplogger)
+        # The electron flux maps calculated by electron_flux.
+        self.clear_flux_cache()
         self.add_calibration_data(self._sca['DETECTOR'],
                             readpatt=readpatt, subarray=subarray,
                             mirifilter=mirifilter, miriband=miriband,
@@ -819,6 +1054,9 @@ class DetectorArray(object):
             A specific version number of the form 'x.y.z'.
         
         """
+        # The electron flux depends on the calibration data.
+        self.clear_flux_cache()
+
         # Get the bad pixel mask associated with this detector.
         self.bad_pixels = None
         if self.simulate_bad_pixels:
@@ -895,6 +1133,8 @@ class DetectorArray(object):
         # Get the pixel flat-field associated with this detector.
         self.linearity_table_left = None
         self.linearity_table_right = None
+        self._linearity_halves = None
+        self.linearity_grid = None
         if self.simulate_nonlinearity and NONLINEARITY_BY_TABLE:
             self.add_linearity_table(self._sca['DETECTOR'], mirifilter=mirifilter,
                               miriband=miriband, cdp_ftp_host=cdp_ftp_host,
@@ -943,6 +1183,8 @@ class DetectorArray(object):
         None
         
         """
+        self.clear_flux_cache()
+
         if self.bad_pixels is not None:
             del self.bad_pixels
         self.bad_pixels = None
@@ -969,11 +1211,64 @@ class DetectorArray(object):
         if self.linearity_table_right is not None:
             del self.linearity_table_right
         self.linearity_table_right = None
+        self._linearity_halves = None
+        if self.linearity_grid is not None:
+            del self.linearity_grid
+        self.linearity_grid = None
 
         if self.readnoise_map is not None:
             del self.readnoise_map
         self.readnoise_map = None
 
+    def _cdp_store_key(self, kind, cdp_filename, **criteria):
+        # The key of the CDP store entry derived from the given CDP file
+        # for this detector geometry, or None if there is no store.
+        if self.cdp_store is None or not cdp_filename:
+            return None
+        return self.cdp_store.make_key(kind, cdp_filename,
+                        illuminated_shape=self.illuminated_shape,
+                        detector_shape=self.detector_shape,
+                        rows=(self.bottom_rows, self.top_rows),
+                        columns=(self.left_columns, self.right_columns),
+                        **criteria)
+
+    def _find_stored_cdp(self, cdptype, detector, readpatt='ANY',
+                         cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
+                         cdp_version='', **criteria):
+        # Look up the CDP store entry derived from the CDP file get_cdp
+        # would return. Returns the store key (None if there is no store
+        # or no CDP), the stored (arrays, attributes) (None if the
+        # entry has not been saved yet) and the name of the CDP file
+        # found (None if not searched for), which can be given to get_cdp
+        # so the file is not searched for again.
+        if self.cdp_store is None:
+            return (None, None, None)
+        (cdprelease, cdpversion, cdpsubversion) = cdp_version_decode( cdp_version )
+        cdp_filename = find_cdp_file(cdptype, detector=detector,
+                                     readpatt=readpatt, ftp_host=cdp_ftp_host,
+                                     ftp_path=cdp_ftp_path,
+                                     ftp_user=SIM_CDP_FTP_USER,
+                                     ftp_passwd=SIM_CDP_FTP_PASSWD,
+                                     cdprelease=cdprelease,
+                                     cdpversion=cdpversion,
+                                     cdpsubversion=cdpsubversion,
+                                     logger=self.toplogger)
+        key = self._cdp_store_key(cdptype, cdp_filename, detector=detector,
+                                  readpatt=readpatt, cdp_version=cdp_version,
+                                  **criteria)
+        if key is None:
+            return (None, None, cdp_filename)
+        stored = self.cdp_store.load(key)
+        if stored is not None and self._verbose > 1:
+            self.logger.info("Attached %s data from CDP store entry \'%s\'" % \
+                             (cdptype, key))
+        return (key, stored, cdp_filename)
+
+    def _save_stored_cdp(self, key, arrays, attributes):
+        # Save derived CDP arrays in the CDP store, if there is one.
+        if key is not None:
+            self.cdp_store.save(key, arrays, attributes)
+
     def add_bad_pixel_mask(self, detector, cdp_ftp_host=None,
                            cdp_ftp_path=SIM_CDP_FTP_PATH, cdp_version=''):
         """
@@ -1016,6 +1311,20 @@ class DetectorArray(object):
         # not include the reference rows added to the level 1 FITS data.
         window = (1, 1, self.illuminated_shape[0], self.detector_shape[1])
 
+        # Attach a bad pixel array saved in the CDP store, if possible.
+        (store_key, stored, cdp_filename) = \
+            self._find_stored_cdp('MASK', detector,
+                                  cdp_ftp_host=cdp_ftp_host,
+                                  cdp_ftp_path=cdp_ftp_path,
+                                  cdp_version=cdp_version)
+        if stored is not None:
+            (arrays, attributes) = stored
+            if self.bad_pixels is not None:
+                del self.bad_pixels
+            self.bad_pixels = arrays['bad_pixels']
+            self.bad_pixel_filename = attributes['filename']
+            return
+
         # Get the required CDP version numbers
         (cdprelease, cdpversion, cdpsubversion) = cdp_version_decode( cdp_version )
 
@@ -1028,7 +1337,8 @@ class DetectorArray(object):
                                  cdprelease=cdprelease,
                                  cdpversion=cdpversion,
                                  cdpsubversion=cdpsubversion,
-                                 logger=self.toplogger) as bad_pixel_mask:
+                                 logger=self.toplogger,
+                                 cdp_filename=cdp_filename) as bad_pixel_mask:
             if bad_pixel_mask is None:
                 strg = "Could not find a bad pixel mask CDP for detector %s." % detector
                 strg += " No bad pixels will be simulated."
@@ -1048,16 +1358,20 @@ class DetectorArray(object):
                     self.logger.warning( "***%s" % strg )
                     #raise ValueError(strg)
     
-            # Define reference columns (if any) as NON-SCIENCE.
-            if self.left_columns > 0:
-                bad_pixel_mask.dq[:,:self.left_columns] = MASK_NON_SCIENCE
-            if self.right_columns > 0:
-                bad_pixel_mask.dq[:,-self.right_columns:] = MASK_NON_SCIENCE
-    
-            # Define the bad pixel array.
+            # Define the bad pixel array. A copy is made so the CDP
+            # data model (which might be shared) is not changed.
             if self.bad_pixels is not None:
                 del self.bad_pixels
-            subarray_mask = bad_pixel_mask.get_subarray(window)
+            subarray_mask = np.array(bad_pixel_mask.get_subarray(window))
+    
+            # Define reference columns (if any) as NON-SCIENCE. The
+            # reference columns are at the edges of the full CDP mask
+            # (which starts at the same column as the window).
+            if self.left_columns > 0:
+                subarray_mask[:,:self.left_columns] = MASK_NON_SCIENCE
+            if self.right_columns > 0:
+                right_start = bad_pixel_mask.dq.shape[1] - self.right_columns
+                subarray_mask[:,right_start:] = MASK_NON_SCIENCE
             
             # If there are any reference rows, extend the bad pixel array to
             # include the additional pixels in the reference rows, otherwise
@@ -1081,6 +1395,8 @@ class DetectorArray(object):
                     os.path.basename(self.bad_pixel_filename)
                 mplt.plot_image(self.bad_pixels, title=tstrg)
             del bad_pixel_mask
+        self._save_stored_cdp(store_key, {'bad_pixels': self.bad_pixels},
+                              {'filename': self.bad_pixel_filename})
 
     def add_gain_map(self, detector, cdp_ftp_host=None,
                      cdp_ftp_path=SIM_CDP_FTP_PATH, cdp_version=''):
@@ -1114,6 +1430,21 @@ class DetectorArray(object):
             self.mean_gain = 1.0
             return
 
+        # Attach a gain map saved in the CDP store, if possible.
+        (store_key, stored, cdp_filename) = \
+            self._find_stored_cdp('GAIN', detector,
+                                  cdp_ftp_host=cdp_ftp_host,
+                                  cdp_ftp_path=cdp_ftp_path,
+                                  cdp_version=cdp_version)
+        if stored is not None:
+            (arrays, attributes) = stored
+            if self.gain_map is not None:
+                del self.gain_map
+            self.gain_map = arrays['gain_map']
+            self.gain_map_filename = attributes['filename']
+            self.mean_gain = attributes['mean_gain']
+            return
+
         # Get the required CDP version numbers
         (cdprelease, cdpversion, cdpsubversion) = cdp_version_decode( cdp_version )
          
@@ -1130,7 +1461,8 @@ class DetectorArray(object):
                              cdprelease=cdprelease,
                              cdpversion=cdpversion,
                              cdpsubversion=cdpsubversion,
-                             logger=self.toplogger) as gain_model:
+                             logger=self.toplogger,
+                             cdp_filename=cdp_filename) as gain_model:
             if gain_model is None:
                 strg = "Could not find gain CDP for detector %s." % detector
                 strg += " A gain of 1.0 (e/DN) will be assumed."
@@ -1172,6 +1504,9 @@ class DetectorArray(object):
             self.gain_map = gain_map
             self.mean_gain = mean_gain
             del gain_model
+        self._save_stored_cdp(store_key, {'gain_map': self.gain_map},
+                              {'filename': self.gain_map_filename,
+                               'mean_gain': float(self.mean_gain)})
         #gc.collect() # FIXME: Solve file open issue before using this.
 
 # # Original version which used a dark supplied with the SCASim release.
@@ -1390,6 +1725,30 @@ class DetectorArray(object):
             return
         del CDPInterface
 
+        # Attach a dark map saved in the CDP store, if possible. An
+        # averaged dark map depends on the mean gain and dark current.
+        store_key = self._cdp_store_key('DARK', local_filename,
+                                        detector=detector, readpatt=readpatt,
+                                        subarray=subarray, averaged=averaged,
+                                        cdp_version=cdp_version,
+                                        mean_gain=float(self.mean_gain),
+                                        dark_current=self._sca['DARK_CURRENT'])
+        if store_key is not None:
+            stored = self.cdp_store.load(store_key)
+            if stored is not None:
+                (arrays, attributes) = stored
+                if self.dark_map is not None:
+                    del self.dark_map
+                self.dark_map = arrays['dark_map']
+                self.dark_map_filename = attributes['filename']
+                self.mean_dark = attributes['mean_dark']
+                self.dark_averaged = averaged
+                if self._verbose > 1:
+                    strg = "Attached DARK data from CDP store entry \'%s\'" % \
+                        store_key
+                    self.logger.info(strg)
+                return
+
         if averaged:
             strg = "Reading averaged DARK model from \'%s\'" % local_filename
         else:
@@ -1484,6 +1843,9 @@ class DetectorArray(object):
                 del self.dark_map
             self.dark_map = dark_map
             del dark_model
+        self._save_stored_cdp(store_key, {'dark_map': self.dark_map},
+                              {'filename': self.dark_map_filename,
+                               'mean_dark': float(self.mean_dark)})
         #gc.collect() # FIXME: Solve file open issue before using this.
 
     def add_flat_map(self, detector, readpatt=None, subarray=None,
@@ -1643,8 +2005,9 @@ class DetectorArray(object):
                 
         self.flat_map_filename = flat_model.meta.filename
         # Fill the masked parts of the flat-field. Do not reshape the
-        # array yet, because it might be subarray-sized.
-        flat_map = flat_model.data_filled
+        # array yet, because it might be subarray-sized. A copy is made
+        # so the CDP data model (which might be shared) is not changed.
+        flat_map = np.array(flat_model.data_filled)
         
         # Remove any remaining NaNs which not been removed by filling
         # the masked parts of the flat-field.
@@ -1741,6 +2104,8 @@ class DetectorArray(object):
         if detector is None:
             self.linearity_table_left = None
             self.linearity_table_right = None
+            self._linearity_halves = None
+            self.linearity_grid = None
             self.linearity_filename = ''
             return
 
@@ -1788,24 +2153,37 @@ class DetectorArray(object):
             self.logger.error(strg)
             self.linearity_table_left = None
             self.linearity_table_right = None
+            self._linearity_halves = None
+            self.linearity_grid = None
             self.linearity_filename = ''
             return
 
         self.linearity_filename = linearity_model.meta.filename
-        # Extract the linearity tables from the left and right halves of 
-        # the linearity CDP.
+        # Keep the coefficients from the middle of the left and right
+        # halves of the linearity CDP, from which the tables for each half
+        # of the detector are derived.
         ncolumns = linearity_model.data.shape[-1]
         nrows = linearity_model.data.shape[-2]
         leftcol = ncolumns//4
         rightcol = leftcol + ncolumns//2
         row = nrows//2
-        self.linearity_table_left = \
-            linearity_model.get_reverse_table(row, leftcol)
-        self.linearity_table_right = \
-            linearity_model.get_reverse_table(row, rightcol)
+        self.linearity_table_left = None
+        self.linearity_table_right = None
+        self._linearity_halves = linearity_model.__class__(
+            coeffs=np.array(linearity_model.data[:, row:row+1,
+                                                 [leftcol, rightcol]]))
+        if NONLINEARITY_TABLE_MODE in ('AMPLIFIER', 'PIXEL'):
+            # The tables for each half are only needed if the tables
+            # for each amplifier or pixel cannot be used, so they are
+            # derived when first asked for.
+            self._add_linearity_grid(linearity_model)
+        else:
+            self.linearity_grid = None
+            self.get_linearity_halves()
 
         # Plot the linearity tables if requested.
         if self._verbose > 1 and self._makeplot:
+            self.get_linearity_halves()
             tstrg = "linearity table obtained from " + \
                 os.path.basename(self.linearity_filename)
             mplt.plot_xy( None, self.linearity_table_left,
@@ -1821,6 +2199,58 @@ class DetectorArray(object):
         del linearity_model
         #gc.collect() # FIXME: Solve file open issue before using this.
 
+    def get_linearity_halves(self):
+        """
+        
+        Return the reverse linearity tables for the left and right
+        halves of the detector, deriving them from the linearity CDP
+        when they are first needed.
+        
+        :Returns:
+        
+        (linearity_table_left, linearity_table_right): tuple of arrays
+            The tables for the left and right halves, or None if there
+            is no linearity CDP.
+        
+        """
+        if self.linearity_table_left is None and \
+           self._linearity_halves is not None:
+            self.linearity_table_left = \
+                self._linearity_halves.get_reverse_table(0, 0)
+            self.linearity_table_right = \
+                self._linearity_halves.get_reverse_table(0, 1)
+            self._linearity_halves = None
+        return (self.linearity_table_left, self.linearity_table_right)
+
+    def _add_linearity_grid(self, linearity_model):
+        # Derive a reverse linearity table for each amplifier or each
+        # pixel, as selected by NONLINEARITY_TABLE_MODE. The per-pixel
+        # tables take a while to calculate, so they are saved in (and
+        # attached from) the CDP store.
+        if NONLINEARITY_TABLE_MODE == 'AMPLIFIER':
+            # The 4 amplifiers read interleaved columns.
+            (step, namps) = (1, 4)
+        else:
+            (step, namps) = (NONLINEARITY_GRID_STEP, None)
+        store_key = self._cdp_store_key('LINEARITY_GRID',
+                                        self.linearity_filename,
+                                        mode=NONLINEARITY_TABLE_MODE,
+                                        step=step)
+        stored = None
+        if store_key is not None:
+            stored = self.cdp_store.load(store_key)
+        if stored is not None:
+            (arrays, attributes) = stored
+            self.linearity_grid = arrays['linearity_grid']
+        else:
+            self.linearity_grid = linearity_model.get_reverse_grid(step=step,
+                                                                namps=namps)
+            self._save_stored_cdp(store_key,
+                                  {'linearity_grid': self.linearity_grid},
+                                  {'filename': self.linearity_filename,
+                                   'step': step})
+        self.linearity_grid_step = step
+
     def add_readnoise_map(self, detector, readpatt=None, cdp_ftp_host=None, 
                           cdp_ftp_path=SIM_CDP_FTP_PATH, cdp_version=''):
         """
@@ -1857,6 +2287,23 @@ class DetectorArray(object):
             self.readnoise_map_filename = ''
             return
 
+        # Attach a read noise map saved in the CDP store, if possible.
+        # The map depends on the mean gain.
+        (store_key, stored, cdp_filename) = \
+            self._find_stored_cdp('READNOISE', detector,
+                                  readpatt=readpatt,
+                                  cdp_ftp_host=cdp_ftp_host,
+                                  cdp_ftp_path=cdp_ftp_path,
+                                  cdp_version=cdp_version,
+                                  mean_gain=float(self.mean_gain))
+        if stored is not None:
+            (arrays, attributes) = stored
+            if self.readnoise_map is not None:
+                del self.readnoise_map
+            self.readnoise_map = arrays['readnoise_map']
+            self.readnoise_map_filename = attributes['filename']
+            return
+
         # Get the required CDP version numbers
         (cdprelease, cdpversion, cdpsubversion) = cdp_version_decode( cdp_version )
         
@@ -1873,7 +2320,8 @@ class DetectorArray(object):
                                   cdprelease=cdprelease,
                                   cdpversion=cdpversion,
                                   cdpsubversion=cdpsubversion,
-                                  logger=self.toplogger) as readnoise_model:
+                                  logger=self.toplogger,
+                                  cdp_filename=cdp_filename) as readnoise_model:
             if readnoise_model is None:
                 strg = "Could not find read noise CDP for detector %s" % detector
                 if readpatt:
@@ -1931,6 +2379,8 @@ class DetectorArray(object):
                 del self.readnoise_map
             self.readnoise_map = readnoise_map
             del readnoise_model
+        self._save_stored_cdp(store_key, {'readnoise_map': self.readnoise_map},
+                              {'filename': self.readnoise_map_filename})
         #gc.collect() # FIXME: Solve file open issue before using this.
         
     def get_subarray_shape(self, subarray=None):
@@ -2203,6 +2653,7 @@ class DetectorArray(object):
             
         """
         np.random.seed(seedvalue)
+        self.pixels.set_seed(seedvalue)
  
     def set_readout_mode(self, samplesum, sampleskip=0, refpixsampleskip=3,
                          nframes=1):
@@ -2484,6 +2935,34 @@ class DetectorArray(object):
             cosmic ray hit (since all the frames belonging to a group
             are averaged.
             
+        """
+        hits = self.cosmic_ray_hits(cosmic_ray_list, nframes=nframes)
+        _apply_cosmic_ray_hits(self.pixels, hits)
+
+    def cosmic_ray_hits(self, cosmic_ray_list, nframes=1):
+        """
+        
+        Convert a series of cosmic ray events into a list of hits
+        which can be applied to the detector pixels, updating the
+        cosmic ray counters.
+        
+        :Parameters:
+        
+        cosmic_ray_list: list of CosmicRay objects
+            A list of cosmic ray events hitting the detector.
+        nframes: int, optional, default=1
+            The number of frames per group. Normally 1 for MIRI data, but
+            if greater than 1 this parameter will dilute the effect of a
+            cosmic ray hit (since all the frames belonging to a group
+            are averaged.
+            
+        :Returns:
+        
+        hits: list of tuple(energy, row, column, leak)
+            The energy (a single value or a 2-D energy map) deposited
+            around each detector pixel. leak is True for a rare negative
+            cosmic ray event, which removes the energy from the pixel.
+            
         """
         # The effect of each cosmic ray hit is diluted if more than 1
         # frames are averaged to make a group.
@@ -2508,23 +2987,24 @@ class DetectorArray(object):
                 strg += "."
                 self.logger.info( strg )
         
-        for cosmic_ray in cosmic_ray_list:
+        hits = []
+        throws = np.random.uniform(0.0, 1.0, len(cosmic_ray_list))
+        for (cosmic_ray, throw) in zip(cosmic_ray_list, throws):
             # The cosmic ray has hit a detector pixel.
             (row, column) = cosmic_ray.get_target_coords()
-            throw = np.random.uniform(0.0, 1.0)
             if throw > detector_properties['COSMIC_RAY_LEAKAGE_FRACTION']:
                 # A normal cosmic ray hit
                 energy_map = energy_mult * cosmic_ray.get_hit_map()
-                self.pixels.hit_by_cosmic_ray(energy_map, row, column)
+                hits.append( (energy_map, row, column, False) )
                 
                 self.cosmic_ray_count += 1
-                affected = np.where( energy_map >= 1 )
-                if affected:
-                    self.cosmic_ray_pixel_count += len(affected[0])
+                self.cosmic_ray_pixel_count += \
+                    np.count_nonzero( energy_map >= 1 )
             else:
                 # A rare negative cosmic ray event.
                 energy = energy_mult * cosmic_ray.get_electrons()
-                self.pixels.leak(energy, row, column)
+                hits.append( (energy, row, column, True) )
+        return hits
 
     def integrate(self, photon_flux, time, intnum=0):
         """
@@ -2544,6 +3024,103 @@ class DetectorArray(object):
             Integration number, which determines which dark calibration is
             used. Must be 0 or greater.
             
+        """
+        electron_flux = self.electron_flux(photon_flux, intnum=intnum)
+        if self._verbose > 3:
+            strg = "Integrating on flux array with "
+            strg += "min=%.2f e max=%.2f e for %.2f %s." % \
+                (electron_flux.min(), electron_flux.max(),
+                 time, self.time_unit)
+            self.logger.debug( strg )
+        # >>> Integrate on the flux
+        self.pixels.integrate(electron_flux, time)
+
+    def electron_flux(self, photon_flux, intnum=0):
+        """
+        
+        Convert the photon flux falling on the illuminated portion of
+        the detector into the electron flux generated in all the
+        detector pixels, taking into account dead pixels, the flat-field
+        and (if averaged) the dark current. Negative values are replaced
+        by zero.
+        
+        The electron flux is constant for the whole of an exposure, so
+        the result is cached, with one version for the first integration
+        and one for later integrations (which use different dark data).
+        The cache is rebuilt when a different photon flux array is given,
+        when the bad pixel, flat-field or dark arrays are replaced, when
+        the dark current (which depends on the detector temperature)
+        changes or when the calibration data are added again. The arrays
+        returned must not be modified.
+        
+        :Parameters:
+        
+        photon_flux: array_like
+            The photon flux in photons per time unit.
+            This must be the same shape and size as the illuminated portion
+            of the detector. If the contents of the array are changed,
+            clear_flux_cache must be called.
+        intnum: int
+            Integration number, which determines which dark calibration is
+            used. Must be 0 or greater.
+            
+        :Returns:
+        
+        electron_flux: array_like
+            The electron flux in electrons per time unit, with the same
+            shape as the detector.
+            
+        :Raises:
+        
+        TypeError
+            Raised if the photon flux has the wrong shape.
+            
+        """
+        # The arrays are compared by identity, so a new array invalidates
+        # the cache but a copy of the same data does not.
+        arrays = (photon_flux, self.bad_pixels, self.flat_map, self.dark_map)
+        values = (self.dark_averaged, getattr(self, 'dark_current', 0.0))
+        if self._flux_cache_arrays is None or \
+           any([new is not old for (new, old) in
+                zip(arrays, self._flux_cache_arrays)]) or \
+           values != self._flux_cache_values:
+            self._flux_cache = {}
+            self._flux_cache_arrays = arrays
+            self._flux_cache_values = values
+
+        # Only an averaged dark map makes later integrations different.
+        later = (intnum > 0) and self.dark_averaged and \
+            (self.dark_map is not None)
+        if later not in self._flux_cache:
+            electron_flux = np.asarray(
+                self._make_electron_flux(photon_flux, intnum=intnum),
+                dtype=self.dtype)
+            np.maximum(electron_flux, 0.0, out=electron_flux)
+            self._flux_cache[later] = electron_flux
+        return self._flux_cache[later]
+
+    def clear_flux_cache(self):
+        """
+        
+        Discard the electron flux maps cached by electron_flux. This
+        is needed only when the contents of the photon flux, bad pixel,
+        flat-field or dark arrays are changed in place.
+        
+        :Parameters:
+        
+        None
+        
+        """
+        self._flux_cache = {}
+        self._flux_cache_arrays = None
+        self._flux_cache_values = None
+
+    def _make_electron_flux(self, photon_flux, intnum=0):
+        """
+        
+        Helper function which calculates the electron flux for
+        electron_flux.
+            
         """
         # The photon flux must be the same size as the illuminated portion
         # of the detector. Other parts get zero illumination.
@@ -2555,7 +3132,9 @@ class DetectorArray(object):
             # TODO: Chop off the reference columns at the left edge of
             # subarray data.     
             #
-            detector_flux = np.zeros(self.detector_shape, dtype=photon_flux.dtype)
+            detector_flux = np.zeros(self.detector_shape,
+                                     dtype=np.result_type(photon_flux.dtype,
+                                                          np.float64))
             if self.top_rows > 0 and self.right_columns > 0:
                 detector_flux[self.bottom_rows:-self.top_rows,
                               self.left_columns:-self.right_columns] \
@@ -2567,13 +3146,13 @@ class DetectorArray(object):
             # The detector flux if effectively zero where pixels are bad/dead.
             if self.bad_pixels is not None:
                 # Dead zones are assumed not to respond at all.
-                dead_zones = np.where((self.bad_pixels & MASK_DEAD) > 0)
+                dead_zones = (self.bad_pixels & MASK_DEAD) > 0
                 detector_flux[dead_zones] = 0.0
                 
             # Multiply the flux by the flat-field.
             # NOTE: The flat-field data includes the reference pixels.
             if self.flat_map is not None:
-                detector_flux = detector_flux * self.flat_map
+                detector_flux *= self.flat_map
 
             # The dark current is applied here ONLY if it has been averaged.
             # NOTE: The dark data includes the reference pixels.
@@ -2592,19 +3171,15 @@ class DetectorArray(object):
                 # DARK simulation is deferred until later.
                 electron_flux = detector_flux
                         
-            if self._verbose > 3:
-                strg = "Integrating on flux array with "
-                if self.simulate_dark_current and self.dark_averaged:
-                    strg += "darkmin=%.2f e darkmax=%.2f e "   % \
-                        (dark_flux.min(), dark_flux.max())
-                    strg += "detmin=%.2f e detmax=%.2f e " % \
-                        (detector_flux.min(), detector_flux.max())
-                strg += "min=%.2f e max=%.2f e for %.2f %s." % \
-                    (electron_flux.min(), electron_flux.max(),
-                     time, self.time_unit)
+            if self._verbose > 3 and self.simulate_dark_current and \
+               self.dark_averaged:
+                strg = "Electron flux array with "
+                strg += "darkmin=%.2f e darkmax=%.2f e "   % \
+                    (np.min(dark_flux), np.max(dark_flux))
+                strg += "detmin=%.2f e detmax=%.2f e." % \
+                    (detector_flux.min(), detector_flux.max())
                 self.logger.debug( strg )
-            # >>> Integrate on the flux
-            self.pixels.integrate(electron_flux, time)
+            return electron_flux
         else:
             # Faulty flux array given - raise an exception.
             strg = "Photon flux array has the wrong shape: " \
@@ -2667,68 +3242,31 @@ class DetectorArray(object):
         # prevent the readout noise calculation from wrapping around
         # and generating spurious large values in the reference pixel
         # regions.
-        read_data = self.pixels.readout(nsamples=total_samples).astype(np.double)
+        read_data = self.pixels.readout(nsamples=total_samples).astype(self.dtype)
 
         # Apply gain and readnoise effects. NOTE: Although the Poisson noise
         # and read noise are not added explicitly in quadrature,
         # combining the two sets of randomly generated offsets has the
         # same effect.
-        if self.simulate_read_noise and not (self.readnoise_map is None):
- 
-            # Take a random sample of numbers from a normal distribution
-            # with zero mean and unit variance and distribute them over
-            # the detector pixels.
-            randArray = np.random.randn(read_data.shape[0],
-                                        read_data.shape[1]).astype(np.double)
-            # Determine the amount of read noise to by applied to the detector
-            # data. The noise is reduced when there is more than one sample.
-            #if total_samples > 1:
-            if False: # MIRI-703: Never reduce the noise by total_samples.
-                if self._verbose > 3:
-                    self.logger.debug( "Applying readout noise in the range of " + \
-                        "%f to %f, with mean %f (e), sampled %d times." % \
-                        (np.min(self.readnoise_map), np.max(self.readnoise_map),
-                         np.mean(self.readnoise_map), total_samples) )
-                noise = self.readnoise_map / np.sqrt(total_samples)
-            else:
-                if self._verbose > 3:
-                    self.logger.debug( "Applying readout noise in the range of %f to %f, with mean %f (e)." % \
-                        (np.min(self.readnoise_map), np.max(self.readnoise_map), np.mean(self.readnoise_map)) )
-                noise = self.readnoise_map
-            # Multiply by the noise scaling factor.
-            # FIXME: The multiplication is needed, even when x 1.0 because it changes the data type.
+        # MIRI-703: Never reduce the noise by total_samples, and assume
+        # that the readnoise CDP has already taken care of defining raised
+        # noise levels for bad pixels.
+        (readnoise_map, gain_map) = self._read_effect_maps()
+        if readnoise_map is not None:
+            if self._verbose > 3:
+                self.logger.debug( "Applying readout noise in the range of %f to %f, with mean %f (e)." % \
+                    (np.min(readnoise_map), np.max(readnoise_map), np.mean(readnoise_map)) )
             if self.noise_factor != 1.0:
                 self.logger.debug( "Scaling noise by %f." % self.noise_factor )
-            noise = noise * self.noise_factor
-
-            # MIRI-703: Assume that the readnoise CDP has already taken care
-            # of defining raised noise levels for bad pixels. The following
-            # code commented out.
-#             # Assume that bad pixels flagged as UNRELIABLE_SLOPE are noisy.
-#             # TODO: The multiplication factor is arbitrary.
-#             if self.bad_pixels is not None:
-#                 noisy_zones = np.where((self.bad_pixels & MASK_UNRELIABLE_SLOPE) > 0)
-#                 noise[noisy_zones] *= 5.0
-
-
-            #print("read_data before noise has mean=%f and std=%f" % (np.mean(read_data), np.std(read_data)))     
-            read_data = read_data + (randArray * noise)   
-            #print("read_data after noise has mean=%f and std=%f" % (np.mean(read_data), np.std(read_data)))
-            del randArray
-         
-        # Apply the gain to convert electrons into DNs
-        if self.simulate_gain and not (self.gain_map is None):
-            if self._verbose > 3:
-                self.logger.debug( "Applying readout gain factor of %f to %f (e/DN)." % \
-                    (np.min(self.gain_map), np.max(self.gain_map)) )
-            read_data = read_data / self.gain_map
-         
+        if gain_map is not None and self._verbose > 3:
+            self.logger.debug( "Applying readout gain factor of %f to %f (e/DN)." % \
+                (np.min(gain_map), np.max(gain_map)) )
         # The smallest DN is zero, so the read noise shouldn't make the
-        # reading go negative. If requested, replace negative values
+        # reading go negative. If requested, negative values are replaced
         # with zero.
-        if removeneg:
-            arenegative = np.where(read_data < 0.0)
-            read_data[arenegative] = 0.0
+        read_data = _apply_read_effects(read_data, readnoise_map=readnoise_map,
+                                        noise_factor=self.noise_factor,
+                                        gain_map=gain_map, removeneg=removeneg)
                 
         # Extract a subarray from the readout if requested and the data
         # isn't already the correct size.
@@ -2776,6 +3314,381 @@ class DetectorArray(object):
         #print("Detector readout: mean=%f, std=%f" % (np.mean(read_data), np.std(read_data)))
         return read_data.astype(np.uint32)
 
+    def simulate_integrations(self, photon_flux, schedule, nbands,
+                              nframes=1, nworkers=None, pool='thread',
+                              subarray=None, total_samples=None,
+                              removeneg=True, out=None):
+        """
+        
+        Simulate a series of integrations, each consisting of a reset
+        followed by one or more groups (integrations, cosmic ray hits
+        and readouts), by dividing the detector into bands of rows
+        and simulating each band in parallel.
+        
+        Every detector pixel evolves independently, so the result is
+        statistically equivalent to calling reset, hit_by_cosmic_rays,
+        integrate and readout for each group in turn. The Poisson and
+        read noise of each band are sampled from an independent random
+        Generator spawned from the global numpy random state, so the
+        result is reproducible for a given seed and number of bands
+        (but is not the same random sequence as a serial simulation).
+        The bands always use the fast readout of the integrator (see
+        ImperfectIntegrator), because the normal readout samples its
+        noise from the global random state, which cannot be shared
+        reproducibly between bands.
+        
+        With a pool of threads, each band writes its readouts straight
+        into its own rows of the output array, so no other copy of
+        the readouts is made. A pool of processes cannot write into
+        the memory of the caller, so each band returns a copy of its
+        readouts, which is then copied into the output array.
+        
+        :Parameters:
+        
+        photon_flux: array_like
+            The photon flux on which to integrate in photons per time unit.
+            This must be the same shape and size as the illuminated portion
+            of the detector.
+        schedule: list of tuple(nresets, groups)
+            A description of each integration, giving the number of
+            resets at the start of the integration and a list of
+            (time, cosmic_ray_list) for each group, where time is the
+            integration time of the group and cosmic_ray_list is a list
+            of the CosmicRay objects hitting the detector during it.
+        nbands: int
+            The number of bands of rows into which the detector is
+            divided.
+        nframes: int, optional, default=1
+            The number of frames per group (see hit_by_cosmic_rays).
+        nworkers: int, optional, default=None
+            The maximum number of bands simulated at the same time.
+            If None, the number of bands or the number of processors,
+            whichever is smaller.
+        pool: str, optional, default='thread'
+            'thread' to simulate the bands in a pool of threads, which
+            write straight into the output array, or 'process' to
+            simulate them in a pool of processes.
+        subarray: tuple of 4 ints, optional, default is None
+            The subarray to be extracted from each readout. See readout.
+        total_samples: int, optional
+            The total number of times the pixel is sampled during readout.
+            Defaults to the current readout mode.
+        removeneg: bool, optional, default=True
+            If True, remove negative values from the readout and replace
+            them with zero.
+        out: array_like, optional
+            A 4-D array, with one plane for each integration and group
+            of the same shape as a readout, into which the readouts are
+            written (for example, the data array of an exposure).
+            If None, a new uint32 array is created.
+            
+        :Returns:
+        
+        read_data: array_like
+            The 4-D array containing the readout for each integration
+            and group (out, if given).
+            
+        :Raises:
+        
+        ValueError
+            Raised if the pool is not recognised or if the out array
+            has the wrong shape.
+            
+        """
+        if pool == 'thread':
+            executor_class = concurrent.futures.ThreadPoolExecutor
+        elif pool == 'process':
+            executor_class = concurrent.futures.ProcessPoolExecutor
+        else:
+            strg = "Unknown pool '%s'. " % str(pool)
+            strg += "It must be 'thread' or 'process'."
+            raise ValueError(strg)
+        if total_samples is None:
+            total_samples = self.samplesum * self.nframes
+
+        # Work out where each detector row is placed in the output.
+        (placements, readout_shape) = self._readout_placements(subarray)
+        ngroups = max([len(groups) for (nresets, groups) in schedule])
+        outshape = (len(schedule), ngroups) + tuple(readout_shape)
+        if out is None:
+            out = np.empty(outshape, dtype=np.uint32)
+        elif tuple(out.shape) != outshape:
+            strg = "Output array has the wrong shape: "
+            strg += "%s instead of %s." % (str(out.shape), str(outshape))
+            raise ValueError(strg)
+
+        # Convert the cosmic ray events into hits and calculate the
+        # electron flux for each integration. The cosmic ray counters
+        # are restarted for each integration, in the same way as reset.
+        plan = []
+        fluxes = []
+        for (intnum, (nresets, groups)) in enumerate(schedule):
+            self.cosmic_ray_count = 0
+            self.cosmic_ray_pixel_count = 0
+            plan.append( (nresets,
+                          [(time, self.cosmic_ray_hits(cosmic_ray_list,
+                                                       nframes=nframes))
+                           for (time, cosmic_ray_list) in groups]) )
+            # The electron flux maps are cached by electron_flux.
+            fluxes.append( self.electron_flux(photon_flux, intnum=intnum) )
+
+        # Divide the detector into bands of rows, each with its own
+        # random number Generator.
+        bands = _row_bands(self.detector_shape[0], nbands)
+        seeds = np.random.SeedSequence(
+            np.random.randint(0, np.iinfo(np.int32).max)).spawn(len(bands))
+        if nworkers is None:
+            nworkers = min(len(bands), os.cpu_count() or 1)
+        (readnoise_map, gain_map) = self._read_effect_maps()
+        if self._verbose > 2:
+            self.logger.info( "Simulating %d integrations in %d bands of rows." % \
+                              (len(schedule), len(bands)) )
+        # Threads share the output array. Processes are given its shape.
+        if pool == 'thread':
+            band_out = out
+        else:
+            band_out = outshape
+        with executor_class(max_workers=nworkers) as executor:
+            futures = []
+            for ((rowstart, rowstop), seed) in zip(bands, seeds):
+                pixels = self.pixels.split_rows(rowstart, rowstop)
+                pixels.fast_readout = True
+                pixels.rng = np.random.default_rng(seed)
+                rows = slice(rowstart, rowstop)
+                band_fluxes = [flux[rows] for flux in fluxes]
+                band_readnoise = None
+                if readnoise_map is not None:
+                    band_readnoise = readnoise_map[rows]
+                band_gain = None
+                if gain_map is not None:
+                    band_gain = gain_map[rows]
+                futures.append( executor.submit(_simulate_band, pixels,
+                                                band_fluxes, plan, rowstart,
+                                                placements, band_out,
+                                                total_samples=total_samples,
+                                                readnoise_map=band_readnoise,
+                                                noise_factor=self.noise_factor,
+                                                gain_map=band_gain,
+                                                removeneg=removeneg) )
+            # Collect the integrator of each band and copy any readouts
+            # returned by a process into the output.
+            band_pixels = []
+            for ((rowstart, rowstop), future) in zip(bands, futures):
+                (pixels, band_data) = future.result()
+                band_pixels.append(pixels)
+                if band_data is not None:
+                    for (rows, columns, outrows, bandrows) in \
+                        _band_placements(placements, rowstart, rowstop):
+                        out[:, :, outrows, :] = band_data[:, :, bandrows, :]
+                    del band_data
+            del futures
+
+        # Merge the bands back together, restoring the integrator state
+        # needed for the next exposure.
+        self.pixels.merge_rows(band_pixels,
+                               [rowstart for (rowstart, rowstop) in bands])
+        return out
+
+    def _readout_placements(self, subarray=None):
+        """
+        
+        Helper function which describes where each detector row is
+        placed in a readout, for simulate_integrations. Returns a list
+        of (first detector row, last detector row + 1, column slice,
+        first readout row) and the shape of the readout, matching the
+        subarray extracted by _extract_subarray.
+        
+        """
+        if subarray is None or \
+           ((subarray[2] == self.illuminated_shape[0]) and \
+            (subarray[3] == self.illuminated_shape[1])):
+            return ([(0, self.detector_shape[0], slice(None), 0)],
+                    self.detector_shape)
+        # Check the subarray and obtain the shape of the readout.
+        # This also defines subrows_bottom and subrows_top.
+        readout_shape = self._extract_subarray(
+                np.zeros(self.detector_shape, dtype=np.uint8), subarray).shape
+        nrows = self.detector_shape[0]
+        placements = []
+        outrow = 0
+        refcolumns = slice(subarray[1], subarray[1] + subarray[3])
+        if self.subrows_bottom > 0:
+            lastrow = min(self.subrows_bottom, nrows)
+            placements.append( (0, lastrow, refcolumns, outrow) )
+            outrow += lastrow
+        firstrow = subarray[0] - 1
+        lastrow = min(firstrow + subarray[2], nrows)
+        placements.append( (firstrow, lastrow,
+                            slice(subarray[1] - 1,
+                                  subarray[1] - 1 + subarray[3]), outrow) )
+        outrow += lastrow - firstrow
+        if self.subrows_top > 0:
+            firstrow = self.illuminated_shape[0]
+            lastrow = min(firstrow + self.subrows_top, nrows)
+            placements.append( (firstrow, lastrow, refcolumns, outrow) )
+        return (placements, readout_shape)
+
+    def simulate_ramp(self, photon_flux, groups, intnum=0, nresets=1,
+                      nframes=1, subarray=None, total_samples=None,
+                      removeneg=True, max_memory=_RAMP_MAX_MEMORY):
+        """
+        
+        Simulate an integration, consisting of a reset followed by one or
+        more groups, by simulating batches of groups at once with the
+        integrate_ramp method of the integrator. This is only possible
+        when the integrator is perfect (i.e. when latency, drifts and
+        nonlinearity by sensitivity are not simulated).
+        
+        The result is statistically equivalent to calling reset,
+        hit_by_cosmic_rays, integrate and readout for each group in
+        turn. The Poisson and read noise are sampled from the random
+        Generator of the integrator, so the result is reproducible for
+        a given seed (but is not the same random sequence as a group
+        by group simulation). A group containing a (rare) charge leakage
+        event is simulated on its own in the usual way.
+        
+        :Parameters:
+        
+        photon_flux: array_like
+            The photon flux on which to integrate in photons per time unit.
+            This must be the same shape and size as the illuminated portion
+            of the detector.
+        groups: list of tuple(time, cosmic_ray_list)
+            The integration time of each group and a list of the CosmicRay
+            objects hitting the detector during it.
+        intnum: int, optional, default=0
+            Integration number, which determines which dark calibration is
+            used. Integration 0 begins a new exposure.
+        nresets: int, optional, default=1
+            The number of resets at the start of the integration.
+        nframes: int, optional, default=1
+            The number of frames per group (see hit_by_cosmic_rays).
+        subarray: tuple of 4 ints, optional, default is None
+            The subarray to be extracted from each readout. See readout.
+        total_samples: int, optional
+            The total number of times the pixel is sampled during readout.
+            Defaults to the current readout mode.
+        removeneg: bool, optional, default=True
+            If True, remove negative values from the readout and replace
+            them with zero.
+        max_memory: int, optional
+            The approximate number of bytes of work space which may be
+            used, which determines how many groups are simulated in
+            each batch.
+            
+        :Returns:
+        
+        read_data: iterator of tuple(group, array_like uint32)
+            The first group of each batch and a 3-D array containing
+            the readouts of that batch of groups.
+            
+        :Raises:
+        
+        ValueError
+            Raised if the integrator is not perfect.
+            
+        """
+        if not self.pixels.is_perfect():
+            strg = "Detector integrations can only be simulated in batches "
+            strg += "when latency, drifts and nonlinearity by sensitivity "
+            strg += "are turned off."
+            raise ValueError(strg)
+        if total_samples is None:
+            total_samples = self.samplesum * self.nframes
+        self.reset(nresets=nresets, new_exposure=(intnum == 0))
+        electron_flux = self.electron_flux(photon_flux, intnum=intnum)
+        (readnoise_map, gain_map) = self._read_effect_maps()
+        if subarray is not None and \
+           (subarray[2] == self.illuminated_shape[0]) and \
+           (subarray[3] == self.illuminated_shape[1]):
+            subarray = None
+
+        # Convert the cosmic ray events into hits and divide the groups
+        # into batches, limited by the work space available. A group with
+        # a leakage event ends a batch.
+        hits = [self.cosmic_ray_hits(cosmic_ray_list, nframes=nframes)
+                for (time, cosmic_ray_list) in groups]
+        times = [time for (time, cosmic_ray_list) in groups]
+        group_bytes = 8 * _RAMP_WORK_ARRAYS * electron_flux.size
+        batch_size = max(1, int(max_memory // group_bytes))
+        if self._verbose > 2:
+            self.logger.info( "Simulating %d groups in batches of up to %d." % \
+                              (len(groups), batch_size) )
+        return self._ramp_batches(electron_flux, times, hits, batch_size,
+                                  subarray, total_samples, removeneg,
+                                  readnoise_map, gain_map)
+
+    def _ramp_batches(self, electron_flux, times, hits, batch_size,
+                      subarray, total_samples, removeneg, readnoise_map,
+                      gain_map):
+        """
+        
+        Helper generator for simulate_ramp, which simulates each batch
+        of groups in turn.
+        
+        """
+        first = 0
+        while first < len(times):
+            last = first
+            while last < len(times) and last - first < batch_size and \
+                  not any([leak for (energy, row, column, leak) in hits[last]]):
+                last += 1
+            if last == first:
+                # Simulate a group containing a leakage event on its own.
+                _apply_cosmic_ray_hits(self.pixels, hits[first])
+                self.pixels.integrate(electron_flux, times[first])
+                read_data = self.readout(subarray=subarray,
+                                         total_samples=total_samples,
+                                         removeneg=removeneg)
+                yield (first, read_data[np.newaxis, :, :])
+                first += 1
+                continue
+
+            deposits = None
+            for group in range(first, last):
+                if hits[group]:
+                    if deposits is None:
+                        deposits = np.zeros((last-first,) + self.detector_shape,
+                                            dtype=self.dtype)
+                    _apply_cosmic_ray_hits(self.pixels, hits[group],
+                                           target=deposits[group-first])
+            read_data = self.pixels.integrate_ramp(electron_flux,
+                                                   times[first:last],
+                                                   deposits=deposits,
+                                                   nsamples=total_samples)
+            del deposits
+            read_data = _apply_read_effects(read_data.astype(self.dtype),
+                                            readnoise_map=readnoise_map,
+                                            noise_factor=self.noise_factor,
+                                            gain_map=gain_map,
+                                            removeneg=removeneg,
+                                            rng=self.pixels.rng)
+            read_data = read_data.astype(np.uint32)
+            if subarray is not None:
+                read_data = np.array([self._extract_subarray(plane, subarray)
+                                      for plane in read_data],
+                                     dtype=np.uint32)
+            yield (first, read_data)
+            first = last
+
+    def _read_effect_maps(self):
+        """
+        
+        Helper function which returns the (readnoise_map, gain_map)
+        to be applied when reading out the detector. Either map is
+        None when the effect is not simulated.
+        
+        """
+        if self.simulate_read_noise and not (self.readnoise_map is None):
+            readnoise_map = self.readnoise_map
+        else:
+            readnoise_map = None
+        if self.simulate_gain and not (self.gain_map is None):
+            gain_map = self.gain_map
+        else:
+            gain_map = None
+        return (readnoise_map, gain_map)
+
     def _extract_subarray(self, full_data, subarray):
         """
         
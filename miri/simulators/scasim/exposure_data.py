@@ -104,6 +104,20 @@ It has been superceeded by the datamodels/miri_exposure_model.py
 12 Mar 2019: Removed use of astropy.extern.six (since Python 2 no longer used).
 13 Dec 2019: Modified from_data_object to prevent DATAMODL, FILETYPE, FILENAME
              and REFTYPE keywords being copied.
+18 Oct 2026: slope_data now fits all the ramps at once with the
+             miri.tools.ramp_fitting module. Added max_memory parameter.
+18 Oct 2026: Added the streaming option, which averages groups and
+             integrations as they are added. _average_data replaced by
+             a reshape-and-mean reduction. The averaged data are
+             recalculated after the data change.
+18 Oct 2026: Added get_data_array, so readouts can be written straight
+             into the SCI data.
+18 Oct 2026: slope_data fits the ramps a block of rows at a time by
+             default and makes the quick estimate one integration at a
+             time, so saving slope data no longer creates data-sized
+             float64 arrays.
+18 Oct 2026: Added the slopes parameter to save, so slopes fitted from
+             a file can be written.
 
 @author: Steven Beard
 
@@ -135,7 +149,11 @@ _MAX_DATA_SIZE_MB = 512.0
 # and eyesight.
 _MAX_PLOTS = 20
 
-from miri.simulators.integrators import linear_regression
+# The default maximum working memory (in bytes) used by slope_data
+# when fitting the ramps.
+_SLOPE_MAX_MEMORY = 256 * 1024 * 1024
+
+from miri.tools.ramp_fitting import ramp_slopes, diff_slopes
 
 
 # Simple Metadata class used for legacy data models
@@ -716,6 +734,13 @@ class ExposureData(object):
         The number of frames per group. Normally 1 for MIRI data.
     groupgap: int, optional, default=0
         The number of dropped frames in between groups.
+    streaming: bool, optional, default=False
+        Set to True to average the groups and integrations as they are
+        added, so the full-resolution data are never held in memory.
+        The data array then contains the averaged data, and functions
+        which use the data (such as add_dark and slope_data) apply to
+        the averaged data. Each group must only be added once.
+        Ignored when neither groups nor integrations are averaged.
         
     :Requires:
     
@@ -731,7 +756,7 @@ class ExposureData(object):
 
     """
     def __init__(self, rows, columns, ngroups, nints, readpatt, grpavg=1,
-                 intavg=1, nframes=1, groupgap=0):
+                 intavg=1, nframes=1, groupgap=0, streaming=False):
         """
         
         Constructor for class ExposureData.
@@ -798,9 +823,19 @@ class ExposureData(object):
         # NAXIS4=nints.
         # NOTE: The new MIRI exposure model uses floating point data.
         # MEMORY MANAGEMENT: Don't create the array until needed.
-        self.datashape = [self.nints, self.ngroups, self.rows, self.columns]
+        # When streaming, only the averaged data are held, in floating
+        # point.
+        self.streaming = streaming and (self.grpavg > 1 or self.intavg > 1)
+        if self.streaming:
+            self.datashape = [self.nints_file, self.ngroups_file, self.rows,
+                              self.columns]
+        else:
+            self.datashape = [self.nints, self.ngroups, self.rows,
+                              self.columns]
         self.datasize = self.nints * self.ngroups * self.rows * self.columns
         self.data = None
+        # The weight given to each group added to the averaged data.
+        self._stream_weight = np.float32(1.0 / (self.grpavg * self.intavg))
 #         self.data = np.zeros(self.datashape, dtype=np.uint32)
         
         # Create a place holder to store averaged SCI data, if needed.
@@ -857,8 +892,17 @@ class ExposureData(object):
         if data.shape == expected_shape:
             # MEMORY MANAGEMENT: Don't create the array until needed.
             if self.data is None:
-                self.data = np.zeros(self.datashape, dtype=np.uint32)    
-            self.data[intg,group,:,:] = data
+                if self.streaming:
+                    self.data = np.zeros(self.datashape, dtype=np.float32)
+                else:
+                    self.data = np.zeros(self.datashape, dtype=np.uint32)    
+            if self.streaming:
+                # Accumulate the group into the averaged data.
+                self.data[intg // self.intavg, group // self.grpavg,:,:] += \
+                    data * self._stream_weight
+            else:
+                self.data[intg,group,:,:] = data
+            self._data_averaged = None
         else:
             strg = "Data array has the wrong shape: " \
                 "(%d, %d) instead of (%d, %d)." % (data.shape[0],
@@ -870,6 +914,30 @@ class ExposureData(object):
         # There is more data waiting to be written.
         self._written = False
 
+    def get_data_array(self):
+        """
+        
+        Return the 4-D SCI data array, so that readouts can be written
+        into it directly instead of with set_group. The data are assumed
+        to change.
+        
+        :Returns:
+        
+        data: array_like uint32
+            The SCI data array, or None if the groups and integrations
+            are averaged as they are added (see the streaming option).
+            
+        """
+        if self.streaming:
+            return None
+        # MEMORY MANAGEMENT: Don't create the array until needed.
+        if self.data is None:
+            self.data = np.zeros(self.datashape, dtype=np.uint32)
+        self._data_averaged = None
+        # There is more data waiting to be written.
+        self._written = False
+        return self.data
+
     def set_exposure(self, data):
         """
         
@@ -895,13 +963,17 @@ class ExposureData(object):
         if data.size == self.datasize:
             if self.data is not None:
                 del self.data
-            self.data = data
             # Reshape the array, in case it has been stored as a cube.
-            self.data.shape = (self.nints, self.ngroups, self.rows,
-                               self.columns)
+            data = data.reshape(self.nints, self.ngroups, self.rows,
+                                self.columns)
+            if self.streaming:
+                self.data = self._average_array(data)
+            else:
+                self.data = data
+            self._data_averaged = None
         else:
             strg = "Data array has the wrong size: " \
-                "%d instead of %d." % (data.size, self.data.size)
+                "%d instead of %d." % (data.size, self.datasize)
             raise TypeError(strg)
         
         # There is more data waiting to be written.
@@ -1337,7 +1409,7 @@ class ExposureData(object):
             self.data[whereclipped] = 65535.0 
 
     def save(self, filename, fileformat='level1', datashape='cube',
-             overwrite=False, recalculate=False):
+             overwrite=False, recalculate=False, slopes=None):
         """
         
         Creates and writes a level 1 FITS file with the exposure data.
@@ -1372,6 +1444,11 @@ class ExposureData(object):
         recalculate: boolean, optional, default=False
             If True the averaged data are recalculated even if already
             available.
+        slopes: array_like, optional
+            Slope data already fitted to the ramps (for example by
+            miri.tools.ramp_fitting.fit_ramps_file), to be written when
+            datashape is 'slope'. If not given, the slopes are fitted
+            to the data.
             
         :Raises:
     
@@ -1413,9 +1490,10 @@ class ExposureData(object):
 
         # Decide whether the SCI_data array contents need to be
         # averaged before writing to the file.
-        if self.grpavg <= 1 and self.intavg <= 1:
+        if (self.grpavg <= 1 and self.intavg <= 1) or \
+           (datashape == "slope" and slopes is not None):
             
-            # No averaging
+            # No averaging (or slopes already fitted to the averaged data)
             if datashape == "cube":
                 # Take a copy of the SCI data and reshape it into a cube
                 datacube = self.data.copy()
@@ -1439,8 +1517,11 @@ class ExposureData(object):
                 # Tidy up, since datacube could be quite large.
                 del datacube
             elif datashape == "slope":
-                # Take a copy of the SCI data and reshape it into a cube
-                dataslope = self.slope_data()
+                # Fit slopes to the SCI data, unless given.
+                if slopes is not None:
+                    dataslope = slopes
+                else:
+                    dataslope = self.slope_data()
                 # TODO: Add World Coordinates?
                 if fileformat == 'level1':
                     sci_hdu = pyfits.ImageHDU(data=dataslope,
@@ -1489,8 +1570,8 @@ class ExposureData(object):
             datacopy = self._average_data(recalculate=recalculate)         
             if datashape == "cube":
                 # Reshape the new array into a cube
-                datacopy.shape = (self.nints_file*self.ngroups_file, 
-                                  self.rows, self.columns)
+                datacopy = datacopy.reshape(self.nints_file*self.ngroups_file,
+                                            self.rows, self.columns)
                 # TODO: Add World Coordinates?
                 if fileformat == 'level1':
                     sci_hdu = pyfits.ImageHDU(data=datacopy,
@@ -1540,13 +1621,12 @@ class ExposureData(object):
             # Always close the file.
             hdulist.close()
 
-    def slope_data(self, grptime=1.0, diff_only=False):
+    def slope_data(self, grptime=1.0, diff_only=False,
+                   max_memory=_SLOPE_MAX_MEMORY):
         """
         
         Generate a copy of the SCIdata array where all groups have
         been combined to make slope data.
-
-        NOTE: This function is very inefficient!
         
         :Parameters:
         
@@ -1556,6 +1636,10 @@ class ExposureData(object):
         diff_only: bool, optional, default=False
             If True, implement a quick and dirty estimate of the
             slope by subtracting the last frame from the first.
+        max_memory: int, optional, default=256MB
+            The maximum number of bytes of working memory to be used by
+            the straight line fit, which fits the ramps a block of rows
+            at a time. If None, all the rows are fitted at once.
            
         :Returned:
         
@@ -1566,24 +1650,17 @@ class ExposureData(object):
             
         """
         assert self.ngroups > 1
-        output = np.zeros([self.nints, self.rows, self.columns],
-                            dtype=np.float32)
-        
         if diff_only:
             # Quick and dirty estimate which subtracts the last
             # ramp from the first
-            timediff = grptime * (self.ngroups - 1)
-            output = (self.data[:,-1,:,:] - self.data[:,0,:,:]) / float(timediff)
+            timediff = grptime * (self.data.shape[1] - 1)
+            output = diff_slopes(self.data, timediff)
         else:
-            # Full straight line fit
-            timearray = grptime * np.array( list(range(0, self.ngroups)) )
-            for intg in range(0, self.nints):
-                for row in range(0, self.rows):
-                    for column in range(0, self.columns):
-                        # Ouch! Slope calculated one (row,column) at a time.
-                        (slope, ic) = linear_regression( timearray,
-                                        self.data[intg,:,row,column])
-                        output[intg,row,column] = slope
+            # Full straight line fit, made for all ramps at once.
+            slope = ramp_slopes( self.data, grptime=grptime,
+                                 max_memory=max_memory )
+            output = slope.astype(np.float32)
+            del slope
         return output
 
     def _average_data(self, recalculate=False):
@@ -1607,30 +1684,20 @@ class ExposureData(object):
         """
         if self.data is None:
             raise TypeError("No exposure data to be averaged.")
-        output = np.zeros([self.nints_file, self.ngroups_file,
-                            self.rows, self.columns],
-                            dtype=np.float32)
-        count = np.zeros([self.nints_file, self.ngroups_file,
-                            1, 1], dtype=np.float32)
-        
-        for intg in range(0, self.nints):
-            intg_file = intg // self.intavg
-            for grp in range(0, self.ngroups):
-                grp_file = grp // self.grpavg
-                output[intg_file,grp_file,:,:] += \
-                    self.data[intg,grp,:,:]
-                count[intg_file,grp_file,0,0] += 1.0
-
-        # Avoid divide by zero.
-        iszero = np.where(count < 1.0)
-        if iszero:
-            count[iszero] = 1.0
-        output = output / count
-        del count
+        if self.streaming:
+            # The data have been averaged already.
+            return self.data
         # NOTE: The new MIRI exposure model uses floating point data, so the
         # average is no longer converted to integer.
-        #return output.astype(np.uint32)
-        return output
+        return self._average_array(self.data)
+
+    def _average_array(self, data):
+        # Average a full-resolution data array over groups and
+        # integrations. The array is reshaped so that the groups and
+        # integrations making up each average lie along their own axes.
+        avgshape = (self.nints_file, self.intavg, self.ngroups_file,
+                    self.grpavg, self.rows, self.columns)
+        return data.reshape(avgshape).mean(axis=(1,3), dtype=np.float32)
 
     @property
     def data_averaged(self):
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+
+"""
+
+Module profiling - Contains the StageProfiler class, which measures the
+time spent and the memory used in each stage of a simulation.
+
+A SensorChipAssembly wraps each stage of a simulation (reading the
+input, loading the calibration data, preparing the illumination,
+generating and depositing cosmic rays, integrating, reading out, storing
+each group and writing the output file) in a StageProfiler.stage block.
+The stages do not overlap, so the time not accounted for by the stages
+is spent elsewhere. When the profiler is
+disabled a stage costs one attribute test, so the instrumentation may
+be left in place.
+
+For each stage the profiler counts the calls and accumulates the wall
+clock time. Memory is sampled at the end of each stage from the
+operating system: the peak resident set size (RSS) of the process,
+which shows the memory a batch node needs, and the amount by which the
+stage raised that peak. The peak RSS is taken from resource.getrusage,
+which is not available on every platform, in which case the memory
+statistics are reported as None.
+
+:Reference:
+
+resource.getrusage
+https://docs.python.org/3/library/resource.html
+
+:History:
+
+18 Oct 2026: Created.
+
+@author: MIRI Software Team
+
+"""
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+# The resource module is only available on Unix-like platforms.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+
+    Return the peak resident set size of the current process in bytes,
+    or None if it cannot be measured on this platform.
+
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        return int(maxrss)
+    return int(maxrss) * 1024
+
+def _megabytes(nbytes):
+    # Convert a number of bytes into megabytes (or None).
+    if nbytes is None:
+        return None
+    return nbytes / (1024.0 * 1024.0)
+
+class StageProfiler(object):
+    """
+
+    Class StageProfiler - Accumulates the time spent and the memory
+    used in each named stage of a simulation.
+
+    :Parameters:
+
+    enabled: bool, optional, default=False
+        Set to True to start measuring straight away.
+
+    :Attributes:
+
+    stages: dict
+        The statistics accumulated for each stage, in the order in
+        which the stages were first used.
+
+    """
+    def __init__(self, enabled=False):
+        """
+
+        Constructor for class StageProfiler.
+
+        Parameters: See class doc string.
+
+        """
+        self.enabled = bool(enabled)
+        self.reset()
+
+    def reset(self):
+        """
+
+        Forget all the statistics accumulated so far and restart the
+        elapsed time.
+
+        """
+        self.stages = {}
+        self._start = time.perf_counter()
+        self._start_rss = peak_rss()
+
+    def enable(self):
+        """
+
+        Start measuring the stages.
+
+        """
+        self.enabled = True
+
+    def disable(self):
+        """
+
+        Stop measuring the stages. The statistics are kept.
+
+        """
+        self.enabled = False
+
+    @contextmanager
+    def stage(self, name):
+        """
+
+        Context manager which measures one execution of a stage.
+        Stages with the same name are accumulated.
+
+        :Parameters:
+
+        name: str
+            The name of the stage.
+
+        """
+        if not self.enabled:
+            yield
+            return
+        rss_before = peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rss_after = peak_rss()
+            stats = self.stages.get(name, None)
+            if stats is None:
+                stats = {'calls': 0, 'elapsed': 0.0, 'max_elapsed': 0.0,
+                         'peak_rss': None, 'peak_rss_increase': None}
+                self.stages[name] = stats
+            stats['calls'] += 1
+            stats['elapsed'] += elapsed
+            stats['max_elapsed'] = max(stats['max_elapsed'], elapsed)
+            if rss_after is not None:
+                stats['peak_rss'] = rss_after
+                stats['peak_rss_increase'] = \
+                    (stats['peak_rss_increase'] or 0) + \
+                    (rss_after - rss_before)
+
+    def report(self):
+        """
+
+        Return the statistics accumulated so far as a dictionary,
+        which may be written to a JSON file.
+
+        :Returns:
+
+        report: dict
+            A dictionary containing the total elapsed time ('elapsed',
+            in seconds), the time accounted for by the stages
+            ('staged'), the peak resident set size of the process at
+            the start and now ('start_peak_rss' and 'peak_rss', in
+            bytes) and a 'stages' dictionary. For each stage, this gives
+            the number of 'calls', the total and longest 'elapsed' and
+            'max_elapsed' times, the 'peak_rss' at the end of the stage
+            and the total 'peak_rss_increase' caused by the stage.
+
+        """
+        stages = {}
+        for (name, stats) in self.stages.items():
+            stages[name] = dict(stats)
+        return {'elapsed': time.perf_counter() - self._start,
+                'staged': sum([stats['elapsed'] for stats in
+                               self.stages.values()]),
+                'start_peak_rss': self._start_rss,
+                'peak_rss': peak_rss(),
+                'stages': stages}
+
+    def write(self, filename, report=None):
+        """
+
+        Write the report to a JSON file.
+
+        :Parameters:
+
+        filename: str
+            The name of the file to be written.
+        report: dict, optional
+            A report previously obtained from the report method.
+            If None, a new report is made.
+
+        """
+        if report is None:
+            report = self.report()
+        with open(filename, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+    def __str__(self):
+        """
+
+        Return a table summarising the report.
+
+        """
+        report = self.report()
+        strg = "Simulation profile: %.3fs elapsed" % report['elapsed']
+        if report['peak_rss'] is not None:
+            strg += ", peak RSS %.1f MB" % _megabytes(report['peak_rss'])
+        strg += "\n  %-16s %8s %10s %10s %12s" % \
+            ('Stage', 'Calls', 'Time (s)', 'Max (s)', 'RSS +(MB)')
+        for (name, stats) in report['stages'].items():
+            strg += "\n  %-16s %8d %10.3f %10.4f" % \
+                (name, stats['calls'], stats['elapsed'], stats['max_elapsed'])
+            if stats['peak_rss_increase'] is not None:
+                strg += " %12.1f" % _megabytes(stats['peak_rss_increase'])
+        strg += "\n  %-16s %8s %10.3f" % \
+            ('(other)', '', report['elapsed'] - report['staged'])
+        return strg
+
+
+def profile_filename(outputfile):
+    """
+
+    Return the name of the JSON profile report written alongside
+    the given output file.
+
+    """
+    (root, ext) = os.path.splitext(outputfile)
+    return root + '_profile.json'
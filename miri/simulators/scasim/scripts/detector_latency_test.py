@@ -17,6 +17,7 @@
 # 22 Sep 2015: The detector latency test is easier now the SCA class is
 #              a singleton. Added a full-frame singleton test.
 # 04 Dec 2015: poisson_integrator module renamed to integrators.
+# 18 Oct 2026: ramps_to_slopes uses the vectorised ramp_slopes function.
 #
 # @author: Steven Beard (UKATC)
 
@@ -44,10 +45,10 @@ from miri.datamodels.miri_illumination_model import \
 import miri.tools.miriplot as mplt
 
 # Import MIRI simulation utilities.
-from miri.simulators.integrators import linear_regression, \
-    ImperfectIntegrator
+from miri.simulators.integrators import ImperfectIntegrator
 from miri.simulators.scasim.sensor_chip_assembly import SensorChipAssembly, \
     simulate_sca, simulate_sca_list
+from miri.tools.ramp_fitting import ramp_slopes
 
 def ramps_to_slopes( array4d, grptime=1.0, diff_only=False ):
     """
@@ -55,16 +56,13 @@ def ramps_to_slopes( array4d, grptime=1.0, diff_only=False ):
     Convert a 4-D input array into a 3-D output array by combining
     all the group planes into a single slope plane.
     
-    NOTE: This function is very inefficient!
-    
-    Dependency: Assumes the function linear_regression has been imported.
+    Dependency: Assumes the function ramp_slopes has been imported.
     
     """
     array4d = np.asarray(array4d)
     assert len(array4d.shape) == 4
     (nints, ngroups, rows, columns) = array4d.shape
     assert ngroups > 1
-    array3d = np.zeros([nints, rows, columns], dtype=np.float32)
     
     if diff_only:
         # A quick and dirty method which subtracts the last ramp
@@ -73,14 +71,9 @@ def ramps_to_slopes( array4d, grptime=1.0, diff_only=False ):
         array3d = (array4d[:,-1,:,:] - array4d[:,0,:,:]) / float(timediff)
         
     else:
-        # A full slope derived from linear regression.
-        timearray = grptime * np.array( list(range(0, ngroups)) )
-        for intg in range(0, nints):
-            for row in range(0, rows):
-                for column in range(0, columns):
-                    (slope, ic) = linear_regression( timearray,
-                                                     array4d[intg,:,row,column])
-                    array3d[intg,row,column] = slope
+        # A full slope derived from linear regression of all the ramps
+        # at once.
+        array3d = ramp_slopes( array4d, grptime=grptime ).astype(np.float32)
     return array3d
 
 # Main program starts here.
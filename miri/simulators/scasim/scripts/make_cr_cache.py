@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# :History:
+#
+# 18 Oct 2026: Created
+#
+# @author: MIRI Software Team
+#
+
+"""
+
+Script 'make_cr_cache' reads the cosmic ray library files and saves
+the processed (rebinned, IPC-convolved, blurred and rounded) hit
+maps in a cache which SCASim can memory-map when it starts. One cache
+is made for each library file (as used by scasim) and one for each
+complete set of library files (as used by load_cosmic_ray_libraries).
+Caches are named by a hash of the library files and the cosmic ray
+properties, so a new cache is needed whenever either changes.
+
+To use the cache, set the CR_CACHE_DIR environment variable to the
+cache directory before running SCASim.
+
+    cache_dir
+        The directory in which to write the cache. If not given, the
+        directory named by the CR_CACHE_DIR environment variable
+        is used.
+
+The following optional parameters may be provided by keyword:
+
+    --crmode
+        The cosmic ray mode to be cached ('SOLAR_MIN', 'SOLAR_MAX'
+        or 'SOLAR_FLARE'). If not given, all modes are cached.
+    --variant
+        The variant of the cosmic ray library files (if any).
+
+The command also takes the following options:
+
+    --noipc:
+        Cache hit maps which are not convolved with the IPC function.
+    --verbose or -v:
+        Generate more output.
+
+"""
+
+# Python logging facility
+import logging
+logging.basicConfig(level=logging.INFO) # Default level is informational output
+LOGGER = logging.getLogger("miri.simulators") # Get a default logger
+
+import optparse
+import os, sys
+
+from miri.simulators.scasim.cosmic_ray import build_cosmic_ray_cache, \
+    cosmic_ray_library_files, CR_CACHE_ENV_NAME
+
+if __name__ == "__main__":
+    # Parse arguments
+    help_text = __doc__
+    usage = "%prog [opt] [cache_dir]\n"
+    usage += "\t[--crmode] [--variant] [--noipc]"
+    parser = optparse.OptionParser(usage)
+    parser.add_option("", "--crmode", dest="crmode", type="string",
+                     default='', help="Cosmic ray mode"
+                     )
+    parser.add_option("", "--variant", dest="variant", type="string",
+                     default='', help="Cosmic ray library variant"
+                     )
+    parser.add_option("", "--noipc", dest="noipc", action="store_true",
+                      help="Do not convolve with the IPC function"
+                     )
+    parser.add_option("-v", "--verbose", dest="verb", action="store_true",
+                      help="Verbose mode"
+                     )
+    (options, args) = parser.parse_args()
+
+    if args:
+        cache_dir = args[0]
+    else:
+        cache_dir = os.environ.get(CR_CACHE_ENV_NAME, '')
+    if not cache_dir:
+        print( help_text )
+        parser.error("No cache directory given and %s is not defined." % \
+                     CR_CACHE_ENV_NAME)
+        sys.exit(1)
+    if options.crmode:
+        crmodes = [options.crmode]
+    else:
+        crmodes = ['SOLAR_MIN', 'SOLAR_MAX', 'SOLAR_FLARE']
+    if options.verb:
+        verbose = 3
+    else:
+        verbose = 1
+
+    for crmode in crmodes:
+        file_list = cosmic_ray_library_files(crmode, variant=options.variant)
+        file_list = [filename for filename in file_list \
+                     if os.path.isfile(filename)]
+        if not file_list:
+            LOGGER.warning("No cosmic ray library files found for %s." % \
+                           crmode)
+            continue
+        for filename in file_list:
+            build_cosmic_ray_cache([filename], cosmic_ray_mode=crmode,
+                                   convolve_ipc=not options.noipc,
+                                   cache_dir=cache_dir, verbose=verbose,
+                                   logger=LOGGER)
+        build_cosmic_ray_cache(file_list, cosmic_ray_mode=crmode,
+                               convolve_ipc=not options.noipc,
+                               cache_dir=cache_dir, verbose=verbose,
+                               logger=LOGGER)
+        LOGGER.info("%s: %d library files cached in %s" % \
+                    (crmode, len(file_list), cache_dir))
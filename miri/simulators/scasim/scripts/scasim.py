@@ -65,6 +65,10 @@
 # 26 Nov 2018: Added the ability to simulate cosmic rays of a single energy.
 # 07 Feb 2018: Added a --local parameter to specify that CDPs are obtained
 #              from local host only.
+# 18 Oct 2026: Added a --profile option, which writes a JSON report of the
+#              time and memory used by each stage of the simulation.
+# 18 Oct 2026: Added --nbands, --nworkers and --pool options, which simulate
+#              bands of detector rows in parallel.
 # 
 # @author: Steven Beard (UKATC)
 
@@ -245,6 +249,20 @@ The command also takes the following options:
         Generate plots.
     --overwrite or -o:
         Overwrite any existing FITS output file.
+    --profile:
+        Measure the time and memory used by each stage of the
+        simulation and write a JSON report alongside the output file
+        (named after the output file with a "_profile.json" suffix).
+    --nbands:
+        Divide the detector into this number of bands of rows and
+        simulate the bands in parallel. The default is 1 (serial).
+    --nworkers:
+        The maximum number of bands simulated at the same time.
+        The default is the number of bands or processors, whichever
+        is smaller.
+    --pool:
+        The kind of pool used to simulate the bands in parallel:
+        'thread' (the default) or 'process'.
     --noqe:
         Simulation without quantum efficiency adjustment (input in electrons/s)
     --nopoisson:
@@ -292,7 +310,8 @@ if __name__ == "__main__":
     usage += "\n\t[--scale] [--local] [--cdp_ftp_path] [--cdprelease] [--previousfile]"
     usage += "\n\t[--nopoisson] [--noreadnoise] [--norefpixels] [--nobadpixels]"
     usage += "\n\t[--nodark] [--noflat] [--nogain] [--nolinearity] "
-    usage += "[--nodrifts] [--nolatency]"
+    usage += "[--nodrifts] [--nolatency] [--profile]"
+    usage += "\n\t[--nbands] [--nworkers] [--pool]"
     parser = optparse.OptionParser(usage)
     
     # Optional arguments (long option strings only).
@@ -368,6 +387,22 @@ if __name__ == "__main__":
     parser.add_option("-o", "--overwrite", dest="overwrite", action="store_true",
                       help="Overwrite output file if it exists"
                      )
+    parser.add_option("", "--profile", dest="profile", action="store_true",
+                      help="Write a JSON report of the time and memory " \
+                           "used by each simulation stage"
+                     )
+    parser.add_option("", "--nbands", dest="nbands", type="int",
+                     default=1, help="Number of bands of rows simulated " \
+                           "in parallel"
+                     )
+    parser.add_option("", "--nworkers", dest="nworkers", type="int",
+                     default=None, help="Maximum number of bands " \
+                           "simulated at the same time"
+                     )
+    parser.add_option("", "--pool", dest="pool", type="choice",
+                     choices=['thread', 'process'], default='thread',
+                     help="Kind of pool used for the bands (thread or process)"
+                     )
     
     parser.add_option("-q", "--noqe", dest="noqe",
                       action="store_true", help="Turn off QE adjustment"
@@ -478,6 +513,10 @@ if __name__ == "__main__":
     nolinearity = options.nolinearity
     nodrifts = options.nodrifts
     nolatency = options.nolatency
+    profile = options.profile
+    nbands = options.nbands
+    nworkers = options.nworkers
+    pool = options.pool
     
     # Set the verbosity level according to the --verbose and --silent
     # options. (Note that --debug wins over --verbose and --silent wins
@@ -575,7 +614,9 @@ if __name__ == "__main__":
                      flat_field_version=cdprelease, 
                      linearity_version=cdprelease, 
                      gain_version=cdprelease,
-                     makeplot=makeplot, verbose=verbose)
+                     makeplot=makeplot, profile=profile,
+                     nbands=nbands, nworkers=nworkers, pool=pool,
+                     verbose=verbose)
     else:
         # No previous exposure specified. Run a basic simulation.
         sca.simulate_files(inputfile, outputfile, detector, scale=scale,
@@ -605,7 +646,9 @@ if __name__ == "__main__":
                      flat_field_version=cdprelease, 
                      linearity_version=cdprelease, 
                      gain_version=cdprelease,
-                     makeplot=makeplot, verbose=verbose)
+                     makeplot=makeplot, profile=profile,
+                     nbands=nbands, nworkers=nworkers, pool=pool,
+                     verbose=verbose)
     del sca
     if verbose > 0:
         LOGGER.info( "Simulation finished." )
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# :History:
+#
+# 18 Oct 2026: Created
+#
+# @author: MIRI Software Team
+
+"""
+
+The 'scasim_batch.py' script runs a batch of MIRI SCA simulations
+described by a JSON manifest file. Each job in the manifest names an
+input illumination file, an output file and a detector, together with
+any other parameter accepted by the SensorChipAssembly simulate_files
+method. Jobs for the same detector (or with the same "chain" key) are
+simulated one after the other so detector persistence is carried from
+one exposure to the next. Independent chains are run in parallel
+worker processes. See the batch_simulation module for the manifest
+format.
+
+The compulsory scasim_batch.py command argument is:
+
+    manifest
+        The path+name of the JSON manifest file.
+
+The following optional parameters may be provided by keyword:
+
+    --workers
+        The maximum number of worker processes. Defaults to the number
+        of processors on the machine. Use 1 to run all the jobs in the
+        calling process.
+    --report
+        The path+name of a JSON file to which a per-job timing report
+        will be written.
+    --cdp_ftp_path
+        A list of folders on the SFTP host to be searched for CDP files,
+        separated by a ":" delimiter. Defaults to the standard simulator
+        CDP repository.
+
+The command also takes the following options:
+
+    --nopreload:
+        Do not import the main CDPs before starting the simulations.
+    --verbose or -v:
+        Generate more output.
+
+"""
+
+# Python logging facility
+import logging
+logging.basicConfig(level=logging.INFO) # Default level is informational output
+LOGGER = logging.getLogger("miri.simulators") # Get a default logger
+
+import optparse
+import sys, time
+
+from miri.simulators.scasim.batch_simulation import run_batch
+from miri.simulators.scasim.detector import SIM_CDP_FTP_PATH
+
+if __name__ == "__main__":
+    # parse arguments
+    help_text = __doc__
+    usage = "%prog [opt] manifest"
+    usage += "\n\t[--workers] [--report] [--cdp_ftp_path] [--nopreload]"
+    parser = optparse.OptionParser(usage)
+
+    parser.add_option("", "--workers", dest="workers", type="int",
+                     default=None, help="Maximum number of worker processes"
+                     )
+    parser.add_option("", "--report", dest="report", type="string",
+                     default='', help="Path+name of JSON timing report"
+                     )
+    parser.add_option("", "--cdp_ftp_path", dest="cdp_ftp_path", type="string",
+                     default=SIM_CDP_FTP_PATH,
+                     help="Search path for imported CDPs"
+                     )
+    parser.add_option("", "--nopreload", dest="nopreload", action="store_true",
+                      help="Do not preload CDPs"
+                     )
+    parser.add_option("-v", "--verbose", dest="verb", action="store_true",
+                      help="Verbose mode"
+                     )
+
+    (options, args) = parser.parse_args()
+
+    try:
+        manifest = args[0]
+    except IndexError:
+        print( help_text )
+        time.sleep(1) # Ensure help text appears before error messages.
+        parser.error("Not enough arguments provided")
+        sys.exit(1)
+
+    report = run_batch(manifest, nworkers=options.workers,
+                       report_file=options.report,
+                       preload=not options.nopreload,
+                       cdp_ftp_path=options.cdp_ftp_path, logger=LOGGER)
+    nfailed = 0
+    for entry in report:
+        if entry['status'] != 'OK':
+            nfailed += 1
+        if options.verb or entry['status'] != 'OK':
+            strg = "Job %d: %s -> %s (%s) %s in %.2f seconds. %s" % \
+                (entry['job'], entry['inputfile'], entry['outputfile'],
+                 entry['detector'], entry['status'], entry['elapsed'],
+                 entry['error'])
+            print(strg)
+    if nfailed > 0:
+        sys.exit(1)
@@ -355,6 +355,36 @@ Calibration Data Products (CDPs).
 30 Jun 2020: Oversized illumination maps which exactly match the size of
              an array containing reference columns are truncated by
              removing reference columns.
+18 Oct 2026: Added fast_readout option to setup, which selects the
+             fast Poisson readout of the detector integrator.
+             set_seed also seeds the detector, if it exists.
+18 Oct 2026: Added nbands, nworkers and pool options to exposure, which
+             simulate the integrations in parallel bands of detector rows.
+18 Oct 2026: Nonlinearity is simulated with the amplifier or pixel
+             reverse linearity tables when NONLINEARITY_TABLE_MODE
+             selects them.
+18 Oct 2026: Added integrator_kernel option to setup, which selects the
+             kernel used by the detector integrator.
+18 Oct 2026: Added batch_ramps option to setup, which simulates all the
+             groups of each integration in batches when the detector
+             integrator is perfect.
+18 Oct 2026: Added precision option to setup, which selects float32
+             instead of float64 for the detector simulation.
+18 Oct 2026: Added a StageProfiler, which measures the time and memory
+             used by each stage of a simulation. simulate_files and
+             simulate_pipe have a profile option, which makes the
+             profile_report and writes it to a JSON file alongside
+             each output file.
+18 Oct 2026: The bands of rows simulated by exposure write their readouts
+             straight into the exposure data.
+18 Oct 2026: write_data fits slope data with fit_ramps_file, a block of
+             rows at a time from a temporary memory-mapped ramp file,
+             using the group time of the exposure.
+18 Oct 2026: The exposure data only stores averaged groups when groups or
+             integrations are averaged. The DARK and nonlinearity
+             corrections are applied to each group before it is averaged.
+18 Oct 2026: Added nbands, nworkers and pool options to simulate_files,
+             simulate_pipe, simulate_sca and simulate_sca_list.
 
 
 @author: Steven Beard
@@ -368,9 +398,11 @@ LOGGER = logging.getLogger("miri.simulators") # Get a default parent logger
 
 #import warnings
 import time, os
+import tempfile
 # The simulator uses the mathematical and array processing functions of
 # numpy.
 import numpy as np
+import astropy.io.fits as pyfits
 
 from miri import __version__
 
@@ -379,6 +411,7 @@ from miri.datamodels.miri_filters import MiriQuantumEfficiency
 
 # MIRI data models
 from miri.datamodels import MiriMeasuredModel
+from miri.datamodels.miri_linearity_model import apply_reverse_grid
 
 # Old and new MIRI exposure data models. The old model is compatible with DHAS
 # and the new model is compatible with the STScI pipeline.
@@ -391,7 +424,13 @@ from miri.datamodels.sim import MiriExposureModel, \
 from miri.simulators.scasim.cosmic_ray import CosmicRayEnvironment, CosmicRay, \
     load_cosmic_ray_library, load_cosmic_ray_random, load_cosmic_ray_single
 from miri.simulators.scasim.detector import DetectorArray, SIM_CDP_FTP_PATH, \
-    NONLINEARITY_BY_TABLE
+    NONLINEARITY_BY_TABLE, NONLINEARITY_TABLE_MODE
+from miri.simulators.integrators import precision_dtype
+from miri.simulators.scasim.profiling import StageProfiler, profile_filename
+from miri.tools.ramp_fitting import fit_ramps_file
+
+# The maximum working memory (in bytes) used when fitting slope data.
+_SLOPE_MAX_MEMORY = 256 * 1024 * 1024
 
 # Import the miri.tools plotting module.
 import miri.tools.miriplot as mplt
@@ -742,6 +781,11 @@ class SensorChipAssembly(object):
         self.detector = None
         self.shape = ()
         self.clock_time = time.time()
+
+        # The profiler measuring each stage of a simulation (only when
+        # enabled) and the last report made.
+        self.profiler = StageProfiler()
+        self.profile_report = None
         
         # Initial values for the simulation flags
         self.simulate_poisson_noise = True
@@ -754,6 +798,10 @@ class SensorChipAssembly(object):
         self.simulate_nonlinearity = True
         self.simulate_drifts = True
         self.simulate_latency = True
+        self.fast_readout = False
+        self.integrator_kernel = 'numpy'
+        self.batch_ramps = False
+        self.precision = 'float64'
       
     def setup(self, detectorid, readout_mode='FAST', subarray='FULL',
               burst_mode=True, inttime=None, ngroups=None, nints=None,
@@ -765,6 +813,8 @@ class SensorChipAssembly(object):
               simulate_flat_field=True, simulate_gain=True,
               simulate_nonlinearity=True,
               simulate_drifts=True, simulate_latency=True,
+              fast_readout=False, integrator_kernel='numpy',
+              batch_ramps=False, precision='float64',
               cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
               readnoise_version='', bad_pixels_version='',
               flat_field_version='', linearity_version='', gain_version='',
@@ -900,6 +950,29 @@ class SensorChipAssembly(object):
         simulate_latency: boolean, optional, default=True
             A flag that may be used to switch off the simulation of
             detector latency and persistence effects.
+        fast_readout: boolean, optional, default=False
+            Set to True to simulate Poisson noise with the fast readout
+            of the detector integrator. This is reproducible for a
+            given seed, but gives a different random sequence from the
+            default readout.
+        integrator_kernel: string, optional, default='numpy'
+            The kernel used by the detector integrator: 'numpy',
+            'inplace' (which updates work buffers in place and gives
+            the same result) or 'numexpr' (which needs the numexpr
+            package). See ImperfectIntegrator.set_kernel.
+        batch_ramps: boolean, optional, default=False
+            Set to True to simulate all the groups of each integration
+            in batches, with cumulative sums of Poisson samples, when
+            latency, drifts and nonlinearity by sensitivity are not
+            simulated. See DetectorArray.simulate_ramp. The result is
+            statistically equivalent to a group by group simulation
+            but uses different random numbers.
+        precision: string, optional, default='float64'
+            The floating point precision of the detector simulation:
+            'float64' or 'float32'. float32 halves the memory needed
+            by the detector integrator and readout calculations, with
+            rounding errors much smaller than 1 DN. The exposure data
+            are always stored as float32. See DetectorArray.
         cdp_ftp_host: str, optional, default=None
             If specified, the address of the server hosting the CDP
             repository. The string 'LOCAL' may be used to restrict searches
@@ -1018,6 +1091,7 @@ class SensorChipAssembly(object):
         # There is no integration data or exposure_data object until an
         # integration.
         self.exposure_data = None
+        self._readout_corrections = None
         self.include_pixeldq = include_pixeldq
         self.include_groupdq = include_groupdq
         self.fileformat = fileformat
@@ -1036,14 +1110,16 @@ class SensorChipAssembly(object):
                 self.logger.info( "Loading QE from \`%s\`" % self._sca['QE_FILE'] )
             # Load the QE information. Plot it if it isn't null.
             #self.qe = QuantumEfficiency(self._sca['QE_FILE'])
-            self.qe = MiriQuantumEfficiency(self._sca['QE_FILE'])
+            with self.profiler.stage('calibration'):
+                self.qe = MiriQuantumEfficiency(self._sca['QE_FILE'])
             if makeplot and self.qe is not None:
                 self.qe.plot()
         else:
             # No QE adjustment
             self.qe = None
         
-        self.define_cosmic_ray_env(cosmic_ray_mode)
+        with self.profiler.stage('cosmic_rays'):
+            self.define_cosmic_ray_env(cosmic_ray_mode)
         
         # Non-linearity simulation by translation table is only possible when
         # amplifier gain is simulated.
@@ -1065,6 +1141,10 @@ class SensorChipAssembly(object):
                                   simulate_drifts=simulate_drifts,
                                   simulate_latency=simulate_latency)
 
+        self.fast_readout       = bool(fast_readout)
+        self.integrator_kernel  = integrator_kernel
+        self.batch_ramps        = bool(batch_ramps)
+        self.precision          = precision_dtype(precision).name
         self.cdp_ftp_host       = cdp_ftp_host
         self.cdp_ftp_path       = cdp_ftp_path
         self.readnoise_version  = readnoise_version
@@ -1239,6 +1319,8 @@ class SensorChipAssembly(object):
             
         """
         np.random.seed(seedvalue)
+        if self.detector is not None:
+            self.detector.set_seed(seedvalue)
 
     def set_simulation_flags(self, readout_mode, qe_adjust=True,
                              simulate_poisson_noise=True,
@@ -1382,7 +1464,8 @@ class SensorChipAssembly(object):
         self._prepare_for_new_data()
 
         # Create the illumination map object and read the data from the file.        
-        self.illumination_map = MiriIlluminationModel(filename)
+        with self.profiler.stage('read_input'):
+            self.illumination_map = MiriIlluminationModel(filename)
         
         # The intensity data must be at least 2-D.
         if self.illumination_map.intensity.ndim < 2:
@@ -1796,9 +1879,10 @@ class SensorChipAssembly(object):
         mirifilter = self.illumination_map.get_fits_keyword('FILTER')
         miriband = self.illumination_map.get_fits_keyword('BAND')
             
-        # A new detector object is only needed if the detector ID
-        # or the shape of the illumination map has changed.
-        if (self.detector is None) or (ishape != self.shape):
+        # A new detector object is only needed if the detector ID, the
+        # shape of the illumination map or the precision has changed.
+        if (self.detector is None) or (ishape != self.shape) or \
+           (self.detector.dtype.name != self.precision):
             # The shape has changed.
             self.shape = ishape
 
@@ -1826,36 +1910,40 @@ class SensorChipAssembly(object):
                 readpatt = 'SLOW'
             else:
                 readpatt = 'FAST'
-            self.detector = DetectorArray(
-                                self.detectorid,
-                                self.shape[0], self.shape[1],
-                                self.temperature,
-                                left_columns=left_columns,
-                                right_columns=right_columns,
-                                bottom_rows=bottom_rows,
-                                top_rows=top_rows,
-                                well_depth=well_depth,
-                                readpatt=readpatt, subarray=self.subarray_str,
-                                mirifilter=mirifilter, miriband=miriband,
-                                simulate_poisson_noise=self.simulate_poisson_noise,
-                                simulate_read_noise=self.simulate_read_noise,
-                                simulate_bad_pixels=self.simulate_bad_pixels,
-                                simulate_dark_current=self.simulate_dark_current,
-                                simulate_flat_field=self.simulate_flat_field,
-                                simulate_gain=self.simulate_gain,
-                                simulate_nonlinearity=self.simulate_nonlinearity,
-                                simulate_drifts=self.simulate_drifts,
-                                simulate_latency=self.simulate_latency,
-                                cdp_ftp_host=self.cdp_ftp_host, 
-                                cdp_ftp_path=self.cdp_ftp_path,
-                                readnoise_version=self.readnoise_version,
-                                bad_pixels_version=self.bad_pixels_version,
-                                flat_field_version=self.flat_field_version,
-                                linearity_version=self.linearity_version,
-                                gain_version=self.gain_version,
-                                makeplot=self._makeplot,
-                                verbose=self._verbose,
-                                logger=self.toplogger)
+            with self.profiler.stage('calibration'):
+                self.detector = DetectorArray(
+                                    self.detectorid,
+                                    self.shape[0], self.shape[1],
+                                    self.temperature,
+                                    left_columns=left_columns,
+                                    right_columns=right_columns,
+                                    bottom_rows=bottom_rows,
+                                    top_rows=top_rows,
+                                    well_depth=well_depth,
+                                    readpatt=readpatt, subarray=self.subarray_str,
+                                    mirifilter=mirifilter, miriband=miriband,
+                                    simulate_poisson_noise=self.simulate_poisson_noise,
+                                    simulate_read_noise=self.simulate_read_noise,
+                                    simulate_bad_pixels=self.simulate_bad_pixels,
+                                    simulate_dark_current=self.simulate_dark_current,
+                                    simulate_flat_field=self.simulate_flat_field,
+                                    simulate_gain=self.simulate_gain,
+                                    simulate_nonlinearity=self.simulate_nonlinearity,
+                                    simulate_drifts=self.simulate_drifts,
+                                    simulate_latency=self.simulate_latency,
+                                    fast_readout=self.fast_readout,
+                                    integrator_kernel=self.integrator_kernel,
+                                    precision=self.precision,
+                                    cdp_ftp_host=self.cdp_ftp_host, 
+                                    cdp_ftp_path=self.cdp_ftp_path,
+                                    readnoise_version=self.readnoise_version,
+                                    bad_pixels_version=self.bad_pixels_version,
+                                    flat_field_version=self.flat_field_version,
+                                    linearity_version=self.linearity_version,
+                                    gain_version=self.gain_version,
+                                    makeplot=self._makeplot,
+                                    verbose=self._verbose,
+                                    logger=self.toplogger)
             
         # If a new detector is not needed, but the readout mode or the
         # output subarray mode have changed, then the calibration data
@@ -1875,17 +1963,23 @@ class SensorChipAssembly(object):
             self.detector.simulate_nonlinearity=self.simulate_nonlinearity
             self.detector.simulate_drifts=self.simulate_drifts
             self.detector.simulate_latency=self.simulate_latency
-            self.detector.add_calibration_data(self.detectorid,
-                    readpatt=readpatt, subarray=self.subarray_str,
-                    mirifilter=mirifilter, miriband=miriband,
-                    cdp_ftp_host=self.cdp_ftp_host, 
-                    cdp_ftp_path=self.cdp_ftp_path,
-                    bad_pixels_version=self.bad_pixels_version,
-                    flat_field_version=self.flat_field_version,
-                    linearity_version=self.linearity_version,
-                    readnoise_version=self.readnoise_version,
-                    gain_version=self.gain_version)
-
+            with self.profiler.stage('calibration'):
+                self.detector.add_calibration_data(self.detectorid,
+                        readpatt=readpatt, subarray=self.subarray_str,
+                        mirifilter=mirifilter, miriband=miriband,
+                        cdp_ftp_host=self.cdp_ftp_host, 
+                        cdp_ftp_path=self.cdp_ftp_path,
+                        bad_pixels_version=self.bad_pixels_version,
+                        flat_field_version=self.flat_field_version,
+                        linearity_version=self.linearity_version,
+                        readnoise_version=self.readnoise_version,
+                        gain_version=self.gain_version)
+
+        # The readout method and integrator kernel can be changed
+        # without a new detector.
+        self.detector.pixels.fast_readout = self.fast_readout
+        if self.detector.pixels.kernel != self.integrator_kernel:
+            self.detector.pixels.set_kernel(self.integrator_kernel)
         self.subarray_previous = self.subarray_str
         self.readout_mode_previous = self.readout_mode
         
@@ -2267,6 +2361,294 @@ class SensorChipAssembly(object):
 #         self.detector.set_readout_mode(self.samplesum, self.sampleskip,
 #                                        self.refpixsampleskip, self.nframes)
        
+        with self.profiler.stage('illumination'):
+            self._prepare_flux(frame_time=frame_time)
+
+        # >>>
+        # >>> Reset the detector.
+        # >>> Insert an extra FRAME_RESETS resets if needed.
+        # >>>
+        extra_resets = self._sca['FRAME_RESETS']
+        if self._verbose > 4:
+            self.logger.debug( "Applying %d extra frame resets." % extra_resets )
+        nresets = 1 + extra_resets
+        if intnum == 0:
+            self.detector.reset(nresets=nresets, new_exposure=True)
+        else:
+            self.detector.reset(nresets=nresets)
+                
+        # >>>
+        # >>> Step through the groups.        
+        # >>>
+        if self._verbose > 1:
+            if self.ngroups > 1:
+                self.logger.info( "Simulating %d groups for integration %d." % \
+                                  (self.ngroups, intnum+1) )
+            else:
+                self.logger.info( "Simulating %d group for integration %d." % \
+                                  (self.ngroups, intnum+1) )
+        for group in range(0, self.ngroups):
+            if self._verbose > 2:
+                self.logger.info( "Integration %d group %d:" % (intnum+1, group+1) )
+                
+            time = self._group_time(group, frame_time=frame_time)
+            
+            # Generate some cosmic ray events during this group of frames
+            # interval.
+            # TODO: The next few lines could be taken outside the group loop.
+            rows = self.shape[0]
+            columns = self.shape[1]
+            pixsize = self._sca['PIXEL_SIZE']
+            
+            with self.profiler.stage('cosmic_rays'):
+                cosmic_ray_list = \
+                    self.cosmic_ray_env.generate_events(rows, columns,
+                                                        time, pixsize)
+                # Hit the detector with the cosmic rays.
+                self.detector.hit_by_cosmic_rays(cosmic_ray_list,
+                                                 self.nframes)
+                del cosmic_ray_list    
+            
+            # >>>
+            # >>> Integrate on the flux, read the detector and update the
+            # >>> exposure data.
+            # TODO: Chop off the reference columns at the left edge of
+            # subarray data.
+            # >>>
+            with self.profiler.stage('integrate'):
+                self.detector.integrate(self.flux, time, intnum=intnum)
+            total_samples = self.nframes * self.samplesum
+            if total_samples < 1:
+                total_samples = 1
+            with self.profiler.stage('readout'):
+                integration_data = \
+                    self.detector.readout(subarray=self.subarray,
+                                          total_samples=total_samples)
+            if self._makeplot and self._verbose > 7:
+                mplt.plot_image2D(integration_data,
+                    xlabel='Columns', ylabel='Rows', withbar=True,
+                    title='Readout for integration %d, group %d' % \
+                        (intnum,group))
+            
+            with self.profiler.stage('set_group'):
+                self._store_group(integration_data, group, intnum)
+
+        # There is no longer any need to return the integration_data
+        return
+
+    def _batched_integration(self, intnum, frame_time=None):
+        """
+        
+        Helper function which simulates a detector integration in the
+        same way as the integration method, but simulates batches of
+        groups at once (see DetectorArray.simulate_ramp) and writes
+        the readouts directly into the exposure data.
+        
+        """
+        with self.profiler.stage('illumination'):
+            self._prepare_flux(frame_time=frame_time)
+        if self._verbose > 1:
+            if self.ngroups > 1:
+                self.logger.info( "Simulating %d groups for integration %d." % \
+                                  (self.ngroups, intnum+1) )
+            else:
+                self.logger.info( "Simulating %d group for integration %d." % \
+                                  (self.ngroups, intnum+1) )
+
+        # Generate the cosmic ray events for each group in turn.
+        nresets = 1 + self._sca['FRAME_RESETS']
+        rows = self.shape[0]
+        columns = self.shape[1]
+        pixsize = self._sca['PIXEL_SIZE']
+        groups = []
+        with self.profiler.stage('cosmic_rays'):
+            for group in range(0, self.ngroups):
+                time = self._group_time(group, frame_time=frame_time)
+                cosmic_ray_list = \
+                    self.cosmic_ray_env.generate_events(rows, columns,
+                                                        time, pixsize)
+                groups.append( (time, cosmic_ray_list) )
+
+        total_samples = self.nframes * self.samplesum
+        if total_samples < 1:
+            total_samples = 1
+        # The cosmic rays are deposited and the groups integrated and
+        # read out while each batch is generated.
+        with self.profiler.stage('integrate_ramp'):
+            batches = self.detector.simulate_ramp(self.flux, groups,
+                                                  intnum=intnum,
+                                                  nresets=nresets,
+                                                  nframes=self.nframes,
+                                                  subarray=self.subarray,
+                                                  total_samples=total_samples)
+        del groups
+        while True:
+            with self.profiler.stage('integrate_ramp'):
+                batch = next(batches, None)
+            if batch is None:
+                break
+            (first, read_data) = batch
+            del batch
+            with self.profiler.stage('set_group'):
+                if first == 0 and read_data.shape[0] == self.ngroups and \
+                   isinstance(self.exposure_data, MiriExposureModel) and \
+                   self._readout_corrections is None:
+                    # The whole integration is stored at once.
+                    self.exposure_data.set_integration(read_data, intnum)
+                else:
+                    for (group, group_data) in enumerate(read_data,
+                                                         start=first):
+                        self._store_group(group_data, group, intnum)
+            del read_data
+
+    def _store_group(self, data, group, intnum):
+        """
+        
+        Helper function which stores a group readout in the exposure
+        data. When the groups are averaged as they are stored, the
+        readout is corrected first (see _correct_readout).
+        
+        """
+        if self._readout_corrections is not None:
+            data = self._correct_readout(data, group, intnum)
+        self.exposure_data.set_group(data, group, intnum)
+
+    def _linearity_grid(self):
+        """
+        
+        Helper function which returns the grid of nonlinearity translation
+        tables for each amplifier or pixel when one is available and
+        matches the exposure data, or None.
+        
+        """
+        grid = self.detector.linearity_grid
+        if grid is not None:
+            (rrows, rcolumns) = self.exposure_data.data.shape[-2:]
+            if grid.shape[1:] != (rrows, rcolumns) and \
+               (grid.shape[1] > 1 or rcolumns % grid.shape[2] != 0):
+                grid = None
+        return grid
+
+    def _get_readout_corrections(self):
+        """
+        
+        Helper function which prepares the corrections which are applied
+        to each group readout before it is averaged. These are the same
+        corrections the exposure method applies to the whole exposure
+        when the groups are not averaged: the DARK calibration (when it
+        is not averaged) and the nonlinearity translation tables.
+        
+        :Returns:
+        
+        corrections: tuple of (dark, grid, tables) or None
+            The DARK data, the grid of translation tables and the
+            (left, right) translation tables. Each item may be None.
+            None is returned when there is nothing to correct.
+        
+        """
+        dark = None
+        if self.detector.simulate_dark_current and \
+           not self.detector.dark_averaged and \
+           self.detector.dark_map is not None:
+            dark = np.asarray(self.detector.dark_map)
+            if dark.ndim not in (3, 4) or dark.shape[-3] < self.ngroups:
+                strg = "DARK data has the wrong shape or insufficient groups"
+                strg += ": DARK addition skipped."
+                self.logger.error(strg)
+                dark = None
+            else:
+                self.logger.info("Adding the DARK calibration from %s" % \
+                                 self.detector.dark_map_filename)
+
+        grid = None
+        tables = None
+        if self.detector.simulate_nonlinearity and NONLINEARITY_BY_TABLE:
+            grid = self._linearity_grid()
+            if grid is not None:
+                self.logger.info("Correcting nonlinearity with %s tables from %s" % \
+                                 (NONLINEARITY_TABLE_MODE.lower(),
+                                  self.detector.linearity_filename))
+            else:
+                tables = self.detector.get_linearity_halves()
+                if tables[0] is not None:
+                    self.logger.info("Correcting nonlinearity from %s" % \
+                                     self.detector.linearity_filename)
+
+        if dark is None and grid is None and tables is None:
+            return None
+        return (dark, grid, tables)
+
+    def _correct_readout(self, data, group, intnum):
+        """
+        
+        Helper function which applies the DARK calibration and the
+        nonlinearity translation tables to a single group readout,
+        clipping the result to the range of 16-bit telemetry data in
+        the same way as the exposure data add_dark and apply_translation
+        methods.
+        
+        """
+        (dark, grid, tables) = self._readout_corrections
+        data = np.array(data, dtype=np.float32)
+        if dark is not None:
+            # NOTE: DARK calibration data includes reference columns.
+            if dark.ndim == 4:
+                # The first DARK integration is different from the others.
+                dark_plane = dark[min(intnum, dark.shape[0]-1), group]
+            else:
+                dark_plane = dark[group]
+            (drows, dcolumns) = dark_plane.shape
+            data[:drows, :dcolumns] += dark_plane
+            np.clip(data, 1.0, 65535.0, out=data)
+        if grid is not None:
+            apply_reverse_grid(data, grid, self.detector.linearity_grid_step,
+                               out=data)
+            np.clip(data, 1.0, 65535.0, out=data)
+        elif tables is not None:
+            rcolmiddle = data.shape[-1]//2
+            for (table, fromcolumn, tocolumn) in \
+                    ((tables[0], 0, rcolmiddle),
+                     (tables[1], rcolmiddle, data.shape[-1])):
+                if table is not None:
+                    table = np.asarray(table)
+                    selection = np.clip(
+                        data[:, fromcolumn:tocolumn].astype(int),
+                        0, len(table)-1)
+                    data[:, fromcolumn:tocolumn] = table[selection]
+            np.clip(data, 1.0, 65535.0, out=data)
+        return data
+
+    def _group_time(self, group, frame_time=None):
+        """
+        
+        Helper function which returns the integration time of a group.
+        
+        """
+        # The group time is the frame time x number of frames per group.
+        if frame_time is None:
+            ftime = self.detector.frame_time(
+                                    self.samplesum,
+                                    self.sampleskip,
+                                    refpixsampleskip=self.refpixsampleskip,
+                                    subarray=self.subarray,
+                                    burst_mode=self.subarray_burst_mode)
+        else:
+            ftime = frame_time
+        time = self.nframes * ftime
+        # For all but the first group, the integration includes
+        # the group gap.
+        if group > 0:
+            time += self.groupgap * ftime
+        return time
+
+    def _prepare_flux(self, frame_time=None):
+        """
+        
+        Helper function which obtains the detector flux from the
+        illumination map (unless already defined) and checks that it
+        is within a sensible range.
+        
+        """
         # Get the combined illumination from the illumination map.
         # This calculation only needs to be done once unless the
         # illumination map or the QE measurement changes.
@@ -2385,88 +2767,67 @@ class SensorChipAssembly(object):
                 " max=" + str(self.fringe_map_data.max())
             self.logger.info(strg)
         
-        # >>>
-        # >>> Reset the detector.
-        # >>> Insert an extra FRAME_RESETS resets if needed.
-        # >>>
-        extra_resets = self._sca['FRAME_RESETS']
-        if self._verbose > 4:
-            self.logger.debug( "Applying %d extra frame resets." % extra_resets )
-        nresets = 1 + extra_resets
-        if intnum == 0:
-            self.detector.reset(nresets=nresets, new_exposure=True)
-        else:
-            self.detector.reset(nresets=nresets)
-                
-        # >>>
-        # >>> Step through the groups.        
-        # >>>
+    def _band_integrations(self, nbands, nworkers=None, pool='thread',
+                           frame_time=None):
+        """
+        
+        Helper function which simulates all the integrations of an
+        exposure in parallel bands of detector rows (see
+        DetectorArray.simulate_integrations) and stores the readouts
+        in the exposure data. The readouts are written straight into
+        the exposure data, unless its groups are averaged as they are
+        stored, in which case the readouts of the whole exposure are
+        simulated first and then stored group by group.
+        
+        """
+        with self.profiler.stage('illumination'):
+            self._prepare_flux(frame_time=frame_time)
         if self._verbose > 1:
-            if self.ngroups > 1:
-                self.logger.info( "Simulating %d groups for integration %d." % \
-                                  (self.ngroups, intnum+1) )
-            else:
-                self.logger.info( "Simulating %d group for integration %d." % \
-                                  (self.ngroups, intnum+1) )
-        for group in range(0, self.ngroups):
-            if self._verbose > 2:
-                self.logger.info( "Integration %d group %d:" % (intnum+1, group+1) )
-                
-            # The group time is the frame time x number of frames per group.
-            if frame_time is None:
-                ftime = self.detector.frame_time(
-                                        self.samplesum,
-                                        self.sampleskip,
-                                        refpixsampleskip=self.refpixsampleskip,
-                                        subarray=self.subarray,
-                                        burst_mode=self.subarray_burst_mode)
-            else:
-                ftime = frame_time
-            time = self.nframes * ftime
-            # For all but the first group, the integration includes
-            # the group gap.
-            if group > 0:
-                time += self.groupgap * ftime
-            
-            # Generate some cosmic ray events during this group of frames
-            # interval.
-            # TODO: The next few lines could be taken outside the group loop.
-            rows = self.shape[0]
-            columns = self.shape[1]
-            pixsize = self._sca['PIXEL_SIZE']
-            
-            cosmic_ray_list = \
-                self.cosmic_ray_env.generate_events(rows, columns,
-                                                    time, pixsize)
-            # Hit the detector with the cosmic rays.
-            self.detector.hit_by_cosmic_rays(cosmic_ray_list, self.nframes)
-            del cosmic_ray_list    
-            
-            # >>>
-            # >>> Integrate on the flux, read the detector and update the
-            # >>> exposure data.
-            # TODO: Chop off the reference columns at the left edge of
-            # subarray data.
-            # >>>
-            self.detector.integrate(self.flux, time, intnum=intnum)
-            total_samples = self.nframes * self.samplesum
-            if total_samples < 1:
-                total_samples = 1
-            integration_data = \
-                self.detector.readout(subarray=self.subarray,
-                                      total_samples=total_samples)
-            if self._makeplot and self._verbose > 7:
-                mplt.plot_image2D(integration_data,
-                    xlabel='Columns', ylabel='Rows', withbar=True,
-                    title='Readout for integration %d, group %d' % \
-                        (intnum,group))
-            
-            self.exposure_data.set_group(integration_data, group, intnum)
+            self.logger.info( "Simulating %d groups for each integration." % \
+                              self.ngroups )
 
-        # There is no longer any need to return the integration_data
-        return
-
-    def exposure(self, nints=None, frame_time=None, start_time=None):
+        # Generate the cosmic ray events for each group in turn.
+        nresets = 1 + self._sca['FRAME_RESETS']
+        rows = self.shape[0]
+        columns = self.shape[1]
+        pixsize = self._sca['PIXEL_SIZE']
+        schedule = []
+        with self.profiler.stage('cosmic_rays'):
+            for intnum in range(0, self.nints):
+                groups = []
+                for group in range(0, self.ngroups):
+                    time = self._group_time(group, frame_time=frame_time)
+                    cosmic_ray_list = \
+                        self.cosmic_ray_env.generate_events(rows, columns,
+                                                            time, pixsize)
+                    groups.append( (time, cosmic_ray_list) )
+                schedule.append( (nresets, groups) )
+
+        total_samples = self.nframes * self.samplesum
+        if total_samples < 1:
+            total_samples = 1
+        # The bands write their readouts straight into the exposure data,
+        # unless the groups are averaged as they are stored.
+        out = self.exposure_data.get_data_array()
+        with self.profiler.stage('integrate_bands'):
+            read_data = self.detector.simulate_integrations(
+                                            self.flux, schedule, nbands,
+                                            nframes=self.nframes,
+                                            nworkers=nworkers, pool=pool,
+                                            subarray=self.subarray,
+                                            total_samples=total_samples,
+                                            out=out)
+        del schedule
+        if out is None:
+            with self.profiler.stage('set_group'):
+                for intnum in range(0, self.nints):
+                    for group in range(0, self.ngroups):
+                        self._store_group(read_data[intnum, group],
+                                          group, intnum)
+        del read_data
+
+    def exposure(self, nints=None, frame_time=None, start_time=None,
+                 nbands=1, nworkers=None, pool='thread'):
         """
         
         Simulate a detector exposure consisting of one or more
@@ -2493,6 +2854,23 @@ class SensorChipAssembly(object):
             If set to 'NOW', the current date-time is obtained from
             the system clock. By default, the internally stored clock
             time is used.
+        nbands: int, optional, default=1
+            If greater than 1, the detector is divided into this number
+            of bands of rows and the integrations are simulated for each
+            band in parallel. The result is reproducible for a given seed
+            and number of bands, but uses different random numbers from
+            a serial simulation.
+        nworkers: int, optional, default=None
+            The maximum number of bands simulated at the same time.
+            By default, the number of bands or the number of processors,
+            whichever is smaller.
+        pool: str, optional, default='thread'
+            The kind of pool used to simulate the bands in parallel:
+            'thread' or 'process'. A pool of threads writes the readouts
+            straight into the exposure data. A pool of processes needs
+            an extra copy of the readouts of each band.
+            NOTE: The bands are not used when the batch_ramps option
+            given to setup simulates the groups in batches.
 
         :Returns:
         
@@ -2559,6 +2937,13 @@ class SensorChipAssembly(object):
 
         # If needed, create a new exposure data object.
         self._new_exposure_data()
+        
+        # When the groups are averaged as they are stored, the DARK and
+        # nonlinearity corrections must be applied to each group readout
+        # before it is averaged.
+        self._readout_corrections = None
+        if self.exposure_data.streaming:
+            self._readout_corrections = self._get_readout_corrections()
 
         # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
         # >>>
@@ -2569,13 +2954,32 @@ class SensorChipAssembly(object):
                 self.logger.info( "Simulating %d integrations." % self.nints )
             else:
                 self.logger.info( "Simulating %d integration." % self.nints )
-        for intnum in range(0, self.nints):
-            self.integration(intnum, frame_time=frame_time)
+        batch_ramps = self.batch_ramps
+        if batch_ramps and not self.detector.pixels.is_perfect():
+            strg = "Integrations cannot be simulated in batches when "
+            strg += "latency, drifts or nonlinearity by sensitivity are "
+            strg += "simulated. Each group is simulated in turn."
+            self.logger.warning(strg)
+            batch_ramps = False
+        if batch_ramps:
+            for intnum in range(0, self.nints):
+                self._batched_integration(intnum, frame_time=frame_time)
+        elif nbands > 1:
+            self._band_integrations(nbands, nworkers=nworkers, pool=pool,
+                                    frame_time=frame_time)
+        else:
+            for intnum in range(0, self.nints):
+                self.integration(intnum, frame_time=frame_time)
         # >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
             
         # If the DARK calibration is not averaged, it is added here.
         # NOTE: DARK calibration data includes reference columns.
-        if self.detector.simulate_dark_current and not self.detector.dark_averaged:
+        # When the groups are averaged as they are stored, the DARK and
+        # nonlinearity corrections have already been applied to each
+        # group readout (see _correct_readout).
+        streaming = self.exposure_data.streaming
+        if self.detector.simulate_dark_current and \
+           not self.detector.dark_averaged and not streaming:
             if self.detector.dark_map is not None:
                 self.logger.info("Adding the DARK calibration from %s" % \
                                  self.detector.dark_map_filename)
@@ -2590,19 +2994,29 @@ class SensorChipAssembly(object):
                     
         # If the nonlinearity correction is done by translation table
         # it is applied to the exposure data here.
-        if self.detector.simulate_nonlinearity and NONLINEARITY_BY_TABLE:
-            rcolumns = self.exposure_data.data.shape[3]
-            rcolmiddle = rcolumns//2
-            if self.detector.linearity_table_left is not None:
-                self.logger.info("Correcting nonlinearity from %s" % \
-                                 self.detector.linearity_filename)
-                self.exposure_data.apply_translation( \
-                    self.detector.linearity_table_left,
-                    fromcolumn=0, tocolumn=rcolmiddle )
-            if self.detector.linearity_table_right is not None:
-                self.exposure_data.apply_translation( \
-                    self.detector.linearity_table_right,
-                    fromcolumn=rcolmiddle, tocolumn=rcolumns )        
+        # A table for each amplifier or pixel is used when one is available
+        # and matches the data.
+        if self.detector.simulate_nonlinearity and NONLINEARITY_BY_TABLE and \
+           not streaming:
+            grid = self._linearity_grid()
+            if grid is not None:
+                self.logger.info("Correcting nonlinearity with %s tables from %s" % \
+                                 (NONLINEARITY_TABLE_MODE.lower(),
+                                  self.detector.linearity_filename))
+                self.exposure_data.apply_reverse_grid( grid,
+                                        self.detector.linearity_grid_step )
+            else:
+                rcolumns = self.exposure_data.data.shape[3]
+                rcolmiddle = rcolumns//2
+                (table_left, table_right) = self.detector.get_linearity_halves()
+                if table_left is not None:
+                    self.logger.info("Correcting nonlinearity from %s" % \
+                                     self.detector.linearity_filename)
+                    self.exposure_data.apply_translation( table_left,
+                        fromcolumn=0, tocolumn=rcolmiddle )
+                if table_right is not None:
+                    self.exposure_data.apply_translation( table_right,
+                        fromcolumn=rcolmiddle, tocolumn=rcolumns )
         
         # Copy the primary metadata from the illumination map to the
         # exposure data and append some additional information.
@@ -3032,6 +3446,10 @@ class SensorChipAssembly(object):
         # output subarray mode will invalidate the exposure data
         # object.
         if self.exposure_data is None:
+            # When groups or integrations are averaged, only the averaged
+            # data are stored and each group is accumulated as it is read
+            # out, so the full hypercube never exists in memory.
+            streaming = (self.avggrps > 1 or self.avgints > 1)
             # Get exposure data size and reference output size according
             # to the output subarray mode.
             data_shape = self.detector.get_subarray_shape(self.subarray)
@@ -3092,7 +3510,8 @@ class SensorChipAssembly(object):
                                         nframes=self.nframes,
                                         groupgap=self.groupgap,
                                         include_pixeldq=self.include_pixeldq,
-                                        include_groupdq=self.include_groupdq)
+                                        include_groupdq=self.include_groupdq,
+                                        streaming=streaming)
                 # Initialise the metadata from the illumination model,
                 # but do not copy the data units or data type information.
                 if self.illumination_map is not None:
@@ -3129,7 +3548,8 @@ class SensorChipAssembly(object):
                                         grpavg=self.avggrps,
                                         intavg=self.avgints,
                                         nframes=self.nframes,
-                                        groupgap=self.groupgap)
+                                        groupgap=self.groupgap,
+                                        streaming=streaming)
                 # Define the correct data units
                 if self.simulate_gain:
                     self.exposure_data.set_fits_keyword('BUNIT', 'DN')
@@ -3282,6 +3702,43 @@ class SensorChipAssembly(object):
         
         return self.exposure_data.get_exposure_times()
           
+    def _fit_slopes(self, filename):
+        """
+        
+        Helper function which fits a straight line to the (averaged)
+        ramps of the exposure data. The ramps are written to a temporary
+        FITS file alongside the given output file and fitted from there
+        a block of rows at a time by fit_ramps_file, so the fit never
+        needs more than _SLOPE_MAX_MEMORY of working memory.
+        
+        Returns a tuple of float32 (slope, slope_err) arrays.
+        
+        """
+        # The time between the averaged groups.
+        if 'TFRAME' in self.metadata:
+            frame_time = self.metadata['TFRAME']
+        else:
+            frame_time = None
+        grptime = self._group_time(1, frame_time=frame_time) * \
+            self.exposure_data.grpavg
+        outdir = os.path.dirname(os.path.abspath(filename))
+        (fd, rampfile) = tempfile.mkstemp(prefix='ramps_', suffix='.fits',
+                                          dir=outdir)
+        os.close(fd)
+        try:
+            sci_hdu = pyfits.ImageHDU(data=self.exposure_data.data_averaged,
+                                      name='SCI')
+            pyfits.HDUList([pyfits.PrimaryHDU(), sci_hdu]).writeto(
+                                                    rampfile, overwrite=True)
+            del sci_hdu
+            (slope, intercept, slope_err) = \
+                fit_ramps_file(rampfile, grptime=grptime,
+                               max_memory=_SLOPE_MAX_MEMORY)
+        finally:
+            os.remove(rampfile)
+        del intercept
+        return (slope.astype(np.float32), slope_err.astype(np.float32))
+
     def write_data(self, filename, datashape='hypercube', overwrite=False):
         """
         
@@ -3300,9 +3757,10 @@ class SensorChipAssembly(object):
             * 'cube' - append the groups and integrations to make a
               3-dimensional FITS image with columns x rows x (groups and
               integrations) dimensions.
-            * 'slope' - combine the groups and integrations with a crude
-              straight line fit to make slope data, contained in a
-              2-dimensional FITS image with columns x rows dimensions.
+            * 'slope' - combine the groups with a straight line fit to
+              make slope data (in data units per second), contained in a
+              3-dimensional FITS image with columns x rows x integrations
+              dimensions.
 
         overwrite: bool, optional, default=False
             Parameter passed to pyfits.HDUlist.writeto
@@ -3346,12 +3804,14 @@ class SensorChipAssembly(object):
                 del cube_data, cube_model
             elif datashape == 'slope' or datashape == 'SLOPE':
                 # The exposure data must be straight-line fitted to make slope data.
-                slope_data = self.exposure_data.slope_data(diff_only=True)
+                (slope_data, slope_err) = self._fit_slopes(filename)
                 if self.include_pixeldq:
                     slope_model = MiriMeasuredModel(data=slope_data,
+                                            err=slope_err,
                                             dq=self.exposure_data.pixeldq)
                 else:
-                    slope_model = MiriMeasuredModel(data=slope_data)
+                    slope_model = MiriMeasuredModel(data=slope_data,
+                                                    err=slope_err)
 
                 # Copy the metadata.
                 # TODO: This does not copy the simulation metadata because it
@@ -3362,11 +3822,17 @@ class SensorChipAssembly(object):
                  # Write the cube data to the given output file.
                 slope_model.save(filename, overwrite=overwrite)
                 # Tidy up the temporary cube model.
-                del slope_data, slope_model
+                del slope_data, slope_err, slope_model
             else:
                 # Leave the data in hypercube format.         
                 # Write the exposure data to the given output file.
                 self.exposure_data.save(filename, overwrite=overwrite)
+        elif datashape == 'slope' or datashape == 'SLOPE':
+            (slope_data, slope_err) = self._fit_slopes(filename)
+            self.exposure_data.save(filename, fileformat=self.fileformat,
+                                    datashape='slope', overwrite=overwrite,
+                                    slopes=slope_data)
+            del slope_data, slope_err
         else:
             self.exposure_data.save(filename, fileformat=self.fileformat,
                                     datashape=datashape, overwrite=overwrite)
@@ -3440,7 +3906,8 @@ class SensorChipAssembly(object):
             cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
             readnoise_version='', bad_pixels_version='',
             flat_field_version='', linearity_version='', gain_version='',
-            makeplot=False, seedvalue=None, verbose=2):
+            makeplot=False, seedvalue=None, profile=False,
+            nbands=1, nworkers=None, pool='thread', verbose=2):
         """
     
         Runs the MIRI SCA simulator on the given input file, generating the
@@ -3571,9 +4038,10 @@ class SensorChipAssembly(object):
             * 'cube' - append the groups and integrations to make a 3
               dimensional FITS image with columns x rows x (groups and
               integrations) dimensions.
-            * 'slope' - combine the groups and integrations with a crude
-              straight line fit to make slope data, contained in a
-              2-dimensional FITS image with columns x rows dimensions.
+            * 'slope' - combine the groups with a straight line fit to
+              make slope data (in data units per second), contained in a
+              3-dimensional FITS image with columns x rows x integrations
+              dimensions.
           
         include_pixeldq: boolean, optional, default=True
             A flag that may be used to switch on the inclusion of the
@@ -3656,6 +4124,22 @@ class SensorChipAssembly(object):
             generating the test data.
             If not specified, a value of None will be sent, which
             randomises the seed.
+        profile: boolean, optional, default=False
+            Set to True to measure the time and memory used by each
+            stage of the simulation. The report is kept in the
+            profile_report attribute and written to a JSON file
+            alongside each output file, named after the output file
+            with a "_profile.json" suffix. Each file reports the
+            simulation up to the moment it was written.
+        nbands: int, optional, default=1
+            If greater than 1, the detector is divided into this number
+            of bands of rows which are simulated in parallel.
+            See the exposure method.
+        nworkers: int, optional, default=None
+            The maximum number of bands simulated at the same time.
+        pool: str, optional, default='thread'
+            The kind of pool used to simulate the bands in parallel:
+            'thread' or 'process'.
         verbose: int, optional, default=2
             Verbosity level. Activates print statements when non-zero.
         
@@ -3711,6 +4195,9 @@ class SensorChipAssembly(object):
         # Set the seed for the np.random function.
         np.random.seed(seedvalue)
 
+        # Measure each stage of the simulation if requested.
+        self._start_profile(profile)
+
         # Extract the properties of the particular sensor chip assembly
         # being simulated.
         try:
@@ -3776,7 +4263,8 @@ class SensorChipAssembly(object):
     
             # Read the fringe map if a name has been provided.
             if fringemap is not None and fringemap:
-                self.read_fringe_map(fringemap, ftype='FITS')
+                with self.profiler.stage('illumination'):
+                    self.read_fringe_map(fringemap, ftype='FITS')
 
             # Wait for the given elapsed time.
             if wait_time is not None and wait_time > 0.0:
@@ -3784,7 +4272,9 @@ class SensorChipAssembly(object):
 
             # Simulate an exposure and return the last integration data.
             simulated_data = self.exposure(frame_time=frame_time,
-                                           start_time=start_time)
+                                           start_time=start_time,
+                                           nbands=nbands, nworkers=nworkers,
+                                           pool=pool)
     
             # Report the exposure times.
             if verbose > 1:
@@ -3826,7 +4316,11 @@ class SensorChipAssembly(object):
                     else:
                         self.logger.info(
                             "Writing OLD FORMAT level 1 FITS file: " + outfile )
-                self.write_data(outfile, datashape=datashape, overwrite=overwrite)
+                with self.profiler.stage('write'):
+                    self.write_data(outfile, datashape=datashape,
+                                    overwrite=overwrite)
+                self._record_profile(outfile)
+        self._finish_profile()
 
     def simulate_pipe(self, illumination_map, scale=1.0,
                       fringemap=None, readout_mode=None, subarray=None,
@@ -3844,7 +4338,9 @@ class SensorChipAssembly(object):
                       readnoise_version='', bad_pixels_version='',
                       flat_field_version='', linearity_version='',
                       gain_version='',
-                      makeplot=False, seedvalue=None, verbose=2):
+                      makeplot=False, seedvalue=None, profile=False,
+                      nbands=1, nworkers=None, pool='thread',
+                      verbose=2):
         """
     
         Runs the MIRI SCA simulator on the given MiriIluminationModel
@@ -4069,6 +4565,19 @@ class SensorChipAssembly(object):
             generating the test data.
             If not specified, a value of None will be sent, which
             randomises the seed.
+        profile: boolean, optional, default=False
+            Set to True to measure the time and memory used by each
+            stage of the simulation. The report is kept in the
+            profile_report attribute.
+        nbands: int, optional, default=1
+            If greater than 1, the detector is divided into this number
+            of bands of rows which are simulated in parallel.
+            See the exposure method.
+        nworkers: int, optional, default=None
+            The maximum number of bands simulated at the same time.
+        pool: str, optional, default='thread'
+            The kind of pool used to simulate the bands in parallel:
+            'thread' or 'process'.
         verbose: int, optional, default=2
             Verbosity level. Activates print statements when non-zero.
         
@@ -4128,6 +4637,9 @@ class SensorChipAssembly(object):
         # Set the seed for the np.random function.
         np.random.seed(seedvalue)
 
+        # Measure each stage of the simulation if requested.
+        self._start_profile(profile)
+
         # Extract the properties of the particular sensor chip assembly
         # being simulated.
         detectorid = illumination_map.meta.instrument.detector
@@ -4186,7 +4698,8 @@ class SensorChipAssembly(object):
         self.set_illumination(illumination_map, scale=scale)    
         # Read the fringe map if a name has been provided.
         if fringemap is not None and fringemap:
-            self.read_fringe_map(fringemap, ftype='FITS')
+            with self.profiler.stage('illumination'):
+                self.read_fringe_map(fringemap, ftype='FITS')
 
         # Wait for the given elapsed time.
         if wait_time is not None and wait_time > 0.0:
@@ -4194,7 +4707,9 @@ class SensorChipAssembly(object):
     
         # Simulate an exposure and return the last integration data.
         simulated_data = self.exposure(frame_time=frame_time,
-                                       start_time=start_time)
+                                       start_time=start_time,
+                                       nbands=nbands, nworkers=nworkers,
+                                       pool=pool)
 
         # Report the exposure times.
         if verbose > 1:
@@ -4217,8 +4732,52 @@ class SensorChipAssembly(object):
                                simulated_data.shape[1]/2)
 
         # Return the exposure data model.
+        self._finish_profile()
         exposure_data = self.exposure_data
         return exposure_data
+
+    def _start_profile(self, profile):
+        """
+        
+        Helper function which starts a new profile of a simulation,
+        if requested, or turns the profiler off.
+        
+        """
+        self.profile_report = None
+        self.profiler.reset()
+        if profile:
+            self.profiler.enable()
+        else:
+            self.profiler.disable()
+
+    def _record_profile(self, outputfile=None):
+        """
+        
+        Helper function which updates the profile_report (when the
+        profiler is enabled) and writes it to a JSON file alongside
+        the given output file.
+        
+        """
+        if self.profiler.enabled:
+            self.profile_report = self.profiler.report()
+            if outputfile:
+                filename = profile_filename(outputfile)
+                self.profiler.write(filename, report=self.profile_report)
+                if self._verbose > 1:
+                    self.logger.info( "Profile written to %s" % filename )
+
+    def _finish_profile(self):
+        """
+        
+        Helper function which makes the final profile_report of a
+        simulation, logs a summary and turns the profiler off.
+        
+        """
+        if self.profiler.enabled:
+            self._record_profile()
+            if self._verbose > 1:
+                self.logger.info( str(self.profiler) )
+            self.profiler.disable()
    
     def temperature_str(self, prefix=''):
         """
@@ -4435,7 +4994,9 @@ def simulate_sca(inputfile, outputfile, detectorid, scale=1.0, fringemap=None,
                  cdp_ftp_host=None, cdp_ftp_path=SIM_CDP_FTP_PATH,
                  readnoise_version='', bad_pixels_version='',
                  flat_field_version='', linearity_version='', gain_version='',
-                 makeplot=False, seedvalue=None, verbose=2, logger=LOGGER):
+                 makeplot=False, seedvalue=None, profile=False,
+                 nbands=1, nworkers=None, pool='thread', verbose=2,
+                 logger=LOGGER):
     """
     
     Runs the MIRI SCA simulator on the given input file, generating the
@@ -4646,6 +5207,19 @@ def simulate_sca(inputfile, outputfile, detectorid, scale=1.0, fringemap=None,
         generating the test data.
         If not specified, a value of None will be sent, which
         randomises the seed.
+    profile: boolean, optional, default=False
+        Set to True to write a JSON report of the time and memory used
+        by each stage of the simulation alongside each output file.
+        See SensorChipAssembly.simulate_files.
+    nbands: int, optional, default=1
+        If greater than 1, the detector is divided into this number
+        of bands of rows which are simulated in parallel.
+        See the exposure method.
+    nworkers: int, optional, default=None
+        The maximum number of bands simulated at the same time.
+    pool: str, optional, default='thread'
+        The kind of pool used to simulate the bands in parallel:
+        'thread' or 'process'.
     verbose: int, optional, default=2
         Verbosity level. Activates print statements when non-zero.
         
@@ -4717,7 +5291,8 @@ def simulate_sca(inputfile, outputfile, detectorid, scale=1.0, fringemap=None,
         flat_field_version=flat_field_version, 
         linearity_version=linearity_version, 
         gain_version=gain_version,
-        makeplot=makeplot, seedvalue=seedvalue, verbose=verbose)
+        makeplot=makeplot, seedvalue=seedvalue, profile=profile,
+        nbands=nbands, nworkers=nworkers, pool=pool, verbose=verbose)
 
 def simulate_sca_list(inputfile, outputfile, detectorid, scale=1.0,
                       fringemap=None,
@@ -4737,7 +5312,9 @@ def simulate_sca_list(inputfile, outputfile, detectorid, scale=1.0,
                       readnoise_version='', bad_pixels_version='',
                       flat_field_version='', linearity_version='',
                       gain_version='',
-                      makeplot=False, seedvalue=None, verbose=2, logger=LOGGER):
+                      makeplot=False, seedvalue=None, profile=False,
+                      nbands=1, nworkers=None, pool='thread',
+                      verbose=2, logger=LOGGER):
     """
     
     Runs the MIRI SCA simulator on the given list of input files,
@@ -4950,6 +5527,19 @@ def simulate_sca_list(inputfile, outputfile, detectorid, scale=1.0,
         generating the test data.
         If not specified, a value of None will be sent, which
         randomises the seed.
+    profile: boolean, optional, default=False
+        Set to True to write a JSON report of the time and memory used
+        by each stage of the simulation alongside each output file.
+        See SensorChipAssembly.simulate_files.
+    nbands: int, optional, default=1
+        If greater than 1, the detector is divided into this number
+        of bands of rows which are simulated in parallel.
+        See the exposure method.
+    nworkers: int, optional, default=None
+        The maximum number of bands simulated at the same time.
+    pool: str, optional, default='thread'
+        The kind of pool used to simulate the bands in parallel:
+        'thread' or 'process'.
     verbose: int, optional, default=2
         Verbosity level. Activates print statements when non-zero.
         
@@ -5021,7 +5611,8 @@ def simulate_sca_list(inputfile, outputfile, detectorid, scale=1.0,
         flat_field_version=flat_field_version, 
         linearity_version=linearity_version, 
         gain_version=gain_version,
-        makeplot=makeplot, seedvalue=seedvalue, verbose=verbose)
+        makeplot=makeplot, seedvalue=seedvalue, profile=profile,
+        nbands=nbands, nworkers=nworkers, pool=pool, verbose=verbose)
    
 def simulate_sca_pipeline(illumination_map, scale=1.0,
                           fringemap=None, readout_mode=None, subarray=None,
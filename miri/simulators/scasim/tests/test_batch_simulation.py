@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""
+
+Module test_batch_simulation - Contains the unit tests for the
+batch_simulation module.
+
+:History:
+
+18 Oct 2026: Created
+
+@author: MIRI Software Team
+
+"""
+
+import os
+import json
+import unittest
+import warnings
+
+from miri.simulators.scasim.batch_simulation import read_manifest, \
+    make_jobs, make_chains, run_batch, _setup_parameters
+
+
+class TestBatchSimulation(unittest.TestCase):
+    def setUp(self):
+        self.manifest = {
+            'defaults': {'readout_mode': 'FAST', 'ngroups': 4},
+            'jobs': [
+                {'inputfile': 'ima1.fits', 'outputfile': 'ima1_out.fits',
+                 'detector': 'MIRIMAGE'},
+                {'inputfile': 'lw1.fits', 'outputfile': 'lw1_out.fits',
+                 'detector': 'MIRIFULONG', 'ngroups': 8},
+                {'inputfile': 'ima2.fits', 'outputfile': 'ima2_out.fits',
+                 'detector': 'MIRIMAGE'},
+                {'inputfile': 'sw1.fits', 'outputfile': 'sw1_out.fits',
+                 'detector': 'MIRIFUSHORT', 'chain': 'MRS'},
+                {'inputfile': 'lw2.fits', 'outputfile': 'lw2_out.fits',
+                 'detector': 'MIRIFULONG', 'chain': 'MRS'}]
+            }
+        self.manifest_file = "MiriBatchManifest_test.json"
+        self.report_file = "MiriBatchReport_test.json"
+
+    def tearDown(self):
+        for filename in (self.manifest_file, self.report_file):
+            if os.path.isfile(filename):
+                try:
+                    os.remove(filename)
+                except Exception as e:
+                    strg = "Could not remove temporary file, " + filename + \
+                        "\n   " + str(e)
+                    warnings.warn(strg)
+
+    def test_manifest(self):
+        # Defaults are applied to every job and may be overridden.
+        with open(self.manifest_file, 'w') as fp:
+            json.dump(self.manifest, fp)
+        jobs = read_manifest(self.manifest_file)
+        self.assertEqual(len(jobs), 5)
+        self.assertEqual(jobs[0]['readout_mode'], 'FAST')
+        self.assertEqual(jobs[0]['ngroups'], 4)
+        self.assertEqual(jobs[1]['ngroups'], 8)
+        self.assertEqual([job['job'] for job in jobs], list(range(5)))
+        # A plain list of jobs is also accepted.
+        jobs = make_jobs(self.manifest['jobs'])
+        self.assertEqual(len(jobs), 5)
+        self.assertFalse('readout_mode' in jobs[0])
+
+    def test_bad_manifest(self):
+        self.assertRaises(TypeError, make_jobs, {'defaults': {}})
+        self.assertRaises(TypeError, make_jobs, ['ima1.fits'])
+        self.assertRaises(KeyError, make_jobs,
+                          [{'inputfile': 'ima1.fits', 'detector': 'MIRIMAGE'}])
+        self.assertRaises(KeyError, make_jobs,
+                          [{'inputfile': 'ima1.fits',
+                            'outputfile': 'ima1_out.fits',
+                            'detector': 'MIRIMAGE', 'nosuchparameter': 1}])
+
+    def test_chains(self):
+        # Jobs are chained by detector unless a chain is given, and
+        # keep their manifest order within each chain.
+        chains = make_chains(make_jobs(self.manifest))
+        self.assertEqual(len(chains), 3)
+        self.assertEqual([job['job'] for job in chains[0]], [0, 2])
+        self.assertEqual([job['job'] for job in chains[1]], [1])
+        self.assertEqual([job['job'] for job in chains[2]], [3, 4])
+
+    def test_setup_parameters(self):
+        # CDPs are preloaded with the readout mode and subarray each job
+        # will use, defaulted in the same way as simulate_files.
+        jobs = make_jobs(self.manifest)
+        kwargs = _setup_parameters(jobs[0], cdp_ftp_host='LOCAL')
+        self.assertEqual(kwargs['readout_mode'], 'FAST')
+        self.assertEqual(kwargs['subarray'], 'FULL')
+        self.assertEqual(kwargs['ngroups'], 4)
+        self.assertEqual(kwargs['cdp_ftp_host'], 'LOCAL')
+        self.assertNotIn('inputfile', kwargs)
+        self.assertNotIn('overwrite', kwargs)
+
+    def test_report(self):
+        # A job which fails is reported without stopping the batch.
+        jobs = [{'inputfile': 'nosuchfile1.fits', 'outputfile': 'out1.fits',
+                 'detector': 'MIRIMAGE'},
+                {'inputfile': 'nosuchfile2.fits', 'outputfile': 'out2.fits',
+                 'detector': 'MIRIMAGE'}]
+        report = run_batch(jobs, nworkers=1, preload=False,
+                           report_file=self.report_file)
+        self.assertEqual(len(report), 2)
+        for jobnum, entry in enumerate(report):
+            self.assertEqual(entry['job'], jobnum)
+            self.assertEqual(entry['status'], 'FAILED')
+            self.assertTrue(entry['error'])
+            self.assertTrue(entry['elapsed'] >= 0.0)
+        with open(self.report_file, 'r') as fp:
+            saved = json.load(fp)
+        self.assertEqual(len(saved), 2)
+        self.assertFalse(os.path.isfile('out1.fits'))
+
+
+# If being run as a main program, run the tests.
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+
+Module test_cdp_store - Contains the unit tests for the CDPStore class.
+
+:History:
+
+18 Oct 2026: Created
+
+@author: MIRI Software Team
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from miri.simulators.scasim.cdp_store import CDPStore, get_cdp_store, \
+    CDP_STORE_ENV_NAME
+
+
+class TestCDPStore(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp(prefix='MiriCDPStore_test_')
+        self.store = CDPStore(os.path.join(self.store_dir, 'store'))
+        self.cdp_file = os.path.join(self.store_dir, 'MIRI_FM_MIRIMAGE_GAIN.fits')
+        with open(self.cdp_file, 'w') as fp:
+            fp.write("Not really a CDP")
+        self.gain_map = np.arange(24, dtype=np.float64).reshape(4,6)
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def test_keys(self):
+        # Keys depend on the kind, the CDP file and every criterion.
+        key = self.store.make_key('GAIN', self.cdp_file, detector='MIRIMAGE',
+                                  readpatt='FAST', cdp_version='')
+        self.assertTrue(key.startswith('GAIN_'))
+        self.assertEqual(key, self.store.make_key('GAIN', self.cdp_file,
+                                                  cdp_version='',
+                                                  readpatt='FAST',
+                                                  detector='MIRIMAGE'))
+        others = [self.store.make_key('DARK', self.cdp_file,
+                                      detector='MIRIMAGE', readpatt='FAST',
+                                      cdp_version=''),
+                  self.store.make_key('GAIN', self.cdp_file,
+                                      detector='MIRIMAGE', readpatt='SLOW',
+                                      cdp_version=''),
+                  self.store.make_key('GAIN', self.cdp_file,
+                                      detector='MIRIMAGE', readpatt='FAST',
+                                      cdp_version='7.1.0'),
+                  self.store.make_key('GAIN', 'another_file.fits',
+                                      detector='MIRIMAGE', readpatt='FAST',
+                                      cdp_version='')]
+        for other in others:
+            self.assertNotEqual(key, other)
+        # A key changes when the CDP file is updated.
+        with open(self.cdp_file, 'a') as fp:
+            fp.write(" any more")
+        self.assertNotEqual(key, self.store.make_key('GAIN', self.cdp_file,
+                                                     detector='MIRIMAGE',
+                                                     readpatt='FAST',
+                                                     cdp_version=''))
+
+    def test_save_load(self):
+        key = self.store.make_key('GAIN', self.cdp_file, detector='MIRIMAGE')
+        self.assertFalse(key in self.store)
+        self.assertIsNone(self.store.load(key))
+        attributes = {'filename': self.cdp_file, 'mean_gain': 5.5}
+        self.assertTrue(self.store.save(key, {'gain_map': self.gain_map},
+                                        attributes))
+        self.assertTrue(key in self.store)
+        (arrays, saved_attributes) = self.store.load(key)
+        self.assertEqual(saved_attributes, attributes)
+        self.assertTrue(np.array_equal(arrays['gain_map'], self.gain_map))
+        # Memory-mapped arrays are read-only.
+        self.assertIsInstance(arrays['gain_map'], np.memmap)
+        self.assertFalse(arrays['gain_map'].flags.writeable)
+        (arrays, saved_attributes) = self.store.load(key, mmap=False)
+        self.assertNotIsInstance(arrays['gain_map'], np.memmap)
+        # Saving an existing entry leaves it unchanged.
+        self.assertTrue(self.store.save(key, {'gain_map': 2 * self.gain_map},
+                                        attributes))
+        (arrays, saved_attributes) = self.store.load(key)
+        self.assertTrue(np.array_equal(arrays['gain_map'], self.gain_map))
+        del arrays
+        # No temporary directories are left behind.
+        names = os.listdir(self.store.store_dir)
+        self.assertEqual(names, [key])
+        descr = str(self.store)
+        self.assertIsNotNone(descr)
+        self.store.clear()
+        self.assertFalse(key in self.store)
+
+    def test_get_store(self):
+        old_value = os.environ.pop(CDP_STORE_ENV_NAME, None)
+        try:
+            self.assertIsNone(get_cdp_store())
+            os.environ[CDP_STORE_ENV_NAME] = self.store_dir
+            store = get_cdp_store()
+            self.assertEqual(store.store_dir, self.store_dir)
+        finally:
+            if old_value is None:
+                os.environ.pop(CDP_STORE_ENV_NAME, None)
+            else:
+                os.environ[CDP_STORE_ENV_NAME] = old_value
+        store = get_cdp_store(self.store_dir)
+        self.assertEqual(store.store_dir, self.store_dir)
+        self.assertRaises(ValueError, CDPStore, '')
+
+
+# If being run as a main program, run the tests.
+if __name__ == '__main__':
+    unittest.main()
@@ -17,6 +17,8 @@ CosmicRayEnvironment and CosmicRay classes.
              statements updated.
 08 Sep 2015: Make compatible with Python 3
 05 May 2017: Changed permission for nosetests.
+18 Oct 2026: Test generating events as arrays.
+18 Oct 2026: Test the cosmic ray library cache.
 
 @author: Steven Beard (UKATC)
 
@@ -29,10 +31,15 @@ import logging
 logging.basicConfig(level=logging.FATAL) # Turn off most log messages 
 LOGGER = logging.getLogger("miri.simulators") # Get a default parent logger
 
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
+import astropy.io.fits as pyfits
 
-from miri.simulators.scasim.cosmic_ray import CosmicRayEnvironment, CosmicRay
+from miri.simulators.scasim.cosmic_ray import CosmicRayEnvironment, \
+    CosmicRay, load_cosmic_ray_library, cosmic_ray_cache_files
 
 _NUMBER_OF_MEASUREMENTS = 10
 
@@ -210,6 +217,38 @@ class TestCosmicRayEnvironment(unittest.TestCase):
             self.assertTrue(np.all(ecount > 0))
         del cosmic_ray_list
         
+    def test_generate_event_arrays(self):
+        # Events generated as arrays must lie inside the detector and
+        # select only energies with a non-zero probability.
+        energies = [100.0, 200.0, 300.0, 400.0]
+        distribution = [0.0, 0.5, 0.0, 0.5]
+        cr_env = CosmicRayEnvironment(self.cr_flux, 'RANDOM',
+                                      energies=energies,
+                                      distribution=distribution,
+                                      images=None, nucleons=None,
+                                      verbose=0, logger=LOGGER)
+        cr_env.set_seed(42)
+        (rows, columns, lkup) = cr_env.generate_event_arrays(20, 30,
+                                                             10.0, 1.0)
+        self.assertTrue(len(lkup) > 100)
+        self.assertEqual(len(rows), len(lkup))
+        self.assertTrue(rows.min() >= 0 and rows.max() < 20)
+        self.assertTrue(columns.min() >= 0 and columns.max() < 30)
+        self.assertEqual(set(lkup), set([1, 3]))
+        # The precomputed hit maps scale with the energy.
+        self.assertEqual(cr_env.hit_maps.shape[0], len(energies))
+        self.assertTrue(cr_env.hit_maps[3].sum() > cr_env.hit_maps[1].sum())
+        
+        # Library events each have their own hit map.
+        (rows, columns, lkup) = self.cr_env_lib.generate_event_arrays(10, 10,
+                                                              10.0, 1.0)
+        self.assertTrue(lkup.min() >= 0)
+        self.assertTrue(lkup.max() < len(self.energies_lib))
+        cosmic_ray = self.cr_env_lib.generate_event(10, 10)
+        self.assertEqual(cosmic_ray.get_hit_map().shape,
+                         self.cr_env_lib.hit_maps.shape[1:])
+        del cr_env, cosmic_ray
+        
     def test_generate_events_quantity(self):
         # Generate a random set of cosmic ray events for detectors only.
         # There should be more events when the pixel size is increased
@@ -228,6 +267,65 @@ class TestCosmicRayEnvironment(unittest.TestCase):
         del cosmic_ray_list1, cosmic_ray_list2, cosmic_ray_list3
         
 
+class TestCosmicRayCache(unittest.TestCase):
+    
+    def setUp(self):
+        # Write a small cosmic ray library file in STScI format, with
+        # 6 events described by 8x8 images.
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, 'cache')
+        self.library = os.path.join(self.tempdir, 'CRs_test_00.fits')
+        rng = np.random.RandomState(42)
+        images = rng.uniform(0.0, 1000.0, size=(6,8,8)).astype(np.float32)
+        nucleons = np.array([0, 1, 2, 3, 4, 5], dtype=np.int16)
+        energies = np.linspace(10.0, 60.0, 6).astype(np.float32)
+        hdulist = pyfits.HDUList([pyfits.PrimaryHDU(),
+                                  pyfits.ImageHDU(images),
+                                  pyfits.ImageHDU(nucleons, name='Ion'),
+                                  pyfits.ImageHDU(energies, name='Energy')])
+        hdulist.writeto(self.library)
+        
+    def tearDown(self):
+        # Tidy up
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+        
+    def test_cache(self):
+        # An environment loaded from the cache (both when the cache is
+        # created and when it is memory-mapped afterwards) must be the
+        # same as an environment loaded without a cache.
+        direct = load_cosmic_ray_library(self.library, verbose=0,
+                                         logger=LOGGER)
+        cache_files = cosmic_ray_cache_files([self.library],
+                                             cache_dir=self.cache_dir)
+        self.assertFalse(os.path.isfile(cache_files[0]))
+        first = load_cosmic_ray_library(self.library,
+                                        cache_dir=self.cache_dir,
+                                        verbose=0, logger=LOGGER)
+        self.assertTrue(os.path.isfile(cache_files[0]))
+        self.assertTrue(os.path.isfile(cache_files[1]))
+        cached = load_cosmic_ray_library(self.library,
+                                         cache_dir=self.cache_dir,
+                                         verbose=0, logger=LOGGER)
+        self.assertIsNone(cached.images)
+        for cr_env in (first, cached):
+            self.assertTrue(np.array_equal(cr_env.hit_maps, direct.hit_maps))
+            self.assertTrue(np.array_equal(cr_env.energies, direct.energies))
+            self.assertTrue(np.array_equal(cr_env.nucleons, direct.nucleons))
+            self.assertAlmostEqual(cr_env.cr_flux, direct.cr_flux)
+        self.assertIsNotNone(cached.__str__())
+        self.assertIsNotNone(cached.stats())
+        cosmic_ray = cached.generate_event(10, 10)
+        self.assertEqual(cosmic_ray.get_hit_map().shape,
+                         direct.hit_maps.shape[1:])
+        
+        # Hit maps with different processing are cached separately.
+        noipc_files = cosmic_ray_cache_files([self.library],
+                                             convolve_ipc=False,
+                                             cache_dir=self.cache_dir)
+        self.assertNotEqual(noipc_files[0], cache_files[0])
+        del direct, first, cached, cosmic_ray
+
+
 # If being run as a main program, run the tests.
 if __name__ == '__main__':
     unittest.main()
@@ -35,6 +35,13 @@ should be executed first.
              Import more detector parameters from detector_properties.
 01 Apr 2020: Improve the memory usage by not opening full-sized CDP files
              when running tests on a tiny detector.
+18 Oct 2026: Test simulating integrations in parallel bands of rows.
+18 Oct 2026: Test the cached electron flux.
+18 Oct 2026: Test simulating the groups of an integration in batches.
+18 Oct 2026: Test the float32 simulation precision.
+18 Oct 2026: Test simulating bands into an output array and a subarray.
+18 Oct 2026: Test that only the linearity tables needed by the selected
+             NONLINEARITY_TABLE_MODE are derived.
 
 @author: Steven Beard (UKATC)
 
@@ -316,6 +323,47 @@ class TestDetectorArray(unittest.TestCase):
         readout3 = self.detector.readout()
         self.assertTrue(np.all(readout3 >= 0.0))
         
+    def test_electron_flux(self):
+        # Define some calibration data by hand.
+        flux = 2.0 * np.ones([_PIXELS_PER_SIDE,_PIXELS_PER_SIDE])
+        detector = self.detector
+        shape = detector.detector_shape
+        detector.bad_pixels = np.zeros(shape, dtype=np.uint32)
+        detector.bad_pixels[0,_REF_PIXELS_LEFT] = 2
+        detector.flat_map = 0.5 * np.ones(shape)
+        detector.dark_map = np.ones((2,) + shape)
+        detector.dark_map[1] = 3.0
+        detector.dark_averaged = True
+        detector.dark_current = 0.1
+
+        # The dark affects every pixel, but the photon flux only reaches
+        # the illuminated pixels which are not dead.
+        first = detector.electron_flux(flux, intnum=0)
+        self.assertEqual(first.shape, shape)
+        self.assertAlmostEqual(first[0,0], 0.1)
+        self.assertAlmostEqual(first[0,_REF_PIXELS_LEFT], 0.1)
+        self.assertAlmostEqual(first[1,_REF_PIXELS_LEFT], 1.1)
+        later = detector.electron_flux(flux, intnum=2)
+        self.assertAlmostEqual(later[1,_REF_PIXELS_LEFT], 1.3)
+
+        # The flux maps are reused until something changes.
+        self.assertIs(detector.electron_flux(flux, intnum=0), first)
+        self.assertIs(detector.electron_flux(flux, intnum=1), later)
+        detector.dark_current = 0.2
+        first = detector.electron_flux(flux, intnum=0)
+        self.assertAlmostEqual(first[1,_REF_PIXELS_LEFT], 1.2)
+        detector.flat_map = np.ones(shape)
+        first = detector.electron_flux(flux, intnum=0)
+        self.assertAlmostEqual(first[1,_REF_PIXELS_LEFT], 2.2)
+        flux[1,0] = 4.0
+        self.assertAlmostEqual(detector.electron_flux(flux)[1,_REF_PIXELS_LEFT],
+                               2.2)
+        detector.clear_flux_cache()
+        self.assertAlmostEqual(detector.electron_flux(flux)[1,_REF_PIXELS_LEFT],
+                               4.2)
+        self.assertAlmostEqual(
+            detector.electron_flux(flux.copy())[1,_REF_PIXELS_LEFT], 4.2)
+
     def test_wrong_shape(self):
         # Attempting to integrate on a flux array of the wrong shape
         # should raise an exception.
@@ -426,6 +474,272 @@ class TestDetectorArray(unittest.TestCase):
         self.assertTrue(readout2.max() > readout1.max())
 
 
+    def _make_detector(self, simulate_poisson_noise=True, **kwargs):
+        # Create a detector matching the one created by setUp.
+        detector = DetectorArray(_KNOWN_DETECTORS[0],
+                                 _PIXELS_PER_SIDE, _PIXELS_PER_SIDE,
+                                 _FIRST_DETECTOR['TARGET_TEMPERATURE'],
+                                 left_columns=_REF_PIXELS_LEFT,
+                                 right_columns=_REF_PIXELS_RIGHT,
+                                 bottom_rows=_REF_PIXELS_BOTTOM,
+                                 top_rows=_REF_PIXELS_TOP,
+                                 well_depth=_FIRST_DETECTOR['WELL_DEPTH'],
+                                 simulate_poisson_noise=simulate_poisson_noise,
+                                 simulate_read_noise=False,
+                                 simulate_bad_pixels=False,
+                                 simulate_dark_current=False,
+                                 simulate_flat_field=False,
+                                 simulate_gain=False,
+                                 simulate_nonlinearity=False,
+                                 verbose=0, logger=LOGGER, **kwargs)
+        detector.set_seed(42)
+        return detector
+
+    def test_simulate_integrations(self):
+        # Define an exposure of 2 integrations of 3 groups, with
+        # cosmic rays hitting the detector during the second group
+        # (including one straddling two bands of rows).
+        nints = 2
+        ngroups = 3
+        flux = 10.0 * np.ones([_PIXELS_PER_SIDE,_PIXELS_PER_SIDE])
+        hit_map = 1000.0 * np.array([[0.0, 0.15, 0.0],
+                                     [0.15, 1.0, 0.15],
+                                     [0.0, 0.15, 0.0]])
+        cosmic_ray_list = [CosmicRay(1000.0, (4,4), hit_map, verbose=0),
+                           CosmicRay(1000.0, (10,8), hit_map, verbose=0)]
+        def make_schedule():
+            return [(1, [(2.0, []), (2.0, cosmic_ray_list), (2.0, [])])] * \
+                nints
+
+        # Without Poisson noise, simulating the bands in parallel gives
+        # exactly the same result as simulating each group in turn.
+        detector = self._make_detector(simulate_poisson_noise=False)
+        serial = []
+        for intnum in range(0, nints):
+            detector.reset(new_exposure=(intnum == 0))
+            for (time, cosmic_rays) in make_schedule()[intnum][1]:
+                detector.hit_by_cosmic_rays(cosmic_rays)
+                detector.integrate(flux, time, intnum=intnum)
+                serial.append(detector.readout())
+        serial = np.array(serial).reshape((nints, ngroups) + \
+                                          detector.detector_shape)
+        serial_counts = detector.pixels.get_counts()
+        del detector
+        detector = self._make_detector(simulate_poisson_noise=False)
+        parallel = detector.simulate_integrations(flux, make_schedule(), 3)
+        self.assertEqual(parallel.shape, serial.shape)
+        self.assertTrue(np.all(parallel == serial))
+        self.assertTrue(np.allclose(detector.pixels.get_counts(),
+                                    serial_counts))
+        self.assertEqual(detector.cosmic_ray_count, 2)
+        del detector
+
+        # With Poisson noise, the result is reproducible for a given seed,
+        # whichever kind of pool is used.
+        results = []
+        for pool in ('thread', 'thread', 'process'):
+            detector = self._make_detector()
+            results.append( detector.simulate_integrations(flux,
+                                                           make_schedule(),
+                                                           3, nworkers=2,
+                                                           pool=pool) )
+            del detector
+        self.assertTrue(np.all(results[0] == results[1]))
+        self.assertTrue(np.all(results[0] == results[2]))
+        self.assertTrue(np.all(np.diff(results[0].astype(np.int64),
+                                       axis=1)[:,:,:_PIXELS_PER_SIDE] >= 0))
+        
+        # The readouts can be written straight into an existing array,
+        # which must have the right shape.
+        detector = self._make_detector()
+        out = np.zeros((nints, ngroups) + detector.detector_shape,
+                       dtype=np.float32)
+        result = detector.simulate_integrations(flux, make_schedule(), 3,
+                                                nworkers=2, out=out)
+        self.assertIs(result, out)
+        self.assertTrue(np.all(out == results[0]))
+        self.assertRaises(ValueError, detector.simulate_integrations,
+                          flux, make_schedule(), 3, out=out[:1])
+        del detector
+
+        # A subarray is extracted from each readout in the same way as
+        # by readout.
+        subarray = (3, 5, 6, 8)
+        detector = self._make_detector(simulate_poisson_noise=False)
+        expected = [detector._extract_subarray(plane, subarray) for plane \
+                    in serial.reshape((-1,) + detector.detector_shape)]
+        expected = np.array(expected).reshape((nints, ngroups) + \
+                                              expected[0].shape)
+        for pool in ('thread', 'process'):
+            detector = self._make_detector(simulate_poisson_noise=False)
+            result = detector.simulate_integrations(flux, make_schedule(), 4,
+                                                    pool=pool,
+                                                    subarray=subarray)
+            self.assertEqual(result.shape, expected.shape)
+            self.assertTrue(np.all(result == expected))
+            del detector
+
+        # An unknown kind of pool is rejected.
+        self.assertRaises(ValueError, self.detector.simulate_integrations,
+                          flux, make_schedule(), 3, pool='cluster')
+
+    def test_simulate_ramp(self):
+        # Define an exposure of 2 integrations of 4 groups, with cosmic
+        # rays hitting the detector during the second group.
+        nints = 2
+        ngroups = 4
+        flux = 10.0 * np.ones([_PIXELS_PER_SIDE,_PIXELS_PER_SIDE])
+        hit_map = 1000.0 * np.array([[0.0, 0.15, 0.0],
+                                     [0.15, 1.0, 0.15],
+                                     [0.0, 0.15, 0.0]])
+        cosmic_ray_list = [CosmicRay(1000.0, (4,4), hit_map, verbose=0),
+                           CosmicRay(1000.0, (10,8), hit_map, verbose=0)]
+        groups = [(2.0, []), (2.0, cosmic_ray_list), (2.0, []), (2.0, [])]
+        # Only 2 groups fit in each batch.
+        max_memory = 2 * 8 * 6 * 20 * 24
+
+        def simulate_batches(detector):
+            batches = []
+            for intnum in range(0, nints):
+                for (first, read_data) in detector.simulate_ramp(
+                                            flux, groups, intnum=intnum,
+                                            max_memory=max_memory):
+                    self.assertEqual(first, len(batches) % ngroups)
+                    batches.extend(read_data)
+            return np.array(batches).reshape((nints, ngroups) + \
+                                             detector.detector_shape)
+
+        # Without Poisson noise, simulating the groups in batches gives
+        # exactly the same result as simulating each group in turn.
+        detector = self._make_detector(simulate_poisson_noise=False,
+                                       simulate_drifts=False,
+                                       simulate_latency=False)
+        serial = []
+        for intnum in range(0, nints):
+            detector.reset(new_exposure=(intnum == 0))
+            for (time, cosmic_rays) in groups:
+                detector.hit_by_cosmic_rays(cosmic_rays)
+                detector.integrate(flux, time, intnum=intnum)
+                serial.append(detector.readout())
+        serial = np.array(serial).reshape((nints, ngroups) + \
+                                          detector.detector_shape)
+        serial_counts = detector.pixels.get_counts()
+        del detector
+        detector = self._make_detector(simulate_poisson_noise=False,
+                                       simulate_drifts=False,
+                                       simulate_latency=False)
+        batched = simulate_batches(detector)
+        self.assertTrue(np.all(batched == serial))
+        self.assertTrue(np.allclose(detector.pixels.get_counts(),
+                                    serial_counts))
+        self.assertEqual(detector.cosmic_ray_count, 2)
+        self.assertEqual(detector.pixels.readings, ngroups)
+        del detector
+
+        # With Poisson noise, the result is reproducible for a given seed
+        # and the ramps never decrease.
+        results = []
+        for attempt in range(0, 2):
+            detector = self._make_detector(simulate_drifts=False,
+                                           simulate_latency=False)
+            results.append( simulate_batches(detector) )
+            del detector
+        self.assertTrue(np.all(results[0] == results[1]))
+        self.assertTrue(np.all(np.diff(results[0].astype(np.int64),
+                                       axis=1) >= 0))
+
+        # A detector simulating latency cannot use batches.
+        self.assertRaises(ValueError, self.detector.simulate_ramp, flux,
+                          groups)
+
+    def test_precision(self):
+        # Without Poisson noise, a detector simulated in float32 gives
+        # readouts within 1 DN of the same detector simulated in float64.
+        flux = 10.0 * np.ones([_PIXELS_PER_SIDE,_PIXELS_PER_SIDE])
+        readouts = {}
+        for precision in ('float64', 'float32'):
+            detector = self._make_detector(simulate_poisson_noise=False,
+                                           precision=precision)
+            self.assertEqual(detector.dtype.name, precision)
+            self.assertEqual(detector.electron_flux(flux).dtype.name,
+                             precision)
+            readouts[precision] = []
+            for intnum in range(0, 2):
+                detector.reset(new_exposure=(intnum == 0))
+                for group in range(0, 3):
+                    detector.integrate(flux, 20.0, intnum=intnum)
+                    readouts[precision].append(detector.readout())
+            self.assertEqual(detector.pixels.expected_count.dtype.name,
+                             precision)
+            del detector
+        difference = np.array(readouts['float32'], dtype=np.int64) - \
+            np.array(readouts['float64'], dtype=np.int64)
+        self.assertTrue(np.all(np.abs(difference) <= 1))
+
+        # Groups simulated in batches are also within 1 DN.
+        groups = [(20.0, [])] * 4
+        ramps = []
+        for precision in ('float64', 'float32'):
+            detector = self._make_detector(simulate_poisson_noise=False,
+                                           simulate_drifts=False,
+                                           simulate_latency=False,
+                                           precision=precision)
+            ramps.append( np.concatenate([read_data for (first, read_data) in
+                                          detector.simulate_ramp(flux, groups)]) )
+            del detector
+        difference = ramps[1].astype(np.int64) - ramps[0].astype(np.int64)
+        self.assertTrue(np.all(np.abs(difference) <= 1))
+
+        # The precision must be recognised.
+        self.assertRaises(ValueError, self._make_detector,
+                          precision='float16')
+
+    def test_linearity_tables(self):
+        # Make a small linearity CDP and count the reverse tables derived
+        # from it when each NONLINEARITY_TABLE_MODE is selected. The
+        # AMPLIFIER mode derives its grid of tables in one operation.
+        import miri.simulators.scasim.detector as detector_module
+        from miri.datamodels.cdp import MiriLinearityModel
+        coeffs = np.zeros([4, _PIXELS_PER_SIDE, _PIXELS_PER_SIDE])
+        coeffs[1] = 1.0
+        coeffs[2] = -1.0e-6
+        linearity_model = MiriLinearityModel(coeffs=coeffs)
+        linearity_model.meta.filename = 'TEST_LINEARITY.fits'
+        calls = []
+        def get_reverse_table(model, row, column, **kwargs):
+            calls.append((row, column))
+            return np.arange(0, 100, dtype=np.float32)
+
+        saved = (detector_module.get_cdp, detector_module.get_cdp_store,
+                 detector_module.NONLINEARITY_TABLE_MODE,
+                 MiriLinearityModel.get_reverse_table)
+        try:
+            detector_module.get_cdp = lambda *args, **kwargs: linearity_model
+            detector_module.get_cdp_store = lambda *args, **kwargs: None
+            MiriLinearityModel.get_reverse_table = get_reverse_table
+            detector = self._make_detector()
+            for (mode, expected) in (('HALVES', 2), ('AMPLIFIER', 0)):
+                detector_module.NONLINEARITY_TABLE_MODE = mode
+                del calls[:]
+                detector.add_linearity_table(detector.detector_name)
+                self.assertEqual(len(calls), expected)
+            self.assertIsNotNone(detector.linearity_grid)
+
+            # In AMPLIFIER mode the tables for each half are only derived
+            # when they are asked for.
+            del calls[:]
+            (left, right) = detector.get_linearity_halves()
+            self.assertEqual(len(calls), 2)
+            self.assertIsNotNone(left)
+            self.assertIsNotNone(right)
+            detector.get_linearity_halves()
+            self.assertEqual(len(calls), 2)
+            del detector
+        finally:
+            (detector_module.get_cdp, detector_module.get_cdp_store,
+             detector_module.NONLINEARITY_TABLE_MODE,
+             MiriLinearityModel.get_reverse_table) = saved
+
 # If being run as a main program, run the tests.
 if __name__ == '__main__':
     unittest.main()
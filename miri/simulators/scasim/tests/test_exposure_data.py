@@ -13,6 +13,7 @@ should be executed first.
 03 Nov 2015: Added exposure time tests.
 09 Mar 2016: Make the message about exceeding the data size limit a
              warning rather than an exception.
+18 Oct 2026: Added averaging tests.
 
 @author: Steven Beard (UKATC)
 
@@ -86,6 +87,31 @@ class TestExposureData(unittest.TestCase):
         data = np.ones([self.nints, self.ngroups, self.rows, self.columns])
         self.exposure_data.set_exposure(data)
         del data
+
+    def test_averaging(self):
+        # Averaging as the groups are added must give the same result
+        # as averaging the complete exposure.
+        nints = 4
+        ngroups = 6
+        data = np.arange(nints*ngroups*self.rows*self.columns,
+                         dtype=np.float32)
+        data.shape = (nints, ngroups, self.rows, self.columns)
+        expected = data.reshape(2, 2, 3, 2, self.rows, self.columns)
+        expected = expected.mean(axis=(1,3))
+        for streaming in (False, True):
+            exposure_data = ExposureData(self.rows, self.columns, ngroups,
+                                         nints, 'FAST', grpavg=2, intavg=2,
+                                         streaming=streaming)
+            for intg in range(0,nints):
+                for group in range(0,ngroups):
+                    exposure_data.set_group(data[intg,group], group, intg)
+            self.assertTrue( np.allclose(exposure_data.data_averaged,
+                                         expected) )
+            # The averaged data change when the data change.
+            exposure_data.set_exposure(data + 1.0)
+            self.assertTrue( np.allclose(exposure_data.data_averaged,
+                                         expected + 1.0) )
+            del exposure_data
         
     def test_exposure_times(self):
         # Test the getting and setting of exposure times
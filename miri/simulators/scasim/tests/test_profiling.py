@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+
+Module test_profiling - Contains the unit tests for the StageProfiler
+class.
+
+:History:
+
+18 Oct 2026: Created
+
+@author: MIRI Software Team
+
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from miri.simulators.scasim.profiling import StageProfiler, \
+    profile_filename, peak_rss
+
+
+class TestStageProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp(prefix='MiriProfile_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def test_stages(self):
+        # A disabled profiler records nothing.
+        profiler = StageProfiler()
+        with profiler.stage('integrate'):
+            pass
+        self.assertEqual(profiler.stages, {})
+
+        # Stages with the same name are accumulated.
+        profiler.enable()
+        for count in range(0, 3):
+            with profiler.stage('integrate'):
+                data = np.ones((100,100))
+        with profiler.stage('readout'):
+            data = data * 2.0
+        del data
+        report = profiler.report()
+        self.assertEqual(list(report['stages'].keys()),
+                         ['integrate', 'readout'])
+        self.assertEqual(report['stages']['integrate']['calls'], 3)
+        self.assertEqual(report['stages']['readout']['calls'], 1)
+        stats = report['stages']['integrate']
+        self.assertTrue(stats['elapsed'] >= stats['max_elapsed'] >= 0.0)
+        self.assertTrue(report['elapsed'] >= report['staged'])
+        if peak_rss() is not None:
+            self.assertTrue(stats['peak_rss'] > 0)
+            self.assertTrue(stats['peak_rss_increase'] >= 0)
+        descr = str(profiler)
+        self.assertIsNotNone(descr)
+
+        # A stage is recorded even if it raises an exception.
+        def fail():
+            with profiler.stage('write'):
+                raise IOError("Cannot write")
+        self.assertRaises(IOError, fail)
+        self.assertEqual(profiler.stages['write']['calls'], 1)
+
+        # The statistics are kept when the profiler is disabled, until it
+        # is reset.
+        profiler.disable()
+        with profiler.stage('readout'):
+            pass
+        self.assertEqual(profiler.stages['readout']['calls'], 1)
+        profiler.reset()
+        self.assertEqual(profiler.stages, {})
+
+    def test_write(self):
+        profiler = StageProfiler(enabled=True)
+        with profiler.stage('calibration'):
+            pass
+        outputfile = os.path.join(self.profile_dir, 'SCATestOutput.fits')
+        filename = profile_filename(outputfile)
+        self.assertEqual(filename, os.path.join(self.profile_dir,
+                                                'SCATestOutput_profile.json'))
+        profiler.write(filename)
+        with open(filename, 'r') as fp:
+            report = json.load(fp)
+        self.assertEqual(report['stages']['calibration']['calls'], 1)
+
+
+# If being run as a main program, run the tests.
+if __name__ == '__main__':
+    unittest.main()
@@ -57,6 +57,10 @@ NOTE: Some tests within this module can take several minutes to run.
              test system has limited memory
 17 Jun 2020: Work-around to allow the test to work with nosetests after
              installation by pip. Unzip the data file if not found.
+18 Oct 2026: Added test_profile.
+18 Oct 2026: Added test_averaged_readout.
+18 Oct 2026: Added test_parallel_bands.
+18 Oct 2026: test_profile no longer needs any CDPs.
 
 @author: Steven Beard (UKATC)
 
@@ -480,6 +484,66 @@ class TestSensorChipAssembly(unittest.TestCase):
                                       exposure_data.data.max())
         del test_map, exposure_data, sca
         
+    def test_averaged_readout(self):
+        # Test that an averaged readout mode only stores the averaged
+        # groups, and that these match the average of the groups
+        # simulated without averaging.
+        test_map = MiriIlluminationModel(_TEST_INPUT_FILE)
+        test_map.set_instrument_metadata(_DEFAULT_SCA)
+        exposures = {}
+        for readout_mode in ('FAST', 'FASTGRPAVG'):
+            sca = SensorChipAssembly1(logger=LOGGER)
+            with warnings.catch_warnings(): # Suppress FITS header warnings.
+                warnings.simplefilter("ignore")
+                exposure_data = sca.simulate_pipe(test_map, scale=1.0,
+                        readout_mode=readout_mode, nints=2, ngroups=8,
+                        cosmic_ray_mode='NONE',
+                        simulate_poisson_noise=False,
+                        simulate_read_noise=False, simulate_ref_pixels=False,
+                        simulate_bad_pixels=False,
+                        simulate_dark_current=False,
+                        simulate_flat_field=False, simulate_gain=False,
+                        simulate_nonlinearity=False, simulate_drifts=False,
+                        simulate_latency=False, seedvalue=1, verbose=0)
+            exposures[readout_mode] = exposure_data
+            del sca
+        full_data = exposures['FAST'].data
+        averaged_data = exposures['FASTGRPAVG'].data
+        self.assertFalse(exposures['FAST'].streaming)
+        self.assertTrue(exposures['FASTGRPAVG'].streaming)
+        (nints, ngroups, rows, columns) = full_data.shape
+        self.assertEqual(averaged_data.shape, (nints, ngroups//4, rows, columns))
+        expected = full_data.reshape(nints, ngroups//4, 4, rows, columns)
+        self.assertTrue(np.allclose(expected.mean(axis=2), averaged_data))
+        del test_map, exposures
+
+    def test_parallel_bands(self):
+        # Test that bands of rows can be simulated in parallel through
+        # the pipeline API and that the result is reproducible for a
+        # given seed and number of bands.
+        test_map = MiriIlluminationModel(_TEST_INPUT_FILE)
+        test_map.set_instrument_metadata(_DEFAULT_SCA)
+        results = []
+        for pool in ('thread', 'thread', 'process'):
+            sca = SensorChipAssembly1(logger=LOGGER)
+            with warnings.catch_warnings(): # Suppress FITS header warnings.
+                warnings.simplefilter("ignore")
+                exposure_data = sca.simulate_pipe(test_map, scale=1.0,
+                        readout_mode='FAST', nints=1, ngroups=4,
+                        cosmic_ray_mode='NONE', simulate_bad_pixels=False,
+                        simulate_dark_current=False,
+                        simulate_flat_field=False, simulate_gain=False,
+                        simulate_nonlinearity=False, simulate_read_noise=False,
+                        simulate_drifts=False, simulate_latency=False,
+                        seedvalue=1, nbands=2, nworkers=2, pool=pool,
+                        verbose=0)
+            results.append(np.array(exposure_data.data))
+            del sca, exposure_data
+        self.assertEqual(results[0].shape[:2], (1, 4))
+        self.assertTrue(np.array_equal(results[0], results[1]))
+        self.assertTrue(np.array_equal(results[0], results[2]))
+        del test_map
+
     def test_saturation(self):
         # Test that the simulator handles saturated data correctly.
         sca = SensorChipAssembly2(logger=LOGGER)
@@ -496,6 +560,42 @@ class TestSensorChipAssembly(unittest.TestCase):
                 os.remove(test_output_file_name)
         del sca
                                  
+    def test_profile(self):
+        # Test the profile report made for a simulation. The simulation
+        # does not need any CDPs.
+        sca = SensorChipAssembly2(logger=LOGGER)
+        with warnings.catch_warnings(): # Suppress FITS header warnings.
+            warnings.simplefilter("ignore")
+            test_output_file_name = "%s_PROFILE.fits" % _TEST_OUTPUT_STUB
+            test_profile_file_name = "%s_PROFILE_profile.json" % \
+                _TEST_OUTPUT_STUB
+            sca.simulate_files(_TEST_INPUT_FILE, test_output_file_name,
+                _DEFAULT_SCA, readout_mode='FAST', subarray='FULL',
+                nints=1, ngroups=3, cosmic_ray_mode='NONE',
+                simulate_bad_pixels=False, simulate_dark_current=False,
+                simulate_flat_field=False, simulate_gain=False,
+                simulate_nonlinearity=False, simulate_read_noise=False,
+                overwrite=True, seedvalue=1, profile=True, verbose=0 )
+            stages = sca.profile_report['stages']
+            for name in ('illumination', 'cosmic_rays', 'integrate',
+                         'readout', 'set_group', 'write'):
+                self.assertTrue(name in stages)
+            self.assertEqual(stages['readout']['calls'], 3)
+            self.assertTrue(os.path.isfile(test_profile_file_name))
+            # A simulation without profiling makes no report.
+            sca.simulate_files(_TEST_INPUT_FILE, test_output_file_name,
+                _DEFAULT_SCA, readout_mode='FAST', subarray='FULL',
+                nints=1, ngroups=3, cosmic_ray_mode='NONE',
+                simulate_bad_pixels=False, simulate_dark_current=False,
+                simulate_flat_field=False, simulate_gain=False,
+                simulate_nonlinearity=False, simulate_read_noise=False,
+                overwrite=True, seedvalue=1, verbose=0 )
+            self.assertIsNone(sca.profile_report)
+            if REMOVE_FILES:
+                os.remove(test_output_file_name)
+                os.remove(test_profile_file_name)
+        del sca
+                                 
     def test_subarray_modes(self):
         # Test the extraction of subarrays from full frame data.
         test_map = MiriIlluminationModel(_TEST_INPUT_FILE2)
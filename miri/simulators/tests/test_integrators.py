@@ -33,6 +33,12 @@ PoissonIntegrator and ImperfectIntegrator class.
 04 Jan 2017: Check the flux is correct when noise is turned on and when there
              is a non-zero pedestal. Also check the flux is correct when
              zeropoint drift and latency effects are included.
+18 Oct 2026: Added tests for the fast readout option and for splitting
+             an integrator into bands of rows. Test depositing a
+             batch of cosmic rays.
+18 Oct 2026: Test the inplace and numexpr integrator kernels.
+             Test integrating a ramp in one batch.
+18 Oct 2026: Test the float32 simulation precision.
 
 @author: Steven Beard (UKATC)
 
@@ -47,6 +53,11 @@ import numpy as np
 
 from miri.simulators.integrators import PoissonIntegrator, ImperfectIntegrator
 
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
 class TestPoissonIntegrator(unittest.TestCase):
     
     def setUp(self):
@@ -207,6 +218,55 @@ class TestPoissonIntegrator(unittest.TestCase):
         self.assertLess(abs(deviation), difference.mean()/100.0)
         del intnoise
 
+    def test_fast_readout(self):
+        # The fast readout must be repeatable for a given seed.
+        exptime = 10.0
+        flux = 25.0 * np.ones((64,64))
+        readouts = []
+        for attempt in range(0, 2):
+            intfast = PoissonIntegrator(64, 64, fast_readout=True, verbose=0)
+            intfast.set_seed(42)
+            intfast.reset()
+            ramp = [intfast.readout()]
+            for group in range(0, 4):
+                intfast.integrate(flux, exptime)
+                ramp.append(intfast.readout())
+            readouts.append(np.array(ramp))
+            del intfast
+        self.assertTrue(np.all(readouts[0] == readouts[1]))
+        
+        # The noise statistics must match those of the normal readout,
+        # (noise approximately the square root of the signal).
+        intnoise = PoissonIntegrator(1024, 1024, fast_readout=True, verbose=0)
+        intnoise.set_seed(42)
+        for fluxlevel in (1.234, 123.456):
+            flux = fluxlevel * np.ones((1024,1024), dtype=np.float32)
+            intnoise.reset()
+            readout1 = intnoise.readout().astype(np.int32)
+            intnoise.integrate(flux, exptime)
+            readout2 = intnoise.readout().astype(np.int32)
+            difference = readout2 - readout1
+            noise = difference.std()
+            deviation = difference.mean() -  (noise * noise)
+            self.assertLess(abs(deviation), difference.mean()/100.0)
+        del intnoise
+        
+        # Without Poisson noise, the fast readout is identical to the
+        # normal readout.
+        flux = [[1.0, 2.0, 3.0], \
+                [4.0, 5.0, 6.0], \
+                [7.0, 8.0, 9.0e9]]
+        normal = PoissonIntegrator(3, 3, bucket_size=1000,
+                                   simulate_poisson_noise=False, verbose=0)
+        fast = PoissonIntegrator(3, 3, bucket_size=1000,
+                                 simulate_poisson_noise=False,
+                                 fast_readout=True, verbose=0)
+        for test in (normal, fast):
+            test.reset()
+            test.integrate(flux, 10.0)
+        self.assertTrue(np.all(normal.readout() == fast.readout()))
+        del normal, fast
+
     def test_saturation(self):
         # If a bucket size is defined, the integrator will saturate
         # when the count reaches or exceeds this bucket size.
@@ -531,6 +591,33 @@ class TestImperfectIntegrator(unittest.TestCase):
         self.assertRaises(TypeError, self.integrator.hit_by_cosmic_ray,
                           energy, 0, 0)
 
+    def test_cosmic_ray_batch(self):
+        # Depositing a batch of cosmic rays at once must give the same
+        # result as depositing them one at a time, including hits which
+        # are partly or completely outside the integrator.
+        energy = np.array([[[10,100,10], [100,1000,100], [10,100,10]],
+                           [[1,2,3], [4,5,6], [7,8,9]],
+                           [[20,200,20], [200,2000,200], [20,200,20]],
+                           [[5,5,5], [5,50,5], [5,5,5]]], dtype=np.float64)
+        rows = [1, 0, 2, 6]
+        columns = [1, 2, 2, 1]
+        single = ImperfectIntegrator(3, 3, verbose=0)
+        for (emap, row, column) in zip(energy, rows, columns):
+            single.hit_by_cosmic_ray(emap, row, column)
+        self.integrator.reset()
+        self.integrator.hit_by_cosmic_rays(energy, rows, columns)
+        self.assertTrue(np.allclose(self.integrator.expected_count,
+                                    single.expected_count))
+        # Single energies are deposited on one pixel each.
+        self.integrator.reset()
+        self.integrator.hit_by_cosmic_rays([100.0, 200.0, 300.0],
+                                           [0, 0, 5], [1, 1, 1])
+        self.assertAlmostEqual(self.integrator.expected_count[0,1], 300.0)
+        self.assertAlmostEqual(self.integrator.expected_count.sum(), 300.0)
+        # There must be one map for each row and column.
+        self.assertRaises(TypeError, self.integrator.hit_by_cosmic_rays,
+                          energy, rows[:2], columns[:2])
+
     def test_leakage(self):
         # Test the effect of charge leakage from the integrator.
         # First integrate some counts.
@@ -575,6 +662,176 @@ class TestImperfectIntegrator(unittest.TestCase):
         self.integrator.set_latency(slow_params, fast_params)
         # Insert more latency tests here.
 
+    def test_split_rows(self):
+        # Integrating an integrator split into bands of rows must give the
+        # same result as integrating the whole integrator, including the
+        # latency and persistence carried from one integration to the next.
+        flux = np.arange(6*4, dtype=np.float64).reshape((6,4)) * 10.0
+        whole = ImperfectIntegrator(6, 4, bucket_size=100000,
+                                    simulate_poisson_noise=False, verbose=0)
+        whole.set_persistence(0.1)
+        whole.set_zeropoint([100.0, 0.01], [[0.0, -2.9], [0.0, -2.3]])
+        whole.set_latency([1.0e-6, 1000.0], [0.002, 50.0])
+        parent = copy.deepcopy(whole)
+        bands = [parent.split_rows(0, 2), parent.split_rows(2, 6)]
+        self.assertEqual(bands[1].shape, (4,4))
+        for (test, rows) in ((whole, slice(0,6)), (bands[0], slice(0,2)),
+                             (bands[1], slice(2,6))):
+            for intnum in range(0, 3):
+                test.reset(new_exposure=(intnum == 0))
+                test.integrate(flux[rows], 5.0)
+                test.readout()
+        parent.merge_rows(bands, [0, 2])
+        self.assertEqual(parent.shape, whole.shape)
+        self.assertEqual(parent.nints, whole.nints)
+        self.assertAlmostEqual(parent.clock_time, whole.clock_time)
+        for name in ('expected_count', 'zeropoint', 'last_readout',
+                     'slow_latent', 'last_flux'):
+            self.assertTrue(np.allclose(getattr(parent, name),
+                                        getattr(whole, name)))
+        
+        # A band of rows outside the integrator is rejected.
+        self.assertRaises(ValueError, whole.split_rows, 4, 8)
+        self.assertRaises(ValueError, whole.split_rows, 2, 2)
+
+    def _simulate_kernel(self, kernel, split=False, precision='float64'):
+        # Simulate some integrations with all the imperfect integrator
+        # effects and the given kernel, returning the final state.
+        flux = np.arange(6*4, dtype=np.float64).reshape((6,4)) * 10.0
+        test = ImperfectIntegrator(6, 4, bucket_size=100000,
+                                   simulate_poisson_noise=False,
+                                   kernel=kernel, precision=precision,
+                                   verbose=0)
+        test.set_persistence([0.001, 0.05, 0.0])
+        test.set_sensitivity([1.2, -0.8])
+        test.set_zeropoint([100.0, 0.01], [[0.0, -2.9], [0.0, -2.3]])
+        test.set_latency([1.0e-6, 1000.0], [0.002, 50.0])
+        readouts = []
+        for intnum in range(0, 3):
+            if split and intnum == 1:
+                bands = [test.split_rows(0, 3), test.split_rows(3, 6)]
+                for (band, rows) in zip(bands, (slice(0,3), slice(3,6))):
+                    band.reset(nresets=2)
+                    band.integrate(flux[rows], 5.0)
+                    band.wait(1.0, bgflux=2.0)
+                    band.integrate(flux[rows], 5.0)
+                test.merge_rows(bands, [0, 3])
+                readouts.append(test.readout())
+            else:
+                test.reset(nresets=2, new_exposure=(intnum == 0))
+                test.integrate(flux, 5.0)
+                test.wait(1.0, bgflux=2.0)
+                test.integrate(flux, 5.0)
+                readouts.append(test.readout())
+        return (test, readouts)
+
+    def test_kernels(self):
+        # The inplace kernel gives exactly the same result as the numpy
+        # kernel, also when the integrator is split into bands of rows.
+        (expected, expected_readouts) = self._simulate_kernel('numpy')
+        for split in (False, True):
+            (test, readouts) = self._simulate_kernel('inplace', split=split)
+            for (readout, expected_readout) in zip(readouts,
+                                                   expected_readouts):
+                self.assertTrue(np.array_equal(readout, expected_readout))
+            for name in ('expected_count', 'zeropoint', 'slow_latent',
+                         'last_flux'):
+                self.assertTrue(np.array_equal(getattr(test, name),
+                                               getattr(expected, name)))
+        # The kernel can be changed, but must be recognised.
+        test.set_kernel('numpy')
+        self.assertEqual(test.kernel, 'numpy')
+        self.assertRaises(ValueError, test.set_kernel, 'silly value')
+        self.assertRaises(ValueError, ImperfectIntegrator, 3, 3,
+                          kernel='silly value', verbose=0)
+
+    def test_integrate_ramp(self):
+        # Without Poisson noise, a ramp integrated in one batch gives the
+        # same readouts and final state as integrating and reading out
+        # each period in turn.
+        flux = np.arange(6*4, dtype=np.float64).reshape((6,4)) * 10.0
+        times = [5.0, 5.0, 2.5, 5.0]
+        deposits = np.zeros((len(times), 6, 4))
+        deposits[1, 2, 3] = 1000.0
+        serial = ImperfectIntegrator(6, 4, bucket_size=1500,
+                                     simulate_poisson_noise=False, verbose=0)
+        batch = copy.deepcopy(serial)
+        self.assertTrue(serial.is_perfect())
+        serial.reset(new_exposure=True)
+        expected = []
+        for (time, deposit) in zip(times, deposits):
+            serial.expected_count += deposit
+            serial.integrate(flux, time)
+            expected.append(serial.readout())
+        batch.reset(new_exposure=True)
+        readouts = batch.integrate_ramp(flux, times, deposits=deposits)
+        self.assertTrue(np.array_equal(readouts, np.array(expected)))
+        self.assertEqual(readouts.max(), 1500)
+        for name in ('expected_count', 'last_count', 'last_readout'):
+            self.assertTrue(np.allclose(getattr(batch, name),
+                                        getattr(serial, name)))
+        for name in ('nperiods', 'readings', 'exposure_time', 'clock_time'):
+            self.assertEqual(getattr(batch, name), getattr(serial, name))
+
+        # With Poisson noise, the readouts never decrease and the mean
+        # signal is close to the expected signal.
+        flux = np.full((50,50), 20.0)
+        noisy = ImperfectIntegrator(50, 50, verbose=0)
+        noisy.set_seed(42)
+        noisy.reset(new_exposure=True)
+        readouts = noisy.integrate_ramp(flux, [10.0] * 5)
+        self.assertTrue(np.all(np.diff(readouts.astype(np.int64), axis=0) >= 0))
+        self.assertAlmostEqual(readouts[-1].mean() / 1000.0, 1.0, places=1)
+
+        # An imperfect integrator cannot integrate a ramp in one batch.
+        noisy.set_persistence(0.1)
+        self.assertFalse(noisy.is_perfect())
+        self.assertRaises(ValueError, noisy.integrate_ramp, flux, [10.0])
+
+    def test_precision(self):
+        # A float32 integrator keeps its arrays in float32 and its
+        # readouts agree with a float64 integrator to within 1 DN.
+        (expected, expected_readouts) = self._simulate_kernel('numpy')
+        for kernel in ('numpy', 'inplace'):
+            (test, readouts) = self._simulate_kernel(kernel,
+                                                     precision='float32')
+            self.assertEqual(test.dtype, np.float32)
+            for name in ('expected_count', 'last_count', 'zeropoint',
+                         'last_readout', 'flux'):
+                self.assertEqual(getattr(test, name).dtype, np.float32)
+            for (readout, expected_readout) in zip(readouts,
+                                                   expected_readouts):
+                self.assertTrue(np.allclose(readout, expected_readout,
+                                            rtol=0.0, atol=1.0))
+
+        # A ramp integrated in one batch also keeps float32 counts.
+        flux = np.arange(6*4, dtype=np.float64).reshape((6,4)) * 10.0
+        ramps = []
+        for precision in ('float64', np.float32):
+            test = PoissonIntegrator(6, 4, simulate_poisson_noise=False,
+                                     precision=precision, verbose=0)
+            test.reset(new_exposure=True)
+            ramps.append(test.integrate_ramp(flux, [5.0] * 4))
+        self.assertEqual(test.expected_count.dtype, np.float32)
+        self.assertTrue(np.allclose(ramps[1], ramps[0], rtol=0.0, atol=1.0))
+
+        # The precision must be recognised.
+        self.assertRaises(ValueError, ImperfectIntegrator, 3, 3,
+                          precision='float16', verbose=0)
+        self.assertRaises(ValueError, PoissonIntegrator, 3, 3,
+                          precision='silly value', verbose=0)
+
+    @unittest.skipIf(numexpr is None, "numexpr is not installed")
+    def test_numexpr_kernel(self):
+        # The numexpr kernel agrees with the numpy kernel to within
+        # rounding errors.
+        (expected, expected_readouts) = self._simulate_kernel('numpy')
+        (test, readouts) = self._simulate_kernel('numexpr')
+        for (readout, expected_readout) in zip(readouts, expected_readouts):
+            self.assertTrue(np.allclose(readout, expected_readout, atol=1.0))
+        self.assertTrue(np.allclose(test.expected_count,
+                                    expected.expected_count))
+
 # If being run as a main program, run the tests.
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+
+Module ramp_fitting - Contains general purpose functions for fitting
+straight lines to MIRI ramp data, including:
+
+fit_ramps - Closed form ordinary least squares fit of a slope, intercept
+    and slope uncertainty to every ramp contained in a 3-D or 4-D data
+    array, optionally excluding groups flagged in the GROUPDQ and PIXELDQ
+    arrays.
+
+ramp_slopes - A convenience function which returns only the slopes.
+
+fit_ramps_file - Fit the ramps contained in a FITS file, streaming the
+    data a block of rows at a time from a memory-mapped SCI extension.
+
+rows_per_block - Calculate how many detector rows can be fitted at once
+    within a given memory limit.
+
+diff_slopes - A quick estimate of the slopes, made by subtracting the
+    first group of each ramp from the last.
+
+The fit is made in two sweeps over the group axis (one for the fit and one
+for the residuals), so the data array is never reordered or copied. Each
+sweep works on one group plane at a time, so the additional memory needed
+is a small number of (nints, rows, columns) accumulators, regardless of
+the number of groups. The data may also be fitted a block of rows at a
+time, so that the working memory stays within a given limit however many
+groups and integrations there are.
+
+:History:
+
+18 Oct 2026: Created, to replace the many per-pixel calls to
+             linear_regression made by the slope_data methods.
+18 Oct 2026: Added the max_memory parameter, rows_per_block and
+             fit_ramps_file, so ramps can be fitted a block of rows at
+             a time from a memory-mapped FITS file.
+18 Oct 2026: Added diff_slopes, which makes the quick estimate used by
+             the slope_data methods one integration at a time.
+18 Oct 2026: fit_ramps_file applies the BZERO offset of unsigned DQ
+             arrays, which are read unscaled along with the ramps.
+
+@author: MIRI Software Team
+
+"""
+
+import numpy as np
+import astropy.io.fits as pyfits
+
+# List all classes and global functions here.
+__all__ = ['fit_ramps', 'ramp_slopes', 'fit_ramps_file', 'rows_per_block',
+           'diff_slopes']
+
+# The number of (nints x columns) float64 working arrays needed for
+# each row fitted by fit_ramps, and the number of additional arrays
+# needed when the fit is masked by DQ arrays.
+_WORK_ARRAYS = 10
+_MASKED_WORK_ARRAYS = 6
+
+# The default maximum working memory (in bytes) used when fitting the
+# ramps contained in a file.
+_DEFAULT_MAX_MEMORY = 1024 * 1024 * 1024
+
+
+def _group_range(ngroups, startgroup=None, endgroup=None):
+    """
+
+    Helper function which converts an optional group range into a
+    valid (start, end) pair for an axis of length ngroups.
+
+    """
+    if startgroup is None:
+        startgroup = 0
+    if endgroup is None:
+        endgroup = ngroups
+    startgroup = int(startgroup)
+    endgroup = int(endgroup)
+    if startgroup < 0 or endgroup > ngroups or \
+       (endgroup - startgroup) < 2:
+        strg = "Group range %d to %d is not valid " % (startgroup, endgroup)
+        strg += "for %d groups (at least 2 groups are needed)." % ngroups
+        raise ValueError(strg)
+    return (startgroup, endgroup)
+
+def _good_groups(groupdq, pixelmask, grp, dq_bitmask):
+    """
+
+    Helper function which returns a boolean array which is True where
+    group grp of each ramp may be used in the fit, or None if every
+    group may be used.
+
+    """
+    good = pixelmask
+    if groupdq is not None:
+        if dq_bitmask is None:
+            ggood = (groupdq[:,grp,:,:] == 0)
+        else:
+            ggood = ((groupdq[:,grp,:,:] & dq_bitmask) == 0)
+        if good is None:
+            good = ggood
+        else:
+            good = ggood & good
+    return good
+
+def rows_per_block(shape, max_memory=None, masked=False):
+    """
+
+    Return the number of detector rows which can be fitted at once
+    by fit_ramps without exceeding a given memory limit.
+
+    :Parameters:
+
+    shape: tuple of ints
+        The shape of the 4-D ramp data (nints, ngroups, rows, columns).
+    max_memory: int, optional
+        The maximum number of bytes of working memory to be used.
+        If None, there is no limit and all the rows are fitted at once.
+    masked: bool, optional, default=False
+        Set to True if the fit is to be masked by DQ arrays, which
+        needs extra working memory.
+
+    :Returned:
+
+    block_rows: int
+        The number of rows per block (at least 1).
+
+    """
+    (nints, ngroups, rows, columns) = shape
+    if max_memory is None:
+        return max(rows, 1)
+    # Working arrays needed for each row, including the temporary
+    # copies of each group plane and a copy of that plane read from
+    # a memory-mapped file.
+    if masked:
+        narrays = _WORK_ARRAYS + _MASKED_WORK_ARRAYS
+    else:
+        narrays = _WORK_ARRAYS
+    bytes_per_row = narrays * nints * columns * 8
+    block_rows = int(max_memory) // bytes_per_row
+    return int(min(max(block_rows, 1), max(rows, 1)))
+
+def _fit_block(data, groupdq, pixelmask, times, startgroup, dq_bitmask,
+               fill_value, slope, intercept, slope_err):
+    """
+
+    Helper function which fits the ramps contained in a 4-D block of data
+    and writes the results to the given slope, intercept and slope_err
+    arrays.
+
+    """
+    masked = (groupdq is not None) or (pixelmask is not None)
+    outshape = slope.shape
+    ngroups = len(times)
+
+    # First pass. Accumulate the sums needed for the least squares fit.
+    # Without any masking the sums involving only the time axis are
+    # the same for every ramp.
+    if masked:
+        sumw = np.zeros(outshape, dtype=np.float64)
+        sumx = np.zeros(outshape, dtype=np.float64)
+        sumxx = np.zeros(outshape, dtype=np.float64)
+    else:
+        sumw = float(ngroups)
+        sumx = times.sum()
+        sumxx = (times * times).sum()
+    sumy = np.zeros(outshape, dtype=np.float64)
+    sumxy = np.zeros(outshape, dtype=np.float64)
+    for ii in range(0, ngroups):
+        grp = startgroup + ii
+        tt = times[ii]
+        if masked:
+            good = _good_groups(groupdq, pixelmask, grp, dq_bitmask)
+            yy = np.where(good, data[:,grp,:,:], 0.0).astype(np.float64)
+            sumw += good
+            sumx += good * tt
+            sumxx += good * (tt * tt)
+        else:
+            yy = data[:,grp,:,:].astype(np.float64)
+        sumy += yy
+        sumxy += tt * yy
+    del yy
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = sumw * sumxx - sumx * sumx
+        slope[...] = (sumw * sumxy - sumx * sumy) / denom
+        intercept[...] = (sumy - slope * sumx) / sumw
+    del sumy, sumxy
+
+    # Second pass. Accumulate the squared residuals from the fit.
+    # (Calculating them directly avoids the loss of precision suffered
+    # by the sum of squares formula when the ramps have large offsets.)
+    rss = np.zeros(outshape, dtype=np.float64)
+    for ii in range(0, ngroups):
+        grp = startgroup + ii
+        resid = data[:,grp,:,:] - (slope * times[ii] + intercept)
+        if masked:
+            good = _good_groups(groupdq, pixelmask, grp, dq_bitmask)
+            resid = np.where(good, resid, 0.0)
+        rss += resid * resid
+    del resid
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope_err[...] = np.sqrt(rss * sumw / ((sumw - 2.0) * denom))
+    del rss
+
+    # Replace the values which cannot be determined.
+    nofit = np.broadcast_to(np.logical_not(denom > 0.0), outshape)
+    slope[nofit] = fill_value
+    intercept[nofit] = fill_value
+    noerr = nofit | np.broadcast_to(np.logical_not(sumw > 2.0), outshape)
+    slope_err[noerr] = fill_value
+
+def fit_ramps(data, grptime=1.0, groupdq=None, pixeldq=None,
+              dq_bitmask=None, startgroup=None, endgroup=None,
+              fill_value=np.nan, max_memory=None):
+    """
+
+    Fit a straight line to every ramp in a 3-D or 4-D data array
+    in one batched pass, using closed form ordinary least squares.
+
+    :Parameters:
+
+    data: array_like
+        The ramp data. Either 4-D, ordered (nints, ngroups, rows, columns),
+        or 3-D, ordered (ngroups, rows, columns).
+    grptime: float, optional, default=1.0
+        The time interval between groups (which determines the
+        time axis for the slope calculation).
+    groupdq: array_like int, optional
+        A GROUPDQ array of the same shape as data. Groups whose quality
+        matches dq_bitmask are excluded from the fit.
+    pixeldq: array_like int, optional
+        A 2-D PIXELDQ array of shape (rows, columns). Pixels whose quality
+        matches dq_bitmask are excluded from the fit altogether.
+    dq_bitmask: int, optional
+        The quality flags which cause data to be rejected. If None
+        (the default) any non-zero quality value causes a rejection.
+    startgroup: int, optional
+        The first group to be fitted. Defaults to the first group.
+    endgroup: int, optional
+        One more than the last group to be fitted (in the same sense as
+        a Python slice). Defaults to the number of groups.
+    fill_value: float, optional, default=NaN
+        The value given to any slope, intercept or error which cannot
+        be determined because there are too few good groups.
+    max_memory: int, optional
+        The maximum number of bytes of working memory to be used (in
+        addition to the memory needed by the input data and the result).
+        If given, the ramps are fitted a block of rows at a time, which
+        allows data mapped from a file to be fitted without reading it
+        all into memory. If None (the default) all the rows are fitted
+        at once.
+
+    :Returned:
+
+    (slope, intercept, slope_err): tuple of 3 float64 arrays
+        The slope (in data units per grptime), the intercept at group 0
+        and the standard error on the slope. The arrays have the shape
+        of the data with the group axis removed. The slope error needs
+        at least 3 good groups.
+
+    :Raises:
+
+    TypeError
+        Raised if the data array has the wrong number of dimensions
+        or the DQ arrays have the wrong shape.
+    ValueError
+        Raised if the group range contains fewer than 2 groups.
+
+    """
+    data = np.asarray(data)
+    if data.ndim == 3:
+        squeeze = True
+        data = data[np.newaxis,:,:,:]
+        if groupdq is not None:
+            groupdq = np.asarray(groupdq)[np.newaxis,:,:,:]
+    elif data.ndim == 4:
+        squeeze = False
+    else:
+        strg = "Ramp data must be 3-D or 4-D (%d-D given)." % data.ndim
+        raise TypeError(strg)
+    (nints, ngroups, rows, columns) = data.shape
+    (startgroup, endgroup) = _group_range(ngroups, startgroup=startgroup,
+                                          endgroup=endgroup)
+
+    if groupdq is not None:
+        groupdq = np.asarray(groupdq)
+        if groupdq.shape != data.shape:
+            strg = "GROUPDQ array has the wrong shape %s " % str(groupdq.shape)
+            strg += "(%s expected)." % str(data.shape)
+            raise TypeError(strg)
+    pixelmask = None
+    if pixeldq is not None:
+        pixeldq = np.asarray(pixeldq)
+        if pixeldq.shape != (rows, columns):
+            strg = "PIXELDQ array has the wrong shape %s " % str(pixeldq.shape)
+            strg += "(%s expected)." % str((rows, columns))
+            raise TypeError(strg)
+        if dq_bitmask is None:
+            pixelmask = (pixeldq == 0)
+        else:
+            pixelmask = ((pixeldq & dq_bitmask) == 0)
+
+    # Fit the ramps in blocks of rows small enough to keep within the
+    # memory limit. The output arrays are filled one block at a time.
+    outshape = (nints, rows, columns)
+    slope = np.empty(outshape, dtype=np.float64)
+    intercept = np.empty(outshape, dtype=np.float64)
+    slope_err = np.empty(outshape, dtype=np.float64)
+    times = grptime * np.arange(startgroup, endgroup, dtype=np.float64)
+    block_rows = rows_per_block(data.shape, max_memory=max_memory,
+                                masked=(groupdq is not None) or \
+                                       (pixelmask is not None))
+    for row1 in range(0, rows, block_rows):
+        row2 = min(row1 + block_rows, rows)
+        if groupdq is not None:
+            gdqblock = groupdq[:,:,row1:row2,:]
+        else:
+            gdqblock = None
+        if pixelmask is not None:
+            pmblock = pixelmask[row1:row2,:]
+        else:
+            pmblock = None
+        _fit_block(data[:,:,row1:row2,:], gdqblock, pmblock, times,
+                   startgroup, dq_bitmask, fill_value,
+                   slope[:,row1:row2,:], intercept[:,row1:row2,:],
+                   slope_err[:,row1:row2,:])
+
+    if squeeze:
+        return (slope[0], intercept[0], slope_err[0])
+    else:
+        return (slope, intercept, slope_err)
+
+def ramp_slopes(data, grptime=1.0, groupdq=None, pixeldq=None,
+                dq_bitmask=None, startgroup=None, endgroup=None,
+                fill_value=np.nan, max_memory=None):
+    """
+
+    Fit a straight line to every ramp in a 3-D or 4-D data array
+    and return only the slopes.
+
+    See fit_ramps for a description of the parameters.
+
+    :Returned:
+
+    slope: array float64
+        The slope of each ramp, with the group axis removed.
+
+    """
+    (slope, intercept, slope_err) = fit_ramps(data, grptime=grptime,
+                                              groupdq=groupdq,
+                                              pixeldq=pixeldq,
+                                              dq_bitmask=dq_bitmask,
+                                              startgroup=startgroup,
+                                              endgroup=endgroup,
+                                              fill_value=fill_value,
+                                              max_memory=max_memory)
+    del intercept, slope_err
+    return slope
+
+def diff_slopes(data, timediff):
+    """
+
+    Estimate the slope of every ramp in a 4-D data array by subtracting
+    the first group from the last. The estimate is made one integration
+    at a time, straight into a float32 result, so unsigned data cannot
+    wrap around and no data-sized float64 arrays are created.
+
+    :Parameters:
+
+    data: array_like
+        The ramp data, ordered (nints, ngroups, rows, columns).
+    timediff: float
+        The time between the first and last groups.
+
+    :Returned:
+
+    slope: array float32
+        The estimated slope of each ramp, of shape (nints, rows, columns).
+
+    """
+    data = np.asarray(data)
+    output = np.empty((data.shape[0],) + data.shape[2:], dtype=np.float32)
+    for intnum in range(0, data.shape[0]):
+        np.subtract(data[intnum,-1,:,:], data[intnum,0,:,:],
+                    out=output[intnum], dtype=np.float32)
+    output /= np.float32(timediff)
+    return output
+
+def _dq_data(hdu):
+    """
+
+    Helper function which returns the data quality array contained in
+    a FITS HDU opened without scaling. Unsigned integer arrays are
+    stored as signed integers with a BZERO offset, which is applied
+    here so that good data have a quality of zero.
+
+    """
+    bzero = hdu.header.get('BZERO', 0)
+    if bzero:
+        return hdu.data.astype(np.int64) + int(bzero)
+    return hdu.data
+
+def fit_ramps_file(filename, grptime=None, use_dq=False, dq_bitmask=None,
+                   startgroup=None, endgroup=None, fill_value=np.nan,
+                   max_memory=_DEFAULT_MAX_MEMORY, extname='SCI'):
+    """
+
+    Fit a straight line to every ramp contained in a FITS file.
+
+    The ramp data are memory-mapped and fitted a block of rows at a time,
+    so only a block of data is read into memory at once and the working
+    memory stays within max_memory, however large the file.
+
+    :Parameters:
+
+    filename: str
+        The name of a FITS file containing 3-D or 4-D ramp data, such
+        as a MIRI level 1b exposure.
+    grptime: float, optional
+        The time interval between groups. If not given, the TGROUP
+        keyword is read from the primary header, or 1.0 is assumed
+        if that keyword is not present.
+    use_dq: bool, optional, default=False
+        If True, exclude the groups and pixels flagged in the GROUPDQ
+        and PIXELDQ extensions (when they exist) from the fit.
+    dq_bitmask: int, optional
+        The quality flags which cause data to be rejected. If None
+        (the default) any non-zero quality value causes a rejection.
+    startgroup: int, optional
+        The first group to be fitted. Defaults to the first group.
+    endgroup: int, optional
+        One more than the last group to be fitted. Defaults to the
+        number of groups.
+    fill_value: float, optional, default=NaN
+        The value given to any result which cannot be determined.
+    max_memory: int, optional, default=1GB
+        The maximum number of bytes of working memory to be used.
+    extname: str, optional, default='SCI'
+        The name of the FITS extension containing the ramp data.
+
+    :Returned:
+
+    (slope, intercept, slope_err): tuple of 3 float64 arrays
+        See fit_ramps.
+
+    :Raises:
+
+    KeyError
+        Raised if the FITS file does not contain the named extension.
+
+    """
+    hdulist = pyfits.open(filename, memmap=True,
+                          do_not_scale_image_data=True)
+    try:
+        if extname not in hdulist:
+            strg = "FITS file '%s' has no %s extension." % \
+                (filename, extname)
+            raise KeyError(strg)
+        if grptime is None:
+            grptime = hdulist[0].header.get('TGROUP', 1.0)
+        scihdu = hdulist[extname]
+        # The unscaled data are fitted, so the memory map is not
+        # replaced by a scaled copy. Scaling is linear, so it can be
+        # applied to the results instead.
+        bscale = scihdu.header.get('BSCALE', 1.0)
+        bzero = scihdu.header.get('BZERO', 0.0)
+        groupdq = None
+        pixeldq = None
+        if use_dq:
+            if 'GROUPDQ' in hdulist:
+                groupdq = _dq_data(hdulist['GROUPDQ'])
+            if 'PIXELDQ' in hdulist:
+                pixeldq = _dq_data(hdulist['PIXELDQ'])
+        (slope, intercept, slope_err) = fit_ramps(scihdu.data,
+                                                  grptime=grptime,
+                                                  groupdq=groupdq,
+                                                  pixeldq=pixeldq,
+                                                  dq_bitmask=dq_bitmask,
+                                                  startgroup=startgroup,
+                                                  endgroup=endgroup,
+                                                  fill_value=np.nan,
+                                                  max_memory=max_memory)
+        del groupdq, pixeldq
+    finally:
+        hdulist.close()
+        del hdulist
+
+    if bscale != 1.0 or bzero != 0.0:
+        slope *= bscale
+        intercept *= bscale
+        intercept += bzero
+        slope_err *= abs(bscale)
+    if not np.isnan(fill_value):
+        slope[np.isnan(slope)] = fill_value
+        intercept[np.isnan(intercept)] = fill_value
+        slope_err[np.isnan(slope_err)] = fill_value
+    return (slope, intercept, slope_err)
+
+
+# A minimal test is run when this file is run as a main program.
+if __name__ == '__main__':
+    print("Testing the module\n")
+    ramps = np.zeros([2, 10, 4, 5])
+    for grp in range(0, 10):
+        ramps[:,grp,:,:] = 3.0 + 2.5 * grp
+    (slope, intercept, slope_err) = fit_ramps(ramps, grptime=1.0)
+    print("Slopes:\n", slope)
+    print("Intercepts:\n", intercept)
+    print("Slope errors:\n", slope_err)
+    assert np.allclose(slope, 2.5)
+    assert np.allclose(intercept, 3.0)
+    print("Test finished.")
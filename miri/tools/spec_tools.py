@@ -60,6 +60,18 @@ Longer description, references, class hierarchy...
 08 Nov 2017: Moved from LRS pipeline package to general purpose spec_tools
              package.
 17 Oct 2019: Merged with the spectral flattening tools from MiriTeam
+18 Oct 2026: condense vectorised, using cumulative sums, a minimum filter
+             and sliding windows for running averages and a reshape for
+             rebinning. It can now process a stack of spectra along a
+             chosen axis.
+18 Oct 2026: The spectral flattening functions process the data a block
+             of wavelengths at a time, accumulating weighted sums in one
+             pass, so memory-mapped cubes can be flattened in constant
+             memory. NaN values and DQ-flagged elements are skipped and
+             the error array is no longer modified.
+18 Oct 2026: Array-like inputs, such as lists, are accepted again. The
+             clamped errors used as weights are also used for the
+             flattened error, as before.
 
 @author:  Juergen Schreiber, Steven Beard (UKATC)
 
@@ -70,11 +82,13 @@ Longer description, references, class hierarchy...
 
 # Import packages/modules from the MIRI development environment
 import numpy as np
+import numpy.ma as ma
 # "numba" import disabled due to segfault issue on import when Numba has been
 # installed via pip into a Conda environment, see MIRI-749.
 # import numba as nb
 import scipy.signal as sig
 from scipy import interpolate
+from scipy import ndimage
 
 # Import MIRI packages/modules with full namespace
 from miri.datamodels.miri_measured_model import MiriMeasuredModel
@@ -84,15 +98,111 @@ from matplotlib import pyplot
 import miri.tools.miriplot as mplt
 import math
 
-def condense(spec, chunk, method = "Median", running = True):
+# The maximum number of elements in the sliding windows given to np.median
+# at one time by condense.
+_CONDENSE_BLOCK_SIZE = 4194304
+
+def _running_reduce(spec, chunk, function):
+    """
+    
+    Helper function which applies a reduction function to a window of
+    chunk elements starting at each element along the last axis of
+    spec. The window is truncated at the end of the axis.
+    
+    """
+    leng = spec.shape[-1]
+    newspec = np.empty(spec.shape, dtype=spec.dtype)
+    nfull = leng - chunk + 1
+    # Windows which lie entirely within the array. These are reduced
+    # a block at a time to limit the size of the temporary arrays.
+    windows = np.lib.stride_tricks.sliding_window_view(spec, chunk, axis=-1)
+    per_window = max(spec.size // leng, 1) * chunk
+    nblock = max(_CONDENSE_BLOCK_SIZE // per_window, 1)
+    for start in range(0, nfull, nblock):
+        stop = min(start + nblock, nfull)
+        newspec[..., start:stop] = function(windows[..., start:stop, :],
+                                            axis=-1)
+    # Truncated windows at the end of the array.
+    for i in range(nfull, leng):
+        newspec[..., i] = function(spec[..., i:], axis=-1)
+    return newspec
+
+def _running_mean(spec, chunk):
+    """
+    
+    Helper function which calculates the mean of a window of chunk
+    elements starting at each element along the last axis of spec,
+    from the difference between cumulative sums. Windows containing
+    non-finite values are given the value np.mean would give.
+    
+    """
+    leng = spec.shape[-1]
+    start = np.arange(leng)
+    stop = np.minimum(start + chunk, leng)
+    count = stop - start
+
+    def _window_sum(values):
+        # Sum of the values within each window.
+        cumsum = np.zeros(values.shape[:-1] + (leng+1,), dtype=np.float64)
+        np.cumsum(values, axis=-1, out=cumsum[..., 1:])
+        return cumsum[..., stop] - cumsum[..., start]
+
+    finite = np.isfinite(spec)
+    if finite.all():
+        newspec = _window_sum(spec) / count
+    else:
+        newspec = _window_sum(np.where(finite, spec, 0.0)) / count
+        nnan = _window_sum(np.isnan(spec))
+        nposinf = _window_sum(np.isposinf(spec))
+        nneginf = _window_sum(np.isneginf(spec))
+        newspec[nposinf > 0] = np.inf
+        newspec[nneginf > 0] = -np.inf
+        newspec[(nnan > 0) | ((nposinf > 0) & (nneginf > 0))] = np.nan
+    return newspec.astype(spec.dtype)
+
+def _running_min(spec, chunk):
+    """
+    
+    Helper function which calculates the minimum of a window of chunk
+    elements starting at each element along the last axis of spec,
+    using a minimum filter. As with np.min, windows containing a NaN
+    are given the value NaN.
+    
+    """
+    leng = spec.shape[-1]
+    # NaN values are hidden from the filter and restored afterwards.
+    isnan = np.isnan(spec)
+    hasnan = isnan.any()
+    if hasnan:
+        filtered = np.where(isnan, np.inf, spec)
+    else:
+        filtered = spec
+    # The origin shifts the filter to the window starting at each element.
+    newspec = ndimage.minimum_filter1d(filtered, chunk, axis=-1,
+                                       mode='nearest', origin=-(chunk//2))
+    # The truncated windows at the end of the array.
+    for i in range(leng - chunk + 1, leng):
+        newspec[..., i] = np.min(filtered[..., i:], axis=-1)
+    if hasnan:
+        cumnan = np.zeros(spec.shape[:-1] + (leng+1,), dtype=np.int64)
+        np.cumsum(isnan, axis=-1, out=cumnan[..., 1:])
+        start = np.arange(leng)
+        stop = np.minimum(start + chunk, leng)
+        newspec[(cumnan[..., stop] - cumnan[..., start]) > 0] = np.nan
+    return newspec
+
+def condense(spec, chunk, method = "Median", running = True, axis = 0):
     """
     
     smoothing/binning of an spectrum array
     
+    The calculation is vectorised, so a stack of spectra (for example
+    every spaxel of a data cube) can be smoothed or rebinned in one call.
+    
     :Parameters:
     
     spec: array 
-        spectrum
+        spectrum, or a 2-D or 3-D array of spectra
     
     chunk: int 
         number of elements to average
@@ -103,67 +213,56 @@ def condense(spec, chunk, method = "Median", running = True):
     running: boolean, optional (default = True)
         true if its a running averaging (smoothing) (default),
         false if it is rebinning 
+    
+    axis: int, optional (default = 0)
+        The spectral axis of a multi-dimensional array.
+        The default is the wavelength axis of a MIRI data cube.
    
     :Returns:
     
     rebinned/smoothed spectrum array
     
+    A running average replaces each element with the average of the
+    chunk elements starting at that element (fewer at the end of the
+    spectrum) and keeps the data type of the input array. Rebinning
+    averages each complete group of chunk elements and returns a
+    floating point array. Any elements left over are ignored.
+    
     """        
     if not isinstance(chunk, int):
         print("in condense: chunk parameter is not integer, will be rounded to integer:")
         chunk = int(np.rint(chunk))
         print(str(chunk))
-    leng = len(spec)
+    if method not in ("Median", "Mean", "Min"):
+        raise ValueError("method parameter has wrong value") 
+    spec = np.asarray(spec)
+    # Work with the spectral axis last.
+    spec = np.moveaxis(spec, axis, -1)
+    leng = spec.shape[-1]
     if leng < chunk:
         print("no of elements in spec is smaller than chunk value!")
         raise ValueError
-    no_chunks = np.int(leng/chunk)
-    newspec = np.copy(spec)
     if running:
-        newspec = np.copy(spec)
-        for i in range(leng):
-            if method == "Median":   
-                if i + chunk < leng:
-                    newspec[i] = np.median(spec[i:i+chunk])
-                else:
-                    newspec[i] = np.median(spec[i:])
-            elif method == "Mean":
-                if i + chunk < leng:
-                    newspec[i] = np.mean(spec[i:i+chunk])
-                else:
-                    newspec[i] = np.mean(spec[i:])
-            elif method == "Min":
-                if i + chunk < leng:
-                    newspec[i] = np.min(spec[i:i+chunk])
-                else:
-                    newspec[i] = np.min(spec[i:])
-            else:
-                raise ValueError("method parameter has wrong value") 
+        if method == "Median":
+            newspec = _running_reduce(spec, chunk, np.median)
+        elif method == "Mean":
+            newspec = _running_mean(spec, chunk)
+        else:
+            newspec = _running_min(spec, chunk)
     else:
-        newspec = np.zeros(no_chunks)
-        for i in range(no_chunks):
-            if method == "Median":
-                if (i+1) * chunk < leng:
-                    newspec[i] = np.median(spec[i*chunk:(i+1)*chunk])
-                else:
-                    newspec[i] = np.median(spec[i*chunk:])
-                    break
-            elif method == "Mean":
-                if (i+1) * chunk < leng:
-                    newspec[i] = np.mean(spec[i*chunk:(i+1)*chunk])
-                else:
-                    newspec[i] = np.mean(spec[i*chunk:])
-                    break 
-            elif method == "Min":
-                if i + chunk < leng:
-                    newspec[i] = np.min(spec[i*chunk:(i+1)*chunk])
-                else:
-                    newspec[i] = np.min(spec[i*chunk:])
-                    break            
-            else:
-                raise ValueError               
+        # Reshape the spectra so each bin lies along its own axis.
+        no_chunks = leng // chunk
+        binned = spec[..., :no_chunks*chunk]
+        binned = binned.reshape(spec.shape[:-1] + (no_chunks, chunk))
+        if method == "Median":
+            newspec = np.median(binned, axis=-1)
+        elif method == "Mean":
+            newspec = np.mean(binned, axis=-1)
+        else:
+            newspec = np.min(binned, axis=-1)
+        newspec = newspec.astype(np.float64)
             
-    return newspec
+    return np.moveaxis(newspec, -1, axis)
 
 def convGauss(x, n_points, sigma, mode = 'valid'):
     """
@@ -822,68 +921,223 @@ def calcStraightLine(x0, y0, x1, y1):
     b = (x1*y0 - x0*y1)/(x1 - x0)
     return m, b
 
-def _get_weights( error, weighted, max_weight_gain ):
+# The default maximum working memory (in bytes) used by the spectral
+# flattening functions, which process the data a block of wavelengths
+# at a time.
+_FLATTEN_MAX_MEMORY = 64 * 1024 * 1024
+
+# The number of float64 working arrays needed for each data element in
+# a block processed by the spectral flattening functions.
+_FLATTEN_WORK_ARRAYS = 8
+
+def _planes_per_block( shape, waveaxis, max_memory ):
     """
     
-    Helper function to convert an error array into a weights array.
+    Helper function which returns the number of wavelength planes of
+    an array of the given shape which can be processed at once within
+    the given working memory (in bytes).
     
     """
-    if weighted and (error is not None):
-        error = np.asarray(error)
-        if error.min() > 0.0:
-            # Prevent very tiny error estimates from skewing the result by
-            # ignoring abnormally large weights.
-            # TODO: Is this adjustment sensible? max_weight_gain is arbitrary.
-            error_limit = error.mean() / max_weight_gain
-            toosmall = np.where(error < error_limit)
-            error[toosmall] = error_limit
-            
-            weights = 1.0 / error     
-        else:
-            weights = None      
-    else:
-        weights = None
-    return weights
+    nplanes = shape[waveaxis]
+    if max_memory is None:
+        return max(nplanes, 1)
+    plane_size = int(np.prod(shape)) // max(nplanes, 1)
+    bytes_per_plane = max(plane_size * 8 * _FLATTEN_WORK_ARRAYS, 1)
+    return max(int(max_memory) // bytes_per_plane, 1)
+
+def _as_array( array ):
+    """
+    
+    Helper function which converts an array-like object (other than
+    None or an ndarray, which may be memory-mapped or masked) into an
+    array.
+    
+    """
+    if array is None or isinstance(array, np.ndarray):
+        return array
+    return np.asanyarray(array)
 
-def _flatten_error_array( error, axis ):
+def _get_block( array, waveaxis, start, stop ):
+    """
+    
+    Helper function which returns the block of wavelength planes
+    start:stop from an array, together with its mask (or None).
+    Only the block is read from a memory-mapped array.
+    
+    """
+    if array is None:
+        return (None, None)
+    index = [slice(None)] * np.ndim(array)
+    index[waveaxis] = slice(start, stop)
+    block = array[tuple(index)]
+    if ma.isMaskedArray(block):
+        return (ma.getdata(block), ma.getmaskarray(block))
+    return (np.asarray(block), None)
+
+def _get_valid( data, datamask, error, errmask, quality, bitmask ):
     """
     
-    Helper function to flatten an error array by taking the
-    root mean square of the contributing pixels rather than
-    the mean.
+    Helper function which returns a boolean array which is True for the
+    data elements which contribute to a flattened result. NaN or masked
+    values and elements with any of the given DQ flags are skipped.
     
     """
+    valid = np.isfinite(data)
+    if datamask is not None:
+        valid &= ~datamask
     if error is not None:
-        error_squared = error * error
-        flat_errorsq = np.average( error_squared, axis=axis )
-        flat_error = np.sqrt( flat_errorsq )
-    else:
-        flat_error = None
-    return flat_error
-
-def _flatten_quality_array( quality, axis, perfect ):
+        valid &= np.isfinite(error)
+        if errmask is not None:
+            valid &= ~errmask
+    if quality is not None and bitmask is not None:
+        valid &= (np.bitwise_and(quality, bitmask) == 0)
+    return valid
+
+def _get_error_limit( data, error, quality, waveaxis, bitmask,
+                      max_weight_gain, nblock ):
     """
     
-    Helper function to flatten a quality array, with the result
-    depending on whether perfection is required or not.
+    Helper function which scans an error array to find the lower limit
+    applied to the errors before they are converted into weights.
+    Very tiny error estimates are prevented from skewing the result by
+    ignoring abnormally large weights. None is returned if the errors
+    cannot be used as weights.
     
     """
-    if quality is not None:
-        if perfect:
-            # Perfection is needed.
-            # The overall quality is the maximum of the contributing quality.
-            flat_quality = np.max( quality, axis=axis)
-        else:
-            # Perfection isn't needed.
-            # The overall quality is the minimum of the contributing quality.
-            flat_quality = np.min( quality, axis=axis)
-    else:
-        flat_quality = None
+    # TODO: Is this adjustment sensible? max_weight_gain is arbitrary.
+    min_error = np.inf
+    sum_error = 0.0
+    count = 0
+    for start in range(0, data.shape[waveaxis], nblock):
+        stop = start + nblock
+        (datablk, datamask) = _get_block( data, waveaxis, start, stop )
+        (errblk, errmask) = _get_block( error, waveaxis, start, stop )
+        (qualblk, qualmask) = _get_block( quality, waveaxis, start, stop )
+        valid = _get_valid( datablk, datamask, errblk, errmask, qualblk,
+                            bitmask )
+        errors = errblk[valid]
+        if errors.size > 0:
+            min_error = min(min_error, errors.min())
+            sum_error += errors.sum(dtype=np.float64)
+            count += errors.size
+    if count == 0 or not (min_error > 0.0):
+        return None
+    return (sum_error / count) / max_weight_gain
+
+def _flatten_blocks( data, error, quality, waveaxis, axes, weighted,
+                     max_weight_gain, perfect, bitmask, max_memory ):
+    """
         
-    return flat_quality
+    Helper function which averages a data array over the given axes,
+    walking along the wavelength axis a block of planes at a time.
+    
+    The weighted sum of the signal, the sum of the weights, the sum of
+    the squared errors and the combined quality are accumulated in one
+    pass over each block, so the working memory needed does not depend
+    on the length of the wavelength axis. (If the signal is weighted,
+    the error array is scanned first to find the largest weight
+    allowed.) Elements which are NaN, masked or flagged by the given
+    DQ bitmask do not contribute to the signal or error. The quality
+    is combined from all the elements. As with the old _get_weights
+    function, the errors are raised to the error limit before they are
+    combined into the flattened error whenever they are used as weights.
+    
+    """
+    # Other array-like inputs (such as lists) are converted to arrays.
+    # Arrays, including memory-mapped arrays, are used as they are.
+    (data, error, quality) = [_as_array(array) for array in \
+                              (data, error, quality)]
+    shape = np.shape(data)
+    ndim = len(shape)
+    waveaxis = waveaxis % ndim
+    axes = tuple(sorted([axis % ndim for axis in axes]))
+    outshape = tuple([shape[ii] for ii in range(ndim) if ii not in axes])
+    accumulate = waveaxis in axes
+    if not accumulate:
+        outwaveaxis = waveaxis - len([axis for axis in axes
+                                      if axis < waveaxis])
+    nblock = _planes_per_block( shape, waveaxis, max_memory )
+
+    # If required, the signal average is weighted by the inverse of the
+    # error.
+    error_limit = None
+    if weighted and error is not None:
+        error_limit = _get_error_limit( data, error, quality, waveaxis,
+                                        bitmask, max_weight_gain, nblock )
+
+    sum_data = np.zeros(outshape, dtype=np.float64)
+    sum_weights = np.zeros(outshape, dtype=np.float64)
+    if error is not None:
+        sum_errorsq = np.zeros(outshape, dtype=np.float64)
+        count = np.zeros(outshape, dtype=np.float64)
+    flat_quality = None
+    for start in range(0, shape[waveaxis], nblock):
+        stop = min(start + nblock, shape[waveaxis])
+        (datablk, datamask) = _get_block( data, waveaxis, start, stop )
+        (errblk, errmask) = _get_block( error, waveaxis, start, stop )
+        (qualblk, qualmask) = _get_block( quality, waveaxis, start, stop )
+        valid = _get_valid( datablk, datamask, errblk, errmask, qualblk,
+                            bitmask )
+        if error_limit is not None:
+            weights = np.where(valid, errblk, 1.0)
+            np.maximum(weights, error_limit, out=weights)
+            np.divide(1.0, weights, out=weights)
+            weights[~valid] = 0.0
+        else:
+            weights = valid.astype(np.float64)
+        signal = np.where(valid, datablk, 0.0)
+        signal *= weights
+        if accumulate:
+            index = Ellipsis
+        else:
+            index = [slice(None)] * len(outshape)
+            index[outwaveaxis] = slice(start, stop)
+            index = tuple(index)
+        sum_data[index] += signal.sum(axis=axes)
+        sum_weights[index] += weights.sum(axis=axes)
+        del signal, weights
+        if error is not None:
+            errorsq = np.where(valid, errblk, 0.0)
+            if error_limit is not None:
+                np.maximum(errorsq, error_limit, out=errorsq)
+                errorsq[~valid] = 0.0
+            errorsq *= errorsq
+            sum_errorsq[index] += errorsq.sum(axis=axes)
+            count[index] += valid.sum(axis=axes)
+            del errorsq
+        if qualblk is not None:
+            # If perfection is needed, the overall quality is the
+            # maximum of the contributing quality. Otherwise it is
+            # the minimum.
+            if perfect:
+                blk_quality = np.max( qualblk, axis=axes )
+            else:
+                blk_quality = np.min( qualblk, axis=axes )
+            if not accumulate:
+                if flat_quality is None:
+                    flat_quality = np.zeros(outshape,
+                                            dtype=blk_quality.dtype)
+                flat_quality[index] = blk_quality
+            elif flat_quality is None:
+                flat_quality = blk_quality
+            elif perfect:
+                np.maximum(flat_quality, blk_quality, out=flat_quality)
+            else:
+                np.minimum(flat_quality, blk_quality, out=flat_quality)
+        del valid
+
+    # Where nothing contributes, the result is NaN.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        flat_data = sum_data / sum_weights
+        if error is not None:
+            flat_error = np.sqrt(sum_errorsq / count)
+        else:
+            flat_error = None
+    return (flat_data, flat_error, flat_quality)
 
 def spec2d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
-                     max_weight_gain=10000.0, perfect=False):
+                     max_weight_gain=10000.0, perfect=False, bitmask=None,
+                     max_memory=_FLATTEN_MAX_MEMORY):
     """
         
     Flatten a 2-D spectrum in the spatial direction to generate one
@@ -892,6 +1146,7 @@ def spec2d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
     The output signal is the (weighted) average of the input signal.
     The output error is the RMS of the input error.
     The output quality is a combination of the input quality.
+    NaN data values and elements flagged by bitmask are skipped.
     
     :Parameters:
         
@@ -917,6 +1172,13 @@ def spec2d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
         Set to False to regard a pixel in the spectrum as bad only
         if all of the contributing pixels are bad (and use the
         error array to mark the reduction in quality).
+    bitmask: int, optional, default=None
+        If given, data elements whose quality has any of these bits
+        set are excluded from the signal and error.
+    max_memory: int, optional, default=64 MB
+        The maximum number of bytes of working memory. The arrays
+        are processed a block of wavelengths at a time, so they can
+        be memory-mapped. None processes the arrays all at once.
 
     :Returns:
 
@@ -929,20 +1191,13 @@ def spec2d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
         spatialaxis = 1
     else:
         spatialaxis = 0
-        
-    # If required, the signal average is weighted by the inverse of the error.
-    weights = _get_weights( error, weighted, max_weight_gain )
-
-    data = np.asarray(data)
-    flat_data = np.average( data, axis=spatialaxis, weights=weights)
-    flat_error = _flatten_error_array( error, axis=spatialaxis)
-    flat_quality = _flatten_quality_array( quality, axis=spatialaxis,
-                                           perfect=perfect)
-
-    return (flat_data, flat_error, flat_quality)
+    return _flatten_blocks( data, error, quality, waveaxis, (spatialaxis,),
+                            weighted, max_weight_gain, perfect, bitmask,
+                            max_memory )
 
 def spec3d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
-                     max_weight_gain=10000.0, perfect=False):
+                     max_weight_gain=10000.0, perfect=False, bitmask=None,
+                     max_memory=_FLATTEN_MAX_MEMORY):
     """
         
     Flatten a spectral data cube in the spatial directions to
@@ -950,6 +1205,7 @@ def spec3d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
         
     The output signal is the (weighted) average of the input signal.
     The output error is the RMS of the input error.
+    NaN data values and elements flagged by bitmask are skipped.
         
     Not a particularly useful function unless the entire data cube
     contains the spectrum of one object.
@@ -957,11 +1213,11 @@ def spec3d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
     :Parameters:
         
     data: array-like
-        The 2-D spectrum to be flattened.
+        The 3-D spectrum to be flattened.
     error: array-like
-        The 2-D error array associated with the data array.
+        The 3-D error array associated with the data array.
     quality: array-like
-        The 2-D data quality array associated with the data array.
+        The 3-D data quality array associated with the data array.
         Good data elements are assumed to have quality=0.
     waveaxis: int, optional, default=0
         The wavelength axis for the data arrays.
@@ -978,6 +1234,13 @@ def spec3d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
         Set to False to regard a pixel in the spectrum as bad only
         if all of the contributing pixels are bad (and use the
         error array to mark the reduction in quality).
+    bitmask: int, optional, default=None
+        If given, data elements whose quality has any of these bits
+        set are excluded from the signal and error.
+    max_memory: int, optional, default=64 MB
+        The maximum number of bytes of working memory. The arrays
+        are processed a block of wavelengths at a time, so they can
+        be memory-mapped. None processes the arrays all at once.
 
     :Returns:
 
@@ -987,35 +1250,29 @@ def spec3d_to_spec1d(data, error, quality, waveaxis=0, weighted=True,
         
     """
     # Determine a formula which averages every axis except the
-    # wavelength axis.
+    # wavelength axis. The cube is averaged over one spatial axis,
+    # and the (much smaller) result averaged over the other.
+    waveaxis = waveaxis % 3
     if waveaxis == 0:
         axis_list = (-1, -1)
     elif waveaxis == 1:
         axis_list = (-1, 0)
     else:
         axis_list = (1, 0)
-        
-    # If required, the signal average is weighted by the inverse of the error.
-    weights1 = _get_weights( error, weighted, max_weight_gain )
 
-    data = np.asarray(data)
-    flat_data1 = np.average( data, axis=axis_list[0], weights=weights1)
-    flat_error1 = _flatten_error_array( error, axis=axis_list[0])
-    flat_quality1 = _flatten_quality_array( quality, axis=axis_list[0],
-                                            perfect=perfect)
-
-    weights2 = _get_weights( flat_error1, weighted, max_weight_gain )
-
-    flat_data2 = np.average( flat_data1, axis=axis_list[1], weights=weights2)
-    flat_error2 = _flatten_error_array( flat_error1, axis=axis_list[1])
-    flat_quality2 = _flatten_quality_array( flat_quality1, axis=axis_list[1],
-                                            perfect=perfect)
-             
-    return (flat_data2, flat_error2, flat_quality2)
+    (flat_data1, flat_error1, flat_quality1) = \
+        _flatten_blocks( data, error, quality, waveaxis, (axis_list[0],),
+                         weighted, max_weight_gain, perfect, bitmask,
+                         max_memory )
+    waveaxis1 = min(waveaxis, 1)
+    return _flatten_blocks( flat_data1, flat_error1, flat_quality1,
+                            waveaxis1, (axis_list[1],), weighted,
+                            max_weight_gain, perfect, None, max_memory )
 
 
 def spec3d_to_image(data, error, quality, waveaxis=0, weighted=True,
-                    max_weight_gain=10000.0, perfect=False):
+                    max_weight_gain=10000.0, perfect=False, bitmask=None,
+                    max_memory=_FLATTEN_MAX_MEMORY):
     """
         
     Flatten a spectral data cube in the wavelength direction to
@@ -1023,6 +1280,7 @@ def spec3d_to_image(data, error, quality, waveaxis=0, weighted=True,
         
     The output signal is the (weighted) average of the input signal.
     The output error is the RMS of the input error.
+    NaN data values and elements flagged by bitmask are skipped.
         
     Not a particularly useful function unless the entire data cube
     contains the spectrum of one object.
@@ -1030,11 +1288,11 @@ def spec3d_to_image(data, error, quality, waveaxis=0, weighted=True,
     :Parameters:
         
     data: array-like
-        The 2-D spectrum to be flattened.
+        The 3-D spectrum to be flattened.
     error: array-like
-        The 2-D error array associated with the data array.
+        The 3-D error array associated with the data array.
     quality: array-like
-        The 2-D data quality array associated with the data array.
+        The 3-D data quality array associated with the data array.
         Good data elements are assumed to have quality=0.
     waveaxis: int, optional, default=0
         The wavelength axis for the data arrays.
@@ -1051,6 +1309,13 @@ def spec3d_to_image(data, error, quality, waveaxis=0, weighted=True,
         Set to False to regard a pixel in the spectrum as bad only
         if all of the contributing pixels are bad (and use the
         error array to mark the reduction in quality).
+    bitmask: int, optional, default=None
+        If given, data elements whose quality has any of these bits
+        set are excluded from the signal and error.
+    max_memory: int, optional, default=64 MB
+        The maximum number of bytes of working memory. The arrays
+        are processed a block of wavelengths at a time, so they can
+        be memory-mapped. None processes the arrays all at once.
 
     :Returns:
 
@@ -1059,16 +1324,9 @@ def spec3d_to_image(data, error, quality, waveaxis=0, weighted=True,
         error and quality arrays for the flattened image.
         
     """
-    # If required, the signal average is weighted by the inverse of the error.
-    weights = _get_weights( error, weighted, max_weight_gain )
-
-    data = np.asarray(data)
-    flat_data = np.average( data, axis=waveaxis, weights=weights)
-    flat_error = _flatten_error_array( error, axis=waveaxis) 
-    flat_quality = _flatten_quality_array( quality, axis=waveaxis,
-                                           perfect=perfect)
-
-    return (flat_data, flat_error, flat_quality)
+    return _flatten_blocks( data, error, quality, waveaxis, (waveaxis,),
+                            weighted, max_weight_gain, perfect, bitmask,
+                            max_memory )
 
 
 
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""
+
+Module test_ramp_fitting - Contains the unit tests for the module
+called ramp_fitting.
+
+:History:
+
+18 Oct 2026: Created
+18 Oct 2026: Test diff_slopes.
+18 Oct 2026: Test fitting a file with unsigned DQ arrays.
+
+@author: MIRI Software Team
+
+"""
+# This module is now converted to Python 3.
+
+
+import os
+import unittest
+import warnings
+import numpy as np
+import astropy.io.fits as pyfits
+
+from miri.tools.ramp_fitting import fit_ramps, ramp_slopes, \
+    fit_ramps_file, rows_per_block, diff_slopes
+
+
+def _lstsq_fit(x, y):
+    # Reference straight line fit made one ramp at a time.
+    matrix = np.vstack( [x, np.ones_like(x)] ).T
+    slope, intercept = np.linalg.lstsq(matrix, y, rcond=-1)[0]
+    return (slope, intercept)
+
+
+class TestRampFitting(unittest.TestCase):
+    def setUp(self):
+        # Create a 4-D set of noisy ramps with a different slope
+        # in every pixel.
+        self.nints = 2
+        self.ngroups = 8
+        self.rows = 3
+        self.columns = 4
+        self.grptime = 2.5
+        rng = np.random.RandomState(42)
+        self.true_slope = rng.uniform(1.0, 10.0,
+                                      size=(self.nints, self.rows,
+                                            self.columns))
+        times = self.grptime * np.arange(self.ngroups)
+        self.data = 100.0 + \
+            self.true_slope[:,np.newaxis,:,:] * \
+            times[np.newaxis,:,np.newaxis,np.newaxis]
+        self.data += rng.normal(0.0, 0.5, size=self.data.shape)
+        self.times = times
+        self.testfile = "MiriRampFitting_test.fits"
+
+    def tearDown(self):
+        del self.data
+        del self.true_slope
+        del self.times
+        if os.path.isfile(self.testfile):
+            try:
+                os.remove(self.testfile)
+            except Exception as e:
+                strg = "Could not remove temporary file, " + self.testfile + \
+                    "\n   " + str(e)
+                warnings.warn(strg)
+
+    def test_fit(self):
+        # The batched fit must agree with a fit made one ramp at a time.
+        (slope, intercept, slope_err) = fit_ramps(self.data,
+                                                  grptime=self.grptime)
+        self.assertEqual(slope.shape, (self.nints, self.rows, self.columns))
+        for intg in range(0, self.nints):
+            for row in range(0, self.rows):
+                for column in range(0, self.columns):
+                    (m, c) = _lstsq_fit(self.times,
+                                        self.data[intg,:,row,column])
+                    self.assertAlmostEqual(m, slope[intg,row,column])
+                    self.assertAlmostEqual(c, intercept[intg,row,column])
+        self.assertTrue(np.all(slope_err > 0.0))
+        self.assertTrue(np.all(np.abs(slope - self.true_slope) <
+                               6.0 * slope_err))
+
+    def test_3d(self):
+        # A 3-D data array gives a 2-D result.
+        slope = ramp_slopes(self.data[0], grptime=self.grptime)
+        self.assertEqual(slope.shape, (self.rows, self.columns))
+        slope4d = ramp_slopes(self.data, grptime=self.grptime)
+        self.assertTrue(np.allclose(slope, slope4d[0]))
+
+    def test_group_range(self):
+        # Fitting a subset of groups is the same as fitting a slice.
+        slope = ramp_slopes(self.data, grptime=self.grptime,
+                            startgroup=2, endgroup=6)
+        (m, c) = _lstsq_fit(self.times[2:6], self.data[1,2:6,2,3])
+        self.assertAlmostEqual(m, slope[1,2,3])
+        self.assertRaises(ValueError, ramp_slopes, self.data,
+                          startgroup=3, endgroup=4)
+        self.assertRaises(TypeError, ramp_slopes, self.data[0,0])
+
+    def test_dq(self):
+        # Flagged groups are excluded from the fit.
+        groupdq = np.zeros(self.data.shape, dtype=np.uint8)
+        groupdq[0,5:,1,1] = 2
+        pixeldq = np.zeros((self.rows, self.columns), dtype=np.uint32)
+        pixeldq[2,0] = 1
+        slope = ramp_slopes(self.data, grptime=self.grptime,
+                            groupdq=groupdq, pixeldq=pixeldq)
+        (m, c) = _lstsq_fit(self.times[:5], self.data[0,:5,1,1])
+        self.assertAlmostEqual(m, slope[0,1,1])
+        self.assertTrue(np.isnan(slope[0,2,0]))
+        self.assertTrue(np.isnan(slope[1,2,0]))
+
+        # Flags not included in the bit mask are ignored.
+        slope = ramp_slopes(self.data, grptime=self.grptime,
+                            groupdq=groupdq, pixeldq=pixeldq,
+                            dq_bitmask=4, fill_value=0.0)
+        unmasked = ramp_slopes(self.data, grptime=self.grptime)
+        self.assertTrue(np.allclose(slope, unmasked))
+
+        # A ramp with fewer than 2 good groups cannot be fitted.
+        groupdq[1,1:,0,0] = 2
+        slope = ramp_slopes(self.data, grptime=self.grptime,
+                            groupdq=groupdq, fill_value=-1.0)
+        self.assertEqual(slope[1,0,0], -1.0)
+
+    def test_blocks(self):
+        # Fitting in blocks of rows gives the same result as fitting
+        # all the rows at once.
+        block_rows = rows_per_block(self.data.shape, max_memory=1)
+        self.assertEqual(block_rows, 1)
+        block_rows = rows_per_block(self.data.shape, max_memory=None)
+        self.assertEqual(block_rows, self.rows)
+        (slope, intercept, slope_err) = fit_ramps(self.data,
+                                                  grptime=self.grptime)
+        (bslope, bintercept, bslope_err) = fit_ramps(self.data,
+                                                     grptime=self.grptime,
+                                                     max_memory=1)
+        self.assertTrue(np.allclose(slope, bslope))
+        self.assertTrue(np.allclose(intercept, bintercept))
+        self.assertTrue(np.allclose(slope_err, bslope_err))
+
+    def test_file(self):
+        # Ramps read from a memory-mapped file, including scaled
+        # integer data, give the same result as ramps held in memory.
+        idata = np.round(self.data).astype(np.uint16)
+        primary_hdu = pyfits.PrimaryHDU()
+        primary_hdu.header['TGROUP'] = self.grptime
+        sci_hdu = pyfits.ImageHDU(data=idata, name='SCI')
+        pyfits.HDUList([primary_hdu, sci_hdu]).writeto(self.testfile,
+                                                       overwrite=True)
+        (slope, intercept, slope_err) = fit_ramps(idata,
+                                                  grptime=self.grptime)
+        (fslope, fintercept, fslope_err) = fit_ramps_file(self.testfile,
+                                                          max_memory=1)
+        self.assertTrue(np.allclose(slope, fslope))
+        self.assertTrue(np.allclose(intercept, fintercept))
+        self.assertTrue(np.allclose(slope_err, fslope_err))
+        self.assertRaises(KeyError, fit_ramps_file, self.testfile,
+                          extname='NOTHERE')
+
+    def test_file_dq(self):
+        # Unsigned DQ arrays (stored with a BZERO offset) are read
+        # correctly, so zero quality flags exclude nothing from the fit.
+        pixeldq = np.zeros((self.rows, self.columns), dtype=np.uint32)
+        pixeldq[0,0] = 1
+        primary_hdu = pyfits.PrimaryHDU()
+        sci_hdu = pyfits.ImageHDU(data=self.data, name='SCI')
+        dq_hdu = pyfits.ImageHDU(data=pixeldq, name='PIXELDQ')
+        groupdq_hdu = pyfits.ImageHDU(
+            data=np.zeros(self.data.shape, dtype=np.uint16), name='GROUPDQ')
+        pyfits.HDUList([primary_hdu, sci_hdu, dq_hdu, groupdq_hdu]).writeto(
+                                                self.testfile, overwrite=True)
+        (slope, intercept, slope_err) = fit_ramps(self.data,
+                                                  grptime=self.grptime,
+                                                  pixeldq=pixeldq)
+        (fslope, fintercept, fslope_err) = fit_ramps_file(self.testfile,
+                                                          grptime=self.grptime,
+                                                          use_dq=True,
+                                                          max_memory=1)
+        self.assertTrue(np.all(np.isnan(fslope[:,0,0])))
+        self.assertTrue(np.allclose(slope, fslope, equal_nan=True))
+        self.assertTrue(np.allclose(slope_err, fslope_err, equal_nan=True))
+
+    def test_diff(self):
+        # The quick estimate is the difference between the last and first
+        # groups divided by the time between them, returned as float32.
+        # Unsigned data which decreases must not wrap around.
+        timediff = self.grptime * (self.ngroups - 1)
+        expected = (self.data[:,-1,:,:] - self.data[:,0,:,:]) / timediff
+        slope = diff_slopes(self.data, timediff)
+        self.assertEqual(slope.dtype, np.float32)
+        self.assertTrue(np.allclose(slope, expected, rtol=1.0e-6))
+        idata = np.round(self.data[:,::-1,:,:]).astype(np.uint16)
+        slope = diff_slopes(idata, timediff)
+        self.assertTrue(np.all(slope < 0.0))
+
+
+# If being run as a main program, run the tests.
+if __name__ == '__main__':
+    unittest.main()
@@ -26,6 +26,8 @@ Or if these parameters appear close to a good fit, try giving
 scipy.optimize.curve_fit failed
 
 10 Oct 2019: Test enabled again.
+18 Oct 2026: Added tests of condense on stacks of spectra.
+18 Oct 2026: Added tests of the spectral flattening functions.
 
 @author:  Juergen Schreiber
 
@@ -37,6 +39,8 @@ import unittest
 import numpy as np
 
 from miri.tools.spec_tools import condense, convGauss
+from miri.tools.spec_tools import spec2d_to_spec1d, spec3d_to_spec1d, \
+   spec3d_to_image
 from miri.tools.spec_tools import lrs2D_spextract, lrs_extract_spec, \
    lrs_extract_spec_with_fit, get_psf_fit, optimalSpecExtraction, \
    subtractBackground, interpolWaveOnRows, interpolLin, interpol_lin, interpolSpline
@@ -69,6 +73,54 @@ class TestCondense(unittest.TestCase):
         self.assertTrue(len(self.spec)== len(self.result))
         self.result = condense(self.spec, 10, method = "Mean",running = False)
         self.assertTrue (len(self.spec)/10 == len(self.result))
+
+    def test_condense_values(self):
+        # The running window starts at each element and is truncated
+        # at the end of the spectrum.
+        spec = np.array([5.0, 3.0, 8.0, 1.0, 9.0, 2.0, 7.0])
+        self.result = condense(spec, 3, method = "Min")
+        self.assertTrue(np.array_equal(self.result,
+                                       [3.0, 1.0, 1.0, 1.0, 2.0, 2.0, 7.0]))
+        self.result = condense(spec, 3, method = "Median")
+        self.assertTrue(np.array_equal(self.result,
+                                       [5.0, 3.0, 8.0, 2.0, 7.0, 4.5, 7.0]))
+        self.result = condense(spec, 2, method = "Mean")
+        self.assertTrue(np.allclose(self.result,
+                                    [4.0, 5.5, 4.5, 5.0, 5.5, 4.5, 7.0]))
+        # Rebinning ignores the incomplete bin at the end.
+        self.result = condense(spec, 3, method = "Mean", running = False)
+        self.assertTrue(np.allclose(self.result, [16.0/3.0, 4.0]))
+        # A NaN affects only the windows which contain it.
+        spec[4] = np.nan
+        for method in ("Median", "Mean", "Min"):
+            self.result = condense(spec, 2, method = method)
+            self.assertTrue(np.all(np.isnan(self.result[3:5])))
+            self.assertTrue(np.all(np.isfinite(self.result[:3])))
+            self.assertTrue(np.all(np.isfinite(self.result[5:])))
+        self.assertRaises(ValueError, condense, spec, 2, method = "Max")
+        self.assertRaises(ValueError, condense, spec, 20)
+
+    def test_condense_stack(self):
+        # A stack of spectra gives the same result as condensing each
+        # spectrum in turn.
+        cube = np.random.RandomState(42).normal(size=(40, 3, 4))
+        for method in ("Median", "Mean", "Min"):
+            for running in (True, False):
+                self.result = condense(cube, 4, method = method,
+                                       running = running, axis = 0)
+                for row in range(0, 3):
+                    for column in range(0, 4):
+                        expected = condense(cube[:,row,column], 4,
+                                            method = method,
+                                            running = running)
+                        self.assertTrue(
+                            np.allclose(self.result[:,row,column], expected))
+                # The spectral axis can be any axis.
+                result = condense(np.moveaxis(cube, 0, -1), 4,
+                                  method = method, running = running,
+                                  axis = -1)
+                self.assertTrue(np.allclose(np.moveaxis(result, -1, 0),
+                                            self.result))
         
         
     def test_convGauss(self):
@@ -162,6 +214,101 @@ class TestLrsExtract(unittest.TestCase):
         
         del result1, spec, spec1, sub, prod, new_spec
 
+
+class TestFlatten(unittest.TestCase):
+    def setUp(self):
+        # Create a small spectral cube with wavelength along axis 0.
+        rng = np.random.RandomState(7)
+        self.data = rng.normal(100.0, 10.0, (23, 4, 5))
+        self.error = rng.uniform(0.5, 2.0, (23, 4, 5))
+        self.quality = rng.randint(0, 4, (23, 4, 5)).astype(np.uint32)
+
+    def tearDown(self):
+        del self.data, self.error, self.quality
+
+    def test_blocks(self):
+        # Flattening a block of wavelengths at a time must give the
+        # same result as flattening the whole cube at once.
+        for weighted in (True, False):
+            for perfect in (True, False):
+                for function in (spec3d_to_spec1d, spec3d_to_image):
+                    whole = function(self.data, self.error, self.quality,
+                                     weighted=weighted, perfect=perfect,
+                                     max_memory=None)
+                    blocks = function(self.data, self.error, self.quality,
+                                      weighted=weighted, perfect=perfect,
+                                      max_memory=1)
+                    for (array1, array2) in zip(whole, blocks):
+                        self.assertTrue(np.allclose(array1, array2))
+                        self.assertTrue(np.array_equal(array1.shape,
+                                                       array2.shape))
+        # The signal is the weighted average of the data and the error
+        # is the RMS error.
+        (flat_data, flat_error, flat_quality) = \
+            spec2d_to_spec1d(self.data[:,:,0], self.error[:,:,0],
+                             self.quality[:,:,0], max_memory=1)
+        weights = 1.0 / self.error[:,:,0]
+        expected = np.sum(self.data[:,:,0] * weights, axis=1) / \
+            np.sum(weights, axis=1)
+        self.assertTrue(np.allclose(flat_data, expected))
+        expected = np.sqrt(np.mean(self.error[:,:,0]**2, axis=1))
+        self.assertTrue(np.allclose(flat_error, expected))
+        self.assertTrue(np.array_equal(flat_quality,
+                                       np.min(self.quality[:,:,0], axis=1)))
+
+    def test_skip(self):
+        # NaN values and DQ-flagged elements are skipped, and the
+        # error array is not changed.
+        self.data[3,2,1] = np.nan
+        error_copy = self.error.copy()
+        (flat_data, flat_error, flat_quality) = \
+            spec3d_to_image(self.data, self.error, self.quality,
+                            weighted=False, bitmask=1, max_memory=1)
+        self.assertTrue(np.array_equal(self.error, error_copy))
+        valid = np.isfinite(self.data) & \
+            (np.bitwise_and(self.quality, 1) == 0)
+        expected = np.sum(np.where(valid, self.data, 0.0), axis=0) / \
+            np.sum(valid, axis=0)
+        self.assertTrue(np.allclose(flat_data, expected))
+        # An element with nothing contributing is NaN.
+        self.quality[:,0,0] = 1
+        (flat_data, flat_error, flat_quality) = \
+            spec3d_to_image(self.data, self.error, self.quality,
+                            bitmask=1)
+        self.assertTrue(np.isnan(flat_data[0,0]))
+        self.assertTrue(np.isnan(flat_error[0,0]))
+        self.assertTrue(np.all(np.isfinite(flat_data[1:,:])))
+
+    def test_lists(self):
+        # Lists are accepted as well as arrays.
+        expected = spec3d_to_spec1d(self.data, self.error, self.quality)
+        result = spec3d_to_spec1d(self.data.tolist(), self.error.tolist(),
+                                  self.quality.tolist())
+        for (array1, array2) in zip(expected, result):
+            self.assertTrue(np.allclose(array1, array2))
+
+    def test_error_limit(self):
+        # Errors much smaller than the mean error are raised to the
+        # error limit, both for the weights and for the flattened error.
+        data = self.data[:,:,0]
+        error = self.error[:,:,0].copy()
+        error[5,2] = 1.0e-9
+        max_weight_gain = 10.0
+        (flat_data, flat_error, flat_quality) = \
+            spec2d_to_spec1d(data, error, None,
+                             max_weight_gain=max_weight_gain)
+        clamped = np.maximum(error, error.mean() / max_weight_gain)
+        weights = 1.0 / clamped
+        expected = np.sum(data * weights, axis=1) / np.sum(weights, axis=1)
+        self.assertTrue(np.allclose(flat_data, expected))
+        expected = np.sqrt(np.mean(clamped**2, axis=1))
+        self.assertTrue(np.allclose(flat_error, expected))
+        # The unweighted average leaves the errors alone.
+        (flat_data, flat_error, flat_quality) = \
+            spec2d_to_spec1d(data, error, None, weighted=False)
+        expected = np.sqrt(np.mean(error**2, axis=1))
+        self.assertTrue(np.allclose(flat_error, expected))
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -302,6 +302,7 @@ setup(
 #             'miri/datamodels/scripts/multicdp_wildcard.csh',
 #             'miri/simulators/scasim/scripts/make_bad_pixel_mask.py',
 #             'miri/simulators/scasim/scripts/make_fringe_map.py',
+             'miri/simulators/scasim/scripts/make_cr_cache.py',
              'miri/simulators/scasim/scripts/make_sca_calibration.py',
              'miri/simulators/scasim/scripts/make_sca_file.py',
              'miri/simulators/scasim/scripts/make_sca_subarray.py',
@@ -309,6 +310,7 @@ setup(
 #             'miri/simulators/scasim/scripts/detector_latency_test.py',
              'miri/simulators/scasim/scripts/plot_exposure_data.py',
              'miri/simulators/scasim/scripts/scasim.py',
+             'miri/simulators/scasim/scripts/scasim_batch.py',
              ],
     data_files=[('', ['LICENCE', 'README'])],
     entry_points=entry_points,